@@ -0,0 +1 @@
+"""Benchmarks for CommandNote models and controllers (headless, no pywebview needed)."""
@@ -0,0 +1,83 @@
+"""
+Benchmark: cost of duplicating a large folder, in memory and in the data file
+
+Creates a folder of --commands commands with --content-size character
+contents in a JSON-stored DataManager and saves it, then duplicates the folder
+and saves again. Reports the traced memory and the file size added by the
+copy, and the time the duplicate and its save took. The tree is serialized
+before each measurement so the cached JSON of the nodes is included.
+
+Usage:
+    python -m benchmarks.bench_dedup [--commands 10000] [--content-size 120] [--journal]
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from controllers import CommandController
+from models import DataManager
+from .synthetic import make_content
+
+
+def run(args: argparse.Namespace) -> None:
+    """Run the benchmark once"""
+    import random
+
+    # Traced from the start: memory freed by the duplicate (cached JSON made
+    # obsolete) only counts if its allocation was traced
+    tracemalloc.start()
+    directory = tempfile.mkdtemp(prefix="commandnote-bench-")
+    path = os.path.join(directory, "commands.json")
+    try:
+        manager = DataManager(path, journal=args.journal)
+        controller = CommandController(manager, history_size=0)
+        rng = random.Random(0)
+        with manager.batch():
+            folder = controller.create_folder(manager.get_root().id, "library")
+            for i in range(args.commands):
+                controller.create_command(folder['id'], f"command {i}", make_content(rng, f"cmd{i}", args.content_size),
+                                          f"Description of command {i}, long enough to be worth sharing")
+        manager.get_root().to_json()
+        if args.journal:
+            manager.storage.compact(wait=True)
+        size_before = os.path.getsize(path)
+
+        gc.collect()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        controller.duplicate_node(folder['id'])
+        elapsed = time.perf_counter() - start
+        manager.get_root().to_json()
+        gc.collect()
+        memory_added = tracemalloc.get_traced_memory()[0] - memory_before
+        if args.journal:
+            manager.storage.compact(wait=True)
+        size_added = os.path.getsize(path) - size_before
+        manager.close()
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{args.commands} commands of {args.content_size} characters{' (journal)' if args.journal else ''}")
+    print(f"  data file   {size_before / 1e6:8.2f} MB, duplicate adds {size_added / 1e6:8.2f} MB "
+          f"({size_added / args.commands:.0f} B per command)")
+    print(f"  memory      duplicate adds {memory_added / 1e6:8.2f} MB ({memory_added / args.commands:.0f} B per command)")
+    print(f"  time        duplicate and save {elapsed * 1000:8.1f} ms")
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=10_000)
+    parser.add_argument("--content-size", type=int, default=120)
+    parser.add_argument("--journal", action='store_true')
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: loading commands.json, json.load + from_dict vs the streaming loader
+
+Reports wall time, the memory held by the finished tree and the tracemalloc
+peak during the load.
+
+Usage:
+    python -m benchmarks.bench_load [--sizes 100000 1000000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from models import CommandNode
+from models.json_stream import load_tree
+from .synthetic import build_tree
+
+
+def run(size: int) -> None:
+    """Run the benchmark for one tree size"""
+    fd, path = tempfile.mkstemp(prefix="commandnote-bench-", suffix=".json")
+    with os.fdopen(fd, 'wb') as f:
+        f.write(build_tree(size).to_json())
+
+    def whole_document() -> CommandNode:
+        with open(path, 'r', encoding='utf-8') as f:
+            return CommandNode.from_dict(json.load(f))
+
+    def streaming() -> CommandNode:
+        with open(path, 'r', encoding='utf-8') as f:
+            return load_tree(f)[0]
+
+    loaders: Dict[str, Callable[[], CommandNode]] = {'json.load': whole_document, 'streaming': streaming}
+    try:
+        for name, load in loaders.items():
+            start = time.perf_counter()
+            root = load()
+            elapsed = time.perf_counter() - start
+            del root
+
+            tracemalloc.start()
+            root = load()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del root
+            print(f"{size:>9} nodes | {name:<9} | {elapsed:7.2f} s | tree {current / 2**20:8.1f} MiB | "
+                  f"peak {peak / 2**20:8.1f} MiB")
+    finally:
+        os.remove(path)
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == "__main__":
+    main()
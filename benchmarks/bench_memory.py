@@ -0,0 +1,142 @@
+"""
+Benchmark: memory per node, dataclass CommandNode vs slot-based CommandNode
+
+Reports tracemalloc bytes per node for the object graph of a tree, built two ways:
+
+    load    parse a commands.json document (uuid4 ids, isoformat timestamps)
+            and build the tree with from_dict, then drop the parsed document
+    create  create new nodes through the constructor, as the UI does
+
+The "before" numbers use a copy of the former dataclass representation.
+
+Usage:
+    python -m benchmarks.bench_memory [--sizes 100000 1000000]
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from models import CommandNode
+
+
+@dataclass
+class LegacyCommandNode:
+    """The dataclass node representation CommandNode used to have"""
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    name: str = ""
+    node_type: str = "folder"
+    content: str = ""
+    description: str = ""
+    parent_id: Optional[str] = None
+    children: List['LegacyCommandNode'] = field(default_factory=list)
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    _index: Any = field(default=None, repr=False, compare=False)
+    _loaded: bool = field(default=True, repr=False, compare=False)
+    _child_count: int = field(default=0, repr=False, compare=False)
+    _dict_cache: Optional[Dict[str, Any]] = field(default=None, repr=False, compare=False)
+    _json_cache: Optional[bytes] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LegacyCommandNode':
+        children_data = data.pop('children', [])
+        node = cls(**data)
+        node.children = [cls.from_dict(child_data) for child_data in children_data]
+        return node
+
+
+def make_document(node_count: int, fanout: int = 10) -> str:
+    """JSON text of a balanced tree in the commands.json format"""
+    def node(name: str, parent_id: Optional[str], node_type: str) -> Dict[str, Any]:
+        now = datetime.now().isoformat()
+        return {
+            'id': str(uuid.uuid4()), 'name': name, 'node_type': node_type,
+            'content': f"echo {name}" if node_type == "command" else "", 'description': "",
+            'parent_id': parent_id, 'children': [], 'created_at': now, 'updated_at': now,
+        }
+
+    root = node("Root", None, "folder")
+    created = 1
+    level = [root]
+    while created < node_count:
+        next_level = []
+        for parent in level:
+            for i in range(min(fanout, node_count - created)):
+                next_level.append(node(f"{parent['name']}/{i}", parent['id'], "folder"))
+                parent['children'].append(next_level[-1])
+                created += 1
+        level = next_level
+    for leaf in level:
+        leaf['node_type'] = "command"
+        leaf['content'] = f"echo {leaf['name']}"
+    return json.dumps(root, ensure_ascii=False)
+
+
+def create_tree(node_cls: Callable[..., Any], node_count: int, fanout: int = 10) -> Any:
+    """Create a balanced tree of new nodes through the constructor"""
+    root = node_cls(name="Root", node_type="folder")
+    created = 1
+    level = [root]
+    while created < node_count:
+        next_level = []
+        for parent in level:
+            children = []
+            for i in range(min(fanout, node_count - created)):
+                children.append(node_cls(name=f"{parent.name}/{i}", node_type="folder", parent_id=parent.id))
+                created += 1
+            parent.children = children
+            next_level.extend(children)
+        level = next_level
+    for leaf in level:
+        leaf.node_type = "command"
+        leaf.content = f"echo {leaf.name}"
+    return root
+
+
+def traced_bytes(build: Callable[[], Any]) -> int:
+    """Bytes still allocated by build() once it returns (its result is kept alive meanwhile)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return current
+
+
+def run(size: int) -> None:
+    """Run the benchmark for one tree size"""
+    document = make_document(size)
+    results = {
+        'load': (traced_bytes(lambda: LegacyCommandNode.from_dict(json.loads(document))),
+                 traced_bytes(lambda: CommandNode.from_dict(json.loads(document)))),
+    }
+    del document
+    results['create'] = (traced_bytes(lambda: create_tree(LegacyCommandNode, size)),
+                         traced_bytes(lambda: create_tree(CommandNode, size)))
+
+    for mode, (before, after) in results.items():
+        print(f"{size:>9} nodes | {mode:<6} | before {before / size:7.1f} B/node | "
+              f"after {after / size:7.1f} B/node | {1 - after / before:6.1%} less")
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size)
+
+
+if __name__ == "__main__":
+    main()
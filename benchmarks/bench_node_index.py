@@ -0,0 +1,81 @@
+"""
+Benchmark: node lookup and parent lookup, tree scan vs NodeIndex
+
+Usage:
+    python -m benchmarks.bench_node_index [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, List, Optional
+
+from models import CommandNode
+from .synthetic import build_tree, make_data_manager
+
+
+def scan_find(node: CommandNode, node_id: str) -> Optional[CommandNode]:
+    """Recursive lookup as DataManager.find_node_by_id used to do it"""
+    if node.id == node_id:
+        return node
+    for child in node.children:
+        result = scan_find(child, node_id)
+        if result:
+            return result
+    return None
+
+
+def scan_parent(root: CommandNode, node_id: str) -> Optional[CommandNode]:
+    """Flatten-and-scan parent search as delete_node / duplicate_node used to do it"""
+    all_nodes = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        all_nodes.append(node)
+        stack.extend(node.children)
+    for node in all_nodes:
+        if node.is_folder() and any(child.id == node_id for child in node.children):
+            return node
+    return None
+
+
+def time_per_call(func: Callable[[str], object], ids: List[str]) -> float:
+    """Average seconds per call over ids"""
+    start = time.perf_counter()
+    for node_id in ids:
+        func(node_id)
+    return (time.perf_counter() - start) / len(ids)
+
+
+def run(size: int, scan_samples: int, index_samples: int) -> None:
+    """Run the benchmark for one tree size"""
+    root = build_tree(size)
+    manager = make_data_manager(root)
+    all_ids = list(manager.index.nodes)
+    scan_ids = random.sample(all_ids, scan_samples)
+    index_ids = [random.choice(all_ids) for _ in range(index_samples)]
+
+    scan_lookup = time_per_call(lambda node_id: scan_find(root, node_id), scan_ids)
+    index_lookup = time_per_call(manager.find_node_by_id, index_ids)
+    scan_parent_time = time_per_call(lambda node_id: scan_parent(root, node_id), scan_ids)
+    index_parent = time_per_call(manager.get_parent, index_ids)
+
+    print(f"{size:>9} nodes | lookup: scan {scan_lookup * 1e3:9.3f} ms, index {index_lookup * 1e6:7.3f} us "
+          f"({scan_lookup / index_lookup:,.0f}x) | parent: scan {scan_parent_time * 1e3:9.3f} ms, "
+          f"index {index_parent * 1e6:7.3f} us ({scan_parent_time / index_parent:,.0f}x)")
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--scan-samples", type=int, default=5)
+    parser.add_argument("--index-samples", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.scan_samples, args.index_samples)
+
+
+if __name__ == "__main__":
+    main()
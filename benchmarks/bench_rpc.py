@@ -0,0 +1,168 @@
+"""
+Benchmark: local RPC server throughput and its effect on the window
+
+Starts an RpcServer in this process, as the window does, and --clients client
+processes that each keep --depth requests in flight for --seconds. Requests
+are reads (get_node, get_children, search) and, with probability
+--write-ratio, writes (create_command, update_node). Meanwhile a probe thread
+calls get_tree_summary on the controller every 10 ms, as the window's bridge
+would, to show how long the window waits while clients are served.
+
+Reports requests per second and the p50/p99 latency of reads, writes and the
+probe.
+
+Usage:
+    python -m benchmarks.bench_rpc [--nodes 10000] [--storage json|journal|sqlite|sharded] [--write-behind]
+                                   [--clients 4] [--depth 16] [--seconds 5] [--write-ratio 0.1]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from controllers import CommandController
+from models import DataManager
+from views.rpc_client import RpcClient
+from views.rpc_server import RpcServer
+from .synthetic import WORDS, build_tree
+
+PROBE_INTERVAL = 0.01
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    """Percentile of latencies in milliseconds"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+
+def run_client(address: str, token: str, ids: List[str], folders: List[str], seconds: float,
+               depth: int, write_ratio: float, seed: int, results: Any) -> None:
+    """Client process: keep depth requests in flight and report their latencies"""
+    rng = random.Random(seed)
+    created: List[str] = []
+    latencies: Dict[str, List[float]] = {'read': [], 'write': []}
+    errors = 0
+    with RpcClient(address, token) as client:
+        pending: Dict[int, Any] = {}
+
+        def send() -> None:
+            if rng.random() < write_ratio:
+                if created and rng.random() < 0.5:
+                    request = client.send('update_node', rng.choice(created), None, f"echo {rng.random()}")
+                else:
+                    request = client.send('create_command', rng.choice(folders), f"bench {seed} {len(created)}",
+                                          f"echo {rng.choice(WORDS)}")
+                pending[request] = ('write', time.perf_counter())
+            else:
+                kind = rng.random()
+                if kind < 0.6:
+                    request = client.send('get_node', rng.choice(ids))
+                elif kind < 0.9:
+                    request = client.send('get_children', rng.choice(folders), 0, 50)
+                else:
+                    request = client.send('search', rng.choice(WORDS), 20)
+                pending[request] = ('read', time.perf_counter())
+
+        deadline = time.perf_counter() + seconds
+        for _ in range(depth):
+            send()
+        while pending:
+            request = next(iter(pending))
+            kind, sent_at = pending.pop(request)
+            try:
+                result = client.receive(request)
+                if kind == 'write' and isinstance(result['data'], dict) and result['data']['id'] not in created:
+                    created.append(result['data']['id'])
+            except Exception:
+                errors += 1
+            latencies[kind].append(time.perf_counter() - sent_at)
+            if time.perf_counter() < deadline:
+                send()
+    results.put((latencies, errors))
+
+
+def probe_window(controller: CommandController, stop: threading.Event, latencies: List[float]) -> None:
+    """Call the tree summary periodically, as the window would"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        controller.get_tree_summary()
+        latencies.append(time.perf_counter() - start)
+        stop.wait(PROBE_INTERVAL)
+
+
+def run(args: argparse.Namespace) -> None:
+    """Run the benchmark once"""
+    directory = tempfile.mkdtemp(prefix="commandnote-bench-")
+    path = os.path.join(directory, "commands.json")
+    try:
+        root = build_tree(args.nodes)
+        with open(path, 'wb') as f:
+            f.write(root.to_json())
+        options: Dict[str, Any] = {'storage': args.storage} if args.storage in ('sqlite', 'sharded') else \
+            {'journal': args.storage == 'journal'}
+        if args.write_behind:
+            options['write_behind'] = True
+        manager = DataManager(path, **options)
+        controller = CommandController(manager)
+        nodes = manager.get_all_nodes()
+        ids = [node.id for node in nodes]
+        folders = [node.id for node in nodes if node.is_folder()]
+        server = RpcServer(controller)
+        address = server.start()
+
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=run_client, args=(
+            address, server.token, ids, folders, args.seconds, args.depth, args.write_ratio, seed, results))
+            for seed in range(args.clients)]
+        stop = threading.Event()
+        probe: List[float] = []
+        prober = threading.Thread(target=probe_window, args=(controller, stop, probe))
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        prober.start()
+        reports = [results.get() for _ in clients]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+        for client in clients:
+            client.join()
+        server.stop()
+        manager.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    reads = [latency for report in reports for latency in report[0]['read']]
+    writes = [latency for report in reports for latency in report[0]['write']]
+    errors = sum(report[1] for report in reports)
+    print(f"{args.nodes} nodes, {args.storage}{' write-behind' if args.write_behind else ''}, "
+          f"{args.clients} clients x {args.depth} in flight, {elapsed:.1f} s")
+    print(f"  total  {(len(reads) + len(writes)) / elapsed:9.0f} req/s  errors {errors}")
+    for name, samples in (('reads', reads), ('writes', writes), ('window', probe)):
+        print(f"  {name:<6} {len(samples):9d} calls  p50 {_percentile(samples, 0.5):8.2f} ms"
+              f"  p99 {_percentile(samples, 0.99):8.2f} ms")
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=10_000)
+    parser.add_argument("--storage", choices=['json', 'journal', 'sqlite', 'sharded'], default='json')
+    parser.add_argument("--write-behind", action='store_true')
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=16, help="requests each client keeps in flight")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
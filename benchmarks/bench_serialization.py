@@ -0,0 +1,99 @@
+"""
+Benchmark: whole-tree serialization after a single edit, fresh vs memoized
+
+Compares what a save / full tree fetch cost before serialization caching
+(a fresh nested dict, then json.dumps of it) with the memoized to_dict() and
+to_json() after one node was changed.
+
+Usage:
+    python -m benchmarks.bench_serialization [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+from models import CommandNode
+from .synthetic import build_tree, make_data_manager
+
+
+def fresh_dict(node: CommandNode) -> Dict[str, Any]:
+    """Uncached conversion as CommandNode.to_dict used to do it"""
+    return {
+        'id': node.id,
+        'name': node.name,
+        'node_type': node.node_type,
+        'content': node.content,
+        'description': node.description,
+        'parent_id': node.parent_id,
+        'children': [fresh_dict(child) for child in node.children],
+        'created_at': node.created_at,
+        'updated_at': node.updated_at
+    }
+
+
+def measure(func: Callable[[], object], repeat: int) -> Tuple[float, int]:
+    """Average seconds per call and peak bytes allocated by one call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(size: int, repeat: int) -> None:
+    """Run the benchmark for one tree size"""
+    root = build_tree(size)
+    manager = make_data_manager(root)
+    all_ids = list(manager.index.nodes)
+
+    def edit() -> None:
+        node = manager.find_node_by_id(random.choice(all_ids))
+        node.description += "."
+        manager.mark_updated(node)
+
+    def fresh_save() -> None:
+        json.dumps(fresh_dict(root), ensure_ascii=False).encode('utf-8')
+
+    def cached_save() -> None:
+        edit()
+        root.to_json()
+
+    def cached_dict() -> None:
+        edit()
+        root.to_dict()
+
+    root.to_dict()
+    root.to_json()
+    results = {
+        'fresh dict': measure(lambda: fresh_dict(root), repeat),
+        'cached dict': measure(cached_dict, repeat),
+        'fresh json': measure(fresh_save, repeat),
+        'cached json': measure(cached_save, repeat),
+    }
+    line = " | ".join(f"{name}: {elapsed * 1e3:9.3f} ms, peak {peak / 1024:10.1f} KiB"
+                      for name, (elapsed, peak) in results.items())
+    print(f"{size:>9} nodes | {line}")
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
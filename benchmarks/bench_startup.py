@@ -0,0 +1,126 @@
+"""
+Benchmark: time to first paint and time to interactive
+
+headless measures, in a fresh interpreter per run, the two paths the window
+waits on: reading the first-paint snapshot (imports included) and importing the
+controllers, loading the data and building the tree summary. It runs on
+synthetic trees and needs no GUI.
+
+app starts the real application --runs times, from source or a PyInstaller
+build, and reports the median of each startup stage written to the startup
+log. The application closes itself once interactive
+(COMMANDNOTE_EXIT_AFTER_STARTUP=1) and uses its usual data directory.
+
+Usage:
+    python -m benchmarks.bench_startup headless [--sizes 1000 100000] [--storage json] [--runs 5]
+    python -m benchmarks.bench_startup app [--command "python main.py"] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from controllers import CommandController
+from models import DataManager
+from models.first_paint import write_first_paint
+from .synthetic import build_tree
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter, so that imports are part of the measurement
+_HEADLESS_RUN = """
+import json, sys, time
+start = time.perf_counter()
+from models.first_paint import read_first_paint
+tree = read_first_paint(sys.argv[1])
+first_paint = time.perf_counter()
+from controllers import CommandController
+from models import DataManager
+controller = CommandController(DataManager(sys.argv[1], **json.loads(sys.argv[2])))
+controller.get_tree_summary()
+interactive = time.perf_counter()
+print(json.dumps({'snapshot': tree is not None, 'first_paint_ms': (first_paint - start) * 1000,
+                  'interactive_ms': (interactive - start) * 1000}))
+"""
+
+
+def run_headless(size: int, storage: str, runs: int) -> Dict[str, float]:
+    """Measure the headless startup paths on one tree size"""
+    manager_options = {'storage': storage} if storage in ('sqlite', 'sharded') else {'journal': storage == 'journal'}
+    directory = tempfile.mkdtemp(prefix="commandnote-bench-")
+    path = os.path.join(directory, "commands.json")
+    try:
+        with open(path, 'wb') as f:
+            f.write(build_tree(size).to_json())
+        # Migrate and snapshot once, as the previous run of the app would have
+        manager = DataManager(path, **manager_options)
+        summary = CommandController(manager).get_tree_summary()
+        manager.close()
+        write_first_paint(path, summary, manager.storage.files())
+
+        samples: List[Dict] = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", _HEADLESS_RUN, path, json.dumps(manager_options)],
+                                    cwd=PROJECT_DIR, check=True, capture_output=True, text=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        if not all(sample['snapshot'] for sample in samples):
+            print("  warning: the snapshot was stale in some runs")
+        return {key: statistics.median(sample[key] for sample in samples)
+                for key in ('first_paint_ms', 'interactive_ms')}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_app(command: str, runs: int) -> Dict[str, float]:
+    """Start the application runs times and get the median time of each startup stage"""
+    directory = tempfile.mkdtemp(prefix="commandnote-bench-")
+    log_file = os.path.join(directory, "startup.log")
+    env = dict(os.environ, COMMANDNOTE_EXIT_AFTER_STARTUP="1", COMMANDNOTE_STARTUP_LOG=log_file)
+    try:
+        for _ in range(runs):
+            subprocess.run(shlex.split(command, posix=os.name != 'nt'), cwd=PROJECT_DIR, env=env, check=True)
+        with open(log_file, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if not entries:
+        raise RuntimeError("The application wrote no startup timings")
+    print(f"  frozen: {entries[0]['frozen']}, storage: {entries[0]['storage']}, runs: {len(entries)}")
+    stages = entries[0]['ms'].keys()
+    return {stage: statistics.median(entry['ms'][stage] for entry in entries if stage in entry['ms'])
+            for stage in stages}
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    headless_parser = commands.add_parser('headless', help="time the startup paths without a GUI")
+    headless_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+    headless_parser.add_argument("--storage", choices=['json', 'journal', 'sqlite', 'sharded'], default='json')
+    headless_parser.add_argument("--runs", type=int, default=5)
+    app_parser = commands.add_parser('app', help="time real application starts")
+    app_parser.add_argument("--command", default=f"{sys.executable} main.py",
+                            help="command starting the application (source or frozen build)")
+    app_parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'headless':
+        for size in args.sizes:
+            result = run_headless(size, args.storage, args.runs)
+            print(f"{size:>9} nodes  first paint {result['first_paint_ms']:8.1f} ms"
+                  f"  interactive {result['interactive_ms']:9.1f} ms")
+    else:
+        for stage, ms in run_app(args.command, args.runs).items():
+            print(f"{stage:>15} {ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
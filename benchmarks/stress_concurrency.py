@@ -0,0 +1,334 @@
+"""
+Stress test: concurrent reads and writes through one CommandController
+
+pywebview runs every js_api call on its own worker thread. This starts
+--readers threads issuing queries (tree summary, children, node, search,
+change sets, whole tree) and --writers threads issuing mutations (create,
+update, move, delete, duplicate, batches) against one controller for
+--seconds. Readers check each result for consistency while the writers run;
+afterwards the tree, the node and search indexes, the serialization caches,
+the change log and the saved data are checked against each other.
+
+Threads are switched far more often than by default (--switch-interval), so
+that unprotected interleavings show up within seconds. Controller errors for
+stale targets (a node deleted by another writer, a move into a descendant)
+are expected and only counted. Anything else, and every invariant violation,
+is reported, and the exit status is 1.
+
+Usage:
+    python -m benchmarks.stress_concurrency [--storage json|journal|sqlite|sharded] [--write-behind]
+                                            [--readers 8] [--writers 4] [--seconds 10] [--nodes 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from controllers import CommandController
+from models import CommandNode, DataManager
+from .synthetic import build_tree
+
+
+class Stress:
+    """Shared state of one stress run"""
+
+    def __init__(self, controller: CommandController, seed: int):
+        self.controller = controller
+        self.manager = controller.data_manager
+        self.stop = threading.Event()
+        self.seed = seed
+        self.counts: Counter = Counter()
+        self.violations: List[str] = []
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def violation(self, message: str) -> None:
+        with self._lock:
+            self.violations.append(message)
+        self.stop.set()
+
+    def random_ids(self, rng: random.Random, k: int = 1) -> List[str]:
+        """Random IDs of nodes currently in the tree (may be gone by the time they are used)"""
+        with self.manager.read_lock:
+            ids = list(self.manager.index.nodes)
+        return [rng.choice(ids) for _ in range(k)]
+
+
+# ========== Readers ==========
+
+def check_summary(stress: Stress, summary: Dict[str, Any], page_size: int) -> None:
+    """Children of a tree summary belong to their folder and match its child count"""
+    stack = [summary]
+    while stack:
+        node = stack.pop()
+        children = node.get('children')
+        if children is None:
+            continue
+        if len(children) != min(node['child_count'], page_size):
+            stress.violation(f"summary of {node['id']}: {len(children)} children, child_count {node['child_count']}")
+        for child in children:
+            if child['parent_id'] != node['id']:
+                stress.violation(f"summary: {child['id']} listed under {node['id']} has parent {child['parent_id']}")
+            stack.append(child)
+
+
+def check_structure(stress: Stress, tree: Dict[str, Any]) -> None:
+    """The full tree has unique IDs and consistent parent links"""
+    seen = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node['id'] in seen:
+            stress.violation(f"tree structure: {node['id']} appears twice")
+        seen.add(node['id'])
+        for child in node['children']:
+            if child['parent_id'] != node['id']:
+                stress.violation(f"tree structure: {child['id']} under {node['id']} has parent {child['parent_id']}")
+            stack.append(child)
+
+
+def reader(stress: Stress, number: int) -> None:
+    """Thread body: random queries, each checked for internal consistency"""
+    rng = random.Random(stress.seed * 1000 + number)
+    controller = stress.controller
+    while not stress.stop.is_set():
+        op = rng.choices(['summary', 'children', 'node', 'search', 'changes', 'structure'],
+                         [20, 30, 30, 15, 10, 1])[0]
+        try:
+            if op == 'summary':
+                check_summary(stress, controller.get_tree_summary(stress.random_ids(rng, 5), page_size=50), 50)
+            elif op == 'children':
+                folder_id = stress.random_ids(rng)[0]
+                for child in controller.get_children(folder_id):
+                    if child['parent_id'] != folder_id:
+                        stress.violation(f"get_children({folder_id}) returned {child['id']} of {child['parent_id']}")
+            elif op == 'node':
+                node_id = stress.random_ids(rng)[0]
+                node = controller.get_node_by_id(node_id)
+                if node is not None and node['id'] != node_id:
+                    stress.violation(f"get_node_by_id({node_id}) returned {node['id']}")
+            elif op == 'search':
+                for result in controller.search_commands(rng.choice(["cmd", "git", "node", "echo"]), 20):
+                    if result['node_type'] != 'command':
+                        stress.violation(f"search returned folder {result['id']}")
+            elif op == 'changes':
+                version = max(0, controller.get_tree_version() - rng.randint(0, 50))
+                changes = controller.get_changes_since(version)
+                if not changes.get('reset') and changes['version'] < version:
+                    stress.violation(f"changes since {version} end at {changes['version']}")
+            else:
+                check_structure(stress, controller.get_tree_structure())
+            stress.count(f"read.{op}")
+        except Exception:
+            stress.violation(f"reader {op} raised:\n{traceback.format_exc()}")
+
+
+# ========== Writers ==========
+
+def writer(stress: Stress, number: int) -> None:
+    """Thread body: random mutations; errors about stale targets are expected"""
+    rng = random.Random(stress.seed * 1000 + 500 + number)
+    controller = stress.controller
+    serial = 0
+    while not stress.stop.is_set():
+        op = rng.choices(['create', 'update', 'move', 'delete', 'duplicate', 'batch'], [30, 25, 20, 10, 5, 10])[0]
+        serial += 1
+        name = f"w{number}-{serial}"
+        try:
+            if op == 'create':
+                parent_id = stress.random_ids(rng)[0]
+                if rng.random() < 0.3:
+                    controller.create_folder(parent_id, name)
+                else:
+                    controller.create_command(parent_id, name, f"echo {name}", "stress")
+            elif op == 'update':
+                controller.update_node(stress.random_ids(rng)[0], name=name, content=f"git {name}")
+            elif op == 'move':
+                node_id, parent_id = stress.random_ids(rng, 2)
+                controller.move_node(node_id, parent_id)
+            elif op == 'delete':
+                node_id = stress.random_ids(rng)[0]
+                if node_id != stress.manager.get_root().id:
+                    controller.delete_node(node_id)
+            elif op == 'duplicate':
+                controller.duplicate_node(stress.random_ids(rng)[0])
+            else:
+                parent_id, node_id = stress.random_ids(rng, 2)
+                controller.apply_batch([
+                    {'op': 'create_folder', 'parent_id': parent_id, 'name': name},
+                    {'op': 'create_command', 'parent_id': '$0', 'name': name + "-cmd", 'content': "node -v"},
+                    {'op': 'move_node', 'node_id': node_id, 'new_parent_id': '$0'},
+                ])
+            stress.count(f"write.{op}")
+        except ValueError:
+            stress.count(f"write.{op}.rejected")
+        except Exception:
+            stress.violation(f"writer {op} raised:\n{traceback.format_exc()}")
+
+
+# ========== Final checks ==========
+
+def signature(root: CommandNode) -> Dict[str, Tuple]:
+    """(parent ID, position, name, type, content, description) of every node"""
+    result = {root.id: (None, 0, root.name, root.node_type, root.content, root.description)}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for position, child in enumerate(node.children):
+            result[child.id] = (node.id, position, child.name, child.node_type, child.content, child.description)
+            stack.append(child)
+    return result
+
+
+def check_final(stress: Stress, start_version: int) -> None:
+    """Cross-check the tree, its indexes, caches and change log once the threads stopped"""
+    manager = stress.manager
+    root = manager.get_root()
+    manager.load_subtree(root)
+    nodes: List[CommandNode] = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        for child in node.children:
+            if child.parent_id != node.id:
+                stress.violation(f"{child.id} is a child of {node.id} but has parent_id {child.parent_id}")
+            if manager.index.get(child.id) is not child:
+                stress.violation(f"node index does not map {child.id} to the node in the tree")
+            if manager.index.get_parent(child.id) is not node:
+                stress.violation(f"node index has the wrong parent for {child.id}")
+            stack.append(child)
+    if len({node.id for node in nodes}) != len(nodes):
+        stress.violation("a node appears twice in the tree")
+    if len(manager.index) != len(nodes):
+        stress.violation(f"node index holds {len(manager.index)} nodes, the tree {len(nodes)}")
+
+    commands = [node for node in nodes if node.is_command()]
+    if manager.search_index is not None and len(manager.search_index) != len(commands):
+        stress.violation(f"search index holds {len(manager.search_index)} commands, the tree {len(commands)}")
+    for node in random.Random(stress.seed).sample(commands, min(200, len(commands))):
+        if node.id not in manager.search(node.name):
+            stress.violation(f"search for {node.name!r} misses {node.id}")
+
+    cached = json.loads(root.to_json())
+    for node in nodes:
+        node.invalidate()
+    if json.loads(root.to_json()) != cached:
+        stress.violation("cached JSON differs from a fresh serialization")
+
+    changes = stress.controller.get_changes_since(start_version)
+    if not changes.get('reset'):
+        for entry in changes['inserted'] + changes['moved'] + changes['updated']:
+            if entry['id'] not in manager.index:
+                stress.violation(f"change set reports {entry['id']}, which is not in the tree")
+        for entry in changes['removed']:
+            if entry['id'] in manager.index:
+                stress.violation(f"change set reports {entry['id']} as removed, but it is in the tree")
+
+
+def stress_test(storage: str = 'json', write_behind: bool = False, readers: int = 8, writers: int = 4,
+                seconds: float = 10, nodes: int = 2000, seed: int = 0) -> Tuple[Stress, float]:
+    """
+    Run the readers and writers, then check the final state
+
+    Args:
+        storage: 'json', 'journal', 'sqlite' or 'sharded'
+        write_behind: Save on the background thread
+        readers: Number of reader threads
+        writers: Number of writer threads
+        seconds: How long the threads run
+        nodes: Size of the initial tree
+        seed: Random seed for the tree and the operations
+
+    Returns:
+        (the Stress state with its violations and operation counts, elapsed seconds)
+    """
+    directory = tempfile.mkdtemp(prefix="commandnote-stress-")
+    path = os.path.join(directory, "commands.json")
+    with open(path, 'wb') as f:
+        f.write(build_tree(nodes, fanout=8, seed=seed).to_json())
+    options: Dict[str, Any] = {'storage': storage} if storage in ('sqlite', 'sharded') else {
+        'journal': storage == 'journal', 'journal_max_records': 200}
+    if write_behind:
+        options.update(write_behind=True, save_delay=0.05)
+    try:
+        stress = Stress(CommandController(DataManager(path, **options)), seed)
+        start_version = stress.controller.get_tree_version()
+        threads = [threading.Thread(target=reader, args=(stress, i), daemon=True) for i in range(readers)]
+        threads += [threading.Thread(target=writer, args=(stress, i), daemon=True) for i in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stress.stop.wait(seconds)
+        stress.stop.set()
+        for thread in threads:
+            thread.join(timeout=60)
+            if thread.is_alive():
+                stress.violation(f"{thread.name} did not stop (deadlock?)")
+                break
+        elapsed = time.perf_counter() - start
+
+        if not stress.violations:
+            check_final(stress, start_version)
+            expected = signature(stress.manager.get_root())
+            stress.manager.close()
+            reloaded = DataManager(path, **dict(options, write_behind=False))
+            reloaded.load_subtree(reloaded.get_root())
+            if signature(reloaded.get_root()) != expected:
+                stress.violation("the saved data differs from the tree in memory")
+            reloaded.close()
+        return stress, elapsed
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run one stress test, print the results and return the exit status"""
+    stress, elapsed = stress_test(args.storage, args.write_behind, args.readers, args.writers, args.seconds,
+                                  args.nodes, args.seed)
+    reads = sum(n for name, n in stress.counts.items() if name.startswith('read.'))
+    writes = sum(n for name, n in stress.counts.items() if name.startswith('write.'))
+    print(f"{args.storage}{' write-behind' if args.write_behind else ''}: {reads} reads, {writes} writes "
+          f"in {elapsed:.1f} s ({reads / elapsed:.0f} reads/s, {writes / elapsed:.0f} writes/s)")
+    for name, n in sorted(stress.counts.items()):
+        print(f"  {name:<24} {n}")
+    if stress.violations:
+        print(f"{len(stress.violations)} violation(s):")
+        for message in stress.violations[:20]:
+            print(f"  {message}")
+        return 1
+    print("All invariants hold")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storage", choices=['json', 'journal', 'sqlite', 'sharded'], default='json')
+    parser.add_argument("--write-behind", action='store_true', help="save on the background thread")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--nodes", type=int, default=2000, help="size of the initial tree")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--switch-interval", type=float, default=1e-5,
+                        help="interpreter thread switch interval; short ones make races show up sooner")
+    args = parser.parse_args(argv)
+    sys.setswitchinterval(args.switch_interval)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
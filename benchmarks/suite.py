@@ -0,0 +1,362 @@
+"""
+Benchmark suite: DataManager and CommandController hot paths across tree sizes
+
+Times loading, saving, the full tree fetch, search, move, delete and duplicate
+on synthetic trees and writes the results as JSON. Every tree size runs in a
+fresh process, so memory numbers do not carry over between sizes. Runs headless:
+only models and controllers are imported, never pywebview.
+
+Each operation reports the median and minimum time over --repeat runs and the
+tracemalloc peak of one extra, untimed run (skipped with --no-memory, which
+makes large sizes much faster). Mutations include their save, as in the app.
+
+compare flags operations whose median time or peak memory grew by more than
+--threshold relative to the baseline, ignoring time changes smaller than
+--min-time seconds (noise on fast operations), and exits with status 1 if any did.
+
+Usage:
+    python -m benchmarks.suite run [--sizes 1000 10000 100000 1000000] [--storage json]
+                                   [--fanout 10] [--depth N] [--content-size 40]
+                                   [--repeat 5] [--output results.json] [--baseline baseline.json]
+    python -m benchmarks.suite compare baseline.json results.json [--threshold 0.25]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from controllers import CommandController
+from models import CommandNode, DataManager
+from .synthetic import build_tree
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def measure(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None,
+            memory: bool = True) -> Dict[str, Any]:
+    """
+    Time func over repeat runs, then trace the memory of one more run
+
+    Args:
+        func: Operation to measure
+        repeat: Number of timed runs
+        setup: Untimed preparation run before every call of func
+        memory: Whether to run the traced extra call
+
+    Returns:
+        Median and minimum seconds, and the tracemalloc peak in MiB (None without memory)
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'peak_mib': None if peak is None else peak / 2**20,
+    }
+
+
+def peak_rss_mib() -> Optional[float]:
+    """Peak resident memory of this process, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def first_command(node: CommandNode) -> CommandNode:
+    """First command below node, in pre-order"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.is_command():
+            return current
+        stack.extend(reversed(current.children))
+    raise ValueError("Tree has no commands")
+
+
+def run_size(size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Benchmark one tree size (meant to run in its own process)
+
+    Args:
+        size: Number of nodes
+        options: Parsed command line options
+
+    Returns:
+        Result entry for the size
+    """
+    repeat = options['repeat']
+    memory = options['memory']
+    manager_options = {'storage': options['storage']} if options['storage'] in ('sqlite', 'sharded') else {
+        'journal': options['storage'] == 'journal'}
+    result: Dict[str, Any] = {'nodes': size, 'ops': {}}
+    ops = result['ops']
+
+    start = time.perf_counter()
+    root = build_tree(size, options['fanout'], options['depth'], options['content_size'])
+    result['build_s'] = time.perf_counter() - start
+    directory = tempfile.mkdtemp(prefix="commandnote-bench-")
+    path = os.path.join(directory, "commands.json")
+    with open(path, 'wb') as f:
+        f.write(root.to_json())
+    result['file_mib'] = os.path.getsize(path) / 2**20
+    del root
+    if options['storage'] in ('sqlite', 'sharded'):
+        # Migrate once, outside the measurements
+        DataManager(path, **manager_options).close()
+
+    state: Dict[str, Any] = {'manager': None}
+
+    def load() -> None:
+        if state['manager'] is not None:
+            state['manager'].close()
+            state['manager'] = None
+        state['manager'] = DataManager(path, **manager_options)
+
+    try:
+        ops['load_data'] = measure(load, repeat, memory=memory)
+        controller = CommandController(state['manager'])
+
+        def reload() -> None:
+            load()
+            controller.data_manager = state['manager']
+
+        ops['get_tree_structure (cold)'] = measure(
+            lambda: controller.get_tree_structure(), repeat, setup=reload, memory=memory
+        )
+        manager: DataManager = state['manager']
+        ops['get_tree_structure'] = measure(lambda: controller.get_tree_structure(), repeat, memory=memory)
+
+        # One edited node per save, as after a change in the UI (the first save
+        # after loading encodes every node and is left out)
+        manager.load_subtree(manager.root)
+        manager.save_data()
+        leaf = first_command(manager.root)
+        counter = iter(range(10**9))
+
+        def edit_leaf() -> None:
+            leaf.description = f"edit {next(counter)}"
+            manager.mark_updated(leaf)
+
+        ops['save_data'] = measure(manager.save_data, repeat, setup=edit_leaf, memory=memory)
+
+        keywords = {'common': 'docker' if options['content_size'] else 'echo', 'rare': 'Root/1/2/', 'miss': 'zz-no-match'}
+        for label, keyword in keywords.items():
+            ops[f'search_commands ({label})'] = measure(
+                lambda: controller.search_commands(keyword, 200), repeat, memory=memory
+            )
+        keywords['typo'] = 'dokcer' if options['content_size'] else 'ehco'
+        for label, keyword in keywords.items():
+            ops[f'search_commands fuzzy ({label})'] = measure(
+                lambda: controller.search_commands(keyword, 200, fuzzy=True), repeat, memory=memory
+            )
+
+        # Within a second-level folder (the first search after loading labels the tree)
+        scope = manager.root.children[0]
+        if scope.is_folder() and scope.children and scope.children[0].is_folder():
+            scope = scope.children[0]
+        if scope.is_folder():
+            ops['search_commands (scoped)'] = measure(
+                lambda: controller.search_commands(keywords['common'], 200, scope=scope.id), repeat, memory=memory
+            )
+
+        # Move a command back and forth between the first two top-level folders
+        folders = [child for child in manager.root.children if child.is_folder()][:2]
+        targets = iter(folders * (repeat + 1))
+        if len(folders) == 2:
+            ops['move_node'] = measure(lambda: controller.move_node(leaf.id, next(targets).id), repeat, memory=memory)
+
+        # Duplicate a second-level folder (or a command in small trees), then delete the copies
+        source = manager.root.children[0]
+        if source.is_folder() and source.children:
+            source = source.children[0]
+        copies: List[str] = []
+        ops['duplicate_node'] = measure(
+            lambda: copies.append(controller.duplicate_node(source.id)['id']), repeat, memory=memory
+        )
+        ops['delete_node'] = measure(lambda: controller.delete_node(copies.pop()), repeat, memory=memory)
+        result['duplicated_nodes'] = sum(1 for _ in iter_subtree(source))
+    finally:
+        if state['manager'] is not None:
+            state['manager'].close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    result['peak_rss_mib'] = peak_rss_mib()
+    return result
+
+
+def iter_subtree(node: CommandNode) -> Iterator[CommandNode]:
+    """Nodes of a subtree, in pre-order"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(current.children))
+
+
+def git_revision() -> Optional[str]:
+    """Current commit of the working tree, if it is a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            min_time: float) -> List[str]:
+    """
+    Print the change of every operation measured in both results
+
+    Args:
+        baseline: Stored results
+        current: New results
+        threshold: Relative growth (0.25 = 25%) counted as a regression
+        min_time: Time differences below this many seconds are never regressions
+
+    Returns:
+        Descriptions of the regressions
+    """
+    regressions = []
+    for size, entry in current['results'].items():
+        base_entry = baseline['results'].get(size)
+        if base_entry is None:
+            continue
+        for op, stats in entry['ops'].items():
+            base = base_entry['ops'].get(op)
+            if base is None:
+                continue
+            ratio = stats['median_s'] / base['median_s'] if base['median_s'] else 1.0
+            flags = []
+            if ratio > 1 + threshold and stats['median_s'] - base['median_s'] > min_time:
+                flags.append(f"time x{ratio:.2f}")
+            if stats['peak_mib'] is not None and base['peak_mib']:
+                memory_ratio = stats['peak_mib'] / base['peak_mib']
+                if memory_ratio > 1 + threshold and stats['peak_mib'] - base['peak_mib'] > 1:
+                    flags.append(f"memory x{memory_ratio:.2f}")
+            print(f"{size:>9} | {op:<28} | {base['median_s'] * 1000:10.2f} ms -> {stats['median_s'] * 1000:10.2f} ms "
+                  f"({ratio - 1:+7.1%}){'  REGRESSION: ' + ', '.join(flags) if flags else ''}")
+            if flags:
+                regressions.append(f"{size} nodes, {op}: {', '.join(flags)}")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the suite and write the results"""
+    options = {
+        'storage': args.storage, 'fanout': args.fanout, 'depth': args.depth,
+        'content_size': args.content_size, 'repeat': args.repeat, 'memory': not args.no_memory,
+    }
+    results = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': options,
+        },
+        'results': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            entry = pool.apply(run_size, (size, options))
+        results['results'][str(size)] = entry
+        for op, stats in entry['ops'].items():
+            peak = '' if stats['peak_mib'] is None else f" | peak {stats['peak_mib']:8.1f} MiB"
+            print(f"{size:>9} | {op:<28} | median {stats['median_s'] * 1000:10.2f} ms | "
+                  f"min {stats['min_s'] * 1000:10.2f} ms{peak}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        return report(compare(baseline, results, args.threshold, args.min_time))
+    return 0
+
+
+def report(regressions: List[str]) -> int:
+    """Print the regressions and turn them into an exit status"""
+    if regressions:
+        print(f"{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions")
+    return 0
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_compare_options(command: argparse.ArgumentParser) -> None:
+        command.add_argument("--threshold", type=float, default=0.25, help="relative growth counted as a regression")
+        command.add_argument("--min-time", type=float, default=0.002, help="ignore time changes below this (seconds)")
+
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_parser.add_argument("--storage", choices=['json', 'journal', 'sqlite', 'sharded'], default='json')
+    run_parser.add_argument("--fanout", type=int, default=10)
+    run_parser.add_argument("--depth", type=int, default=None, help="levels below the root (default: from fanout)")
+    run_parser.add_argument("--content-size", type=int, default=40, help="command content length")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--no-memory", action='store_true', help="skip the traced memory runs")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--baseline", help="results to compare against")
+    add_compare_options(run_parser)
+
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    add_compare_options(compare_parser)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        sys.exit(run(args))
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    sys.exit(report(compare(baseline, current, args.threshold, args.min_time)))
+
+
+if __name__ == "__main__":
+    main()
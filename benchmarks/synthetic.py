@@ -0,0 +1,127 @@
+"""Synthetic tree generator for benchmarks"""
+
+import os
+import random
+import tempfile
+from typing import List, Optional
+
+from models import CommandNode, DataManager
+
+
+# Words command contents are made of, so searches hit a realistic share of nodes
+WORDS = ["git", "docker", "kubectl", "ssh", "grep", "find", "awk", "sed", "curl", "tar",
+         "python", "npm", "make", "rsync", "systemctl", "journalctl", "--verbose", "-rf",
+         "--all", "/var/log", "~/projects", "origin", "main", "deploy", "build", "status"]
+
+
+def make_content(rng: random.Random, name: str, size: int) -> str:
+    """
+    Command content of about size characters
+
+    Args:
+        rng: Random generator (seeded for reproducible trees)
+        name: Node name, included so every command is distinct
+        size: Target length, 0 for a short "echo <name>"
+
+    Returns:
+        Command content
+    """
+    if size <= 0:
+        return f"echo {name}"
+    parts = [name]
+    length = len(name)
+    while length < size:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)[:size].rstrip()
+
+
+def build_tree(node_count: int, fanout: int = 10, depth: Optional[int] = None, content_size: int = 0,
+               seed: int = 0) -> CommandNode:
+    """
+    Build a tree with node_count nodes
+
+    Every folder gets `fanout` children; the last level holds commands. With a
+    depth limit, the folders on the deepest folder level share all remaining
+    nodes as commands instead.
+
+    Args:
+        node_count: Total number of nodes to create (including root)
+        fanout: Children per folder
+        depth: Levels below the root (the deepest one holds commands), unlimited by default
+        content_size: Length of command contents, 0 for a short "echo <name>"
+        seed: Seed for the generated contents
+
+    Returns:
+        Root node
+    """
+    rng = random.Random(seed)
+    root = CommandNode(name="Root", node_type="folder", description="Root directory")
+    created = 1
+    level: List[CommandNode] = [root]
+    level_depth = 0
+    while created < node_count:
+        if depth is not None and level_depth + 1 >= depth:
+            # Deepest level: spread the remaining nodes over the folders as commands
+            remaining = node_count - created
+            for i, parent in enumerate(level):
+                count = remaining // len(level) + (1 if i < remaining % len(level) else 0)
+                parent.children = [
+                    CommandNode(
+                        name=f"{parent.name}/{j}",
+                        node_type="command",
+                        content=make_content(rng, f"{parent.name}/{j}", content_size),
+                        description=f"Node {created + j}",
+                        parent_id=parent.id,
+                    )
+                    for j in range(count)
+                ]
+                created += count
+            return root
+
+        next_level = []
+        for parent in level:
+            children = []
+            for i in range(fanout):
+                if created >= node_count:
+                    break
+                child = CommandNode(
+                    name=f"{parent.name}/{i}",
+                    node_type="folder",
+                    description=f"Node {created}",
+                    parent_id=parent.id,
+                )
+                children.append(child)
+                created += 1
+            parent.children = children
+            next_level.extend(children)
+            if created >= node_count:
+                break
+        level = next_level
+        level_depth += 1
+
+    # Turn the leaves into commands
+    for leaf in level:
+        if not leaf.children:
+            leaf.node_type = "command"
+            leaf.content = make_content(rng, leaf.name, content_size)
+    return root
+
+
+def make_data_manager(root: CommandNode) -> DataManager:
+    """
+    Create a DataManager on a scratch file and install the given tree
+
+    Args:
+        root: Root node of the tree to manage
+
+    Returns:
+        Data manager holding the tree
+    """
+    fd, path = tempfile.mkstemp(prefix="commandnote-bench-", suffix=".json")
+    os.close(fd)
+    os.remove(path)
+    manager = DataManager(path)
+    manager.set_root(root)
+    return manager
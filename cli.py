@@ -0,0 +1,359 @@
+"""
+CommandNote command line: find, print, list and add commands without opening the window
+
+Usage:
+    python cli.py search KEYWORD [--in FOLDER] [--limit 50] [--format tsv|json|ids] [--fuzzy]
+    python cli.py get NODE [--json]
+    python cli.py ls [FOLDER] [--recursive] [--format tsv|json|ids]
+    python cli.py add FOLDER NAME [CONTENT] [--description TEXT]
+
+NODE and FOLDER are node IDs or slash-separated paths below the root folder
+("Docker/Build"). CONTENT is read from standard input when omitted or "-".
+
+Output is one node per line: tsv prints the ID, the path (folders end with "/")
+and the content with tabs and newlines escaped; json prints one JSON object per
+line; ids prints the IDs only. get prints the raw content of a command, e.g.:
+
+    python cli.py search docker | fzf --delimiter '\\t' --with-nth 2,3 | cut -f1 | xargs python cli.py get
+
+search, get and ls read a SQLite copy of the JSON data ("<data file>.index.sqlite3"),
+which is rebuilt only when the data files change, so they do not load the whole
+tree. add loads and saves the data like the application, then refreshes the copy;
+when a CommandNote server runs for the data file (server.py, or the window with
+COMMANDNOTE_RPC=1), add goes through it instead, so the change is not lost to its
+next save and shows up in the window right away.
+The storage settings are the application's (COMMANDNOTE_STORAGE, COMMANDNOTE_JOURNAL).
+search, get and ls only read: without data they fail rather than create it.
+Exits with status 1 when nothing matched and 2 on errors.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+# Only what every lookup needs is imported here; the rest (the controller, the
+# importer, the server client, other backends) on use, to keep lookups fast
+from models import DataManager, QueryIndex
+
+if TYPE_CHECKING:
+    from models import CommandNode
+    from views.rpc_client import RpcClient
+
+# Searches stop at this many results unless --limit says otherwise (0: no limit)
+DEFAULT_SEARCH_LIMIT = 50
+
+
+def _storage_options() -> Dict[str, Any]:
+    """DataManager options from the environment, minus those meant for the long-running app"""
+    from config import data_manager_options
+    options = data_manager_options()
+    options.pop('write_behind', None)
+    options.pop('save_delay', None)
+    options.pop('watch', None)
+    options.pop('watch_interval', None)
+    return options
+
+
+def source_files(data_file: str, options: Dict[str, Any]) -> List[str]:
+    """
+    Files the JSON or sharded data is read from, which the query index is checked against
+
+    Args:
+        data_file: JSON data file path
+        options: DataManager options
+    """
+    if options.get('storage') == 'sharded':
+        from models.sharded_storage import ShardedStorage, shard_directory
+        return ShardedStorage(shard_directory(data_file)).files()
+    from models import JsonStorage
+    # Journal files are replayed on load even with journaling off, so they always count
+    return JsonStorage(data_file, journal=True).files()
+
+
+def open_reader(data_file: str) -> DataManager:
+    """
+    Open the data for lookups
+
+    JSON (and sharded) data is read through its query index; the SQLite
+    backend is already indexed and lazily loaded, so it is opened directly.
+    Nothing is created when there is no data yet.
+
+    Args:
+        data_file: JSON data file path
+
+    Returns:
+        Data manager over the data (not meant for changes)
+
+    Raises:
+        ValueError: There is no data
+    """
+    options = _storage_options()
+    if options.get('storage') == 'sqlite':
+        stored = [os.path.splitext(data_file)[0] + ".sqlite3", data_file]
+    else:
+        sources = source_files(data_file, options)
+        stored = sources + [data_file]
+    if not any(map(os.path.exists, stored)):
+        raise ValueError(f"No data at {data_file} (add a command first)")
+    if options.get('storage') == 'sqlite':
+        return DataManager(data_file, **options)
+
+    def load_root() -> 'CommandNode':
+        if options.get('storage') != 'sharded' and os.path.exists(data_file) and \
+                not any(map(os.path.exists, sources[1:])):
+            # Plain snapshot: parse it without building the in-memory search index
+            from models.json_stream import load_tree
+            with open(data_file, 'r', encoding='utf-8') as f:
+                root, _ = load_tree(f)
+            if root is not None:
+                return root
+        manager = DataManager(data_file, **options)
+        manager.load_subtree(manager.get_root())
+        manager.close()
+        return manager.get_root()
+
+    storage = QueryIndex(data_file, sources).open_storage(load_root)
+    return DataManager(data_file, storage=storage)
+
+
+def resolve(manager: DataManager, reference: str) -> Optional['CommandNode']:
+    """
+    Find a node by ID, or by its slash-separated path below the root folder
+
+    Args:
+        manager: Data manager
+        reference: Node ID or path
+
+    Returns:
+        Found node, or None
+    """
+    node = manager.find_node_by_id(reference)
+    if node is not None:
+        return node
+    node = manager.get_root()
+    for name in (part for part in reference.split('/') if part):
+        manager.load_children(node)
+        node = next((child for child in node.children if child.name == name), None)
+        if node is None:
+            return None
+    return node
+
+
+def node_path(manager: DataManager, node: 'CommandNode') -> str:
+    """Slash-separated path of a node below the root folder (folders end with "/")"""
+    if node is manager.get_root():
+        return '/'
+    path = node.get_path('/')
+    return path + '/' if node.is_folder() else path
+
+
+def resolve_remote(client: 'RpcClient', reference: str) -> Optional[str]:
+    """
+    Find a node through a running server, by ID or by path (see resolve)
+
+    Args:
+        client: Connection to the server
+        reference: Node ID or path
+
+    Returns:
+        ID of the found node, or None
+    """
+    node = client.call('get_node', reference)
+    if node is not None:
+        return node['id']
+    node_id = client.call('get_tree')['id']
+    for name in (part for part in reference.split('/') if part):
+        node_id = next((child['id'] for child in client.call('get_children', node_id) if child['name'] == name), None)
+        if node_id is None:
+            return None
+    return node_id
+
+
+def _escape(text: str) -> str:
+    """Keep a field on one tab-separated line"""
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def write_nodes(manager: DataManager, nodes: Iterator['CommandNode'], output_format: str) -> int:
+    """
+    Print nodes one per line
+
+    Args:
+        manager: Data manager the nodes belong to
+        nodes: Nodes to print
+        output_format: "tsv", "json" or "ids"
+
+    Returns:
+        Number of nodes printed
+    """
+    count = 0
+    for node in nodes:
+        if output_format == 'ids':
+            line = node.id
+        elif output_format == 'json':
+            line = json.dumps(dict(node.to_summary(), content=node.content, description=node.description,
+                                   path=node_path(manager, node)), ensure_ascii=False)
+        else:
+            line = f"{node.id}\t{_escape(node_path(manager, node))}\t{_escape(node.content)}"
+        sys.stdout.write(line + '\n')
+        count += 1
+    return count
+
+
+def iter_subtree(manager: DataManager, folder: 'CommandNode') -> Iterator['CommandNode']:
+    """Nodes below a folder in tree order (the folder excluded)"""
+    stack = [folder]
+    while stack:
+        node = stack.pop()
+        if node is not folder:
+            yield node
+        if node.is_folder():
+            manager.load_children(node)
+            stack.extend(reversed(node.children))
+
+
+# ========== Commands ==========
+
+def cmd_search(args: argparse.Namespace) -> int:
+    manager = open_reader(args.data_file)
+    try:
+        scope = None
+        if args.folder is not None:
+            folder = resolve(manager, args.folder)
+            if folder is None or not folder.is_folder():
+                raise ValueError(f"Folder does not exist: {args.folder}")
+            scope = folder.id
+        if args.fuzzy:
+            ids = [node_id for node_id, _, _ in manager.fuzzy_search(args.keyword, args.limit or None, scope=scope)]
+        else:
+            ids = manager.search(args.keyword, args.limit or None, scope)
+        nodes = (node for node in map(manager.find_node_by_id, ids) if node is not None)
+        return 0 if write_nodes(manager, nodes, args.format) else 1
+    finally:
+        manager.close()
+
+
+def cmd_get(args: argparse.Namespace) -> int:
+    manager = open_reader(args.data_file)
+    try:
+        node = resolve(manager, args.node)
+        if node is None:
+            raise ValueError(f"Node does not exist: {args.node}")
+        if args.json:
+            from controllers import CommandController
+            detail = dict(CommandController(manager).get_node_by_id(node.id), path=node_path(manager, node))
+            sys.stdout.write(json.dumps(detail, ensure_ascii=False, indent=2) + '\n')
+        elif node.is_folder():
+            raise ValueError(f"{args.node} is a folder, list it with ls")
+        else:
+            sys.stdout.write(node.content if node.content.endswith('\n') else node.content + '\n')
+        return 0
+    finally:
+        manager.close()
+
+
+def cmd_ls(args: argparse.Namespace) -> int:
+    manager = open_reader(args.data_file)
+    try:
+        folder = resolve(manager, args.folder) if args.folder else manager.get_root()
+        if folder is None or not folder.is_folder():
+            raise ValueError(f"Folder does not exist: {args.folder}")
+        if args.recursive:
+            nodes = iter_subtree(manager, folder)
+        else:
+            manager.load_children(folder)
+            nodes = iter(folder.children)
+        return 0 if write_nodes(manager, nodes, args.format) else 1
+    finally:
+        manager.close()
+
+
+def cmd_add(args: argparse.Namespace) -> int:
+    from controllers import CommandController
+    from views.rpc_client import RpcClient, RpcError
+    content = sys.stdin.read() if args.content in (None, '-') else args.content
+    try:
+        client = RpcClient.for_data_file(args.data_file)
+        if client is not None:
+            with client:
+                folder_id = resolve_remote(client, args.folder)
+                if folder_id is None:
+                    raise ValueError(f"Folder does not exist: {args.folder}")
+                result = client.call('create_command', folder_id, args.name, content.rstrip('\n'), args.description)
+            sys.stdout.write(result['data']['id'] + '\n')
+            return 0
+    except RpcError as e:
+        raise ValueError(str(e)) from e
+    options = _storage_options()
+    manager = DataManager(args.data_file, **options)
+    controller = CommandController(manager)
+    try:
+        folder = resolve(manager, args.folder)
+        if folder is None:
+            raise ValueError(f"Folder does not exist: {args.folder}")
+        data = controller.create_command(folder.id, args.name, content.rstrip('\n'), args.description)
+    finally:
+        manager.close()
+    if options.get('storage') not in ('sqlite', 'sharded'):
+        # The tree is loaded already: refresh the index now rather than at the next lookup
+        QueryIndex(args.data_file, source_files(args.data_file, options)).rebuild(manager.get_root())
+    sys.stdout.write(data['id'] + '\n')
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(prog="commandnote", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-file", default=None, help="JSON data file (default: data/commands.json)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    formats = ['tsv', 'json', 'ids']
+
+    search_parser = commands.add_parser('search', help="search commands by name, description or content")
+    search_parser.add_argument("keyword")
+    search_parser.add_argument("--in", dest='folder', help="only search this folder (ID or path)")
+    search_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="0 for all matches")
+    search_parser.add_argument("--format", choices=formats, default='tsv')
+    search_parser.add_argument("--fuzzy", action='store_true',
+                               help="typo-tolerant matching (characters in order, misspelled name words)")
+    search_parser.set_defaults(handler=cmd_search)
+
+    get_parser = commands.add_parser('get', help="print the content of a command")
+    get_parser.add_argument("node", help="node ID or path")
+    get_parser.add_argument("--json", action='store_true', help="print all fields as JSON")
+    get_parser.set_defaults(handler=cmd_get)
+
+    ls_parser = commands.add_parser('ls', help="list a folder")
+    ls_parser.add_argument("folder", nargs='?', help="folder ID or path (default: the root folder)")
+    ls_parser.add_argument("--recursive", "-r", action='store_true')
+    ls_parser.add_argument("--format", choices=formats, default='tsv')
+    ls_parser.set_defaults(handler=cmd_ls)
+
+    add_parser = commands.add_parser('add', help="add a command to a folder")
+    add_parser.add_argument("folder", help="folder ID or path")
+    add_parser.add_argument("name")
+    add_parser.add_argument("content", nargs='?', help="command content (default: standard input)")
+    add_parser.add_argument("--description", default="")
+    add_parser.set_defaults(handler=cmd_add)
+
+    args = parser.parse_args(argv)
+    if args.data_file is None:
+        from models.paths import default_data_dir, default_data_file
+        if args.handler is cmd_add:
+            default_data_dir().mkdir(exist_ok=True)
+        args.data_file = default_data_file()
+    try:
+        return args.handler(args)
+    except ValueError as e:
+        sys.stderr.write(f"commandnote: {e}\n")
+        return 2
+    except BrokenPipeError:
+        # Reader went away (| head): silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,9 @@
 
 import os
 import sys
+import time
 import warnings
+from models.paths import default_data_dir
 
 def suppress_pywebview_warnings():
     """Suppress pywebview warnings and error messages"""
@@ -20,3 +22,85 @@ def optimize_startup():
     
     # Suppress unnecessary warnings
     suppress_pywebview_warnings()
+
+def data_manager_options():
+    """Get DataManager keyword options from environment variables"""
+    options = {}
+    if os.environ.get('COMMANDNOTE_STORAGE'):
+        options['storage'] = os.environ['COMMANDNOTE_STORAGE']
+    if os.environ.get('COMMANDNOTE_JOURNAL', '').lower() in ('1', 'true', 'yes'):
+        options['journal'] = True
+        if os.environ.get('COMMANDNOTE_JOURNAL_MAX_RECORDS'):
+            options['journal_max_records'] = int(os.environ['COMMANDNOTE_JOURNAL_MAX_RECORDS'])
+        if os.environ.get('COMMANDNOTE_JOURNAL_MAX_BYTES'):
+            options['journal_max_bytes'] = int(os.environ['COMMANDNOTE_JOURNAL_MAX_BYTES'])
+    if os.environ.get('COMMANDNOTE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes'):
+        options['write_behind'] = True
+        if os.environ.get('COMMANDNOTE_SAVE_DELAY'):
+            options['save_delay'] = float(os.environ['COMMANDNOTE_SAVE_DELAY'])
+    # Off by default: polling adds a stat call per second and a hash of the data file after each save
+    if os.environ.get('COMMANDNOTE_WATCH', '').lower() in ('1', 'true', 'yes'):
+        options['watch'] = True
+        if os.environ.get('COMMANDNOTE_WATCH_INTERVAL'):
+            options['watch_interval'] = float(os.environ['COMMANDNOTE_WATCH_INTERVAL'])
+    return options
+
+def controller_options():
+    """Get CommandController keyword options from environment variables"""
+    options = {}
+    if os.environ.get('COMMANDNOTE_UNDO_LIMIT'):
+        options['history_size'] = int(os.environ['COMMANDNOTE_UNDO_LIMIT'])
+    return options
+
+def metrics_options():
+    """Get Metrics keyword options from environment variables (None when metrics are off)"""
+    if os.environ.get('COMMANDNOTE_METRICS', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    return {'log_file': os.environ.get('COMMANDNOTE_METRICS_LOG') or str(default_data_dir() / "metrics.log")}
+
+def rpc_options():
+    """Get RpcServer options from environment variables (None when the server is off)"""
+    if os.environ.get('COMMANDNOTE_RPC', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    return {'address': os.environ.get('COMMANDNOTE_RPC_ADDRESS') or None}
+
+def process_start_time():
+    """
+    Get when this process started (epoch seconds), before the interpreter and the
+    frozen bundle were loaded; None where it cannot be read
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/stat', 'rb') as f:
+                # Fields after the command name, which may contain spaces; starttime is field 22
+                fields = f.read().rsplit(b')', 1)[1].split()
+            with open('/proc/stat', 'rb') as f:
+                boot_time = next(int(line.split()[1]) for line in f if line.startswith(b'btime'))
+            return boot_time + int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            creation, exit_time, kernel, user = (wintypes.FILETIME() for _ in range(4))
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation),
+                                            ctypes.byref(exit_time), ctypes.byref(kernel), ctypes.byref(user)):
+                return None
+            ticks = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+            # FILETIME counts 100 ns intervals since 1601-01-01
+            return (ticks - 116444736000000000) / 1e7
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return None
+    return None
+
+def startup_options(launched_at=None):
+    """
+    Get WebViewApp startup timing options from environment variables
+
+    Args:
+        launched_at: Time main.py started, used when the process start time cannot be read
+    """
+    return {
+        'started_at': process_start_time() or launched_at or time.time(),
+        'log_file': os.environ.get('COMMANDNOTE_STARTUP_LOG') or None,
+        'exit_after_startup': os.environ.get('COMMANDNOTE_EXIT_AFTER_STARTUP', '').lower() in ('1', 'true', 'yes'),
+    }
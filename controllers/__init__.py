@@ -1,5 +1,6 @@
 """Controllers package for CommandNote application."""
 
 from .command_controller import CommandController
+from .command_importer import CommandImporter, FolderRule, ImportedCommand
 
-__all__ = ['CommandController']
+__all__ = ['CommandController', 'CommandImporter', 'FolderRule', 'ImportedCommand']
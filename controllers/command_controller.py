@@ -1,19 +1,93 @@
 """Command Controller - Business logic controller"""
 
-from typing import List, Dict, Any, Optional
+import functools
+import threading
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from models import CommandNode, DataManager
-from datetime import datetime
+from .command_importer import CommandImporter, ContentHashes
+from .undo_history import DEFAULT_HISTORY_SIZE, UndoHistory
+
+
+def _with_tree_lock(method):
+    """Run a controller method while holding the data manager's tree lock (exclusive)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.data_manager.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _with_read_lock(method):
+    """Run a controller method while holding the data manager's read lock (shared with other readers)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.data_manager.read_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _undoable(method):
+    """Record the changes a controller method makes as one undo step (call under the tree lock)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._inverse_log is not None or self.history is None:
+            # Part of an enclosing step (a batch), or no history kept
+            return method(self, *args, **kwargs)
+        self._inverse_log = []
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            step = self._inverse_log
+            self._inverse_log = None
+        self.history.record(step)
+        return result
+    return wrapper
+
+
+# Results per batch of iter_search_commands
+SEARCH_BATCH_SIZE = 50
+
+# Operations accepted by apply_batch: (required arguments, optional arguments)
+BATCH_OPERATIONS = {
+    'create_folder': (('parent_id', 'name'), ('description',)),
+    'create_command': (('parent_id', 'name', 'content'), ('description',)),
+    'update_node': (('node_id',), ('name', 'content', 'description')),
+    'move_node': (('node_id', 'new_parent_id'), ()),
+    'delete_node': (('node_id',), ()),
+    'duplicate_node': (('node_id',), ()),
+}
+# Arguments that may refer to the node returned by an earlier operation of the batch ("$0", "$1", ...)
+_NODE_REFERENCE_ARGS = ('parent_id', 'node_id', 'new_parent_id')
 
 
 class CommandController:
     """Command controller that handles all business logic"""
     
-    def __init__(self):
-        """Initialize controller"""
-        self.data_manager = DataManager()
+    def __init__(self, data_manager: Optional[DataManager] = None, history_size: int = DEFAULT_HISTORY_SIZE):
+        """
+        Initialize controller
+        
+        Args:
+            data_manager: Data manager to use, defaults to one on the default data file
+            history_size: Number of changes that can be undone, 0 to keep no history
+        """
+        self.data_manager = data_manager if data_manager is not None else DataManager()
+        # While a mutation or batch runs, it records the operations that undo it here
+        self._inverse_log: Optional[List[Tuple]] = None
+        self.history: Optional[UndoHistory] = None
+        if history_size > 0:
+            self.history = UndoHistory(history_size)
+            self.data_manager.index.listeners.append(self.history)
+        # Content hashes of the commands, built by the first import
+        self._content_hashes: Optional[ContentHashes] = None
+        self._content_hashes_lock = threading.Lock()
     
     # ========== Query Operations ==========
     
+    # Queries run under the read lock: in parallel with each other, never during a
+    # mutation, so they see a consistent tree and cannot cache a stale serialized form
+    
+    @_with_read_lock
     def get_tree_structure(self) -> Dict[str, Any]:
         """
         Get complete tree structure
@@ -22,63 +96,215 @@ class CommandController:
             Dictionary representation of tree structure
         """
         root = self.data_manager.get_root()
+        self.data_manager.load_subtree(root)
         return root.to_dict()
     
+    @_with_read_lock
+    def get_tree_summary(self, expanded_ids: Optional[List[str]] = None, page_size: int = 200) -> Dict[str, Any]:
+        """
+        Get the shallow tree used by the tree view
+        
+        Nodes carry id, name, node_type, parent_id and child_count only. Children are
+        included for the root and for expanded folders, at most page_size per folder;
+        the rest is fetched with get_children.
+        
+        Args:
+            expanded_ids: IDs of folders that are expanded in the tree view
+            page_size: Maximum number of children returned per folder
+        
+        Returns:
+            Summary of the root node, with the tree version it reflects
+        """
+        expanded = set(expanded_ids or ())
+        root = self.data_manager.get_root()
+        summary = root.to_summary()
+        summary['version'] = self.get_tree_version()
+        # Folders whose children still have to be filled in
+        stack = [(root, summary)]
+        while stack:
+            node, node_summary = stack.pop()
+            self.data_manager.load_children(node)
+            node_summary['children'] = []
+            for child in node.children[:page_size]:
+                child_summary = child.to_summary()
+                node_summary['children'].append(child_summary)
+                if child.id in expanded and child.is_folder():
+                    stack.append((child, child_summary))
+        return summary
+    
+    def get_tree_version(self) -> int:
+        """
+        Get the current tree version (bumped by every change)
+        
+        Returns:
+            Tree version number
+        """
+        return self.data_manager.change_log.version
+    
+    @_with_read_lock
+    def get_changes_since(self, version: int) -> Dict[str, Any]:
+        """
+        Get the changes made after a tree version
+        
+        Args:
+            version: Tree version the caller has seen
+        
+        Returns:
+            Change set with removed, inserted, moved and updated node summaries and the new
+            version, or {"reset": True} when the caller has to reload the tree
+        """
+        return self.data_manager.change_log.changes_since(version)
+    
+    def run_with_changes(self, method, *args, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Run a mutation and get the change set it made
+        
+        The version is read and the change set built under the same tree lock as
+        the mutation, so changes other writers (RPC clients, a merge of the data
+        file) make meanwhile are neither included nor missed.
+        
+        Args:
+            method: Controller mutation (one that runs under the tree lock)
+            *args, **kwargs: Its arguments
+        
+        Returns:
+            (result of method, change set since the version before it)
+        """
+        with self.data_manager.lock:
+            version = self.get_tree_version()
+            result = method(*args, **kwargs)
+            return result, self.data_manager.change_log.changes_since(version)
+    
+    @_with_read_lock
     def get_node_by_id(self, node_id: str) -> Optional[Dict[str, Any]]:
         """
-        Get node information by ID
+        Get node information by ID (without its subtree)
         
         Args:
             node_id: Node ID
         
         Returns:
-            Node information dictionary, or None
+            Node information dictionary with child_count, or None
         """
         node = self.data_manager.find_node_by_id(node_id)
         if node:
-            return node.to_dict()
+            return node.to_detail()
         return None
     
-    def get_children(self, node_id: str) -> List[Dict[str, Any]]:
+    @_with_read_lock
+    def get_children(self, node_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Get all child nodes of a specified node
+        Get a page of the child nodes of a specified node
         
         Args:
             node_id: Parent node ID
+            offset: Index of the first child to return
+            limit: Maximum number of children, defaults to all remaining
         
         Returns:
-            List of child nodes
+            List of child node summaries
         """
         node = self.data_manager.find_node_by_id(node_id)
         if node:
-            return [child.to_dict() for child in node.children]
+            self.data_manager.load_children(node)
+            end = None if limit is None else offset + limit
+            return [child.to_summary() for child in node.children[offset:end]]
         return []
     
-    def search_commands(self, keyword: str) -> List[Dict[str, Any]]:
+    @_with_read_lock
+    def search_commands(self, keyword: str, limit: Optional[int] = None, fuzzy: bool = False,
+                        cancel=None, scope: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Search commands
         
         Args:
             keyword: Search keyword
+            limit: Maximum number of results, defaults to all matches
+            fuzzy: Typo-tolerant matching (subsequences, a few edits in name words) instead of substrings
+            cancel: threading.Event that stops a fuzzy search with SearchCancelled when set
+            scope: ID of the folder to search in, defaults to the whole tree
         
         Returns:
-            List of matching commands
+            List of matching commands, best match first, each with a "match" entry: the field
+            matched ("name", "description" or "content") and the [start, end) offsets to highlight,
+            and a "path" entry: the names of its folders and its own, separated by " / "
         """
-        all_nodes = self.data_manager.get_all_nodes()
-        results = []
+        self._check_scope(scope)
+        return [result for batch in self._search_batches(keyword, limit, fuzzy, cancel, None, scope)
+                for result in batch]
+    
+    def iter_search_commands(self, keyword: str, limit: Optional[int] = None, fuzzy: bool = False, cancel=None,
+                             batch_size: int = SEARCH_BATCH_SIZE,
+                             scope: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Search commands, yielding the results in batches as they are found (see search_commands)
         
-        keyword_lower = keyword.lower()
-        for node in all_nodes:
-            if node.is_command():
-                if (keyword_lower in node.name.lower() or 
-                    keyword_lower in node.content.lower() or 
-                    keyword_lower in node.description.lower()):
-                    results.append(node.to_dict())
+        Fuzzy results come tier by tier, so the best matches arrive before the
+        weaker ones are searched. The read lock is held until the iterator is
+        exhausted or closed, so handle each batch quickly.
         
-        return results
+        Args:
+            keyword: Search keyword
+            limit: Maximum number of results, defaults to all matches
+            fuzzy: Typo-tolerant matching instead of substrings
+            cancel: threading.Event that stops a fuzzy search with SearchCancelled when set
+            batch_size: Maximum number of results per batch
+            scope: ID of the folder to search in, defaults to the whole tree
+        
+        Returns:
+            Iterator over lists of matching commands, best match first across all lists
+        """
+        with self.data_manager.read_lock:
+            self._check_scope(scope)
+            yield from self._search_batches(keyword, limit, fuzzy, cancel, batch_size, scope)
+    
+    def _check_scope(self, scope: Optional[str]) -> None:
+        """Check that a search scope is an existing folder (call under the read lock)"""
+        if scope is None:
+            return
+        folder = self.data_manager.find_node_by_id(scope)
+        if not folder:
+            raise ValueError(f"Folder does not exist: {scope}")
+        if not folder.is_folder():
+            raise ValueError("Can only search within folders")
+    
+    def _search_batches(self, keyword: str, limit: Optional[int], fuzzy: bool, cancel,
+                        batch_size: Optional[int], scope: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Search results as node dictionaries with their match, in batches of at most batch_size (any if None)"""
+        if fuzzy:
+            batches = self.data_manager.iter_fuzzy_search(keyword, limit, cancel, scope)
+        else:
+            batches = iter([[(node_id, None, None) for node_id in self.data_manager.search(keyword, limit, scope)]])
+        for matches in batches:
+            step = batch_size or len(matches) or 1
+            for start in range(0, len(matches), step):
+                results = []
+                for node_id, field, ranges in matches[start:start + step]:
+                    node = self.data_manager.find_node_by_id(node_id)
+                    if node:
+                        if field is None:
+                            field, ranges = self._substring_match(node, keyword)
+                        # to_dict() is shared: extend a copy
+                        results.append(dict(node.to_dict(), match={'field': field,
+                                                                   'offsets': [list(r) for r in ranges]},
+                                            path=node.get_path()))
+                if results:
+                    yield results
+    
+    @staticmethod
+    def _substring_match(node: CommandNode, keyword: str) -> Tuple[str, List[Tuple[int, int]]]:
+        """Field and range of the first occurrence of keyword in a node"""
+        keyword = keyword.lower()
+        for field in ('name', 'description', 'content'):
+            start = getattr(node, field).lower().find(keyword)
+            if start >= 0:
+                return field, [(start, start + len(keyword))]
+        return 'name', []
     
     # ========== Create Operations ==========
     
+    @_with_tree_lock
+    @_undoable
     def create_folder(self, parent_id: str, name: str, description: str = "") -> Dict[str, Any]:
         """
         Create folder
@@ -104,11 +330,16 @@ class CommandController:
             description=description
         )
         
+        self.data_manager.load_children(parent)
+        self._record_inverse('restore', parent.id, {'updated_at': parent.updated_at})
         parent.add_child(new_folder)
+        self._record_inverse('remove', new_folder.id)
         self.data_manager.save_data()
         
         return new_folder.to_dict()
     
+    @_with_tree_lock
+    @_undoable
     def create_command(self, parent_id: str, name: str, content: str, description: str = "") -> Dict[str, Any]:
         """
         Create command
@@ -136,13 +367,18 @@ class CommandController:
             description=description
         )
         
+        self.data_manager.load_children(parent)
+        self._record_inverse('restore', parent.id, {'updated_at': parent.updated_at})
         parent.add_child(new_command)
+        self._record_inverse('remove', new_command.id)
         self.data_manager.save_data()
         
         return new_command.to_dict()
     
     # ========== Update Operations ==========
     
+    @_with_tree_lock
+    @_undoable
     def update_node(self, node_id: str, name: str = None, content: str = None, description: str = None) -> Dict[str, Any]:
         """
         Update node information
@@ -160,6 +396,13 @@ class CommandController:
         if not node:
             raise ValueError(f"Node does not exist: {node_id}")
         
+        self._record_inverse('restore', node.id, {
+            'name': node.name,
+            'content': node.content,
+            'description': node.description,
+            'updated_at': node.updated_at,
+        })
+        
         if name is not None:
             node.name = name
         
@@ -169,13 +412,16 @@ class CommandController:
         if description is not None:
             node.description = description
         
-        node.updated_at = datetime.now().isoformat()
+        node.touch()
+        self.data_manager.mark_updated(node)
         self.data_manager.save_data()
         
         return node.to_dict()
     
     # ========== Delete Operations ==========
     
+    @_with_tree_lock
+    @_undoable
     def delete_node(self, node_id: str) -> bool:
         """
         Delete node
@@ -192,17 +438,23 @@ class CommandController:
             raise ValueError("Cannot delete root node")
         
         # Find node's parent and delete
-        all_nodes = self.data_manager.get_all_nodes()
-        for node in all_nodes:
-            if node.is_folder():
-                if node.remove_child(node_id):
-                    self.data_manager.save_data()
-                    return True
+        parent = self.data_manager.get_parent(node_id)
+        node = self.data_manager.find_node_by_id(node_id)
+        if parent and node and self._inverse_log is not None:
+            # The node object is kept for the undo, so it needs its whole subtree
+            self.data_manager.load_subtree(node)
+            self._record_inverse('restore', parent.id, {'updated_at': parent.updated_at})
+            self._record_inverse('insert', parent.id, parent.children.index(node), node)
+        if parent and parent.remove_child(node_id):
+            self.data_manager.save_data()
+            return True
         
         return False
     
     # ========== Move Operations ==========
     
+    @_with_tree_lock
+    @_undoable
     def move_node(self, node_id: str, new_parent_id: str) -> Dict[str, Any]:
         """
         Move node to new parent node
@@ -225,10 +477,18 @@ class CommandController:
             raise ValueError("Target node must be a folder")
         if node.id == new_parent.id:
             raise ValueError("Cannot move to itself")
+        if self.data_manager.index.is_ancestor(node.id, new_parent.id):
+            raise ValueError("Cannot move a folder into its own subfolder")
         
-        # Delete from original parent node
-        if not self.delete_node(node_id):
+        # Detach from original parent node
+        old_parent = self.data_manager.get_parent(node_id)
+        if not old_parent or node not in old_parent.children:
             raise ValueError("Unable to delete node from original location")
+        self.data_manager.load_children(new_parent)
+        self._record_inverse('restore', old_parent.id, {'updated_at': old_parent.updated_at})
+        self._record_inverse('restore', new_parent.id, {'updated_at': new_parent.updated_at})
+        self._record_inverse('move', node.id, old_parent.id, old_parent.children.index(node))
+        old_parent.detach_child(node_id)
         
         # Add to new parent node
         new_parent.add_child(node)
@@ -238,6 +498,8 @@ class CommandController:
     
     # ========== Duplicate Operations ==========
     
+    @_with_tree_lock
+    @_undoable
     def duplicate_node(self, node_id: str) -> Dict[str, Any]:
         """
         Duplicate a node (creates a copy in the same parent)
@@ -253,15 +515,10 @@ class CommandController:
             raise ValueError(f"Node does not exist: {node_id}")
         
         # Find parent node
-        parent = None
-        all_nodes = self.data_manager.get_all_nodes()
-        for n in all_nodes:
-            if n.is_folder() and any(child.id == node_id for child in n.children):
-                parent = n
-                break
-        
+        parent = self.data_manager.get_parent(node_id)
         if not parent:
             raise ValueError("Cannot find parent node")
+        self.data_manager.load_subtree(node)
         
         # Create duplicate with modified name
         duplicate_name = f"{node.name} (Copy)"
@@ -272,7 +529,7 @@ class CommandController:
                 node_type="folder",
                 description=node.description
             )
-            # Recursively copy children
+            # Copy children with their subtrees
             for child in node.children:
                 self._duplicate_child(child, new_node)
         else:
@@ -283,33 +540,323 @@ class CommandController:
                 description=node.description
             )
         
+        self._record_inverse('restore', parent.id, {'updated_at': parent.updated_at})
         parent.add_child(new_node)
+        self._record_inverse('remove', new_node.id)
         self.data_manager.save_data()
         
         return new_node.to_dict()
     
     def _duplicate_child(self, child: CommandNode, parent: CommandNode) -> None:
         """
-        Helper method to recursively duplicate child nodes
+        Helper method to duplicate a child node with its whole subtree
+        (iteratively, so deep folders do not hit the recursion limit)
         
         Args:
             child: Child node to duplicate
             parent: Parent node to add to
         """
-        if child.is_folder():
-            new_child = CommandNode(
-                name=child.name,
-                node_type="folder",
-                description=child.description
-            )
-            for grandchild in child.children:
-                self._duplicate_child(grandchild, new_child)
-        else:
-            new_child = CommandNode(
-                name=child.name,
-                node_type="command",
-                content=child.content,
-                description=child.description
-            )
+        stack = [(child, parent)]
+        while stack:
+            source, target = stack.pop()
+            if source.is_folder():
+                new_child = CommandNode(
+                    name=source.name,
+                    node_type="folder",
+                    description=source.description
+                )
+                stack.extend((grandchild, new_child) for grandchild in reversed(source.children))
+            else:
+                new_child = CommandNode(
+                    name=source.name,
+                    node_type="command",
+                    content=source.content,
+                    description=source.description
+                )
+            
+            target.add_child(new_child)
+    
+    # ========== Import Operations ==========
+    
+    def import_file(self, path: str, parent_id: Optional[str] = None, file_format: Optional[str] = None,
+                    folder_name: Optional[str] = None, progress=None) -> Dict[str, Any]:
+        """
+        Import a shell history (bash, zsh) or snippet file (JSON, YAML) into a new folder
+        
+        Commands already in the tree are skipped, the rest is grouped into folders
+        by program and added with a single save. See CommandImporter.
+        
+        Args:
+            path: File path
+            parent_id: Folder to create the import folder in, defaults to the root
+            file_format: "bash", "zsh", "json" or "yaml", detected when omitted
+            folder_name: Name of the import folder, defaults to the file name
+            progress: Called with the import counters while importing
         
-        parent.add_child(new_child)
+        Returns:
+            Import counters and the summary of the created folder
+        """
+        return self.import_file_with_changes(path, parent_id, file_format, folder_name, progress)[0]
+    
+    def import_file_with_changes(self, path: str, parent_id: Optional[str] = None, file_format: Optional[str] = None,
+                                 folder_name: Optional[str] = None,
+                                 progress=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Import a file like import_file, and get the change set of the import
+        
+        The file is read without the tree lock, so run_with_changes does not
+        fit: the change set is built under the lock that inserts the new folder.
+        
+        Returns:
+            (import counters and folder summary, change set)
+        """
+        if parent_id is None:
+            parent_id = self.data_manager.get_root().id
+        importer = CommandImporter(self, progress=progress)
+        result = importer.import_file(path, parent_id, file_format, folder_name)
+        changes = importer.changes
+        if changes is None:
+            # Nothing was new: no change
+            with self.data_manager.read_lock:
+                changes = self.data_manager.change_log.changes_since(self.get_tree_version())
+        if result['folder'] is not None and self.history is not None:
+            with self.data_manager.lock:
+                self.history.record(importer.inverse)
+        return result, changes
+    
+    def content_hashes(self) -> ContentHashes:
+        """
+        Content hashes of the commands in the tree, for duplicate checks
+        (call under the read lock)
+        
+        The first call loads the whole tree and hashes it; the hashes then
+        follow the tree's changes, until the tree is replaced.
+        """
+        hashes = self._content_hashes
+        if hashes is None or hashes.stale:
+            with self._content_hashes_lock:
+                hashes = self._content_hashes
+                if hashes is None or hashes.stale:
+                    root = self.data_manager.get_root()
+                    self.data_manager.load_subtree(root)
+                    if hashes is None:
+                        hashes = ContentHashes()
+                        # Callers hold the read lock, so no change slips in before it listens
+                        self.data_manager.index.listeners.append(hashes)
+                    hashes.rebuild(root)
+                    self._content_hashes = hashes
+        return hashes
+    
+    # ========== Batch Operations ==========
+    
+    @_with_tree_lock
+    @_undoable
+    def apply_batch(self, ops: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Apply several operations as one change
+        
+        Each operation is a dictionary with an "op" key naming a mutation method
+        (see BATCH_OPERATIONS) and that method's arguments. An ID argument can be
+        "$<n>" to refer to the node returned by operation n of the same batch.
+        All operations are validated before any is applied; if one of them fails,
+        the ones already applied are undone. The result is saved once.
+        
+        Args:
+            ops: Operations to apply, in order
+        
+        Returns:
+            Result of every operation, in order
+        """
+        self._validate_batch(ops)
+        results: List[Any] = []
+        with self.data_manager.batch():
+            outer_log = self._inverse_log
+            self._inverse_log = []
+            try:
+                for i, op in enumerate(ops):
+                    try:
+                        results.append(self._apply_operation(op, results))
+                    except ValueError as e:
+                        raise ValueError(f"Operation {i} ({op['op']}) failed: {e}") from e
+            except Exception:
+                for inverse in reversed(self._inverse_log):
+                    self._apply_inverse(inverse)
+                raise
+            finally:
+                inverse_log = self._inverse_log
+                self._inverse_log = outer_log
+            if outer_log is not None:
+                outer_log.extend(inverse_log)
+        return results
+    
+    def _validate_batch(self, ops: List[Dict[str, Any]]) -> None:
+        """
+        Check the shape of batch operations without applying them
+        
+        Args:
+            ops: Operations to check
+        """
+        if not isinstance(ops, list):
+            raise ValueError("Batch must be a list of operations")
+        for i, op in enumerate(ops):
+            if not isinstance(op, dict) or op.get('op') not in BATCH_OPERATIONS:
+                raise ValueError(f"Operation {i}: unknown operation {op.get('op') if isinstance(op, dict) else op!r}")
+            required, optional = BATCH_OPERATIONS[op['op']]
+            args = set(op) - {'op'}
+            missing = [name for name in required if name not in args]
+            if missing:
+                raise ValueError(f"Operation {i} ({op['op']}): missing {', '.join(missing)}")
+            unknown = args - set(required) - set(optional)
+            if unknown:
+                raise ValueError(f"Operation {i} ({op['op']}): unknown {', '.join(sorted(unknown))}")
+            for name in args:
+                value = op[name]
+                if value is None and name in optional:
+                    continue
+                if not isinstance(value, str):
+                    raise ValueError(f"Operation {i} ({op['op']}): {name} must be a string")
+                if name in _NODE_REFERENCE_ARGS and value.startswith('$'):
+                    ref = value[1:]
+                    if not ref.isdigit() or int(ref) >= i or ops[int(ref)]['op'] == 'delete_node':
+                        raise ValueError(f"Operation {i} ({op['op']}): {name} {value} does not refer to "
+                                         f"a node created or changed by an earlier operation")
+    
+    def _apply_operation(self, op: Dict[str, Any], results: List[Any]) -> Any:
+        """
+        Apply one validated batch operation
+        
+        Args:
+            op: Operation to apply
+            results: Results of the earlier operations, for "$<n>" references
+        
+        Returns:
+            Result of the mutation method
+        """
+        args = {name: value for name, value in op.items() if name != 'op'}
+        for name in _NODE_REFERENCE_ARGS:
+            value = args.get(name)
+            if isinstance(value, str) and value.startswith('$'):
+                args[name] = results[int(value[1:])]['id']
+        result = getattr(self, op['op'])(**args)
+        if result is False:
+            raise ValueError(f"Node does not exist: {args['node_id']}")
+        return result
+    
+    # ========== Undo Operations ==========
+    
+    @_with_tree_lock
+    def undo(self) -> bool:
+        """
+        Undo the latest change (a mutation, batch or import) that is not undone yet
+        
+        Returns:
+            Whether there was a change to undo
+        """
+        step = self.history.pop_undo() if self.history is not None else None
+        if step is None:
+            return False
+        self.history.push_redo(self._apply_step(step))
+        return True
+    
+    @_with_tree_lock
+    def redo(self) -> bool:
+        """
+        Redo the latest undone change, unless a new change was made since
+        
+        Returns:
+            Whether there was a change to redo
+        """
+        step = self.history.pop_redo() if self.history is not None else None
+        if step is None:
+            return False
+        self.history.push_undo(self._apply_step(step))
+        return True
+    
+    @_with_read_lock
+    def get_history(self) -> Dict[str, int]:
+        """
+        Get how many changes can be undone and redone
+        
+        Returns:
+            Dictionary with "undo" and "redo" step counts
+        """
+        if self.history is None:
+            return {'undo': 0, 'redo': 0}
+        return self.history.state()
+    
+    def _apply_step(self, step: List[Tuple]) -> List[Tuple]:
+        """
+        Apply the inverse operations of an undo or redo step, last first, saving once
+        
+        If one of them fails, the tree no longer matches the history: the ones
+        applied are reverted and the history is cleared.
+        
+        Args:
+            step: Inverse operations in the order they were recorded
+        
+        Returns:
+            The step that reverts this one
+        """
+        reverse: List[Tuple] = []
+        with self.data_manager.batch():
+            try:
+                for inverse in reversed(step):
+                    reverse.append(self._apply_inverse(inverse))
+            except Exception as e:
+                for inverse in reversed(reverse):
+                    self._apply_inverse(inverse)
+                self.history.clear()
+                raise ValueError(f"Unable to undo or redo the change: {e}") from e
+        return reverse
+    
+    def _record_inverse(self, *inverse: Any) -> None:
+        """Record the operation that undoes a change, while a mutation or batch is running"""
+        if self._inverse_log is not None:
+            self._inverse_log.append(inverse)
+    
+    def _apply_inverse(self, inverse: Tuple) -> Tuple:
+        """
+        Undo one recorded change
+        
+        Args:
+            inverse: ('remove', node_id), ('insert', parent_id, index, node),
+                ('move', node_id, parent_id, index) or ('restore', node_id, fields)
+        
+        Returns:
+            The inverse of the operation applied, which redoes the change
+        """
+        kind = inverse[0]
+        if kind == 'remove':
+            node_id = inverse[1]
+            parent = self.data_manager.get_parent(node_id)
+            node = self.data_manager.find_node_by_id(node_id)
+            # The removed node is kept for the redo, so it needs its whole subtree
+            self.data_manager.load_subtree(node)
+            reverse = ('insert', parent.id, parent.children.index(node), node)
+            parent.remove_child(node_id)
+        elif kind == 'insert':
+            _, parent_id, index, node = inverse
+            parent = self.data_manager.find_node_by_id(parent_id)
+            self.data_manager.load_children(parent)
+            parent.add_child(node, index)
+            reverse = ('remove', node.id)
+        elif kind == 'move':
+            _, node_id, parent_id, index = inverse
+            node = self.data_manager.find_node_by_id(node_id)
+            old_parent = self.data_manager.get_parent(node_id)
+            new_parent = self.data_manager.find_node_by_id(parent_id)
+            self.data_manager.load_children(new_parent)
+            reverse = ('move', node_id, old_parent.id, old_parent.children.index(node))
+            old_parent.detach_child(node_id)
+            new_parent.add_child(node, index)
+        elif kind == 'restore':
+            _, node_id, fields = inverse
+            node = self.data_manager.find_node_by_id(node_id)
+            reverse = ('restore', node_id, {name: getattr(node, name) for name in fields})
+            for name, value in fields.items():
+                setattr(node, name, value)
+            self.data_manager.mark_updated(node)
+        else:
+            raise ValueError(f"Unknown inverse operation: {kind}")
+        self.data_manager.save_data()
+        return reverse
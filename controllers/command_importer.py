@@ -0,0 +1,527 @@
+"""Command Importer - Streaming import of shell history and snippet files"""
+
+import codecs
+import hashlib
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from models import CommandNode, TreeListener
+from models.json_stream import iter_array
+
+
+class ImportedCommand(NamedTuple):
+    """One command read from an import source"""
+    content: str
+    name: str = ""
+    description: str = ""
+    # Folder path below the import folder ("a/b"); empty to group by the folder rules
+    folder: str = ""
+
+
+class FolderRule(NamedTuple):
+    """Put commands whose normalized content matches pattern into folder (may use \\1 groups)"""
+    pattern: str
+    folder: str
+
+
+# Group commands by the program they run, skipping sudo, env and variable assignments
+DEFAULT_FOLDER_RULES = [
+    FolderRule(r'^(?:sudo\s+(?:-\S+\s+)*|env\s+|[A-Za-z_]\w*=\S*\s+)*([\w.+-]+)', r'\1'),
+]
+FALLBACK_FOLDER = "Other"
+# Longest command name derived from its content
+NAME_LENGTH = 60
+
+_ZSH_EXTENDED = re.compile(r'^: \d+:\d+;')
+_BASH_TIMESTAMP = re.compile(r'^#\d+$')
+# zsh escapes bytes it uses internally as 0x83 followed by the byte xor 32
+_ZSH_META = 0x83
+
+
+def normalize_command(content: str) -> str:
+    """
+    Normalize command content for duplicate detection
+    
+    Line continuations are joined and whitespace runs collapsed, so the same
+    command typed with different spacing is recognized.
+    
+    Args:
+        content: Command content
+    
+    Returns:
+        Normalized content
+    """
+    return " ".join(content.replace("\\\n", " ").split())
+
+
+def content_hash(content: str) -> bytes:
+    """
+    Hash of the normalized command content
+    
+    Args:
+        content: Command content
+    
+    Returns:
+        16-byte digest
+    """
+    return _digest(normalize_command(content))
+
+
+def _digest(normalized: str) -> bytes:
+    """Hash of already normalized content"""
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
+# ========== Readers ==========
+
+class _ProgressFile:
+    """Binary file wrapper that counts the bytes read, for progress reporting"""
+    
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.bytes_read = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.bytes_read += len(data)
+        return data
+    
+    def __iter__(self) -> Iterator[bytes]:
+        for line in self.f:
+            self.bytes_read += len(line)
+            yield line
+
+
+class _TextReader:
+    """Text view (read(size) only) over a binary file, decoded incrementally"""
+    
+    def __init__(self, f: _ProgressFile):
+        self.f = f
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    
+    def read(self, size: int = -1) -> str:
+        while True:
+            data = self.f.read(size)
+            text = self.decoder.decode(data, final=not data)
+            # A chunk that ends inside a multi-byte character decodes to nothing yet
+            if text or not data:
+                return text
+
+
+def _decode_lines(f: _ProgressFile) -> Iterator[str]:
+    """Lines of a binary file as text, without the line break"""
+    for raw in f:
+        yield raw.decode('utf-8', errors='replace').rstrip('\r\n')
+
+
+def _unmetafy(raw: bytes) -> bytes:
+    """Undo zsh's history file escaping of non-ASCII bytes"""
+    if _ZSH_META not in raw:
+        return raw
+    out = bytearray()
+    meta = False
+    for byte in raw:
+        if meta:
+            out.append(byte ^ 32)
+            meta = False
+        elif byte == _ZSH_META:
+            meta = True
+        else:
+            out.append(byte)
+    return bytes(out)
+
+
+def read_bash_history(f: _ProgressFile) -> Iterator[ImportedCommand]:
+    """
+    Read a bash history file (one command per line, optional "#<time>" lines)
+    
+    Args:
+        f: History file opened in binary mode
+    
+    Returns:
+        Iterator over the commands
+    """
+    for line in _decode_lines(f):
+        if line.strip() and not _BASH_TIMESTAMP.match(line):
+            yield ImportedCommand(content=line.strip())
+
+
+def read_zsh_history(f: _ProgressFile) -> Iterator[ImportedCommand]:
+    """
+    Read a zsh history file, plain or in the extended ": <time>:<duration>;<command>"
+    format. Multi-line commands are stored with a backslash before each line break.
+    
+    Args:
+        f: History file opened in binary mode
+    
+    Returns:
+        Iterator over the commands
+    """
+    pending: List[str] = []
+    for raw in f:
+        line = _unmetafy(raw).decode('utf-8', errors='replace').rstrip('\r\n')
+        if not pending:
+            line = _ZSH_EXTENDED.sub('', line, count=1)
+        if line.endswith('\\'):
+            pending.append(line[:-1])
+            continue
+        pending.append(line)
+        content = "\n".join(pending).strip()
+        pending = []
+        if content:
+            yield ImportedCommand(content=content)
+    if pending and "\n".join(pending).strip():
+        yield ImportedCommand(content="\n".join(pending).strip())
+
+
+def _snippet(item: Any) -> Optional[ImportedCommand]:
+    """
+    Command from one snippet entry: a string, or a mapping with content (or
+    command/cmd), name (or title), description and folder (or category, or the
+    first of tags)
+    """
+    if isinstance(item, str):
+        return ImportedCommand(content=item.strip()) if item.strip() else None
+    if not isinstance(item, dict):
+        return None
+    content = item.get('content') or item.get('command') or item.get('cmd')
+    if not isinstance(content, str) or not content.strip():
+        return None
+    folder = item.get('folder') or item.get('category')
+    tags = item.get('tags')
+    if not folder and isinstance(tags, list) and tags:
+        folder = tags[0]
+    return ImportedCommand(
+        content=content.strip(),
+        name=str(item.get('name') or item.get('title') or ""),
+        description=str(item.get('description') or ""),
+        folder=str(folder or "")
+    )
+
+
+def read_json_snippets(f: _ProgressFile) -> Iterator[ImportedCommand]:
+    """
+    Read a JSON snippet collection: a top-level array of snippet entries
+    
+    Args:
+        f: Snippet file opened in binary mode
+    
+    Returns:
+        Iterator over the commands
+    """
+    for item in iter_array(_TextReader(f)):
+        command = _snippet(item)
+        if command:
+            yield command
+
+
+def read_yaml_snippets(f: _ProgressFile) -> Iterator[ImportedCommand]:
+    """
+    Read a YAML snippet collection: a top-level sequence of snippet entries.
+    Each entry is parsed on its own, so only one is held in memory at a time.
+    
+    Args:
+        f: Snippet file opened in binary mode
+    
+    Returns:
+        Iterator over the commands
+    """
+    try:
+        # Imported on use: it is optional, and only YAML snippet files need it
+        import yaml
+    except ImportError:
+        raise ValueError("Importing YAML needs PyYAML (pip install pyyaml, or commandnote[yaml])") from None
+    
+    def parse(lines: List[str]) -> Optional[ImportedCommand]:
+        return _snippet(yaml.safe_load("\n".join(lines))[0])
+    
+    entry: List[str] = []
+    for line in _decode_lines(f):
+        # A new entry starts with "-" in the first column
+        if line == '-' or line.startswith('- '):
+            if entry:
+                command = parse(entry)
+                if command:
+                    yield command
+            entry = [line]
+        elif entry and line != '...':
+            entry.append(line)
+    if entry:
+        command = parse(entry)
+        if command:
+            yield command
+
+
+READERS: Dict[str, Callable[[_ProgressFile], Iterator[ImportedCommand]]] = {
+    'bash': read_bash_history,
+    'zsh': read_zsh_history,
+    'json': read_json_snippets,
+    'yaml': read_yaml_snippets,
+}
+
+
+def detect_format(path: str) -> str:
+    """
+    Guess the format of an import file from its name and first line
+    
+    Args:
+        path: File path
+    
+    Returns:
+        One of the READERS keys
+    """
+    name = os.path.basename(path).lower()
+    if name.endswith('.json'):
+        return 'json'
+    if name.endswith(('.yaml', '.yml')):
+        return 'yaml'
+    if 'zsh' in name:
+        return 'zsh'
+    with open(path, 'rb') as f:
+        first_line = f.readline().decode('utf-8', errors='replace')
+    return 'zsh' if _ZSH_EXTENDED.match(first_line) else 'bash'
+
+
+# ========== Duplicate Detection ==========
+
+class ContentHashes(TreeListener):
+    """
+    Content hashes of the commands in a tree, kept up to date through tree
+    events so an import checks for duplicates without walking the tree.
+    
+    Lazy backends register nodes they load without events, so the hashes are
+    built from a fully loaded tree; a replaced tree marks them stale until
+    the owner rebuilds them (see CommandController.content_hashes).
+    """
+    
+    def __init__(self):
+        """Initialize empty hashes"""
+        # node_id -> hash, and hash -> number of commands with it
+        self._hashes: Dict[str, bytes] = {}
+        self._counts: Counter = Counter()
+        self.stale = False
+    
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._counts
+    
+    def rebuild(self, root: CommandNode) -> None:
+        """
+        Hash every command of a tree
+        
+        Args:
+            root: Root node of the (fully loaded) tree
+        """
+        self._hashes.clear()
+        self._counts.clear()
+        self.stale = False
+        self._add_subtree(root)
+    
+    def _add(self, node: CommandNode) -> None:
+        """Hash a command node"""
+        if node.is_command():
+            digest = content_hash(node.content)
+            self._hashes[node.id] = digest
+            self._counts[digest] += 1
+    
+    def _remove(self, node_id: str) -> None:
+        """Forget the hash of a node, if it had one"""
+        digest = self._hashes.pop(node_id, None)
+        if digest is not None:
+            self._counts[digest] -= 1
+            if not self._counts[digest]:
+                del self._counts[digest]
+    
+    def _add_subtree(self, node: CommandNode) -> None:
+        """Hash the commands of a subtree"""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self._add(current)
+            stack.extend(current.children)
+    
+    # ========== TreeListener ==========
+    
+    def tree_reset(self, root: CommandNode) -> None:
+        self.stale = True
+    
+    def node_added(self, node: CommandNode, parent: CommandNode) -> None:
+        self._add_subtree(node)
+    
+    def node_removed(self, node: CommandNode, parent: CommandNode) -> None:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self._remove(current.id)
+            stack.extend(current.children)
+    
+    def node_updated(self, node: CommandNode) -> None:
+        self._remove(node.id)
+        self._add(node)
+
+
+# ========== Importer ==========
+
+class CommandImporter:
+    """
+    Import pipeline: read commands lazily from a source, skip the ones whose
+    normalized content is already in the tree (or earlier in the source), group
+    the rest into folders by rule and add them as one new folder with a single save
+    """
+    
+    def __init__(self, controller, rules: Optional[List[FolderRule]] = None,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None, progress_interval: float = 0.25):
+        """
+        Initialize importer
+        
+        Args:
+            controller: CommandController owning the tree
+            rules: Folder rules, first match wins, defaults to grouping by program
+            progress: Called with the import counters while importing and once at the end
+            progress_interval: Minimum seconds between progress calls
+        """
+        self.controller = controller
+        self.rules = [(re.compile(rule.pattern), rule.folder)
+                      for rule in (DEFAULT_FOLDER_RULES if rules is None else rules)]
+        self.progress = progress
+        self.progress_interval = progress_interval
+        # Change set of the last import that added a folder (built under the tree lock that added it),
+        # and the operations that undo it (see CommandController._apply_inverse)
+        self.changes: Optional[Dict[str, Any]] = None
+        self.inverse: Optional[List[Tuple]] = None
+    
+    def import_file(self, path: str, parent_id: str, file_format: Optional[str] = None,
+                    folder_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Import a shell history or snippet file
+        
+        Args:
+            path: File path
+            parent_id: Folder to create the import folder in
+            file_format: "bash", "zsh", "json" or "yaml", detected when omitted
+            folder_name: Name of the import folder, defaults to the file name
+        
+        Returns:
+            Import counters and the summary of the created folder (None when nothing was new)
+        """
+        file_format = file_format or detect_format(path)
+        if file_format not in READERS:
+            raise ValueError(f"Unknown import format: {file_format}")
+        with open(path, 'rb') as raw:
+            f = _ProgressFile(raw)
+            return self.import_commands(
+                READERS[file_format](f), parent_id, folder_name or os.path.basename(path),
+                total_bytes=os.fstat(raw.fileno()).st_size, bytes_read=lambda: f.bytes_read
+            )
+    
+    def import_commands(self, commands: Iterable[ImportedCommand], parent_id: str, folder_name: str,
+                        total_bytes: Optional[int] = None,
+                        bytes_read: Optional[Callable[[], int]] = None) -> Dict[str, Any]:
+        """
+        Import commands into a new folder
+        
+        The new folder is built outside the tree and added to it at the end in
+        one change, so indexes, storage and the UI see a single insertion.
+        
+        Args:
+            commands: Commands to import (consumed once)
+            parent_id: Folder to create the import folder in
+            folder_name: Name of the import folder
+            total_bytes: Size of the source, for progress reporting
+            bytes_read: Returns how much of the source was read so far
+        
+        Returns:
+            Import counters and the summary of the created folder (None when nothing was new)
+        """
+        data_manager = self.controller.data_manager
+        with data_manager.read_lock:
+            parent = data_manager.find_node_by_id(parent_id)
+            if not parent:
+                raise ValueError(f"Parent node does not exist: {parent_id}")
+            if not parent.is_folder():
+                raise ValueError("Can only import into folders")
+            existing = self.controller.content_hashes()
+        
+        import_folder = CommandNode(name=folder_name, node_type="folder")
+        folders: Dict[str, CommandNode] = {}
+        counters = {'read': 0, 'imported': 0, 'duplicates': 0, 'bytes_read': 0, 'total_bytes': total_bytes}
+        last_report = time.monotonic()
+        # Hashes of the commands read so far (the tree's are in existing)
+        seen = set()
+        for command in commands:
+            counters['read'] += 1
+            normalized = normalize_command(command.content)
+            digest = _digest(normalized)
+            if digest in seen or digest in existing:
+                counters['duplicates'] += 1
+            else:
+                seen.add(digest)
+                folder = self._folder(import_folder, folders, command.folder or self._group(normalized))
+                folder.add_child(CommandNode(
+                    name=command.name or self._name(command.content),
+                    node_type="command",
+                    content=command.content,
+                    description=command.description
+                ))
+                counters['imported'] += 1
+            if self.progress and time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                counters['bytes_read'] = bytes_read() if bytes_read else 0
+                self.progress(dict(counters, done=False))
+        
+        counters['bytes_read'] = bytes_read() if bytes_read else 0
+        folder_summary = None
+        if counters['imported']:
+            with data_manager.batch():
+                parent = data_manager.find_node_by_id(parent_id)
+                if not parent:
+                    raise ValueError(f"Parent node was deleted during the import: {parent_id}")
+                data_manager.load_children(parent)
+                version = data_manager.change_log.version
+                self.inverse = [('restore', parent.id, {'updated_at': parent.updated_at}), ('remove', import_folder.id)]
+                parent.add_child(import_folder)
+                self.changes = data_manager.change_log.changes_since(version)
+                data_manager.save_data()
+            folder_summary = import_folder.to_summary()
+        if self.progress:
+            self.progress(dict(counters, done=True))
+        return dict(counters, folder=folder_summary)
+    
+    def _group(self, normalized: str) -> str:
+        """Folder path for a command (normalized content) from the first matching rule"""
+        for pattern, folder in self.rules:
+            match = pattern.match(normalized)
+            if match:
+                return match.expand(folder)
+        return FALLBACK_FOLDER
+    
+    @staticmethod
+    def _folder(import_folder: CommandNode, folders: Dict[str, CommandNode], path: str) -> CommandNode:
+        """Get (creating as needed) the folder for a "/"-separated path below the import folder"""
+        folder = folders.get(path)
+        if folder is not None:
+            return folder
+        folder = import_folder
+        prefix = ""
+        for part in (part.strip() for part in path.split('/')):
+            if not part:
+                continue
+            prefix = f"{prefix}/{part}"
+            child = folders.get(prefix)
+            if child is None:
+                child = CommandNode(name=part, node_type="folder")
+                folder.add_child(child)
+                folders[prefix] = child
+            folder = child
+        folders[path] = folder
+        return folder
+    
+    @staticmethod
+    def _name(content: str) -> str:
+        """Command name derived from its first line"""
+        first_line = content.split('\n', 1)[0].strip()
+        if len(first_line) > NAME_LENGTH:
+            return first_line[:NAME_LENGTH - 1] + "…"
+        return first_line
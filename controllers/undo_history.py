@@ -0,0 +1,78 @@
+"""Undo History - Bounded undo/redo stacks of inverse operations"""
+
+from collections import deque
+from typing import Deque, List, Optional, Tuple, TYPE_CHECKING
+
+from models import TreeListener
+
+if TYPE_CHECKING:
+    from models import CommandNode
+
+# Steps kept for undo by default
+DEFAULT_HISTORY_SIZE = 100
+
+
+class UndoHistory(TreeListener):
+    """
+    Undo and redo stacks for CommandController.
+
+    A step is the list of inverse operations recorded by one mutation or
+    batch (see CommandController._apply_inverse), in the order they were
+    recorded; applying them in reverse undoes the step. Applying a step yields
+    the inverse of each operation, which is the step that redoes it, so both
+    stacks hold the same kind of entries.
+
+    An operation names nodes by ID and, for deletions, keeps a reference to
+    the removed subtree rather than a copy, so a step costs memory in
+    proportion to the number of nodes it changed directly, not to the size of
+    the tree. Only the newest max_steps steps are kept. The stacks are
+    cleared when the whole tree is replaced, since the IDs they refer to may
+    no longer exist.
+    """
+
+    def __init__(self, max_steps: int = DEFAULT_HISTORY_SIZE):
+        """
+        Initialize empty history
+
+        Args:
+            max_steps: Number of steps kept for undo (and redo)
+        """
+        self.max_steps = max_steps
+        self._undo: Deque[List[Tuple]] = deque(maxlen=max_steps)
+        self._redo: Deque[List[Tuple]] = deque(maxlen=max_steps)
+
+    def record(self, step: List[Tuple]) -> None:
+        """Add the step of a new change, which makes the undone steps unreachable"""
+        if step:
+            self._undo.append(step)
+            self._redo.clear()
+
+    def pop_undo(self) -> Optional[List[Tuple]]:
+        """Take the newest step to undo, None if there is none"""
+        return self._undo.pop() if self._undo else None
+
+    def pop_redo(self) -> Optional[List[Tuple]]:
+        """Take the newest undone step, None if there is none"""
+        return self._redo.pop() if self._redo else None
+
+    def push_undo(self, step: List[Tuple]) -> None:
+        """Add a redone step back for undo"""
+        self._undo.append(step)
+
+    def push_redo(self, step: List[Tuple]) -> None:
+        """Add an undone step for redo"""
+        self._redo.append(step)
+
+    def clear(self) -> None:
+        """Forget every step"""
+        self._undo.clear()
+        self._redo.clear()
+
+    def state(self) -> dict:
+        """Number of steps that can be undone and redone"""
+        return {'undo': len(self._undo), 'redo': len(self._redo)}
+
+    # ========== TreeListener ==========
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        self.clear()
@@ -3,8 +3,14 @@ CommandNote - Command Note Tool
 Desktop application built with MVC architecture using PyWebView
 """
 
+import time
+
+# Fallback start time for the startup timings, taken before the heavier imports
+LAUNCHED_AT = time.time()
+
 from views import WebViewApp
-from config import optimize_startup
+from config import (optimize_startup, data_manager_options, controller_options, metrics_options, startup_options,
+                    rpc_options)
 
 
 def main():
@@ -12,7 +18,8 @@ def main():
     # Optimize startup and suppress warnings
     optimize_startup()
     
-    app = WebViewApp()
+    app = WebViewApp(data_manager_options(), metrics_options(), startup_options(LAUNCHED_AT), rpc_options(),
+                     controller_options())
     app.run()
 
 
@@ -1,6 +1,36 @@
 """Models package for CommandNote application."""
 
+from .change_log import ChangeLog
 from .command_node import CommandNode
 from .data_manager import DataManager
+from .node_index import NodeIndex, TreeListener
+from .paths import default_data_dir, default_data_file
+from .rwlock import ReadWriteLock
+from .search_index import SearchIndex, SearchCancelled
+from .storage import Storage, JsonStorage
 
-__all__ = ['CommandNode', 'DataManager']
+__all__ = ['ChangeLog', 'CommandNode', 'DataManager', 'default_data_dir', 'default_data_file', 'Metrics',
+           'NodeIndex', 'TreeListener', 'SearchIndex', 'SearchCancelled', 'Storage', 'JsonStorage', 'SqliteStorage',
+           'ShardedStorage', 'QueryIndex', 'ReadWriteLock']
+
+
+def __getattr__(name):
+    # Optional modules (sqlite3, metrics) are imported on first use. The import
+    # statements are spelled out, not computed, so that PyInstaller's import
+    # analysis still finds these modules.
+    if name == 'Metrics':
+        from .metrics import Metrics as value
+    elif name == 'QueryIndex':
+        from .query_index import QueryIndex as value
+    elif name == 'ShardedStorage':
+        from .sharded_storage import ShardedStorage as value
+    elif name == 'SqliteStorage':
+        from .sqlite_storage import SqliteStorage as value
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
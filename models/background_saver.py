@@ -0,0 +1,116 @@
+"""Background Saver - Coalescing write-behind for DataManager"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class BackgroundSaver:
+    """
+    Coalesces save requests and runs them on a background thread.
+
+    mark_dirty() returns immediately; the save runs once no new change has
+    arrived for `delay` seconds, or at the latest `max_delay` seconds after the
+    first unsaved change, so a long drag-and-drop session still gets persisted.
+    """
+
+    def __init__(self, save: Callable[[], bool], delay: float = 0.5, max_delay: float = 5.0):
+        """
+        Initialize saver and start its thread
+
+        Args:
+            save: Function performing the actual save, returns success
+            delay: Debounce window in seconds
+            max_delay: Upper bound on how long a change may stay unsaved
+        """
+        self._save = save
+        self.delay = delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._dirty_since: Optional[float] = None
+        self._last_change: Optional[float] = None
+        self._saving = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="commandnote-saver", daemon=True)
+        self._thread.start()
+
+    @property
+    def dirty(self) -> bool:
+        """Whether there are changes not yet handed to save"""
+        return self._dirty_since is not None
+
+    def mark_dirty(self) -> None:
+        """Schedule a save"""
+        with self._cond:
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_change = now
+            self._cond.notify_all()
+
+    def _take_dirty(self) -> bool:
+        """Clear the dirty flag and mark a save as running (caller holds the condition)"""
+        if self._dirty_since is None:
+            return False
+        self._dirty_since = None
+        self._last_change = None
+        self._saving = True
+        return True
+
+    def _finish_save(self, success: bool) -> None:
+        """Record the end of a save; a failed save is retried after the next window"""
+        with self._cond:
+            self._saving = False
+            if not success and self._dirty_since is None:
+                self._dirty_since = self._last_change = time.monotonic()
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        """Thread body"""
+        while True:
+            with self._cond:
+                while self._dirty_since is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Debounce: wait for a quiet period, bounded by max_delay
+                while self._dirty_since is not None and not self._closed:
+                    deadline = min(self._last_change + self.delay, self._dirty_since + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed or not self._take_dirty():
+                    continue
+            success = False
+            try:
+                success = self._save()
+            finally:
+                self._finish_save(success)
+
+    def flush(self) -> bool:
+        """
+        Save pending changes on the calling thread and wait for a running save
+
+        Returns:
+            Whether everything is on disk
+        """
+        with self._cond:
+            while self._saving:
+                self._cond.wait()
+            if not self._take_dirty():
+                return True
+        success = False
+        try:
+            success = self._save()
+        finally:
+            self._finish_save(success)
+        return success
+
+    def close(self) -> bool:
+        """Stop the background thread and flush what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        return self.flush()
@@ -0,0 +1,231 @@
+"""Blob Store - Content-addressed table of command bodies shared by several nodes"""
+
+import base64
+import hashlib
+import json
+from typing import Dict, List, Optional, Set, Union, TYPE_CHECKING
+
+from .node_index import TreeListener
+
+if TYPE_CHECKING:
+    from .command_node import CommandNode
+
+# Node fields stored in the table, and the key that replaces each in the data file
+BODY_FIELDS = {'content': 'content_blob', 'description': 'description_blob'}
+# Shorter bodies are always written inline: a reference would not be smaller
+BLOB_MIN_SIZE = 48
+# Holders of a shared body are kept in a list up to this many, then in a set
+_HOLDER_LIST_SIZE = 16
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def blob_digest(text: str) -> str:
+    """Key of a body in the table: 72-bit BLAKE2b of its UTF-8 form, in URL-safe base64 (12 characters)"""
+    return base64.urlsafe_b64encode(hashlib.blake2b(text.encode('utf-8'), digest_size=9).digest()).decode('ascii')
+
+
+class _Blob:
+    """A body held by more than one node"""
+
+    __slots__ = ('text', 'holders', '_digest')
+
+    def __init__(self, text: str, holders: List['CommandNode']):
+        self.text = text
+        self._digest: Optional[str] = None
+        # Most bodies are shared by a few nodes: a list is smaller than a set
+        self.holders: Union[List['CommandNode'], Set['CommandNode']] = holders
+
+    @property
+    def digest(self) -> str:
+        """Key of the body in the table, computed when first written"""
+        if self._digest is None:
+            self._digest = blob_digest(self.text)
+        return self._digest
+
+    def add(self, node: 'CommandNode') -> None:
+        """Add a holder"""
+        if type(self.holders) is list:
+            self.holders.append(node)
+            if len(self.holders) > _HOLDER_LIST_SIZE:
+                self.holders = set(self.holders)
+        else:
+            self.holders.add(node)
+
+    def remove(self, node: 'CommandNode') -> None:
+        """Remove a holder"""
+        if type(self.holders) is list:
+            self.holders.remove(node)
+        else:
+            self.holders.discard(node)
+
+
+class BlobStore(TreeListener):
+    """
+    Reference-counted table of the long bodies (content, description) of a tree.
+
+    Nodes holding equal bodies are given one shared string, and once a body is
+    held by two nodes it is written to the data file once, in the "blobs"
+    table at the top of the document, with the nodes referring to it by
+    digest:
+
+        {"blobs": {"<digest>": "<body>", ...}, "id": ..., "children": [
+            {"id": ..., "content_blob": "<digest>", ...}, ...]}
+
+    The cached JSON of those nodes only holds the digest, so duplicating a
+    folder adds little to memory or to the file. A body held by a single node
+    is written inline, which keeps files without duplicates as they were: a
+    body moves out of the table when all but one of its holders are deleted
+    or changed.
+
+    Holders follow the tree through the listener events; each node remembers
+    the bodies it was counted with, so an update releases the old ones.
+    A digest is computed once per shared body, when JSON is first encoded.
+    """
+
+    def __init__(self):
+        """Initialize empty store"""
+        # Bodies held by one node, and that node (its JSON is inline)
+        self._single: Dict[str, 'CommandNode'] = {}
+        # Bodies held by several nodes (their JSON refers to the table)
+        self._shared: Dict[str, _Blob] = {}
+        # Encoded table, until the set of shared bodies changes
+        self._table: Optional[bytes] = None
+
+    def __len__(self) -> int:
+        return len(self._shared)
+
+    def reference(self, text: str) -> Optional[str]:
+        """
+        Digest to write instead of a body, None to write it inline
+
+        Args:
+            text: Body of an indexed node
+        """
+        if len(text) < BLOB_MIN_SIZE:
+            return None
+        blob = self._shared.get(text)
+        return blob.digest if blob is not None else None
+
+    def encode_table(self) -> bytes:
+        """JSON object of the shared bodies by digest"""
+        if self._table is None:
+            self._table = _json_encoder.encode({blob.digest: text for text, blob in self._shared.items()}).encode('utf-8')
+        return self._table
+
+    def wrap_snapshot(self, payload: bytes) -> bytes:
+        """
+        Add the table to the JSON of the root node (written with this store)
+
+        Args:
+            payload: Output of root.to_json()
+
+        Returns:
+            Data file content
+        """
+        if not self._shared:
+            return payload
+        return b'{"blobs":' + self.encode_table() + b',\n' + payload[1:]
+
+    # ========== Counting ==========
+
+    def _acquire(self, text: str, node: 'CommandNode') -> str:
+        """Add a holder of a long body; returns the shared string it should keep"""
+        blob = self._shared.get(text)
+        if blob is not None:
+            blob.add(node)
+            return blob.text
+        holder = self._single.get(text)
+        if holder is None:
+            self._single[text] = node
+            return text
+        # Second holder: the first one's JSON changes to a reference
+        canonical = holder.content if holder.content == text else holder.description
+        del self._single[text]
+        self._shared[text] = _Blob(canonical, [holder, node])
+        self._table = None
+        holder.invalidate()
+        return canonical
+
+    def _release(self, text: str, node: 'CommandNode') -> None:
+        """Remove a holder of a long body"""
+        blob = self._shared.get(text)
+        if blob is None:
+            self._single.pop(text, None)
+            return
+        blob.remove(node)
+        if len(blob.holders) == 1:
+            # Last holder: its JSON changes back to inline
+            (holder,) = blob.holders
+            del self._shared[text]
+            self._single[text] = holder
+            self._table = None
+            holder.invalidate()
+
+    def _count(self, node: 'CommandNode') -> None:
+        """Count the long bodies of a node and have it hold the shared strings"""
+        content = node.content
+        description = node.description
+        long_content = len(content) >= BLOB_MIN_SIZE
+        # A node holds a body once, even as both fields
+        long_description = len(description) >= BLOB_MIN_SIZE and description != content
+        if long_content:
+            node.content = self._acquire(content, node)
+        if long_description:
+            node.description = self._acquire(description, node)
+        elif long_content and description == content:
+            node.description = node.content
+        # The counted bodies: one string in the usual case, no tuple
+        if long_content and long_description:
+            node._bodies = (node.content, node.description)
+        elif long_content or long_description:
+            node._bodies = node.content if long_content else node.description
+        else:
+            node._bodies = None
+
+    def _uncount(self, node: 'CommandNode') -> None:
+        """Release the bodies a node was counted with"""
+        bodies = node._bodies
+        if bodies is None:
+            return
+        node._bodies = None
+        if type(bodies) is tuple:
+            for text in bodies:
+                self._release(text, node)
+        else:
+            self._release(bodies, node)
+
+    # ========== TreeListener ==========
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        self._single.clear()
+        self._shared.clear()
+        self._table = None
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            # Serialized forms cached before may not match the new table
+            node._json_cache = node._dict_cache = node._subtree_json = None
+            node._bodies = None
+            self._count(node)
+            stack.extend(node.children)
+
+    def node_added(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self._count(current)
+            stack.extend(current.children)
+
+    def node_removed(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self._uncount(current)
+            # The subtree may come back (undo) when its bodies are no longer in the table
+            current._json_cache = current._subtree_json = None
+            stack.extend(current.children)
+
+    def node_updated(self, node: 'CommandNode') -> None:
+        self._uncount(node)
+        self._count(node)
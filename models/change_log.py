@@ -0,0 +1,134 @@
+"""Change Log - Versioned tree changes for incremental view updates"""
+
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple, TYPE_CHECKING
+
+from .node_index import NodeIndex, TreeListener
+
+if TYPE_CHECKING:
+    from .command_node import CommandNode
+
+
+# Event kinds recorded per node
+INSERTED = 'inserted'
+REMOVED = 'removed'
+MOVED = 'moved'
+UPDATED = 'updated'
+
+
+class ChangeLog(TreeListener):
+    """
+    Monotonically versioned record of tree changes.
+
+    Every event bumps the tree version. changes_since() coalesces the events
+    after a version into one change set per node, described by the node's
+    current state:
+
+        {
+            "since": 41, "version": 45,
+            "removed": [{"id": ..., "parent_id": ...}],
+            "inserted": [{summary..., "index": 3}],
+            "moved": [{summary..., "index": 0}],
+            "updated": [{summary...}]
+        }
+
+    A node inserted and removed again in the window does not appear at all.
+    When the requested version is older than the retained history (or the
+    whole tree was replaced since), the change set is {"reset": true}.
+    """
+
+    def __init__(self, index: NodeIndex, max_entries: int = 10000):
+        """
+        Initialize change log
+
+        Args:
+            index: Node index used to read the current state of changed nodes
+            max_entries: Number of events kept for changes_since()
+        """
+        self.index = index
+        self.version = 0
+        self._reset_version = 0
+        # (version, node_id, kind, parent_id)
+        self._entries: Deque[Tuple[int, str, str, Optional[str]]] = deque(maxlen=max_entries)
+
+    def _record(self, node_id: str, kind: str, parent_id: Optional[str] = None) -> None:
+        """Append one event"""
+        self.version += 1
+        self._entries.append((self.version, node_id, kind, parent_id))
+
+    # ========== TreeListener ==========
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        self.version += 1
+        self._reset_version = self.version
+        self._entries.clear()
+
+    def node_added(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        self._record(node.id, INSERTED, parent.id)
+        self._record(parent.id, UPDATED)
+
+    def node_removed(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        self._record(node.id, REMOVED, parent.id)
+        self._record(parent.id, UPDATED)
+
+    def node_moved(self, node: 'CommandNode', old_parent: 'CommandNode', new_parent: 'CommandNode') -> None:
+        self._record(node.id, MOVED, new_parent.id)
+        if old_parent is not None:
+            self._record(old_parent.id, UPDATED)
+        self._record(new_parent.id, UPDATED)
+
+    def node_updated(self, node: 'CommandNode') -> None:
+        self._record(node.id, UPDATED)
+
+    # ========== Queries ==========
+
+    def changes_since(self, version: int) -> Dict[str, Any]:
+        """
+        Get the coalesced change set after a version
+
+        Args:
+            version: Tree version the caller has seen
+
+        Returns:
+            Change set dictionary (see class docstring)
+        """
+        truncated = bool(self._entries) and self._entries[0][0] > version + 1
+        if version < self._reset_version or version > self.version or truncated:
+            return {'since': version, 'version': self.version, 'reset': True}
+
+        # node_id -> [first kind, last kind, parent when first removed]
+        touched: Dict[str, list] = {}
+        for entry_version, node_id, kind, parent_id in self._entries:
+            if entry_version <= version:
+                continue
+            state = touched.get(node_id)
+            if state is None:
+                touched[node_id] = [kind, kind, parent_id if kind == REMOVED else None]
+            else:
+                if kind == REMOVED and state[2] is None:
+                    state[2] = parent_id
+                state[1] = kind
+
+        changes = {'since': version, 'version': self.version,
+                   'removed': [], 'inserted': [], 'moved': [], 'updated': []}
+        for node_id, (first, last, removed_from) in touched.items():
+            node = self.index.get(node_id)
+            if node is None or last == REMOVED:
+                # Gone now; only report nodes the caller could have seen
+                if first != INSERTED:
+                    changes['removed'].append({'id': node_id, 'parent_id': removed_from})
+                continue
+            summary = node.to_summary()
+            if first == INSERTED:
+                changes['inserted'].append(self._with_position(node, summary))
+            elif first in (MOVED, REMOVED) or last == MOVED:
+                changes['moved'].append(self._with_position(node, summary))
+            else:
+                changes['updated'].append(summary)
+        return changes
+
+    def _with_position(self, node: 'CommandNode', summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the position of a node among its siblings to its summary"""
+        parent = self.index.get_parent(node.id)
+        summary['index'] = parent.children.index(node) if parent is not None else 0
+        return summary
@@ -1,26 +1,176 @@
 """Command Node Model - Tree structure node model"""
 
-from typing import List, Optional, Dict, Any
-from dataclasses import dataclass, field
-from datetime import datetime
+from typing import Iterable, List, Optional, Dict, Any, Sequence, Union, TYPE_CHECKING
+from datetime import datetime, timedelta
+import base64
+import json
+import sys
 import uuid
 
+from .blob_store import BODY_FIELDS
+
+if TYPE_CHECKING:
+    from .node_index import NodeIndex
+
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+_CHILDREN_KEY = b'"children":['
+# Subtrees encoding to less than this keep their whole JSON; larger ones are joined from pieces
+SUBTREE_JSON_CACHE_LIMIT = 64 * 1024
+
+# Timestamps are kept as integer microseconds since 1970-01-01 in naive local
+# time, which converts back to the exact isoformat() string they came from
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Shared empty children sequence of leaves (the list is created on first add)
+_NO_CHILDREN: Sequence['CommandNode'] = ()
+
+Timestamp = Union[int, str, None]
+
+
+def new_id() -> str:
+    """Generate a node ID: a random UUID in 22-character URL-safe base64"""
+    return base64.urlsafe_b64encode(uuid.uuid4().bytes)[:22].decode('ascii')
+
+
+def now_timestamp() -> int:
+    """Current local time in the internal timestamp format"""
+    return (datetime.now() - _EPOCH) // _MICROSECOND
+
+
+def parse_timestamp(value: Timestamp) -> Timestamp:
+    """
+    Convert an isoformat() string to the internal timestamp format
+
+    Strings that would not be reproduced exactly (time zones, other separators,
+    explicit zero microseconds) are kept as they are.
+    """
+    if not isinstance(value, str):
+        return value
+    length = len(value)
+    if length == 19 or (length == 26 and value[19] == '.' and value[20:] != '000000'):
+        if value[10] == 'T':
+            try:
+                moment = datetime.fromisoformat(value)
+            except ValueError:
+                return value
+            if moment.tzinfo is None:
+                return (moment - _EPOCH) // _MICROSECOND
+    return value
+
+
+def format_timestamp(value: Timestamp) -> Optional[str]:
+    """Convert an internal timestamp back to its isoformat() string"""
+    if type(value) is int:
+        return (_EPOCH + timedelta(microseconds=value)).isoformat()
+    return value
+
+
+def _resolve_blob(blobs: Optional[Dict[str, str]], digest: str) -> str:
+    """Body a data file refers to by digest"""
+    text = blobs.get(digest) if blobs is not None else None
+    if text is None:
+        raise ValueError(f"Unknown blob: {digest}")
+    return text
+
 
-@dataclass
 class CommandNode:
     """
     Command node class supporting tree structure.
     Can be either a folder or a command.
+    
+    Nodes use __slots__ and keep timestamps as integers (formatted only when
+    serialized), node types interned and leaves without a children list, so
+    large libraries stay small in memory.
     """
-    id: str = field(default_factory=lambda: str(uuid.uuid4()))
-    name: str = ""
-    node_type: str = "folder"  # "folder" or "command"
-    content: str = ""  # Command content (only used by command type)
-    description: str = ""  # Description
-    parent_id: Optional[str] = None
-    children: List['CommandNode'] = field(default_factory=list)
-    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
-    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    
+    # Keys of the dictionary format besides "children"
+    FIELDS = frozenset(('id', 'name', 'node_type', 'content', 'description', 'parent_id', 'created_at', 'updated_at'))
+    
+    __slots__ = ('id', 'name', 'node_type', 'content', 'description', 'parent_id', '_children',
+                 '_created', '_updated', '_index', '_loaded', '_child_count', '_dict_cache', '_json_cache', '_subtree_json',
+                 '_bodies')
+    
+    def __init__(self, id: Optional[str] = None, name: str = "", node_type: str = "folder",
+                 content: str = "", description: str = "", parent_id: Optional[str] = None,
+                 children: Optional[Iterable['CommandNode']] = None,
+                 created_at: Timestamp = None, updated_at: Timestamp = None):
+        """
+        Initialize node
+        
+        Args:
+            id: Node ID, a new one is generated by default
+            name: Name
+            node_type: "folder" or "command"
+            content: Command content (only used by command type)
+            description: Description
+            parent_id: Parent node ID
+            children: Child nodes
+            created_at: Creation time (isoformat string), defaults to now
+            updated_at: Last update time (isoformat string), defaults to created_at
+        """
+        self.id = id if id is not None else new_id()
+        self.name = name
+        self.node_type = sys.intern(node_type)
+        self.content = content
+        self.description = description
+        self.parent_id = parent_id
+        self._children: Optional[List['CommandNode']] = list(children) if children else None
+        created = parse_timestamp(created_at) if created_at is not None else now_timestamp()
+        updated = parse_timestamp(updated_at) if updated_at is not None else created
+        self._created = created
+        # New and never edited nodes share one timestamp object
+        self._updated = created if updated == created else updated
+        # Index of the tree this node belongs to (maintained by NodeIndex)
+        self._index: Optional['NodeIndex'] = None
+        # False while a lazy storage backend has not loaded the children yet
+        self._loaded = True
+        # Number of children reported by storage while they are not loaded
+        self._child_count = 0
+        # Memoized to_dict() result of the subtree, JSON fragment of this node and
+        # JSON of the whole subtree when it is small (only kept while indexed)
+        self._dict_cache: Optional[Dict[str, Any]] = None
+        self._json_cache: Optional[bytes] = None
+        self._subtree_json: Optional[bytes] = None
+        # Long content and/or description as counted by the tree's BlobStore
+        self._bodies: Union[str, tuple, None] = None
+    
+    def __repr__(self) -> str:
+        return (f"CommandNode(id={self.id!r}, name={self.name!r}, node_type={self.node_type!r}, "
+                f"children={len(self.children)})")
+    
+    @property
+    def children(self) -> Sequence['CommandNode']:
+        """Child nodes (an empty tuple for nodes without children; use add_child to add)"""
+        children = self._children
+        return children if children is not None else _NO_CHILDREN
+    
+    @children.setter
+    def children(self, children: Iterable['CommandNode']) -> None:
+        self._children = list(children) if children else None
+    
+    @property
+    def created_at(self) -> Optional[str]:
+        """Creation time as isoformat string"""
+        return format_timestamp(self._created)
+    
+    @created_at.setter
+    def created_at(self, value: Timestamp) -> None:
+        self._created = parse_timestamp(value)
+    
+    @property
+    def updated_at(self) -> Optional[str]:
+        """Last update time as isoformat string"""
+        return format_timestamp(self._updated)
+    
+    @updated_at.setter
+    def updated_at(self, value: Timestamp) -> None:
+        self._updated = parse_timestamp(value)
+    
+    def touch(self) -> None:
+        """Set the update time to now"""
+        self._updated = now_timestamp()
     
     def is_folder(self) -> bool:
         """Check if node is a folder"""
@@ -30,20 +180,68 @@ class CommandNode:
         """Check if node is a command"""
         return self.node_type == "command"
     
-    def add_child(self, child: 'CommandNode') -> None:
-        """Add child node"""
+    def child_count(self) -> int:
+        """Get number of children (also known before lazy children are loaded)"""
+        return len(self.children) if self._loaded else self._child_count
+    
+    def add_child(self, child: 'CommandNode', index: Optional[int] = None) -> None:
+        """
+        Add child node
+        
+        Args:
+            child: Node to add
+            index: Position among the children, defaults to the end
+        """
         child.parent_id = self.id
-        self.children.append(child)
-        self.updated_at = datetime.now().isoformat()
+        child._dict_cache = child._json_cache = child._subtree_json = None
+        if self._children is None:
+            self._children = []
+        if index is None:
+            self._children.append(child)
+        else:
+            self._children.insert(index, child)
+        self.touch()
+        self.invalidate()
+        if self._index is not None:
+            self._index.attach(self, child)
     
     def remove_child(self, child_id: str) -> bool:
         """Remove child node"""
+        child = self._pop_child(child_id)
+        if child is None:
+            return False
+        if self._index is not None:
+            self._index.discard(self, child)
+        return True
+    
+    def detach_child(self, child_id: str) -> Optional['CommandNode']:
+        """
+        Take a child node out without dropping it from the index.
+        Used by moves: the detached node is expected to be re-added elsewhere.
+        """
+        child = self._pop_child(child_id)
+        if child is not None and self._index is not None:
+            self._index.detach(self, child)
+        return child
+    
+    def _pop_child(self, child_id: str) -> Optional['CommandNode']:
+        """Pop child node from the children list"""
         for i, child in enumerate(self.children):
             if child.id == child_id:
-                self.children.pop(i)
-                self.updated_at = datetime.now().isoformat()
-                return True
-        return False
+                self._children.pop(i)
+                if not self._children:
+                    self._children = None
+                self.touch()
+                self.invalidate()
+                return child
+        return None
+    
+    def insert_position(self, child: 'CommandNode') -> Optional[int]:
+        """Position of a child, or None when it is the last one (appended)"""
+        children = self.children
+        if children and children[-1] is child:
+            return None
+        return children.index(child)
     
     def find_child_by_id(self, child_id: str) -> Optional['CommandNode']:
         """Find child node by ID"""
@@ -52,8 +250,143 @@ class CommandNode:
                 return child
         return None
     
+    def invalidate(self) -> None:
+        """
+        Drop the memoized serialized forms of this node, and the memoized
+        subtree forms of its ancestors (which contain this node).
+        Called for structural changes here and by NodeIndex.touch() for field changes.
+        """
+        self._json_cache = self._dict_cache = self._subtree_json = None
+        node = self._index.get_parent(self.id) if self._index is not None else None
+        # Subtree forms are built bottom-up: a node without them never has an
+        # ancestor with them, so the walk stops early. Leaves are encoded without
+        # a subtree form of their own, so the parent is always checked.
+        while node is not None and (node._dict_cache is not None or node._subtree_json is not None):
+            node._dict_cache = node._subtree_json = None
+            node = node._index.get_parent(node.id) if node._index is not None else None
+    
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary format"""
+        """
+        Convert to dictionary format
+        
+        The result is memoized per node and shared between calls: treat it as read-only.
+        """
+        if self._dict_cache is not None:
+            return self._dict_cache
+        # Pre-order list of the nodes without a cached dict; built in reverse, children first
+        order = []
+        stack: List['CommandNode'] = [self]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(child for child in node.children if child._dict_cache is None)
+        built: Dict[int, Dict[str, Any]] = {}
+        for node in reversed(order):
+            children = []
+            for child in node.children:
+                child_data = built.pop(id(child), None)
+                children.append(child_data if child_data is not None else child._dict_cache)
+            data = {
+                'id': node.id,
+                'name': node.name,
+                'node_type': node.node_type,
+                'content': node.content,
+                'description': node.description,
+                'parent_id': node.parent_id,
+                'children': children,
+                'created_at': node.created_at,
+                'updated_at': node.updated_at
+            }
+            if node._index is not None:
+                node._dict_cache = data
+            built[id(node)] = data
+        return built[id(self)]
+    
+    def _json_fragment(self) -> bytes:
+        """
+        Compact JSON of this node with an empty children list (memoized while indexed)
+        
+        Bodies in the blob table of the tree's index are written as references.
+        """
+        fragment = self._json_cache
+        if fragment is None:
+            fields = {
+                'id': self.id,
+                'name': self.name,
+                'node_type': self.node_type,
+                'content': self.content,
+                'description': self.description,
+                'parent_id': self.parent_id,
+                'children': [],
+                'created_at': self.created_at,
+                'updated_at': self.updated_at
+            }
+            if self._bodies is not None and self._index is not None and self._index.blobs is not None:
+                for name, key in BODY_FIELDS.items():
+                    digest = self._index.blobs.reference(fields[name])
+                    if digest is not None:
+                        del fields[name]
+                        fields[key] = digest
+            fragment = _json_encoder.encode(fields).encode('utf-8')
+            if self._index is not None:
+                self._json_cache = fragment
+        return fragment
+    
+    def to_json(self) -> bytes:
+        """
+        Convert to UTF-8 JSON, equivalent to json.dumps(self.to_dict())
+        
+        Each node starts a line and is otherwise compact, so a change to the
+        data file shows up in a line diff (git, sync tools) as the lines of the
+        nodes changed.
+        
+        In a tree with a blob store (JSON storage), bodies held by several nodes
+        are written as references instead: see BlobStore.wrap_snapshot.
+        
+        The encoding of every node is memoized, and small subtrees keep their
+        whole encoding, so re-encoding a tree only re-encodes the nodes changed
+        since the last call and joins the rest.
+        """
+        chunks: List[Any] = []
+        size = 0
+        # Nodes still to emit, raw chunks (separators and closing parts), or
+        # (node, first chunk, size before) markers closing a subtree
+        stack: List[Any] = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, tuple):
+                node, start, size_before = item
+                if size - size_before < SUBTREE_JSON_CACHE_LIMIT and node._index is not None:
+                    node._subtree_json = b''.join(chunks[start:])
+                    chunks[start:] = [node._subtree_json]
+                continue
+            if not isinstance(item, CommandNode):
+                chunks.append(item)
+                size += len(item)
+                continue
+            cached = item._subtree_json
+            if cached is None and not item.children:
+                cached = item._json_fragment()
+            if cached is not None:
+                chunks.append(cached)
+                size += len(cached)
+                continue
+            fragment = item._json_fragment()
+            # Strings in JSON never contain an unescaped quote, so the key is found exactly
+            split = fragment.index(_CHILDREN_KEY) + len(_CHILDREN_KEY)
+            view = memoryview(fragment)
+            children = item.children
+            stack.append((item, len(chunks), size))
+            stack.append(view[split:])
+            for i in range(len(children) - 1, -1, -1):
+                stack.append(children[i])
+                stack.append(b',\n' if i else b'\n')
+            chunks.append(view[:split])
+            size += split
+        return b''.join(chunks)
+    
+    def to_fields(self) -> Dict[str, Any]:
+        """Convert to dictionary format without the children key"""
         return {
             'id': self.id,
             'name': self.name,
@@ -61,20 +394,114 @@ class CommandNode:
             'content': self.content,
             'description': self.description,
             'parent_id': self.parent_id,
-            'children': [child.to_dict() for child in self.children],
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+    
+    def to_summary(self) -> Dict[str, Any]:
+        """Convert to the small form used by the tree view (no content, no children)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'node_type': self.node_type,
+            'parent_id': self.parent_id,
+            'child_count': self.child_count()
+        }
+    
+    def to_detail(self) -> Dict[str, Any]:
+        """Convert to dictionary format without the subtree (children are counted only)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'node_type': self.node_type,
+            'content': self.content,
+            'description': self.description,
+            'parent_id': self.parent_id,
+            'child_count': self.child_count(),
             'created_at': self.created_at,
             'updated_at': self.updated_at
         }
     
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'CommandNode':
-        """Create node from dictionary"""
-        children_data = data.pop('children', [])
-        node = cls(**data)
-        node.children = [cls.from_dict(child_data) for child_data in children_data]
+    def from_fields(cls, data: Dict[str, Any], children: Sequence['CommandNode'] = (),
+                    blobs: Optional[Dict[str, str]] = None) -> 'CommandNode':
+        """
+        Create one node from the fields of its dictionary format
+        
+        Args:
+            data: Node fields ("children" and unknown keys are ignored)
+            children: Already built child nodes
+            blobs: Blob table of the data file, for bodies written as references
+        
+        Returns:
+            Created node
+        """
+        content = data.get('content', "")
+        description = data.get('description', "")
+        if 'content_blob' in data:
+            content = _resolve_blob(blobs, data['content_blob'])
+        if 'description_blob' in data:
+            description = _resolve_blob(blobs, data['description_blob'])
+        node = cls(
+            id=data.get('id'),
+            name=data.get('name', ""),
+            node_type=data.get('node_type', "folder"),
+            content=content,
+            description=description,
+            parent_id=data.get('parent_id'),
+            created_at=data.get('created_at'),
+            updated_at=data.get('updated_at'),
+        )
+        if children:
+            for child in children:
+                # Share the parent's ID string instead of keeping a loaded copy per child
+                child.parent_id = node.id
+            node.children = children
         return node
     
-    def get_path(self) -> str:
-        """Get node path (for display)"""
-        # This method needs to traverse to root node, temporarily returning name
-        return self.name
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], blobs: Optional[Dict[str, str]] = None) -> 'CommandNode':
+        """
+        Create node from dictionary (iteratively, any depth; data is not modified)
+        
+        Args:
+            data: Dictionary format of the subtree
+            blobs: Blob table of the data file, for bodies written as references
+        
+        Returns:
+            Root of the created subtree
+        """
+        root = cls.from_fields(data, blobs=blobs)
+        stack = [(root, data)]
+        while stack:
+            node, node_data = stack.pop()
+            children_data = node_data.get('children')
+            if children_data:
+                children = [cls.from_fields(child_data, blobs=blobs) for child_data in children_data]
+                for child in children:
+                    child.parent_id = node.id
+                node.children = children
+                stack.extend(zip(children, children_data))
+        return root
+    
+    def get_path(self, separator: str = " / ") -> str:
+        """
+        Get node path (for display): the names from the top-level folder down
+        to this node, the root folder left out. Walks the parent map of the
+        index, O(depth), so it follows moves and renames; a node that is not
+        in a tree has its name only.
+        
+        Args:
+            separator: Text between the names
+        """
+        names = [self.name]
+        index = self._index
+        if index is not None:
+            parent = index.get_parent(self.id)
+            while parent is not None:
+                grandparent = index.get_parent(parent.id)
+                if grandparent is None:
+                    break
+                names.append(parent.name)
+                parent = grandparent
+        return separator.join(reversed(names))
@@ -1,59 +1,121 @@
 """Data Manager - Data persistence management"""
 
-import json
 import os
-import sys
-from typing import Optional, List
-from pathlib import Path
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Collection, Iterator, Optional, List, Tuple, Union, TYPE_CHECKING
+from .background_saver import BackgroundSaver
+from .change_log import ChangeLog
 from .command_node import CommandNode
+from .file_watcher import FileWatcher
+from .fileio import atomic_write_bytes
+from .paths import default_data_dir, default_data_file
+from .rwlock import ReadWriteLock
+from .node_index import NodeIndex
+from .search_index import SearchIndex, StorageSearchIndex
+from .storage import Storage, JsonStorage
+from .tree_labels import TreeLabels
+from .tree_merge import LocalEdits, merge_tree
+
+if TYPE_CHECKING:
+    from .metrics import Metrics
 
 
 class DataManager:
     """Data manager responsible for reading and saving data"""
     
-    def __init__(self, data_file: str = None):
+    def __init__(self, data_file: str = None, storage: Union[str, Storage] = "json", journal: bool = False,
+                 journal_max_records: int = 1000, journal_max_bytes: int = 1024 * 1024,
+                 write_behind: bool = False, save_delay: float = 0.5, watch: bool = False,
+                 watch_interval: float = 1.0, metrics: Optional['Metrics'] = None):
         """
         Initialize data manager
         
         Args:
             data_file: Data file path, defaults to data/commands.json next to executable or project directory
+            storage: Storage backend: "json", "sqlite" (data/commands.sqlite3, migrated from the
+                     JSON data file on first use), "sharded" (data/commands.shards/, migrated
+                     from and back to the JSON data file) or a Storage instance
+            journal: Append each change to a journal next to the data file instead of rewriting it (json only)
+            journal_max_records: Journal records after which the snapshot is rewritten in the background
+            journal_max_bytes: Journal size after which the snapshot is rewritten in the background
+            write_behind: Return from save_data immediately and save on a background thread
+            save_delay: Debounce window in seconds for write-behind saves
+            watch: Poll the data file for changes made by other programs and merge them
+                   into the tree (json without journal only, see reload_external)
+            watch_interval: Seconds between polls
+            metrics: Records load and save durations ("data.load", "data.save") when given
         """
         if data_file is None:
-            # Check if running as executable (bundled by PyInstaller)
-            if getattr(sys, 'frozen', False):
-                # Running as exe, use the directory containing the exe
-                base_dir = Path(sys.executable).parent
-            else:
-                # Running as script, use project root directory
-                base_dir = Path(__file__).parent.parent
-            
-            data_dir = base_dir / "data"
-            data_dir.mkdir(exist_ok=True)
-            data_file = str(data_dir / "commands.json")
+            default_data_dir().mkdir(exist_ok=True)
+            data_file = default_data_file()
         
         self.data_file = data_file
+        if isinstance(storage, Storage):
+            self.storage = storage
+        elif storage == "sqlite":
+            # sqlite3 is only imported when the backend is used
+            from .sqlite_storage import SqliteStorage
+            self.storage = SqliteStorage(os.path.splitext(data_file)[0] + ".sqlite3", import_file=data_file)
+        elif storage == "sharded":
+            from .sharded_storage import ShardedStorage, shard_directory
+            self.storage = ShardedStorage(shard_directory(data_file), import_file=data_file)
+        elif storage == "json":
+            self.storage = JsonStorage(data_file, journal, journal_max_records, journal_max_bytes)
+        else:
+            raise ValueError(f"Unknown storage backend: {storage}")
+        
         self.root: Optional[CommandNode] = None
+        self.index = NodeIndex()
+        self.change_log = ChangeLog(self.index)
+        self.index.listeners.append(self.change_log)
+        # Interval labels answering "is this node inside that folder" (scoped searches)
+        self.labels = TreeLabels(self.index)
+        self.index.listeners.append(self.labels)
+        # Lazy backends search in storage, or load the whole tree for the in-memory index on first use
+        self.search_index: Optional[SearchIndex] = None
+        if not self.storage.lazy:
+            self.search_index = SearchIndex()
+            self.index.listeners.append(self.search_index)
+        # Fuzzy search index of lazy backends, filled from storage on first use
+        self._fuzzy_index: Optional[StorageSearchIndex] = None
+        # The tree is read under read_lock (shared) and mutated under lock (exclusive)
+        self.rwlock = ReadWriteLock()
+        self.lock = self.rwlock.write_lock
+        self.read_lock = self.rwlock.read_lock
+        # Serializes lazy loading, which readers do while holding only the read lock
+        self._load_lock = threading.RLock()
+        # Held for a whole save so snapshots reach the disk in the order they were taken
+        self._write_lock = threading.Lock()
+        # save_data() calls inside batch() blocks are deferred to the end of the outermost block
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self.metrics = metrics
         self._load_data()
+        # Called (on the watcher thread) after changes made by other programs were merged
+        self.on_external_change: Optional[Callable[[], None]] = None
+        self.watcher: Optional[FileWatcher] = None
+        self._local_edits: Optional[LocalEdits] = None
+        if watch and self.storage.watchable:
+            self._local_edits = LocalEdits()
+            self.index.listeners.append(self._local_edits)
+            self.watcher = FileWatcher(self.storage.files(), self.reload_external, watch_interval)
+        self._saver: Optional[BackgroundSaver] = None
+        if write_behind:
+            self._saver = BackgroundSaver(self._save_now, save_delay)
     
     def _load_data(self) -> None:
-        """Load data from file"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if data:
-                        self.root = CommandNode.from_dict(data)
-                    else:
-                        self._create_default_root()
-            except (json.JSONDecodeError, Exception) as e:
-                print(f"Failed to load data: {e}")
-                self._create_default_root()
-        else:
+        """Load data from storage"""
+        start = time.perf_counter()
+        if not self.storage.open(self):
             self._create_default_root()
+        if self.metrics is not None:
+            self.metrics.record("data.load", time.perf_counter() - start)
     
     def _create_default_root(self) -> None:
         """Create default root node"""
-        self.root = CommandNode(
+        root = CommandNode(
             name="Root",
             node_type="folder",
             description="Root directory"
@@ -71,47 +133,416 @@ class DataManager:
             description="Check Python version"
         )
         example_folder.add_child(example_cmd)
-        self.root.add_child(example_folder)
+        root.add_child(example_folder)
+        self.set_root(root)
         
-        self.save_data()
+        with self._write_lock:
+            self.storage.write_tree(root)
     
     def save_data(self) -> bool:
-        """Save data to file"""
-        try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.root.to_dict(), f, ensure_ascii=False, indent=2)
+        """
+        Save data to storage (append pending journal records in journal mode)
+        
+        In write-behind mode this only schedules the save and returns immediately;
+        inside a batch() block it is deferred to the end of the block.
+        """
+        if self._batch_depth:
+            self._batch_dirty = True
             return True
+        if self._saver is not None:
+            self._saver.mark_dirty()
+            return True
+        return self._save_now()
+    
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Hold the tree lock for a group of changes and save once at the end
+        
+        save_data() calls made inside the block (at any nesting depth) are
+        collected into a single save when the outermost block exits.
+        """
+        with self.lock:
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._batch_dirty:
+                    self._batch_dirty = False
+                    self.save_data()
+    
+    def _save_now(self) -> bool:
+        """Persist the current state on the calling thread"""
+        start = time.perf_counter()
+        merged = False
+        try:
+            with self._write_lock:
+                # What another program wrote since the last save is merged, not overwritten
+                merged = self._merge_external()[0]
+                self._write_locked()
+            success = True
         except Exception as e:
             print(f"Failed to save data: {e}")
+            success = False
+        if self.metrics is not None:
+            self.metrics.record("data.save", time.perf_counter() - start, error=not success)
+        if merged and self.on_external_change is not None:
+            self.on_external_change()
+        return success
+    
+    def _write_locked(self) -> None:
+        """Write changes to storage and record the files as our own (caller holds _write_lock)"""
+        if self._local_edits is None:
+            self.storage.save()
+            return
+        with self.read_lock:
+            taken = self._local_edits.take()
+        try:
+            self.storage.save()
+        except BaseException:
+            self._local_edits.restore(taken)
+            raise
+        self.watcher.acknowledge()
+    
+    def reload_external(self) -> bool:
+        """
+        Merge the changes another program made to the data file into the tree
+        
+        Called by the file watcher when the file content changed. Only the
+        nodes that differ (by ID and updated_at) are added, removed, moved or
+        updated, through the usual tree events, so indexes and the change log
+        follow and the UI receives a delta; edits not saved yet win over the
+        file, which is then rewritten with them (see merge_tree).
+        
+        Returns:
+            Whether the tree changed
+        """
+        if self.watcher is None or self.watcher.changed() is None:
             return False
+        with self.lock:
+            # Saves take _write_lock either inside the tree lock (from controllers) or
+            # outside it (write-behind thread): a running save is not waited for here,
+            # it merges the change itself or the next poll does
+            if not self._write_lock.acquire(blocking=False):
+                return False
+            try:
+                changed, kept = self._merge_external()
+            finally:
+                self._write_lock.release()
+            if kept:
+                self.save_data()
+        if changed and self.on_external_change is not None:
+            self.on_external_change()
+        return changed
+    
+    def _merge_external(self) -> Tuple[bool, bool]:
+        """
+        Merge the data file into the tree if another program changed it (caller holds _write_lock)
+        
+        Returns:
+            (whether the tree changed, whether it has local edits the file does not have)
+        """
+        if self.watcher is None:
+            return False, False
+        fingerprint = self.watcher.changed()
+        if fingerprint is None:
+            return False, False
+        try:
+            disk_root = self.storage.read_tree()
+        except Exception as e:
+            # Possibly read while being written: the next poll retries
+            print(f"Failed to read changed data file: {e}")
+            return False, False
+        if disk_root is None:
+            return False, False
+        with self.lock:
+            version = self.change_log.version
+            self._local_edits.enabled = False
+            try:
+                kept = merge_tree(self, disk_root, self._local_edits)
+            finally:
+                self._local_edits.enabled = True
+            changed = self.change_log.version != version
+        self.watcher.acknowledge(fingerprint)
+        return changed, kept
+    
+    def flush(self) -> bool:
+        """
+        Write pending changes now and wait for a running background save.
+        Call before the application exits.
+        
+        Returns:
+            Whether everything is on disk
+        """
+        if self._saver is not None:
+            return self._saver.flush()
+        return True
+    
+    def close(self) -> bool:
+        """
+        Flush pending changes and stop background threads
+        
+        Returns:
+            Whether everything is on disk
+        """
+        success = True
+        if self.watcher is not None:
+            self.watcher.close()
+        if self._saver is not None:
+            success = self._saver.close()
+            self._saver = None
+        self.storage.close()
+        return success
+    
+    def export_json(self, path: str) -> None:
+        """
+        Export the whole tree in the JSON data file format
+        
+        Args:
+            path: Target file path
+        """
+        with self.read_lock:
+            self.load_subtree(self.root)
+            payload = self.root.to_json()
+            if self.index.blobs is not None:
+                payload = self.index.blobs.wrap_snapshot(payload)
+        atomic_write_bytes(path, payload + b'\n')
     
     def get_root(self) -> CommandNode:
         """Get root node"""
         return self.root
     
+    def set_root(self, root: CommandNode) -> None:
+        """
+        Replace the whole tree and rebuild the node index
+        
+        Args:
+            root: New root node
+        """
+        if self.storage.lazy and self.search_index is not None:
+            # Built from a fully loaded tree, which the new root is not
+            self.index.listeners.remove(self.search_index)
+            self.search_index = None
+        self.root = root
+        self.index.build(root)
+    
+    def load_children(self, node: CommandNode) -> None:
+        """
+        Make sure the children of a folder are loaded (lazy storage backends)
+        
+        Args:
+            node: Folder node
+        """
+        if node._loaded:
+            return
+        with self._load_lock:
+            if node._loaded:
+                return
+            children = self.storage.load_children(node)
+            # Readers check _loaded without the lock: publish it last
+            node.children = children
+            self.index.register_loaded(node, children)
+            node.invalidate()
+            node._loaded = True
+    
+    def load_subtree(self, node: CommandNode) -> None:
+        """
+        Make sure a whole subtree is loaded (lazy storage backends)
+        
+        Args:
+            node: Subtree root
+        """
+        if not self.storage.lazy:
+            return
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.load_children(current)
+            stack.extend(child for child in current.children if child.is_folder())
+    
     def find_node_by_id(self, node_id: str, current_node: Optional[CommandNode] = None) -> Optional[CommandNode]:
         """
-        Find node by ID (recursive search)
+        Find node by ID (index lookup; lazy backends load the folders on the path to it)
         
         Args:
             node_id: Node ID
-            current_node: Current search node, defaults to root node
+            current_node: Only return the node if it is inside this subtree, defaults to root node
         
         Returns:
             Found node, or None
         """
-        if current_node is None:
-            current_node = self.root
+        node = self.index.get(node_id)
+        if node is None and self.storage.lazy:
+            node = self._materialize(node_id)
+        if node is None or current_node is None or current_node is self.root:
+            return node
         
-        if current_node.id == node_id:
-            return current_node
+        if node is current_node or self.index.is_ancestor(current_node.id, node_id):
+            return node
+        return None
+    
+    def _materialize(self, node_id: str) -> Optional[CommandNode]:
+        """Load the folders on the path to a node that is not loaded yet"""
+        with self._load_lock:
+            path = self.storage.locate(node_id)
+            if not path:
+                return None
+            for ancestor_id in path[:-1]:
+                ancestor = self.index.get(ancestor_id)
+                if ancestor is None:
+                    return None
+                self.load_children(ancestor)
+            return self.index.get(node_id)
+    
+    def search(self, keyword: str, limit: Optional[int] = None, scope: Optional[str] = None) -> List[str]:
+        """
+        Search commands by name, description or content
         
-        for child in current_node.children:
-            result = self.find_node_by_id(node_id, child)
-            if result:
-                return result
+        Args:
+            keyword: Search keyword
+            limit: Maximum number of results, defaults to all matches
+            scope: ID of a folder to search in, defaults to the whole tree
         
-        return None
+        Returns:
+            Matching node IDs, best match first
+        """
+        within = self._scope(scope)
+        if within is None:
+            results = self.storage.search(keyword, limit)
+        else:
+            results = self.storage.search(keyword, None)
+            if results is not None:
+                results = [node_id for node_id in results if node_id in within][:limit]
+        if results is None:
+            results = self._memory_search_index().search(keyword, limit, within)
+        return results
+    
+    def fuzzy_search(self, keyword: str, limit: Optional[int] = None, cancel=None,
+                     scope: Optional[str] = None) -> List[Tuple[str, str, List[Tuple[int, int]]]]:
+        """
+        Typo-tolerant search by name, description or content (see SearchIndex.iter_fuzzy_search)
+        
+        Args:
+            keyword: Search keyword
+            limit: Maximum number of results, defaults to all matches
+            cancel: threading.Event that stops the search with SearchCancelled when set
+            scope: ID of a folder to search in, defaults to the whole tree
+        
+        Returns:
+            (node_id, field, ranges) of the matches, best match first
+        """
+        return [result for batch in self.iter_fuzzy_search(keyword, limit, cancel, scope) for result in batch]
+    
+    def iter_fuzzy_search(self, keyword: str, limit: Optional[int] = None, cancel=None,
+                          scope: Optional[str] = None) -> Iterator[List[Tuple[str, str, List[Tuple[int, int]]]]]:
+        """
+        Typo-tolerant search yielding batches of results as their rank becomes final
+        
+        Args:
+            keyword: Search keyword
+            limit: Maximum number of results, defaults to all matches
+            cancel: threading.Event that stops the search with SearchCancelled when set
+            scope: ID of a folder to search in, defaults to the whole tree
+        
+        Returns:
+            Iterator over lists of (node_id, field, ranges), best match first across all lists
+        """
+        within = self._scope(scope)
+        return self._fuzzy_search_index().iter_fuzzy_search(keyword, limit, cancel, within)
+    
+    def _scope(self, scope: Optional[str]) -> Optional[Collection[str]]:
+        """
+        IDs of the nodes inside a folder: a range of the tree labels, not a
+        walk of the folder (call under the read lock)
+        
+        Args:
+            scope: Folder ID, or None for the whole tree
+        
+        Returns:
+            The node IDs, None for the whole tree
+        """
+        if scope is None or scope == self.root.id:
+            return None
+        folder = self.find_node_by_id(scope)
+        if folder is None or not folder.is_folder():
+            return ()
+        if self.storage.lazy:
+            # Results from storage are indexed (and labeled) once their folders are loaded
+            self.load_subtree(folder)
+        return self.labels.subtree(folder)
+    
+    def _fuzzy_search_index(self) -> SearchIndex:
+        """
+        Index fuzzy searches run on
+        
+        Lazy backends that can search read every command from storage into a
+        fuzzy-only index on the first call (and after changes it cannot
+        follow), which then follows the tree like the in-memory index. The
+        first one is loaded from tables the storage saved, when it has them.
+        """
+        if self.search_index is not None or not self.storage.searchable:
+            return self._memory_search_index()
+        index = self._fuzzy_index
+        if index is None or index.stale:
+            with self._load_lock:
+                index = self._fuzzy_index
+                if index is None or index.stale:
+                    tables = None
+                    if index is not None:
+                        self.index.listeners.remove(index)
+                    else:
+                        tables = self.storage.read_fuzzy_tables()
+                    if tables is not None:
+                        index = StorageSearchIndex.from_tables(tables)
+                    else:
+                        index = StorageSearchIndex()
+                        index.add_rows(self.storage.iter_commands())
+                    # Callers hold the read lock, so no change slips in before it listens
+                    self.index.listeners.append(index)
+                    self._fuzzy_index = index
+        return index
+    
+    def _memory_search_index(self) -> SearchIndex:
+        """
+        In-memory search index, which lazy backends that cannot search by
+        themselves build on the first search by loading the whole tree
+        """
+        index = self.search_index
+        if index is None:
+            with self._load_lock:
+                index = self.search_index
+                if index is None:
+                    self.load_subtree(self.root)
+                    index = SearchIndex()
+                    index.rebuild(self.root)
+                    # Callers hold the read lock, so no change slips in before it listens
+                    self.index.listeners.append(index)
+                    self.search_index = index
+        return index
+    
+    def mark_updated(self, node: CommandNode) -> None:
+        """
+        Notify indexes that fields of a node were changed
+        
+        Args:
+            node: Changed node
+        """
+        self.index.touch(node)
+    
+    def get_parent(self, node_id: str) -> Optional[CommandNode]:
+        """
+        Get parent node (index lookup)
+        
+        Args:
+            node_id: Child node ID
+        
+        Returns:
+            Parent node, or None for the root / unknown IDs
+        """
+        if node_id not in self.index and self.storage.lazy:
+            self.find_node_by_id(node_id)
+        return self.index.get_parent(node_id)
     
     def get_all_nodes(self, current_node: Optional[CommandNode] = None) -> List[CommandNode]:
         """
@@ -125,9 +556,13 @@ class DataManager:
         """
         if current_node is None:
             current_node = self.root
+        self.load_subtree(current_node)
         
-        nodes = [current_node]
-        for child in current_node.children:
-            nodes.extend(self.get_all_nodes(child))
+        nodes = []
+        stack = [current_node]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(reversed(node.children))
         
         return nodes
@@ -0,0 +1,113 @@
+"""File Watcher - Notices changes other programs make to the data files"""
+
+import threading
+from typing import Any, Callable, List, Optional
+
+from .fileio import file_fingerprint, files_hash
+
+
+class FileWatcher:
+    """
+    Polls a set of files on a background thread and reports changes made by
+    other programs (a sync client, a git checkout, a second instance).
+
+    Each poll compares the size and modification time of the files with the
+    state they were acknowledged in, and only when those differ compares their
+    content hash: rewriting the same content (touch, checkout of an unchanged
+    file) is not a change. The owner acknowledges its own writes; the hash of
+    what it wrote is computed by the next poll, on the polling thread. Until
+    then changed() reports any new size or modification time as a change, so
+    a save calling it never reads the files.
+    """
+
+    def __init__(self, paths: List[str], on_change: Callable[[], Any], interval: float = 1.0):
+        """
+        Initialize watcher and start its thread (the files as they are now are acknowledged)
+
+        Args:
+            paths: Files to watch (missing files are watched for appearing)
+            on_change: Called on the polling thread when changed() reports a change
+            interval: Seconds between polls
+        """
+        self.paths = list(paths)
+        self.interval = interval
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        # Acknowledged state: fingerprint, and content hash once computed
+        self._fingerprint = file_fingerprint(self.paths)
+        self._hash: Optional[str] = None
+        # Hash of the last fingerprint that differed, so a change is hashed once
+        self._seen = (None, None)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="commandnote-watcher", daemon=True)
+        self._thread.start()
+
+    def acknowledge(self, fingerprint: Optional[List[Any]] = None) -> None:
+        """
+        Record the files as known (after writing them, or merging what they contain)
+
+        Args:
+            fingerprint: State the files were read in, defaults to their current state
+        """
+        if fingerprint is None:
+            fingerprint = file_fingerprint(self.paths)
+        with self._lock:
+            self._fingerprint = fingerprint
+            self._hash = None
+
+    def changed(self) -> Optional[List[Any]]:
+        """
+        Compare the files with the acknowledged state (hashes them only when
+        their size or modification time changed and the acknowledged content
+        hash is known)
+
+        Returns:
+            Their fingerprint if their content changed, None otherwise
+        """
+        fingerprint = file_fingerprint(self.paths)
+        with self._lock:
+            known, known_hash = self._fingerprint, self._hash
+        if fingerprint == known:
+            return None
+        if known_hash is None:
+            # Nothing to compare the content with
+            return fingerprint
+        seen, digest = self._seen
+        if seen != fingerprint:
+            digest = files_hash(self.paths)
+            self._seen = (fingerprint, digest)
+        if digest == known_hash:
+            # Same content, new modification time
+            with self._lock:
+                if self._fingerprint is known:
+                    self._fingerprint = fingerprint
+            return None
+        return fingerprint
+
+    def close(self) -> None:
+        """Stop the polling thread"""
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _hash_acknowledged(self) -> None:
+        """Compute the content hash of the acknowledged state, if the files are still in it"""
+        with self._lock:
+            known, known_hash = self._fingerprint, self._hash
+        if known_hash is not None or file_fingerprint(self.paths) != known:
+            return
+        digest = files_hash(self.paths)
+        # Only if nothing was written or acknowledged while hashing
+        with self._lock:
+            if self._fingerprint is known and file_fingerprint(self.paths) == known:
+                self._hash = digest
+
+    def _run(self) -> None:
+        """Thread body"""
+        while not self._stop.wait(self.interval):
+            try:
+                self._hash_acknowledged()
+                if self.changed() is not None:
+                    self._on_change()
+            except Exception as e:
+                print(f"Failed to check data files for changes: {e}")
@@ -0,0 +1,103 @@
+"""File IO helpers shared by the storage code"""
+
+import hashlib
+import os
+import tempfile
+from typing import Any, List
+
+# Read once at import: os.umask() can only be read by setting it, which would race other threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def replacement_mode(path: str) -> int:
+    """
+    Permission bits for a file about to replace path
+
+    Args:
+        path: Target file path
+
+    Returns:
+        The mode of the existing file, or what open() would create under the process umask
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_bytes(path: str, data: bytes) -> None:
+    """
+    Write a file so that readers see either the old or the new content, never a partial one.
+
+    The data goes to a temporary file in the same directory, is fsynced and then
+    renamed over the target, keeping its permissions (mkstemp creates files
+    readable by the owner only).
+
+    Args:
+        path: Target file path
+        data: File content
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if hasattr(os, 'fchmod'):
+                os.fchmod(f.fileno(), replacement_mode(path))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def file_fingerprint(paths: List[str]) -> List[Any]:
+    """
+    Cheap identity of a set of files, for telling whether data derived from them is stale
+
+    Args:
+        paths: File paths
+
+    Returns:
+        [path, size, mtime_ns] for each file, size and mtime None for missing files
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            fingerprint.append([path, None, None])
+        else:
+            fingerprint.append([path, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+def files_hash(paths: List[str], chunk_size: int = 1024 * 1024) -> str:
+    """
+    Hash of the content of a set of files (missing files hash differently from empty ones)
+
+    Args:
+        paths: File paths
+        chunk_size: Read size
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(b'file\0')
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+        except FileNotFoundError:
+            digest.update(b'missing\0')
+    return digest.hexdigest()
@@ -0,0 +1,71 @@
+"""First paint - Small snapshot of the top of the tree shown while the data loads
+
+The snapshot is the tree summary the window asked for last (root and top-level
+nodes), written next to the data file when the application closes. It records
+the size and modification time of the storage files it was taken from, so a
+snapshot that no longer matches them (data edited elsewhere, restored backup)
+is ignored instead of shown.
+
+Reading the snapshot only needs json and the file helpers, so the window can
+show it without waiting for the data to load.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from .fileio import atomic_write_bytes, file_fingerprint
+
+# Bumped when the snapshot layout changes; other versions are ignored
+FORMAT = 1
+
+
+def first_paint_path(data_file: str) -> str:
+    """Snapshot file of a data file"""
+    return data_file + ".firstpaint"
+
+
+def write_first_paint(data_file: str, summary: Dict[str, Any], source_files: List[str]) -> bool:
+    """
+    Write the first-paint snapshot of a data file
+
+    Args:
+        data_file: Data file path
+        summary: Tree summary to show at the next start (see CommandController.get_tree_summary)
+        source_files: Storage files the summary reflects (see Storage.files)
+
+    Returns:
+        Whether the snapshot was written
+    """
+    # The tree version restarts at every load, so the snapshot carries none
+    tree = {key: value for key, value in summary.items() if key != 'version'}
+    snapshot = {'format': FORMAT, 'sources': file_fingerprint(source_files), 'tree': tree}
+    try:
+        atomic_write_bytes(first_paint_path(data_file),
+                           json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return True
+    except OSError as e:
+        print(f"Failed to write first-paint snapshot: {e}")
+        return False
+
+
+def read_first_paint(data_file: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the first-paint snapshot of a data file
+
+    Args:
+        data_file: Data file path
+
+    Returns:
+        Tree summary, None if there is no snapshot or it is out of date
+    """
+    try:
+        with open(first_paint_path(data_file), 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('format') != FORMAT:
+        return None
+    sources = snapshot.get('sources') or []
+    if file_fingerprint([source[0] for source in sources]) != sources:
+        return None
+    return snapshot.get('tree')
@@ -0,0 +1,210 @@
+"""Fuzzy matching - Subsequence scoring and bounded edit distance for typo-tolerant search"""
+
+import re
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# Subsequence scores, after fzf: every matched character scores, gaps cost,
+# and matches at word starts or continuing a run of matches earn a bonus
+SCORE_MATCH = 16
+SCORE_GAP_START = -3
+SCORE_GAP_EXTENSION = -1
+BONUS_BOUNDARY = 8
+BONUS_CONSECUTIVE = 4
+BONUS_FIRST_CHAR_MULTIPLIER = 2
+
+
+def subsequence_pattern(pattern: str, max_gap: Optional[int] = None) -> 're.Pattern[str]':
+    """
+    Regular expression that finds pattern as a subsequence within one line of a
+    newline-separated text
+
+    Each next character is reached with a possessive run of characters that
+    are neither it nor a newline, so an attempt never backtracks. The
+    expression starts with a literal, which lets the regex engine skip ahead
+    to candidate positions at C speed.
+
+    Args:
+        pattern: Characters to find in order (lowercase, no newlines)
+        max_gap: Most characters allowed between two matched characters, unbounded by default
+
+    Returns:
+        Compiled expression
+    """
+    repeat = "*+" if max_gap is None else f"{{0,{max_gap}}}+"
+    parts = [re.escape(pattern[0])]
+    for char in pattern[1:]:
+        escaped = re.escape(char)
+        parts.append(f"[^\\n{escaped}]{repeat}{escaped}")
+    return re.compile("".join(parts))
+
+
+def word_start_pattern(keyword: str) -> 're.Pattern[str]':
+    """
+    Regular expression that finds keyword where it is not preceded by a letter or digit
+
+    The check looks behind the keyword once it has matched, so the expression
+    still starts with a literal the regex engine can scan for.
+    """
+    escaped = re.escape(keyword)
+    return re.compile(escaped + r"(?<![^\W_]" + escaped + ")")
+
+
+def subsequence_positions(text: str, pattern: str, end: Optional[int] = None) -> Optional[List[int]]:
+    """
+    Positions of a short occurrence of pattern as a subsequence of text
+
+    The first occurrence found left to right is shrunk by taking the pattern
+    again from its end backwards (after fzf's v1 algorithm), so "git" in
+    "go get it" matches "g", "i", "t" of "get it" rather than the spread-out
+    first letters.
+
+    Args:
+        text: Text to search (lowercase)
+        pattern: Characters to find in order (lowercase)
+        end: Position of the last character of an occurrence already found,
+             to skip the left to right pass
+
+    Returns:
+        Matched positions, None if pattern is not a subsequence of text
+    """
+    if end is None:
+        end = -1
+        for char in pattern:
+            end = text.find(char, end + 1)
+            if end < 0:
+                return None
+    positions = [end] * len(pattern)
+    position = end
+    for i in range(len(pattern) - 2, -1, -1):
+        position = text.rfind(pattern[i], 0, position)
+        positions[i] = position
+    return positions
+
+
+def score_positions(text: str, positions: Sequence[int]) -> int:
+    """
+    Score matched positions in text (higher is better)
+
+    Args:
+        text: Matched text
+        positions: Matched positions, ascending
+
+    Returns:
+        Score
+    """
+    score = 0
+    previous = -2
+    run_bonus = 0
+    for i, position in enumerate(positions):
+        bonus = BONUS_BOUNDARY if position == 0 or not text[position - 1].isalnum() else 0
+        if position == previous + 1:
+            # A run keeps the bonus of the word start it began at
+            run_bonus = max(run_bonus, bonus, BONUS_CONSECUTIVE)
+            bonus = run_bonus
+        else:
+            if i:
+                score += SCORE_GAP_START + SCORE_GAP_EXTENSION * (position - previous - 2)
+            run_bonus = bonus
+        if not i:
+            bonus *= BONUS_FIRST_CHAR_MULTIPLIER
+        score += SCORE_MATCH + bonus
+        previous = position
+    return score
+
+
+def max_score(length: int) -> int:
+    """Best possible score of a pattern of this length (a whole word)"""
+    if not length:
+        return 0
+    return (SCORE_MATCH + BONUS_BOUNDARY * BONUS_FIRST_CHAR_MULTIPLIER) + (length - 1) * (SCORE_MATCH + BONUS_BOUNDARY)
+
+
+def to_ranges(positions: Sequence[int]) -> List[Tuple[int, int]]:
+    """
+    Merge matched positions into [start, end) ranges for highlighting
+
+    Args:
+        positions: Matched positions, ascending
+
+    Returns:
+        Ranges of consecutive positions
+    """
+    ranges: List[Tuple[int, int]] = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position:
+            ranges[-1] = (ranges[-1][0], position + 1)
+        else:
+            ranges.append((position, position + 1))
+    return ranges
+
+
+def max_typos(length: int) -> int:
+    """
+    Edits allowed for a word of this length: none below 4 characters, 2 from 8
+
+    Any edit of a shorter word matches too many others (one edit turns "git"
+    into "get", "gif", "it"...); search_index still forgives 3-character words
+    one swap of neighbouring characters (see is_transposition).
+    """
+    if length < 4:
+        return 0
+    return 1 if length < 8 else 2
+
+
+def is_transposition(a: str, b: str) -> bool:
+    """Whether b is a with two neighbouring characters swapped ("gti" and "git")"""
+    if len(a) != len(b):
+        return False
+    differ = [i for i, (char_a, char_b) in enumerate(zip(a, b)) if char_a != char_b]
+    return len(differ) == 2 and differ[1] == differ[0] + 1 and a[differ[0]] == b[differ[1]] and \
+        a[differ[1]] == b[differ[0]]
+
+
+def edit_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """
+    Edit distance with adjacent transpositions (optimal string alignment), bounded
+
+    Only the diagonal band of width 2 * limit + 1 is computed, and the
+    computation stops once every cell of a row exceeds limit.
+
+    Args:
+        a: First string
+        b: Second string
+        limit: Largest distance of interest
+
+    Returns:
+        Distance, None if it is larger than limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if a == b:
+        return 0
+    big = limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low = max(1, i - limit)
+        high = min(len(b), i + limit)
+        current = [big] * (len(b) + 1)
+        current[0] = i if i <= limit else big
+        row_min = current[0]
+        char_a = a[i - 1]
+        for j in range(low, high + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return None
+        previous2, previous = previous, current
+    distance = previous[len(b)]
+    return distance if distance <= limit else None
+
+
+def deletions(word: str) -> Iterator[str]:
+    """The word with one character removed, at every position"""
+    for i in range(len(word)):
+        yield word[:i] + word[i + 1:]
@@ -0,0 +1,213 @@
+"""Change Journal - Append-only log of tree mutations"""
+
+import json
+import os
+from typing import Any, Dict, Iterator, List
+
+from .command_node import CommandNode
+from .node_index import TreeListener
+
+
+class Journal(TreeListener):
+    """
+    Append-only change journal stored next to the snapshot file.
+
+    Each tree event becomes one JSON line with a sequence number:
+
+        {"seq": 12, "op": "add", "parent": "<id>", "nodes": [{...}, ...], "at": "..."}
+        {"seq": 13, "op": "update", "id": "<id>", "name": ..., "content": ..., ...}
+        {"seq": 14, "op": "move", "id": "<id>", "parent": "<id>", "index": 0, "at": "...", "from_at": "..."}
+        {"seq": 15, "op": "remove", "id": "<id>", "at": "..."}
+
+    An added subtree is stored flat, in pre-order, so records stay shallow
+    however deep the subtree is. "index" is only present for nodes not
+    appended at the end; "from_at" is the new updated_at of the old parent.
+    Records are buffered until commit(). During compaction the active log is
+    rotated to "<journal>.compacting" until the new snapshot is on disk; the
+    snapshot stores the last sequence number it contains, so records are never
+    applied twice.
+    """
+
+    def __init__(self, data_file: str, max_records: int = 1000, max_bytes: int = 1024 * 1024):
+        """
+        Initialize journal
+
+        Args:
+            data_file: Snapshot file path; the journal lives at "<data_file>.journal"
+            max_records: Number of records after which compaction is due
+            max_bytes: Journal size in bytes after which compaction is due
+        """
+        self.path = data_file + ".journal"
+        self.compacting_path = self.path + ".compacting"
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.seq = 0
+        self.record_count = 0
+        self.byte_count = 0
+        self._pending: List[bytes] = []
+
+    # ========== Reading ==========
+
+    def read_records(self, after_seq: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Read records from the rotated and the active log, in order
+
+        A torn final record (partial line left by a crash) is cut off the file.
+
+        Args:
+            after_seq: Skip records already contained in the snapshot
+
+        Yields:
+            Journal records
+        """
+        self.record_count = 0
+        self.byte_count = 0
+        for path in (self.compacting_path, self.path):
+            if not os.path.exists(path):
+                continue
+            for record in self._read_file(path):
+                self.seq = max(self.seq, record['seq'])
+                if path == self.path:
+                    self.record_count += 1
+                if record['seq'] > after_seq:
+                    yield record
+        if os.path.exists(self.path):
+            self.byte_count = os.path.getsize(self.path)
+        self.seq = max(self.seq, after_seq)
+
+    def _read_file(self, path: str) -> Iterator[Dict[str, Any]]:
+        """Read one log file, truncating it at the first torn record"""
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("missing line terminator")
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"Journal {path}: dropping torn record at byte {offset}")
+                    break
+                offset += len(line)
+                yield record
+            else:
+                return
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+
+    @staticmethod
+    def node_from_record(record: Dict[str, Any]) -> CommandNode:
+        """
+        Build the subtree of an "add" record
+
+        Args:
+            record: Journal record
+
+        Returns:
+            Root of the added subtree
+        """
+        if 'node' in record:
+            # Nested form written by earlier versions
+            return CommandNode.from_dict(record['node'])
+        nodes = [CommandNode.from_fields(fields) for fields in record['nodes']]
+        by_id = {node.id: node for node in nodes}
+        children: Dict[str, List[CommandNode]] = {}
+        for node in nodes[1:]:
+            children.setdefault(node.parent_id, []).append(node)
+        for parent_id, parent_children in children.items():
+            parent = by_id[parent_id]
+            for child in parent_children:
+                child.parent_id = parent.id
+            parent.children = parent_children
+        return nodes[0]
+
+    # ========== Writing ==========
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        """Buffer a record until the next commit"""
+        self.seq += 1
+        record['seq'] = self.seq
+        self._pending.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n")
+
+    @staticmethod
+    def _with_position(record: Dict[str, Any], node: CommandNode, parent: CommandNode) -> Dict[str, Any]:
+        """Add the position of a node that was not appended at the end of its parent"""
+        position = parent.insert_position(node)
+        if position is not None:
+            record['index'] = position
+        return record
+
+    def commit(self) -> None:
+        """Append buffered records to the log and fsync it"""
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.record_count += len(self._pending)
+        self.byte_count += len(data)
+        self._pending.clear()
+
+    def needs_compaction(self) -> bool:
+        """Check whether the log has grown past its record or size limit"""
+        return self.record_count >= self.max_records or self.byte_count >= self.max_bytes
+
+    def rotate(self) -> None:
+        """Move the active log aside before a snapshot is written"""
+        if os.path.exists(self.path):
+            if os.path.exists(self.compacting_path):
+                # A previous compaction did not finish: keep its records too
+                with open(self.path, 'rb') as src, open(self.compacting_path, 'ab') as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+        self.record_count = 0
+        self.byte_count = 0
+
+    def finish_compaction(self) -> None:
+        """Drop the rotated log once the snapshot containing it is on disk"""
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+    def clear(self) -> None:
+        """Delete all log files (after a full snapshot was written)"""
+        self._pending.clear()
+        for path in (self.compacting_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.record_count = 0
+        self.byte_count = 0
+
+    # ========== TreeListener ==========
+
+    def node_added(self, node: CommandNode, parent: CommandNode) -> None:
+        nodes = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            nodes.append(current.to_fields())
+            stack.extend(reversed(current.children))
+        record = {'op': 'add', 'parent': parent.id, 'nodes': nodes, 'at': parent.updated_at}
+        self._append(self._with_position(record, node, parent))
+
+    def node_removed(self, node: CommandNode, parent: CommandNode) -> None:
+        self._append({'op': 'remove', 'id': node.id, 'at': parent.updated_at})
+
+    def node_moved(self, node: CommandNode, old_parent: CommandNode, new_parent: CommandNode) -> None:
+        record = {'op': 'move', 'id': node.id, 'parent': new_parent.id, 'at': new_parent.updated_at}
+        if old_parent is not None:
+            record['from_at'] = old_parent.updated_at
+        self._append(self._with_position(record, node, new_parent))
+
+    def node_updated(self, node: CommandNode) -> None:
+        self._append({
+            'op': 'update',
+            'id': node.id,
+            'name': node.name,
+            'content': node.content,
+            'description': node.description,
+            'updated_at': node.updated_at,
+        })
+
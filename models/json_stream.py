@@ -0,0 +1,222 @@
+"""JSON Stream - Incremental loader for the commands.json tree"""
+
+import json
+import re
+from json.decoder import scanstring
+from json.scanner import make_scanner
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from .command_node import CommandNode
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Keys of the top-level object that are neither node fields nor returned as extra fields
+_DOCUMENT_KEYS = frozenset(('children', 'blobs', 'content_blob', 'description_blob'))
+# Scans one JSON value (C accelerated when available)
+_scan_value = make_scanner(json.JSONDecoder())
+# Objects tried in one go per read although they run past the buffer: a failed
+# try scans to the end of the buffer, so trying every level of a deep chain of
+# such objects would cost the buffer size per level
+MAX_FAILED_SCANS = 8
+
+
+class _Reader:
+    """Character buffer over a text file, refilled in chunks as the parser advances"""
+
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        # Objects found since the last read to run past the buffer (see load_tree)
+        self.failed_scans = 0
+
+    def fill(self, need: int = 0) -> bool:
+        """Drop the consumed part of the buffer and read the next chunk"""
+        if self.eof:
+            return False
+        data = self.f.read(max(self.chunk_size, need))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        self.failed_scans = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON data")
+
+    def at_end(self) -> bool:
+        """Check that only whitespace is left"""
+        try:
+            self.peek()
+        except ValueError:
+            return True
+        return False
+
+    def expect(self, char: str) -> None:
+        """Consume the next non-whitespace character, which must be char"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found!r}")
+        self.pos += 1
+
+    def scan(self, string: bool = False) -> Any:
+        """Parse the next value (or key string), reading more data while it is incomplete"""
+        self.peek()
+        while True:
+            try:
+                if string:
+                    if self.buf[self.pos] != '"':
+                        raise ValueError(f"Expected a key at offset {self.pos}")
+                    value, end = scanstring(self.buf, self.pos + 1)
+                else:
+                    value, end = _scan_value(self.buf, self.pos)
+                # A number may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except (StopIteration, json.JSONDecodeError) as e:
+                if self.eof:
+                    raise ValueError(f"Invalid JSON value at offset {self.pos}") from e
+            # Grow the read so a long value is not re-scanned once per chunk
+            self.fill(len(self.buf) - self.pos)
+
+
+def load_tree(f: TextIO, chunk_size: int = 64 * 1024) -> Tuple[Optional[CommandNode], Dict[str, Any]]:
+    """
+    Build the node tree while reading a commands.json document
+
+    Subtrees that fit in the read buffer are decoded in one go; larger ones
+    (and, until the next read, the objects nested in MAX_FAILED_SCANS of them)
+    are parsed field by field, holding only the nodes on the path to the
+    current position as dictionaries. Every node is built as soon as its
+    object is complete, so peak memory stays close to the size of the finished
+    tree instead of the parsed document plus the tree.
+
+    Args:
+        f: Text file positioned at the document
+        chunk_size: Characters read at a time
+
+    Returns:
+        Root node (None for an empty document) and the fields of the top-level
+        object that are not node fields (such as "journal_seq")
+    
+    Bodies written as references are resolved through the document's "blobs"
+    table, which precedes the root's fields.
+    """
+    reader = _Reader(f, chunk_size)
+    if reader.peek() != '{':
+        # Anything but an object (such as null) holds no tree
+        if reader.scan():
+            raise ValueError("Top-level JSON value is not an object")
+        return None, {}
+
+    # Open objects: (fields, children) per level, and whether the level is inside its "children" array
+    stack: List[Tuple[Dict[str, Any], List[CommandNode]]] = []
+    in_children: List[bool] = []
+    result: List[Tuple[CommandNode, Dict[str, Any]]] = []
+    # Shared bodies by digest (see BlobStore)
+    blobs: Dict[str, str] = {}
+
+    def finish(fields: Dict[str, Any], node: CommandNode) -> None:
+        """Hand a completed node to its parent (or keep it as the root)"""
+        if stack:
+            stack[-1][1].append(node)
+        elif fields:
+            result.append((node, {key: value for key, value in fields.items()
+                                  if key not in CommandNode.FIELDS and key not in _DOCUMENT_KEYS}))
+
+    def open_object() -> None:
+        """At '{': build a subtree that fits in the buffer at once, otherwise descend into it"""
+        if len(reader.buf) - reader.pos < reader.chunk_size // 2:
+            reader.fill()
+        data = None
+        if reader.failed_scans < MAX_FAILED_SCANS:
+            try:
+                data, end = _scan_value(reader.buf, reader.pos)
+            except (StopIteration, json.JSONDecodeError, RecursionError):
+                # Runs past the buffer (or is invalid, which the field-wise parse reports)
+                reader.failed_scans += 1
+        if isinstance(data, dict):
+            reader.pos = end
+            if not stack and isinstance(data.get('blobs'), dict):
+                blobs.update(data['blobs'])
+            finish(data, CommandNode.from_dict(data, blobs))
+            return
+        reader.pos += 1
+        stack.append(({}, []))
+        in_children.append(False)
+
+    open_object()
+    while stack:
+        char = reader.peek()
+        if in_children[-1]:
+            if char == ']':
+                reader.pos += 1
+                in_children[-1] = False
+            elif char == ',':
+                reader.pos += 1
+            elif char == '{':
+                open_object()
+            else:
+                raise ValueError(f"Expected a node object at offset {reader.pos}, found {char!r}")
+            continue
+
+        if char == ',':
+            reader.pos += 1
+        elif char == '}':
+            reader.pos += 1
+            fields, children = stack.pop()
+            in_children.pop()
+            finish(fields, CommandNode.from_fields(fields, children, blobs))
+        else:
+            key = reader.scan(string=True)
+            reader.expect(':')
+            if key == 'children':
+                reader.expect('[')
+                in_children[-1] = True
+            elif key == 'blobs' and len(stack) == 1:
+                blobs.update(reader.scan())
+            else:
+                stack[-1][0][key] = reader.scan()
+
+    if not reader.at_end():
+        raise ValueError(f"Extra data after the JSON document at offset {reader.pos}")
+    return result[0] if result else (None, {})
+
+
+def iter_array(f: TextIO, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one at a time
+
+    Only the element being parsed is held in memory, so arbitrarily long
+    arrays can be processed with constant memory.
+
+    Args:
+        f: Text file positioned at the document
+        chunk_size: Characters read at a time
+
+    Returns:
+        Iterator over the decoded elements
+    """
+    reader = _Reader(f, chunk_size)
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+    else:
+        while True:
+            yield reader.scan()
+            if reader.peek() == ']':
+                reader.pos += 1
+                break
+            reader.expect(',')
+    if not reader.at_end():
+        raise ValueError(f"Extra data after the JSON document at offset {reader.pos}")
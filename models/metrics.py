@@ -0,0 +1,280 @@
+"""Metrics - Opt-in call counts, latency percentiles, payload sizes and profiling"""
+
+import functools
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# logging and cProfile are imported when a log file or a profile is asked for
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with constant memory
+
+    Buckets are SUB_BUCKETS per doubling from 1 µs, so a percentile is
+    reported to within about 20% of the true value, however many samples
+    were recorded.
+    """
+
+    SUB_BUCKETS = 4
+    # 2**31 µs (about 36 minutes) and above share the last bucket
+    BUCKETS = 31 * SUB_BUCKETS + 1
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        """Record one latency"""
+        micros = seconds * 1e6
+        index = 0 if micros <= 1 else min(int(math.log2(micros) * self.SUB_BUCKETS) + 1, self.BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th percentile
+
+        Args:
+            q: Percentile between 0 and 100
+
+        Returns:
+            Latency in seconds (0 without samples)
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(2 ** (index / self.SUB_BUCKETS) / 1e6, self.max)
+        return self.max
+
+
+class _CallStats:
+    """Counters for one instrumented call name"""
+
+    __slots__ = ('latency', 'errors', 'bytes_total', 'bytes_max', 'bytes_last')
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.bytes_total = 0
+        self.bytes_max = 0
+        self.bytes_last = 0
+
+
+class Metrics:
+    """
+    Collects per-call latency and payload statistics
+
+    Nothing here runs unless a Metrics object is created: callers are only
+    wrapped (see instrument()) when metrics are enabled, and DataManager only
+    times loads and saves when it was given one.
+    """
+
+    def __init__(self, log_file: Optional[str] = None, log_max_bytes: int = 1024 * 1024, log_backups: int = 3):
+        """
+        Initialize metrics
+
+        Args:
+            log_file: Rotating log file receiving one JSON line per recorded call, none by default
+            log_max_bytes: Log size after which it is rotated
+            log_backups: Rotated log files kept
+        """
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _CallStats] = {}
+        self.started_at = datetime.now().isoformat()
+        self.log_file = log_file
+        self._logger = None
+        if log_file:
+            import logging
+            from logging.handlers import RotatingFileHandler
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            self._logger = logging.getLogger(f"commandnote.metrics.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(log_file, maxBytes=log_max_bytes, backupCount=log_backups,
+                                          encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger.addHandler(handler)
+        # Profiling of the next calls (see profile_next)
+        self._profile_lock = threading.Lock()
+        self._profiler = None
+        self._profile_remaining = 0
+        self._profile_path: Optional[str] = None
+        self.last_profile: Optional[str] = None
+
+    def record(self, name: str, seconds: float, size: Optional[int] = None, error: bool = False) -> None:
+        """
+        Record one call
+
+        Args:
+            name: Call name, such as "api.get_tree" or "data.save"
+            seconds: Duration
+            size: Serialized payload size in bytes, if known
+            error: Whether the call failed
+        """
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _CallStats()
+            stats.latency.add(seconds)
+            if error:
+                stats.errors += 1
+            if size is not None:
+                stats.bytes_total += size
+                stats.bytes_last = size
+                if size > stats.bytes_max:
+                    stats.bytes_max = size
+        if self._logger is not None:
+            entry = {'at': datetime.now().isoformat(), 'call': name, 'ms': round(seconds * 1000, 3)}
+            if size is not None:
+                entry['bytes'] = size
+            if error:
+                entry['error'] = True
+            self._logger.info(json.dumps(entry))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the statistics of every call name
+
+        Returns:
+            Per call: count, errors, mean/p50/p95/p99/max latency in milliseconds
+            and total/max/last payload bytes
+        """
+        with self._lock:
+            calls = {}
+            for name, stats in sorted(self._stats.items()):
+                latency = stats.latency
+                calls[name] = {
+                    'count': latency.count,
+                    'errors': stats.errors,
+                    'mean_ms': latency.total / latency.count * 1000 if latency.count else 0.0,
+                    'p50_ms': latency.percentile(50) * 1000,
+                    'p95_ms': latency.percentile(95) * 1000,
+                    'p99_ms': latency.percentile(99) * 1000,
+                    'max_ms': latency.max * 1000,
+                    'bytes_total': stats.bytes_total,
+                    'bytes_max': stats.bytes_max,
+                    'bytes_last': stats.bytes_last,
+                }
+        return {
+            'since': self.started_at,
+            'calls': calls,
+            'log_file': self.log_file,
+            'profiling_calls_left': self._profile_remaining,
+            'last_profile': self.last_profile,
+        }
+
+    def reset(self) -> None:
+        """Drop all recorded statistics"""
+        with self._lock:
+            self._stats.clear()
+            self.started_at = datetime.now().isoformat()
+
+    # ========== Profiling ==========
+
+    def profile_next(self, calls: int, path: str) -> None:
+        """
+        Profile the next instrumented calls with cProfile
+
+        Args:
+            calls: Number of calls to profile
+            path: File the pstats data is written to once they are done
+        """
+        import cProfile
+        with self._profile_lock:
+            self._profiler = cProfile.Profile()
+            self._profile_remaining = calls
+            self._profile_path = path
+
+    def _profiled(self, func: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+        """Run a call under the profiler if a capture is pending (one call at a time)"""
+        if not self._profile_lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            profiler = self._profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                self._profile_remaining -= 1
+                if self._profile_remaining <= 0:
+                    os.makedirs(os.path.dirname(os.path.abspath(self._profile_path)), exist_ok=True)
+                    profiler.dump_stats(self._profile_path)
+                    self.last_profile = self._profile_path
+                    self._profiler = None
+        finally:
+            self._profile_lock.release()
+
+
+def payload_size(result: Any) -> Optional[int]:
+    """Size of a result serialized the way the JS bridge sends it (None if not JSON)"""
+    try:
+        return len(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+    except (TypeError, ValueError):
+        return None
+
+
+def instrument(metrics: Metrics, name: str, func: Callable[..., Any],
+               measure_payload: bool = True) -> Callable[..., Any]:
+    """
+    Wrap a callable so every call is recorded
+
+    A call counts as failed if it raises, or returns {"success": False, ...}
+    (the error form of the JS bridge).
+
+    Args:
+        metrics: Metrics to record into
+        name: Call name
+        func: Callable to wrap
+        measure_payload: Whether to serialize the result to measure its size
+
+    Returns:
+        Wrapped callable
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            if metrics._profiler is not None:
+                result = metrics._profiled(func, args, kwargs)
+            else:
+                result = func(*args, **kwargs)
+        except BaseException:
+            metrics.record(name, time.perf_counter() - start, error=True)
+            raise
+        elapsed = time.perf_counter() - start
+        error = isinstance(result, dict) and result.get('success') is False
+        metrics.record(name, elapsed, payload_size(result) if measure_payload else None, error)
+        return result
+    return wrapper
+
+
+def instrument_methods(metrics: Metrics, obj: Any, names: List[str], prefix: str) -> None:
+    """
+    Replace methods of an object by instrumented versions (instance attributes)
+
+    Args:
+        metrics: Metrics to record into
+        obj: Object whose methods are wrapped
+        names: Method names
+        prefix: Prefix of the recorded call names
+    """
+    for name in names:
+        setattr(obj, name, instrument(metrics, f"{prefix}.{name}", getattr(obj, name)))
@@ -0,0 +1,151 @@
+"""Node Index - Id index and parent map for the command tree"""
+
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .command_node import CommandNode
+
+
+class TreeListener:
+    """
+    Base class for objects that follow tree changes (search index, journal, ...).
+    Subclasses override the events they care about.
+    """
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        """The whole tree was replaced"""
+
+    def node_added(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        """A node (and its subtree) was added under parent"""
+
+    def node_removed(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        """A node (and its subtree) was removed from parent"""
+
+    def node_moved(self, node: 'CommandNode', old_parent: 'CommandNode', new_parent: 'CommandNode') -> None:
+        """A node (and its subtree) was moved between folders"""
+
+    def node_updated(self, node: 'CommandNode') -> None:
+        """Fields of a node (name, content, description) were changed"""
+
+
+class NodeIndex:
+    """
+    Id -> node and id -> parent lookup tables for one tree.
+
+    The index is kept up to date by CommandNode.add_child / remove_child /
+    detach_child, so lookups never need to walk the tree. Registered
+    TreeListeners are notified of every structural change.
+    """
+
+    def __init__(self):
+        """Initialize empty index"""
+        self.nodes: Dict[str, 'CommandNode'] = {}
+        self.parents: Dict[str, 'CommandNode'] = {}
+        self.listeners: List[TreeListener] = []
+        # Shared command bodies written by reference (a BlobStore, set by the JSON storage)
+        self.blobs: Optional[Any] = None
+        # Parents of nodes detached for a move, until they are re-attached
+        self._detached_from: Dict[str, 'CommandNode'] = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.nodes
+
+    # ========== Building ==========
+
+    def build(self, root: 'CommandNode') -> None:
+        """
+        Rebuild the index from a root node
+
+        Args:
+            root: Root node of the tree
+        """
+        self.nodes.clear()
+        self.parents.clear()
+        self._detached_from.clear()
+        self._register(root, None)
+        for listener in self.listeners:
+            listener.tree_reset(root)
+
+    def _register(self, node: 'CommandNode', parent: Optional['CommandNode']) -> None:
+        """Register a subtree (iterative, so deep trees do not hit the recursion limit)"""
+        stack = [(node, parent)]
+        while stack:
+            current, current_parent = stack.pop()
+            current._index = self
+            self.nodes[current.id] = current
+            if current_parent is not None:
+                self.parents[current.id] = current_parent
+            for child in current.children:
+                stack.append((child, current))
+
+    def register_loaded(self, parent: 'CommandNode', children: List['CommandNode']) -> None:
+        """Register children loaded lazily from storage (no listener events: they are not new)"""
+        for child in children:
+            self._register(child, parent)
+
+    # ========== Maintenance (called by CommandNode) ==========
+
+    def attach(self, parent: 'CommandNode', child: 'CommandNode') -> None:
+        """
+        Record that child was added under parent
+
+        A child that is still indexed (detached for a move) only has its parent
+        entry updated; a new subtree is registered node by node.
+        """
+        if self.nodes.get(child.id) is child:
+            self.parents[child.id] = parent
+            old_parent = self._detached_from.pop(child.id, None)
+            for listener in self.listeners:
+                listener.node_moved(child, old_parent, parent)
+        else:
+            self._register(child, parent)
+            for listener in self.listeners:
+                listener.node_added(child, parent)
+
+    def detach(self, parent: 'CommandNode', child: 'CommandNode') -> None:
+        """Record that child was taken out of parent but stays indexed"""
+        self.parents.pop(child.id, None)
+        self._detached_from[child.id] = parent
+
+    def discard(self, parent: 'CommandNode', child: 'CommandNode') -> None:
+        """Remove a subtree from the index"""
+        for listener in self.listeners:
+            listener.node_removed(child, parent)
+        stack = [child]
+        while stack:
+            current = stack.pop()
+            if self.nodes.get(current.id) is current:
+                del self.nodes[current.id]
+            self.parents.pop(current.id, None)
+            current._index = None
+            stack.extend(current.children)
+
+    def touch(self, node: 'CommandNode') -> None:
+        """Record that fields of node were changed"""
+        node.invalidate()
+        for listener in self.listeners:
+            listener.node_updated(node)
+
+    # ========== Queries ==========
+
+    def get(self, node_id: str) -> Optional['CommandNode']:
+        """Get node by ID"""
+        return self.nodes.get(node_id)
+
+    def get_parent(self, node_id: str) -> Optional['CommandNode']:
+        """Get parent node by child ID"""
+        return self.parents.get(node_id)
+
+    def iter_ancestors(self, node_id: str) -> Iterator['CommandNode']:
+        """Iterate over ancestors from the direct parent up to the root"""
+        parent = self.parents.get(node_id)
+        while parent is not None:
+            yield parent
+            parent = self.parents.get(parent.id)
+
+    def is_ancestor(self, ancestor_id: str, node_id: str) -> bool:
+        """Check whether ancestor_id is a strict ancestor of node_id (O(depth))"""
+        return any(parent.id == ancestor_id for parent in self.iter_ancestors(node_id))
@@ -0,0 +1,21 @@
+"""Paths - Default locations of the data files"""
+
+import sys
+from pathlib import Path
+
+
+def default_data_dir() -> Path:
+    """Directory of the data files: data/ next to the executable, or in the project directory"""
+    # Check if running as executable (bundled by PyInstaller)
+    if getattr(sys, 'frozen', False):
+        # Running as exe, use the directory containing the exe
+        base_dir = Path(sys.executable).parent
+    else:
+        # Running as script, use project root directory
+        base_dir = Path(__file__).parent.parent
+    return base_dir / "data"
+
+
+def default_data_file() -> str:
+    """Default data file path (data/commands.json)"""
+    return str(default_data_dir() / "commands.json")
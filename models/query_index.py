@@ -0,0 +1,146 @@
+"""Query Index - On-disk copy of the JSON data that can be searched without loading it"""
+
+import json
+import os
+import sqlite3
+import tempfile
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from .command_node import CommandNode
+from .fileio import file_fingerprint, files_hash, replacement_mode
+from .search_index import fuzzy_tables
+from .sqlite_storage import SqliteStorage
+
+_META_SCHEMA = "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+
+# Bumped when the index layout changes; indexes of other versions are rebuilt
+FORMAT = 2
+
+
+def query_index_path(data_file: str) -> str:
+    """Query index file of a data file"""
+    return data_file + ".index.sqlite3"
+
+
+def _command_rows(root: CommandNode) -> Iterator[Tuple[str, str, str, str]]:
+    """(node_id, name, description, content) of every command, in tree order"""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.is_command():
+            yield node.id, node.name, node.description, node.content
+        stack.extend(reversed(node.children))
+
+
+class QueryIndex:
+    """
+    SQLite copy of the JSON data (the SqliteStorage layout: adjacency table plus
+    FTS5 trigram table, and the tables of a fuzzy search index) used by the
+    command line, which opens it as a lazy storage backend instead of loading
+    and indexing the whole tree.
+
+    The index records the size, modification time and content hash of the files
+    it was built from. When the size or mtime differ it hashes the files again,
+    and is only rebuilt if the content changed.
+    """
+
+    def __init__(self, data_file: str, source_files: List[str], index_file: Optional[str] = None):
+        """
+        Initialize query index
+
+        Args:
+            data_file: JSON data file path
+            source_files: Files the data is read from (see Storage.files)
+            index_file: Index database path, defaults to "<data_file>.index.sqlite3"
+        """
+        self.data_file = data_file
+        self.source_files = source_files
+        self.index_file = index_file or query_index_path(data_file)
+
+    def is_current(self) -> bool:
+        """
+        Check the index against the source files (updating the recorded mtimes if
+        only those changed)
+
+        Returns:
+            Whether the index reflects the current data
+        """
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            conn = sqlite3.connect(self.index_file)
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+                if meta.get('format') != str(FORMAT):
+                    return False
+                fingerprint = file_fingerprint(self.source_files)
+                if json.loads(meta.get('sources', 'null')) == fingerprint:
+                    return True
+                if meta.get('hash') != files_hash(self.source_files):
+                    return False
+                # Touched but unchanged (copied, saved without edits)
+                with conn:
+                    conn.execute("UPDATE meta SET value = ? WHERE key = 'sources'", (json.dumps(fingerprint),))
+                return True
+            finally:
+                conn.close()
+        except (sqlite3.Error, ValueError):
+            return False
+
+    def source_state(self) -> Tuple[List[Any], str]:
+        """Fingerprint and content hash of the source files"""
+        return file_fingerprint(self.source_files), files_hash(self.source_files)
+
+    def rebuild(self, root: CommandNode, state: Optional[Tuple[List[Any], str]] = None) -> None:
+        """
+        Replace the index with the content of a tree
+
+        The new index is written next to the old one and renamed over it, so
+        concurrent readers see either of them.
+
+        Args:
+            root: Root node of the current data
+            state: source_state() taken before the tree was read, defaults to the current one
+        """
+        fingerprint, content_hash = state or self.source_state()
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.index_file) + ".", suffix=".tmp",
+                                        dir=directory)
+        os.close(fd)
+        try:
+            os.chmod(tmp_path, replacement_mode(self.index_file))
+            storage = SqliteStorage(tmp_path, journal_mode="DELETE")
+            try:
+                storage.write_tree(root)
+                storage.write_fuzzy_tables(fuzzy_tables(_command_rows(root)))
+                with storage.conn:
+                    storage.conn.execute(_META_SCHEMA)
+                    storage.conn.executemany(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        [('format', str(FORMAT)), ('sources', json.dumps(fingerprint)), ('hash', content_hash)]
+                    )
+            finally:
+                storage.conn.close()
+            os.replace(tmp_path, self.index_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def open_storage(self, load_root: Callable[[], CommandNode]) -> SqliteStorage:
+        """
+        Open the index as a storage backend, rebuilding it first if it is stale
+
+        Args:
+            load_root: Loads the current tree from the source files (only called to rebuild)
+
+        Returns:
+            Storage for a DataManager (reading only: changes are not written back to the JSON data)
+        """
+        if not self.is_current():
+            # Taken first, so that a change made while loading leaves the index stale rather than wrong
+            state = self.source_state()
+            self.rebuild(load_root(), state)
+        return SqliteStorage(self.index_file, journal_mode="DELETE")
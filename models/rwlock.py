@@ -0,0 +1,109 @@
+"""Read/Write Lock - Shared reads, exclusive writes for the command tree"""
+
+import threading
+
+
+class _LockSide:
+    """One side of a ReadWriteLock, usable as a context manager"""
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self) -> None:
+        self.acquire()
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class ReadWriteLock:
+    """
+    Any number of readers, or a single writer
+
+    Readers and writers take turns: once a writer waits, new readers queue
+    behind it, and when a writer is done the readers that were waiting for it
+    go in before the next writer. A steady stream of either side cannot starve
+    the other.
+
+    Both sides are reentrant, and the writing thread may also take the read
+    side. A thread that only holds the read side cannot take the write side:
+    two readers upgrading would wait for each other forever, so this raises
+    RuntimeError instead.
+
+    Use the read_lock and write_lock attributes, e.g. "with lock.read_lock:".
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        # Threads holding the read side
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        # Readers let in ahead of waiting writers when the last writer finished
+        self._read_passes = 0
+        # Read depth of the current thread
+        self._local = threading.local()
+        self.read_lock = _LockSide(self.acquire_read, self.release_read)
+        self.write_lock = _LockSide(self.acquire_write, self.release_write)
+
+    def acquire_read(self) -> None:
+        """Take the read side (waits while a writer holds or waits for the lock)"""
+        depth = getattr(self._local, 'depth', 0)
+        with self._cond:
+            if not depth:
+                # Re-entrant reads and reads by the writer must not queue behind waiting writers
+                if self._writer != threading.get_ident() and (self._writer is not None or self._waiting_writers):
+                    self._waiting_readers += 1
+                    try:
+                        while self._writer is not None or (self._waiting_writers and not self._read_passes):
+                            self._cond.wait()
+                    finally:
+                        self._waiting_readers -= 1
+                    if self._read_passes:
+                        self._read_passes -= 1
+                self._readers += 1
+        self._local.depth = depth + 1
+
+    def release_read(self) -> None:
+        """Release the read side"""
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            raise RuntimeError("Releasing a read lock that is not held")
+        self._local.depth = depth - 1
+        if depth == 1:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        """Take the write side (waits until no other thread reads or writes)"""
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, 'depth', 0):
+            raise RuntimeError("Cannot take the write lock while holding the read lock")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers or self._read_passes:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self) -> None:
+        """Release the write side"""
+        if self._writer != threading.get_ident():
+            raise RuntimeError("Releasing a write lock that is not held")
+        self._write_depth -= 1
+        if not self._write_depth:
+            with self._cond:
+                self._writer = None
+                self._read_passes = self._waiting_readers
+                self._cond.notify_all()
@@ -0,0 +1,774 @@
+"""Search Index - Incremental in-memory index for command search"""
+
+import heapq
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from bisect import bisect_right
+from functools import partial
+from itertools import accumulate, chain
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+
+from .fuzzy import (SCORE_MATCH, deletions, edit_distance, is_transposition, max_score, max_typos, score_positions,
+                    subsequence_pattern, subsequence_positions, to_ranges, word_start_pattern)
+from .node_index import TreeListener
+
+if TYPE_CHECKING:
+    from .command_node import CommandNode
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Field weights used for ranking: name matches above description above content
+NAME_SCORE = 300
+DESCRIPTION_SCORE = 200
+CONTENT_SCORE = 100
+
+# Fuzzy results come in tiers, best first; within a tier they are ranked by
+# match quality (subsequence score, then shorter text)
+TIER_NAME_PREFIX = 8
+TIER_NAME_EXACT = 7
+TIER_NAME_SUBSEQUENCE = 6
+TIER_DESCRIPTION_EXACT = 5
+TIER_CONTENT_EXACT = 4
+TIER_NAME_TYPO = 3
+TIER_DESCRIPTION_SUBSEQUENCE = 2
+TIER_CONTENT_SUBSEQUENCE = 1
+# Score span of one tier (above any match quality)
+_TIER_SPAN = 1 << 24
+# Longest keyword searched fuzzily (longer ones are only searched as they are)
+MAX_FUZZY_KEYWORD = 256
+# Subsequence matches in descriptions and contents must lie within this many
+# characters per keyword character, or long texts would match almost anything
+COMPACT_SPAN = 3
+# Name tokens shorter than this are not matched with typos
+TYPO_MIN_TOKEN = 3
+# Candidates scanned between two looks at the cancel flag
+_CANCEL_CHECK_INTERVAL = 1024
+# Recent fuzzy keywords whose candidate documents are kept for refining
+REFINEMENT_CACHE_SIZE = 8
+# Largest candidate set kept: collecting a bigger one costs more than refining it saves
+MAX_REFINEMENT_CANDIDATES = 5000
+# Keyword characters a candidate set stays usable for: it is collected with
+# description and content gaps wide enough for the compact matches of a
+# keyword this much longer
+REFINEMENT_LOOKAHEAD = 4
+
+# Document field numbers (see SearchIndex._docs) and the names results report
+NAME, DESCRIPTION, CONTENT = 1, 2, 3
+FIELD_NAMES = {NAME: 'name', DESCRIPTION: 'description', CONTENT: 'content'}
+
+# Saved form of a fuzzy-only index (see fuzzy_tables): node IDs in document
+# order; per field (name, description, content) the lowercased texts joined by
+# newlines, one line per document, and the offset each line starts at; and the
+# documents of each name token
+FuzzyTables = Tuple[List[str], List[Tuple[str, array]], Dict[str, array]]
+
+
+class SearchCancelled(Exception):
+    """Raised by a search whose cancel flag was set while it ran"""
+
+
+def tokenize(text: str) -> Set[str]:
+    """Split lowercased text into word tokens"""
+    return set(_TOKEN_RE.findall(text))
+
+
+def trigrams(text: str) -> Set[str]:
+    """Get the set of 3-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fuzzy_tables(rows: Iterable[Tuple[str, str, str, str]]) -> FuzzyTables:
+    """
+    Build the saved form of a fuzzy-only index, which StorageSearchIndex.from_tables()
+    loads without indexing every command again
+
+    Newlines in the fields become spaces, as in the blobs fuzzy searches scan
+    (which matches the same documents at the same positions).
+
+    Args:
+        rows: (node_id, name, description, content) of each command, IDs unique
+
+    Returns:
+        The tables
+    """
+    ids: List[str] = []
+    fields: Tuple[List[str], List[str], List[str]] = ([], [], [])
+    name_tokens: Dict[str, array] = {}
+    for docno, (node_id, name, description, content) in enumerate(rows):
+        ids.append(node_id)
+        name = name.lower().replace('\n', ' ')
+        fields[0].append(name)
+        fields[1].append(description.lower().replace('\n', ' '))
+        fields[2].append(content.lower().replace('\n', ' '))
+        for token in tokenize(name):
+            docnos = name_tokens.get(token)
+            if docnos is None:
+                docnos = name_tokens[token] = array('I')
+            docnos.append(docno)
+    blobs = [("\n".join(texts), array('q', accumulate((len(text) + 1 for text in texts), initial=0)))
+             for texts in fields]
+    return ids, blobs, name_tokens
+
+
+class SearchIndex(TreeListener):
+    """
+    Token postings plus a trigram index over command name, description and content.
+
+    Every command gets a document number. Trigram postings are append-only
+    arrays of document numbers; removed or updated commands leave a dead
+    document behind that is skipped at query time and dropped by compact().
+    The index follows the tree through TreeListener events, so it is never
+    rebuilt on a mutation.
+
+    Fuzzy search (fuzzy_search) scans one newline-separated string per field
+    with C-level str.find and regular expressions instead of looping over the
+    documents in Python, plus a deletion index over name tokens for typos.
+    Both are built on the first fuzzy search; the strings are rebuilt after
+    changes, the deletion index follows them. The candidate documents of
+    recent keywords are kept to refine the next keystrokes' searches, until
+    the next change.
+    """
+
+    def __init__(self, postings: bool = True):
+        """
+        Initialize empty index
+
+        Args:
+            postings: Keep the token and trigram postings search() needs; an index
+                      only used for fuzzy_search() is much faster to fill without them
+        """
+        self.postings = postings
+        # docno -> (node_id, name, description, content), lowercased; None when dead
+        self._docs: List[Optional[Tuple[str, str, str, str]]] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._tokens: Dict[str, Set[int]] = {}
+        self._trigrams: Dict[str, array] = {}
+        self._dead = 0
+        # Name token -> docnos, and (once built) token or token minus one character -> tokens
+        self._name_tokens: Dict[str, Set[int]] = {}
+        self._typo_keys: Optional[Dict[str, Set[str]]] = None
+        # Per field: all documents joined by newlines, and the offset each document starts at
+        self._blobs: Optional[List[Tuple[str, List[int]]]] = None
+        # Keyword characters -> (window, docnos) of the candidate sets, most recent last
+        self._refinements: 'OrderedDict[str, Tuple[int, List[int]]]' = OrderedDict()
+        self._refinements_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    # ========== Maintenance ==========
+
+    def rebuild(self, root: 'CommandNode') -> None:
+        """
+        Rebuild the index from a root node
+
+        Args:
+            root: Root node of the tree
+        """
+        self._docs.clear()
+        self._doc_ids.clear()
+        self._tokens.clear()
+        self._trigrams.clear()
+        self._dead = 0
+        self._name_tokens.clear()
+        self._typo_keys = None
+        self._fuzzy_changed()
+        self._add_subtree(root)
+
+    def add(self, node: 'CommandNode') -> None:
+        """Index a single command node"""
+        if not node.is_command():
+            return
+        if node.id in self._doc_ids:
+            self.remove(node.id)
+
+        self._insert(node.id, node.name.lower(), node.description.lower(), node.content.lower())
+
+    def add_rows(self, rows: Iterable[Tuple[str, str, str, str]]) -> None:
+        """
+        Index commands read from storage rather than from the tree
+
+        Args:
+            rows: (node_id, name, description, content) of each command
+        """
+        for node_id, name, description, content in rows:
+            if node_id in self._doc_ids:
+                self.remove(node_id)
+            self._insert(node_id, name.lower(), description.lower(), content.lower())
+
+    def _insert(self, node_id: str, name: str, description: str, content: str) -> None:
+        """Append a document and its postings"""
+        docno = len(self._docs)
+        self._docs.append((node_id, name, description, content))
+        self._doc_ids[node_id] = docno
+
+        if self.postings:
+            for field_text in (name, description, content):
+                for token in tokenize(field_text):
+                    self._tokens.setdefault(token, set()).add(docno)
+            for gram in trigrams(name) | trigrams(description) | trigrams(content):
+                postings = self._trigrams.get(gram)
+                if postings is None:
+                    postings = self._trigrams[gram] = array('I')
+                postings.append(docno)
+        for token in tokenize(name):
+            docnos = self._name_tokens.get(token)
+            if docnos is None:
+                docnos = self._name_tokens[token] = set()
+                if self._typo_keys is not None:
+                    _add_typo_keys(self._typo_keys, token)
+            docnos.add(docno)
+        self._fuzzy_changed()
+
+    def remove(self, node_id: str) -> None:
+        """Remove a single command node from the index"""
+        docno = self._doc_ids.pop(node_id, None)
+        if docno is None:
+            return
+        _, name, description, content = self._docs[docno]
+        for field_text in (name, description, content) if self.postings else ():
+            for token in tokenize(field_text):
+                postings = self._tokens.get(token)
+                if postings is not None:
+                    postings.discard(docno)
+                    if not postings:
+                        del self._tokens[token]
+        for token in tokenize(name):
+            docnos = self._name_tokens.get(token)
+            if docnos is not None:
+                docnos.discard(docno)
+                if not docnos:
+                    del self._name_tokens[token]
+                    if self._typo_keys is not None:
+                        _remove_typo_keys(self._typo_keys, token)
+        self._docs[docno] = None
+        self._dead += 1
+        self._fuzzy_changed()
+
+        if self._dead > 1024 and self._dead > len(self._doc_ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """Renumber live documents and drop dead entries from the postings"""
+        live = [doc for doc in self._docs if doc is not None]
+        self._docs.clear()
+        self._doc_ids.clear()
+        self._tokens.clear()
+        self._trigrams.clear()
+        self._dead = 0
+        self._name_tokens.clear()
+        self._typo_keys = None
+        self._fuzzy_changed()
+        for doc in live:
+            self._insert(*doc)
+
+    def _fuzzy_changed(self) -> None:
+        """Drop the fuzzy search data derived from the documents"""
+        self._blobs = None
+        self._refinements.clear()
+
+    def _add_subtree(self, node: 'CommandNode') -> None:
+        """Index all commands of a subtree"""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.add(current)
+            stack.extend(current.children)
+
+    def _remove_subtree(self, node: 'CommandNode') -> None:
+        """Remove all commands of a subtree"""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.remove(current.id)
+            stack.extend(current.children)
+
+    # ========== TreeListener ==========
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        self.rebuild(root)
+
+    def node_added(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        self._add_subtree(node)
+
+    def node_removed(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        self._remove_subtree(node)
+
+    def node_updated(self, node: 'CommandNode') -> None:
+        self.add(node)
+
+    # ========== Queries ==========
+
+    def _candidates(self, keyword: str):
+        """Document numbers that may contain keyword (a superset of the matches)"""
+        if len(keyword) < 3:
+            return range(len(self._docs))
+
+        rarest = None
+        for gram in trigrams(keyword):
+            postings = self._trigrams.get(gram)
+            if postings is None:
+                return ()
+            if rarest is None or len(postings) < len(rarest):
+                rarest = postings
+        return rarest
+
+    def search(self, keyword: str, limit: Optional[int] = None,
+               within: Optional[Collection[str]] = None) -> List[str]:
+        """
+        Search commands whose name, description or content contains keyword
+
+        Args:
+            keyword: Search keyword (case-insensitive substring)
+            limit: Maximum number of results, defaults to all matches
+            within: IDs results must be among (the nodes of a folder), defaults to all
+
+        Returns:
+            Matching node IDs, best match first
+        """
+        keyword = keyword.lower()
+        if not keyword:
+            return []
+
+        whole_token = self._tokens.get(keyword, ())
+        candidates = self._candidates(keyword)
+        if within is not None:
+            if len(within) < len(candidates) // 2:
+                # A small folder: look at its commands only
+                # (in document order: walking the documents in tree order is slower)
+                candidates = sorted(docno for docno in map(self._doc_ids.get, within) if docno is not None)
+                within = None
+            else:
+                within = set(within)
+        scored = []
+        for docno in candidates:
+            doc = self._docs[docno]
+            if doc is None:
+                continue
+            node_id, name, description, content = doc
+            if within is not None and node_id not in within:
+                continue
+
+            score = 0
+            if keyword in name:
+                score = NAME_SCORE
+                if name == keyword:
+                    score += 100
+                elif name.startswith(keyword):
+                    score += 50
+            elif keyword in description:
+                score = DESCRIPTION_SCORE
+            elif keyword in content:
+                score = CONTENT_SCORE
+            else:
+                continue
+            if docno in whole_token:
+                score += 25
+
+            scored.append((-score, name, docno, node_id))
+
+        if limit is not None:
+            scored = heapq.nsmallest(limit, scored)
+        else:
+            scored.sort()
+        return [node_id for _, _, _, node_id in scored]
+
+    # ========== Fuzzy Search ==========
+
+    def fuzzy_search(self, keyword: str, limit: Optional[int] = None, cancel=None,
+                     within: Optional[Collection[str]] = None) -> List[Tuple[str, str, List[Tuple[int, int]]]]:
+        """
+        Typo-tolerant search, best match first (all batches of iter_fuzzy_search)
+
+        Args:
+            keyword: Search keyword (case-insensitive)
+            limit: Maximum number of results, defaults to all matches
+            cancel: Object with an is_set() method (threading.Event); when it is
+                    set, the search stops with SearchCancelled
+            within: IDs results must be among (the nodes of a folder), defaults to all
+
+        Returns:
+            (node_id, field, ranges) of the matches (see iter_fuzzy_search)
+        """
+        return [result for batch in self.iter_fuzzy_search(keyword, limit, cancel, within) for result in batch]
+
+    def iter_fuzzy_search(self, keyword: str, limit: Optional[int] = None, cancel=None,
+                          within: Optional[Collection[str]] = None
+                          ) -> Iterator[List[Tuple[str, str, List[Tuple[int, int]]]]]:
+        """
+        Typo-tolerant search, yielding batches of results as their rank becomes final
+
+        Commands match in tiers: keyword at a word start in the name, anywhere
+        in the name, keyword characters in order in the name (like fzf,
+        whitespace ignored), keyword in the description, in the content, a name
+        word within max_typos() edits of the keyword (one swap of neighbouring
+        characters for 3-character keywords), then keyword characters close
+        together in the description or content. Within a tier, matches at word
+        starts and in runs rank higher, then shorter texts.
+
+        The best limit results are kept in a heap. Tiers are searched best
+        first, and the search stops once the heap holds limit results of
+        better tiers than the next one. Results kept after a tier can no longer
+        be displaced, so each tier's are yielded as soon as it is done.
+
+        The candidate documents of the last few keywords are remembered: those
+        with the keyword characters in order in the name, or in the description
+        or content with gaps of at most a window sized for a few more
+        characters. They include every match but typo ones of any keyword whose
+        characters include these in order and that fits the window, such as the
+        next keystrokes, which are then only looked for in those documents.
+
+        Args:
+            keyword: Search keyword (case-insensitive)
+            limit: Maximum number of results, defaults to all matches
+            cancel: Object with an is_set() method (threading.Event); when it is
+                    set, the search stops with SearchCancelled
+            within: IDs results must be among (the nodes of a folder), defaults to all
+
+        Yields:
+            Lists of (node_id, field, ranges), best first across all batches:
+            the field the match was found in ("name", "description" or
+            "content") and the matched [start, end) character ranges in it
+        """
+        keyword = keyword.lower().replace('\n', ' ')
+        pattern = "".join(keyword.split())
+        if not pattern:
+            return
+        # docnos of the lines of the blobs searched, None when they hold every document
+        docnos = self._refinement_candidates(pattern, max(len(keyword), COMPACT_SPAN * len(pattern)))
+        # A small folder: only its commands are scanned (and they are no candidate set to remember)
+        scoped = within is not None and len(within) < (len(self._doc_ids) if docnos is None else len(docnos)) // 2
+        if scoped:
+            docnos = sorted(docno for docno in map(self._doc_ids.get, within) if docno is not None)
+        elif within is not None:
+            within = set(within)
+        blobs = self._fuzzy_blobs() if docnos is None else self._join_fields([self._docs[d] for d in docnos])
+
+        tiers = [
+            (TIER_NAME_PREFIX, lambda: self._exact_matches(blobs, docnos, NAME, keyword, True, cancel)),
+            (TIER_NAME_EXACT, lambda: self._exact_matches(blobs, docnos, NAME, keyword, False, cancel)),
+            (TIER_NAME_SUBSEQUENCE, lambda: self._subsequence_matches(blobs, docnos, NAME, pattern, False, cancel)),
+            (TIER_DESCRIPTION_EXACT, lambda: self._exact_matches(blobs, docnos, DESCRIPTION, keyword, None, cancel)),
+            (TIER_CONTENT_EXACT, lambda: self._exact_matches(blobs, docnos, CONTENT, keyword, None, cancel)),
+            (TIER_NAME_TYPO, lambda: self._typo_matches(keyword, cancel)),
+            (TIER_DESCRIPTION_SUBSEQUENCE,
+             lambda: self._subsequence_matches(blobs, docnos, DESCRIPTION, pattern, True, cancel)),
+            (TIER_CONTENT_SUBSEQUENCE, lambda: self._subsequence_matches(blobs, docnos, CONTENT, pattern, True, cancel)),
+        ]
+        if len(keyword) > MAX_FUZZY_KEYWORD:
+            # Too long to be typed: only look for it as is
+            tiers = [tier for tier in tiers if tier[0] in (TIER_NAME_PREFIX, TIER_NAME_EXACT, TIER_DESCRIPTION_EXACT,
+                                                           TIER_CONTENT_EXACT)]
+        # Min-heap of (score, -docno, docno, field, positions): the weakest kept result on top
+        heap: List[Tuple[int, int, int, int, Sequence[int]]] = []
+        seen: Set[int] = set()
+        for tier, matches in tiers:
+            if cancel is not None and cancel.is_set():
+                raise SearchCancelled()
+            if limit is not None and len(heap) >= limit and heap[0][0] >= (tier + 1) * _TIER_SPAN:
+                # Nothing in this tier or below can displace a kept result
+                break
+            for docno, field, positions, quality in matches():
+                if docno in seen:
+                    continue
+                seen.add(docno)
+                if within is not None and self._docs[docno][0] not in within:
+                    continue
+                item = (tier * _TIER_SPAN + quality, -docno, docno, field, positions)
+                if limit is None or len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            batch = sorted((item for item in heap if item[0] >= tier * _TIER_SPAN and item[0] < (tier + 1) * _TIER_SPAN),
+                           reverse=True)
+            if batch:
+                yield [(self._docs[docno][0], FIELD_NAMES[field], to_ranges(positions))
+                       for _, _, docno, field, positions in batch]
+
+        # Collected last, when every result is out
+        if scoped:
+            return
+        window = COMPACT_SPAN * (len(pattern) + REFINEMENT_LOOKAHEAD)
+        lines = self._candidate_lines(blobs, pattern, window, cancel)
+        if lines is not None:
+            self._remember_refinement(pattern, window, lines if docnos is None else [docnos[line] for line in lines])
+
+    def _refinement_candidates(self, pattern: str, span: int) -> Optional[List[int]]:
+        """
+        Smallest remembered candidate set that holds the matches of a keyword
+
+        Args:
+            pattern: Keyword characters
+            span: Widest description or content match the keyword can have
+        """
+        best = None
+        with self._refinements_lock:
+            for cached, (window, docnos) in self._refinements.items():
+                if span <= window and (best is None or len(docnos) < len(best[1])) and \
+                        subsequence_positions(pattern, cached) is not None:
+                    best = cached, docnos
+            if best is None:
+                return None
+            self._refinements.move_to_end(best[0])
+            return best[1]
+
+    def _remember_refinement(self, pattern: str, window: int, docnos: List[int]) -> None:
+        """Keep the candidate set of a keyword, forgetting the least recently used"""
+        with self._refinements_lock:
+            self._refinements[pattern] = (window, docnos)
+            self._refinements.move_to_end(pattern)
+            while len(self._refinements) > REFINEMENT_CACHE_SIZE:
+                self._refinements.popitem(last=False)
+
+    def _fuzzy_blobs(self) -> List[Tuple[str, List[int]]]:
+        """Per field, every document joined by newlines and their start offsets (built on demand)"""
+        blobs = self._blobs
+        if blobs is None:
+            blobs = self._join_fields(self._docs)
+            # Concurrent readers may both build it; either result is current
+            self._blobs = blobs
+        return blobs
+
+    @staticmethod
+    def _join_fields(docs: Sequence[Optional[Tuple[str, str, str, str]]]) -> List[Tuple[str, List[int]]]:
+        """Per field, the documents joined by newlines (one line each) and the offset each line starts at"""
+        blobs = [("", [])]
+        for field in (NAME, DESCRIPTION, CONTENT):
+            texts = [doc[field].replace('\n', ' ') if doc is not None else '' for doc in docs]
+            starts = list(accumulate((len(text) + 1 for text in texts), initial=0))
+            blobs.append(("\n".join(texts), starts))
+        return blobs
+
+    @staticmethod
+    def _candidate_lines(blobs, pattern: str, window: int, cancel) -> Optional[List[int]]:
+        """
+        Lines of the blobs with the pattern characters in order in the name, or
+        in the description or content with at most window characters between
+        two of them
+
+        Returns:
+            Sorted line numbers, None if there are more than MAX_REFINEMENT_CANDIDATES
+        """
+        lines: Set[int] = set()
+        for field in (NAME, DESCRIPTION, CONTENT):
+            if cancel is not None and cancel.is_set():
+                raise SearchCancelled()
+            blob, starts = blobs[field]
+            search = subsequence_pattern(pattern, None if field == NAME else window).search
+            match = search(blob)
+            while match is not None:
+                line = bisect_right(starts, match.start()) - 1
+                lines.add(line)
+                if len(lines) > MAX_REFINEMENT_CANDIDATES:
+                    return None
+                match = search(blob, starts[line + 1])
+        return sorted(lines)
+
+    @staticmethod
+    def _quality(score: int, text: str) -> int:
+        """Rank within a tier: match score, then shorter text (spread-out matches may score below zero)"""
+        return (max(score, 0) << 8) | (255 - min(len(text), 255))
+
+    def _exact_matches(self, blobs, docnos: Optional[List[int]], field: int, keyword: str,
+                       word_start: Optional[bool], cancel) -> Iterator[Tuple[int, int, Sequence[int], int]]:
+        """
+        Documents containing keyword in a field
+
+        Args:
+            blobs: Result of _fuzzy_blobs() or _join_fields()
+            docnos: docno of each line of the blobs, None if they hold every document
+            field: Field to search
+            keyword: Lowercase keyword
+            word_start: True for occurrences at a word start only, False for the
+                        others, None for both (word starts first)
+            cancel: Cancel flag, or None
+        """
+        blob, starts = blobs[field]
+        if word_start is None:
+            yield from self._exact_matches(blobs, docnos, field, keyword, True, cancel)
+            word_start = False
+        if word_start:
+            search = word_start_pattern(keyword).search
+
+            def find(start: int) -> int:
+                match = search(blob, start)
+                return match.start() if match is not None else -1
+        else:
+            find = partial(blob.find, keyword)
+        length = len(keyword)
+        position = find(0)
+        scanned = 0
+        while position >= 0:
+            line = bisect_right(starts, position) - 1
+            docno = line if docnos is None else docnos[line]
+            text = self._docs[docno][field]
+            start = position - starts[line]
+            positions = range(start, start + length)
+            score = score_positions(text, positions)
+            if text == keyword:
+                score += max_score(length)
+            yield docno, field, positions, self._quality(score, text)
+            scanned += 1
+            if cancel is not None and not scanned % _CANCEL_CHECK_INTERVAL and cancel.is_set():
+                raise SearchCancelled()
+            position = find(starts[line + 1])
+
+    def _subsequence_matches(self, blobs, docnos: Optional[List[int]], field: int, pattern: str, compact: bool,
+                             cancel) -> Iterator[Tuple[int, int, Sequence[int], int]]:
+        """Documents containing the pattern characters in order in a field (close together if compact)"""
+        blob, starts = blobs[field]
+        span = COMPACT_SPAN * len(pattern)
+        search = subsequence_pattern(pattern, span - len(pattern) if compact else None).search
+        match = search(blob)
+        scanned = 0
+        while match is not None:
+            line = bisect_right(starts, match.start()) - 1
+            docno = line if docnos is None else docnos[line]
+            text = self._docs[docno][field]
+            # Tighten the occurrence the expression found
+            positions = subsequence_positions(text, pattern, match.end() - 1 - starts[line])
+            scanned += 1
+            if cancel is not None and not scanned % _CANCEL_CHECK_INTERVAL and cancel.is_set():
+                raise SearchCancelled()
+            if compact and positions[-1] - positions[0] >= span:
+                # Each gap fits but the whole does not: look for a tighter one in the same text
+                match = search(blob, match.start() + 1)
+                continue
+            yield docno, field, positions, self._quality(score_positions(text, positions), text)
+            match = search(blob, starts[line + 1])
+
+    def _typo_matches(self, keyword: str, cancel) -> Iterator[Tuple[int, int, Sequence[int], int]]:
+        """Documents with a name word a few edits away from a single-word keyword"""
+        limit = max_typos(len(keyword))
+        # Too short for edits, but long enough for a swap of neighbouring characters ("gti")
+        swaps_only = not limit and len(keyword) >= TYPO_MIN_TOKEN
+        if not (limit or swaps_only) or not keyword.isalnum():
+            return
+        keys = self._typo_index()
+        # Tokens sharing a one-deletion variant with the keyword are within one edit
+        # (or one transposition); for two edits, also try the keyword minus two characters
+        variants = set(chain([keyword], deletions(keyword)))
+        if limit > 1:
+            variants.update(chain.from_iterable(deletions(variant) for variant in list(variants)))
+        candidates: Set[str] = set()
+        for variant in variants:
+            candidates.update(keys.get(variant, ()))
+        for token in candidates:
+            if swaps_only:
+                distance = 1 if is_transposition(keyword, token) else None
+            else:
+                distance = edit_distance(keyword, token, limit)
+            if not distance:
+                # Too far, or an exact match already found in the first tier
+                continue
+            if cancel is not None and cancel.is_set():
+                raise SearchCancelled()
+            word = re.compile(word_start_pattern(token).pattern + r"(?![^\W_])")
+            for docno in list(self._name_tokens.get(token, ())):
+                text = self._docs[docno][NAME]
+                match = word.search(text)
+                start = match.start() if match is not None else text.find(token)
+                score = max_score(len(token)) - 2 * SCORE_MATCH * distance
+                yield docno, NAME, range(start, start + len(token)), self._quality(score, text)
+
+    def _typo_index(self) -> Dict[str, Set[str]]:
+        """Name tokens under themselves and their one-deletion variants (built on demand)"""
+        keys = self._typo_keys
+        if keys is None:
+            keys = {}
+            for token in self._name_tokens:
+                _add_typo_keys(keys, token)
+            # Published once complete, as concurrent readers may use it right away
+            self._typo_keys = keys
+        return keys
+
+
+def _add_typo_keys(keys: Dict[str, Set[str]], token: str) -> None:
+    """Register a name token in the typo index"""
+    if len(token) < TYPO_MIN_TOKEN:
+        return
+    for key in chain([token], deletions(token)):
+        keys.setdefault(key, set()).add(token)
+
+
+def _remove_typo_keys(keys: Dict[str, Set[str]], token: str) -> None:
+    """Drop a name token from the typo index"""
+    if len(token) < TYPO_MIN_TOKEN:
+        return
+    for key in chain([token], deletions(token)):
+        tokens = keys.get(key)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del keys[key]
+
+
+class StorageSearchIndex(SearchIndex):
+    """
+    Fuzzy-only index of a lazy storage backend, filled from storage rows.
+
+    It follows the tree like SearchIndex, except for what tree events cannot
+    tell about folders that were never loaded (their commands when they are
+    removed, or a whole new tree): it then only marks itself stale, and the
+    DataManager fills a new one from storage.
+    """
+
+    def __init__(self):
+        """Initialize empty index"""
+        super().__init__(postings=False)
+        self.stale = False
+        # Whether the name token postings are the saved arrays, which searches
+        # only read, rather than sets
+        self._saved_postings = False
+
+    @classmethod
+    def from_tables(cls, tables: FuzzyTables) -> 'StorageSearchIndex':
+        """
+        Load an index saved by storage (see fuzzy_tables)
+
+        Args:
+            tables: Saved index
+
+        Returns:
+            Index holding the saved documents, with its fuzzy search blobs in place
+        """
+        ids, blobs, name_tokens = tables
+        index = cls()
+        texts = [blob.split("\n") if ids else [] for blob, _ in blobs]
+        index._docs = list(zip(ids, *texts))
+        index._doc_ids = dict(zip(ids, range(len(ids))))
+        index._name_tokens = name_tokens
+        index._saved_postings = True
+        # Line starts stay arrays: the searches only index and bisect them
+        index._blobs = [("", [])] + list(blobs)
+        return index
+
+    def _thaw_postings(self) -> None:
+        """Turn saved name token postings into the sets changes update"""
+        if self._saved_postings:
+            self._name_tokens = {token: set(docnos) for token, docnos in self._name_tokens.items()}
+            self._saved_postings = False
+
+    def _insert(self, node_id: str, name: str, description: str, content: str) -> None:
+        self._thaw_postings()
+        super()._insert(node_id, name, description, content)
+
+    def remove(self, node_id: str) -> None:
+        self._thaw_postings()
+        super().remove(node_id)
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        self.stale = True
+
+    def node_removed(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if not current._loaded:
+                self.stale = True
+                return
+            stack.extend(current.children)
+        super().node_removed(node, parent)
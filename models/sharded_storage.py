@@ -0,0 +1,502 @@
+"""Sharded Storage - Manifest plus one JSON file per top-level folder, loaded on demand"""
+
+import json
+import os
+import shutil
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from .command_node import CommandNode, _CHILDREN_KEY
+from .fileio import atomic_write_bytes
+from .json_stream import load_tree
+from .node_index import TreeListener
+from .storage import JsonStorage, Storage
+
+if TYPE_CHECKING:
+    from .data_manager import DataManager
+
+MANIFEST_NAME = "manifest.json"
+# Below the top level, a folder gets a shard of its own once its JSON in its parent's shard reaches this size
+SHARD_MIN_BYTES = 256 * 1024
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def shard_directory(data_file: str) -> str:
+    """Directory of the sharded layout of a data file (data/commands.json -> data/commands.shards)"""
+    return os.path.splitext(data_file)[0] + ".shards"
+
+
+def _keys_file(shard_file: str) -> str:
+    """ID file written next to a shard file (shard-3.json -> shard-3.ids)"""
+    return os.path.splitext(shard_file)[0] + ".ids"
+
+
+def _node_key(node_id: str) -> int:
+    """Key of a node ID in the ID files"""
+    return zlib.crc32(node_id.encode('utf-8'))
+
+
+class _Shard:
+    """Table entry of a folder whose children are stored in a file of their own"""
+
+    __slots__ = ('file', 'parent', 'count', 'keys')
+
+    def __init__(self, file: Optional[str], parent: str, count: int):
+        # File name in the shard directory (None until first written)
+        self.file = file
+        # Folder whose shard holds this folder's own record (the root for top-level folders)
+        self.parent = parent
+        # Number of children, shown before they are loaded
+        self.count = count
+        # Sorted keys of the nodes whose records the file holds, once read from its ID file
+        self.keys: Optional[array] = None
+
+
+class ShardedStorage(Storage, TreeListener):
+    """
+    Sharded JSON storage: a manifest (data/commands.shards/manifest.json) with
+    the root, the top-level commands and the table of shards, and one file per
+    shard holding the children of one folder.
+
+    Every top-level folder is a shard, and so is any deeper folder whose JSON
+    reaches SHARD_MIN_BYTES in its parent's shard; inside a shard file such
+    folders only have their own fields. Shards are read when their folder is
+    first opened, or when a search needs the rest of the tree. Each shard file
+    has an ID file next to it with the sorted CRC-32s of the IDs it holds, so
+    looking up an ID that is not loaded reads only the shards that may hold it
+    (none for an ID that is in no shard).
+
+    Changes mark the shards they touch, and save() writes only those, each to
+    a new file, then replaces the manifest: the manifest is the commit point,
+    so a save that moved a node between shards (or was interrupted) is seen
+    either whole or not at all. Files of the previous version are deleted once
+    the new manifest is in place.
+
+    On first open, an existing single-file commands.json is migrated and kept
+    as commands.json.bak; JsonStorage migrates back the other way.
+    """
+
+    lazy = True
+
+    def __init__(self, directory: str, import_file: Optional[str] = None, shard_min_bytes: int = SHARD_MIN_BYTES):
+        """
+        Initialize sharded storage
+
+        Args:
+            directory: Shard directory (see shard_directory)
+            import_file: JSON data file migrated when the directory holds no data yet
+            shard_min_bytes: JSON size from which a folder below the top level gets its own shard
+        """
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, MANIFEST_NAME)
+        self.import_file = import_file
+        self.shard_min_bytes = shard_min_bytes
+        self.data_manager: Optional['DataManager'] = None
+        self._shards: Dict[str, _Shard] = {}
+        # Shard folders whose children changed since the last save (the root is always written)
+        self._dirty: Set[str] = set()
+        # Files of replaced or removed shards, deleted after the next manifest is written
+        self._obsolete: List[str] = []
+        self._next_file = 0
+        # Unreferenced files (left by an interrupted save) are deleted after the first save
+        self._collected = False
+
+    def files(self) -> List[str]:
+        # Every save rewrites the manifest
+        return [self.manifest_file]
+
+    # ========== Loading ==========
+
+    def open(self, data_manager: 'DataManager') -> bool:
+        self.data_manager = data_manager
+        loaded = False
+        if os.path.exists(self.manifest_file) or self._migrate_json():
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    root, extra = load_tree(f)
+                if root is not None:
+                    self._shards = {shard_id: _Shard(entry['file'], entry['parent'], entry['children'])
+                                    for shard_id, entry in extra.get('shards', {}).items()}
+                    self._next_file = extra.get('next_file', 0)
+                    self._mark_unloaded(root.children, root.id)
+                    data_manager.set_root(root)
+                    loaded = True
+            except Exception as e:
+                print(f"Failed to load data: {e}")
+        data_manager.index.listeners.append(self)
+        return loaded
+
+    def _migrate_json(self) -> bool:
+        """One-shot import of the single-file JSON data into an empty shard directory"""
+        if not self.import_file or not os.path.exists(self.import_file):
+            return False
+        try:
+            if any(map(os.path.exists, JsonStorage(self.import_file, journal=True).files()[1:])):
+                # Loading with journaling off folds the journal into the data file
+                from .data_manager import DataManager
+                DataManager(self.import_file, storage="json").close()
+            with open(self.import_file, 'r', encoding='utf-8') as f:
+                root, _ = load_tree(f)
+        except (ValueError, OSError) as e:
+            print(f"Failed to migrate {self.import_file}: {e}")
+            return False
+        if root is None:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        self.write_tree(root)
+        # Kept aside, so that the JSON backend migrates the shards back instead of loading stale data
+        os.replace(self.import_file, self.import_file + ".bak")
+        print(f"Migrated {self.import_file} to {self.directory}")
+        return True
+
+    def _mark_unloaded(self, nodes: List[CommandNode], shard_id: str) -> None:
+        """Mark the folders of a freshly read shard that are shards of their own as not loaded"""
+        pending = {child_id: shard for child_id, shard in self._shards.items() if shard.parent == shard_id}
+        stack = list(nodes)
+        while stack and pending:
+            node = stack.pop()
+            shard = pending.pop(node.id, None)
+            if shard is not None:
+                node._loaded = False
+                node._child_count = shard.count
+            else:
+                stack.extend(node.children)
+
+    def load_children(self, node: CommandNode) -> List[CommandNode]:
+        shard = self._shards.get(node.id)
+        if shard is None or shard.file is None:
+            return []
+        with open(os.path.join(self.directory, shard.file), 'r', encoding='utf-8') as f:
+            holder, _ = load_tree(f)
+        if holder is None or holder.id != node.id:
+            raise ValueError(f"Shard {shard.file} does not hold the children of {node.id}")
+        children = list(holder.children)
+        self._mark_unloaded(children, node.id)
+        return children
+
+    def locate(self, node_id: str) -> Optional[List[str]]:
+        # Only the shards whose ID files have the node's key are read (keys may collide)
+        index = self.data_manager.index
+        if node_id not in index:
+            key = _node_key(node_id)
+            for shard_id in [shard_id for shard_id, shard in self._shards.items()
+                             if not self._loaded(shard_id) and self._may_hold(shard, key)]:
+                self._load_shard(shard_id)
+                if node_id in index:
+                    break
+            else:
+                return None
+        path = [ancestor.id for ancestor in index.iter_ancestors(node_id)]
+        path.reverse()
+        path.append(node_id)
+        return path
+
+    def _loaded(self, shard_id: str) -> bool:
+        """Whether the children of a shard folder are in the tree"""
+        folder = self.data_manager.index.get(shard_id)
+        return folder is not None and folder._loaded
+
+    def _may_hold(self, shard: _Shard, key: int) -> bool:
+        """Whether a shard file may hold a node with this key (always, without an ID file)"""
+        if shard.file is None:
+            return False
+        if shard.keys is None:
+            try:
+                with open(os.path.join(self.directory, _keys_file(shard.file)), 'rb') as f:
+                    keys = array('I', f.read())
+            except OSError:
+                # Written before ID files existed
+                return True
+            if sys.byteorder == 'big':
+                keys.byteswap()
+            shard.keys = keys
+        position = bisect_left(shard.keys, key)
+        return position < len(shard.keys) and shard.keys[position] == key
+
+    def _load_shard(self, shard_id: str) -> None:
+        """Load the children of a shard folder, after the shards holding its record if needed"""
+        index = self.data_manager.index
+        chain = [shard_id]
+        while chain[-1] not in index:
+            parent = self._shards[chain[-1]].parent
+            if parent not in self._shards:
+                # Held by the manifest, which is always loaded
+                return
+            chain.append(parent)
+        for folder_id in reversed(chain):
+            folder = index.get(folder_id)
+            if folder is None:
+                return
+            if not folder._loaded:
+                self.data_manager.load_children(folder)
+
+    # ========== Saving ==========
+
+    def save(self) -> None:
+        with self.data_manager.read_lock:
+            writes, manifest, obsolete = self._encode(self.data_manager.root)
+        self._commit(writes, manifest, obsolete)
+
+    def write_tree(self, root: CommandNode) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with self.data_manager.read_lock:
+            self._reset()
+            writes, manifest, obsolete = self._encode(root)
+        self._commit(writes, manifest, obsolete)
+
+    def _reset(self) -> None:
+        """Forget every shard: the next save writes the whole tree"""
+        for shard in self._shards.values():
+            if shard.file is not None:
+                self._obsolete.extend((shard.file, _keys_file(shard.file)))
+        self._shards.clear()
+        self._dirty.clear()
+
+    def _encode(self, root: CommandNode) -> Tuple[List[Tuple[str, str, bytes]], bytes, List[str]]:
+        """
+        Serialize the changed shards and the manifest (called under the tree's read lock)
+
+        Returns:
+            (shard ID, file name, content) of the shard files to write, the
+            manifest, and the files to delete once it is written
+        """
+        index = root._index
+        queue = [node for node in map(index.get, self._dirty) if node is not None and node.id in self._shards] \
+            if index is not None else []
+        self._dirty.clear()
+        obsolete = self._obsolete
+        self._obsolete = []
+        writes = []
+        root_content, promoted = self._encode_content(root, 0)
+        queue.extend(promoted)
+        while queue:
+            folder = queue.pop()
+            content, promoted = self._encode_content(folder, self.shard_min_bytes)
+            queue.extend(promoted)
+            shard = self._shards[folder.id]
+            if shard.file is not None:
+                obsolete.extend((shard.file, _keys_file(shard.file)))
+            shard.file = f"shard-{self._next_file}.json"
+            shard.count = len(folder.children)
+            shard.keys = keys = self._shard_keys(folder)
+            self._next_file += 1
+            if sys.byteorder == 'big':
+                keys = array('I', keys)
+                keys.byteswap()
+            writes.append((folder.id, shard.file, b'{"id":' + _json_encoder.encode(folder.id).encode('utf-8') +
+                           b',"children":[' + content + b']}'))
+            writes.append((folder.id, _keys_file(shard.file), keys.tobytes()))
+
+        if not self._collected and os.path.isdir(self.directory):
+            self._collected = True
+            referenced = {shard.file for shard in self._shards.values() if shard.file is not None}
+            referenced.update([_keys_file(name) for name in referenced])
+            obsolete.extend(name for name in os.listdir(self.directory) if name.startswith("shard-")
+                            and name.endswith((".json", ".ids")) and name not in referenced)
+        table = {shard_id: {'file': shard.file, 'parent': shard.parent, 'children': shard.count}
+                 for shard_id, shard in self._shards.items()}
+        fragment = root._json_fragment()
+        split = fragment.index(_CHILDREN_KEY) + len(_CHILDREN_KEY)
+        manifest = b''.join((b'{"shards":', _json_encoder.encode(table).encode('utf-8'),
+                             b',"next_file":%d,' % self._next_file,
+                             fragment[1:split], root_content, fragment[split:]))
+        return writes, manifest, obsolete
+
+    def _encode_content(self, folder: CommandNode, min_bytes: int) -> Tuple[bytes, List[CommandNode]]:
+        """
+        JSON of the children of a shard folder, without the brackets
+
+        Args:
+            folder: Shard folder (or the root)
+            min_bytes: JSON size from which a child folder is moved to a shard of its own (0: all of them)
+
+        Returns:
+            The JSON, and the child folders that were made shards (written as their fields only)
+        """
+        anchors = self._anchors(folder)
+        parts = []
+        promoted = []
+        for child in folder.children:
+            if child.id in self._shards:
+                parts.append(child._json_fragment())
+                continue
+            if child.is_folder() and not min_bytes:
+                encoded = None
+            elif child.id in anchors:
+                encoded = self._encode_subtree(child, anchors)
+            else:
+                encoded = child.to_json()
+            if child.is_folder() and (encoded is None or len(encoded) >= min_bytes):
+                parts.append(child._json_fragment())
+                promoted.append(child)
+            else:
+                parts.append(encoded)
+        for child in promoted:
+            self._shards[child.id] = _Shard(None, folder.id, 0)
+            if child.id in anchors:
+                # The shards below it are now inside its own shard
+                for shard_id, shard in self._shards.items():
+                    if shard.parent == folder.id and child._index.is_ancestor(child.id, shard_id):
+                        shard.parent = child.id
+        return b','.join(parts), promoted
+
+    def _shard_keys(self, folder: CommandNode) -> array:
+        """Sorted keys of the nodes whose records the shard file of a folder holds"""
+        keys = []
+        stack = list(folder.children)
+        while stack:
+            node = stack.pop()
+            keys.append(_node_key(node.id))
+            if node.id not in self._shards:
+                stack.extend(node.children)
+        keys.sort()
+        return array('I', keys)
+
+    def _anchors(self, folder: CommandNode) -> Set[str]:
+        """IDs of the nodes of a shard that have shard folders below them"""
+        anchors: Set[str] = set()
+        index = folder._index
+        if index is None:
+            return anchors
+        for shard_id, shard in self._shards.items():
+            if shard.parent != folder.id:
+                continue
+            for ancestor in index.iter_ancestors(shard_id):
+                if ancestor is folder or ancestor.id in anchors:
+                    break
+                anchors.add(ancestor.id)
+        return anchors
+
+    def _encode_subtree(self, node: CommandNode, anchors: Set[str]) -> bytes:
+        """JSON of a subtree in which the shard folders are written as their fields only"""
+        chunks = []
+        stack: List[object] = [node]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, CommandNode):
+                chunks.append(item)
+            elif item.id in self._shards:
+                chunks.append(item._json_fragment())
+            elif item.id in anchors:
+                fragment = item._json_fragment()
+                split = fragment.index(_CHILDREN_KEY) + len(_CHILDREN_KEY)
+                chunks.append(fragment[:split])
+                stack.append(fragment[split:])
+                children = item.children
+                for i in range(len(children) - 1, -1, -1):
+                    stack.append(children[i])
+                    if i:
+                        stack.append(b',')
+            else:
+                chunks.append(item.to_json())
+        return b''.join(chunks)
+
+    def _commit(self, writes: List[Tuple[str, str, bytes]], manifest: bytes, obsolete: List[str]) -> None:
+        """Write the new shard files, then the manifest that refers to them, then drop the old files"""
+        try:
+            for _, name, payload in writes:
+                atomic_write_bytes(os.path.join(self.directory, name), payload)
+            atomic_write_bytes(self.manifest_file, manifest)
+        except BaseException:
+            # The manifest on disk still refers to the old files: write these shards again next time
+            self._dirty.update(shard_id for shard_id, _, _ in writes)
+            self._obsolete.extend(obsolete)
+            raise
+        for name in obsolete:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    # ========== TreeListener ==========
+
+    def _record_shard(self, node: CommandNode) -> str:
+        """ID of the shard folder (or root) whose file holds the fields of a node"""
+        for ancestor in self.data_manager.index.iter_ancestors(node.id):
+            if ancestor.id in self._shards:
+                return ancestor.id
+        return self.data_manager.root.id
+
+    def _content_shard(self, folder: CommandNode) -> str:
+        """ID of the shard folder (or root) whose file holds the children of a folder"""
+        if folder.id in self._shards or folder is self.data_manager.root:
+            return folder.id
+        return self._record_shard(folder)
+
+    def _changed(self, folder: CommandNode) -> None:
+        """Mark the files holding the children and the fields (updated_at) of a folder"""
+        self._dirty.add(self._content_shard(folder))
+        self._dirty.add(self._record_shard(folder))
+
+    def tree_reset(self, root: CommandNode) -> None:
+        self._reset()
+
+    def node_added(self, node: CommandNode, parent: CommandNode) -> None:
+        self._changed(parent)
+
+    def node_removed(self, node: CommandNode, parent: CommandNode) -> None:
+        self._changed(parent)
+        removed = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.id in self._shards:
+                removed.append(current.id)
+            stack.extend(current.children)
+        # Shards below folders that were never loaded are only known from the table
+        while removed:
+            gone = set(removed)
+            for shard_id in gone:
+                shard = self._shards.pop(shard_id)
+                if shard.file is not None:
+                    self._obsolete.extend((shard.file, _keys_file(shard.file)))
+            removed = [shard_id for shard_id, shard in self._shards.items() if shard.parent in gone]
+
+    def node_moved(self, node: CommandNode, old_parent: Optional[CommandNode], new_parent: CommandNode) -> None:
+        if old_parent is not None:
+            self._changed(old_parent)
+        self._changed(new_parent)
+        # The record of the node, and of the shard folders inside it, now lives in another file
+        target = self._content_shard(new_parent)
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            shard = self._shards.get(current.id)
+            if shard is not None:
+                shard.parent = target
+            else:
+                stack.extend(current.children)
+
+    def node_updated(self, node: CommandNode) -> None:
+        self._dirty.add(self._record_shard(node))
+
+
+def migrate_shards_to_json(data_file: str) -> bool:
+    """
+    Write the sharded data of a data file back as the single JSON file, keeping
+    the shard directory aside (".bak")
+
+    Args:
+        data_file: JSON data file path, which must not exist yet
+
+    Returns:
+        False when there is no sharded data to migrate
+    """
+    directory = shard_directory(data_file)
+    if not os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+        return False
+    from .data_manager import DataManager
+    source = DataManager(data_file, storage="sharded")
+    try:
+        source.export_json(data_file)
+    finally:
+        source.close()
+    backup = directory + ".bak"
+    shutil.rmtree(backup, ignore_errors=True)
+    os.replace(directory, backup)
+    print(f"Migrated {directory} to {data_file}")
+    return True
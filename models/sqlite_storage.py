@@ -0,0 +1,390 @@
+"""SQLite Storage - Adjacency-table storage with lazy folder loading"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from typing import Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from .command_node import CommandNode
+from .json_stream import load_tree
+from .node_index import TreeListener
+from .storage import Storage
+
+if TYPE_CHECKING:
+    from .data_manager import DataManager
+    from .search_index import FuzzyTables
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT REFERENCES nodes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL DEFAULT 0,
+    name TEXT NOT NULL DEFAULT '',
+    node_type TEXT NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS nodes_parent ON nodes(parent_id, position);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5(
+    name, description, content, content='nodes', content_rowid='rowid', tokenize='trigram'
+);
+"""
+
+# Dropped and recreated around write_tree, which indexes all rows at once
+_FTS_BULK_TRIGGERS = ("""
+CREATE TRIGGER IF NOT EXISTS nodes_fts_insert AFTER INSERT ON nodes WHEN new.node_type = 'command' BEGIN
+    INSERT INTO nodes_fts(rowid, name, description, content)
+    VALUES (new.rowid, new.name, new.description, new.content);
+END
+""", """
+CREATE TRIGGER IF NOT EXISTS nodes_fts_delete AFTER DELETE ON nodes WHEN old.node_type = 'command' BEGIN
+    INSERT INTO nodes_fts(nodes_fts, rowid, name, description, content)
+    VALUES ('delete', old.rowid, old.name, old.description, old.content);
+END
+""")
+
+_FTS_UPDATE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS nodes_fts_update AFTER UPDATE OF name, description, content ON nodes
+WHEN old.node_type = 'command' BEGIN
+    INSERT INTO nodes_fts(nodes_fts, rowid, name, description, content)
+    VALUES ('delete', old.rowid, old.name, old.description, old.content);
+    INSERT INTO nodes_fts(rowid, name, description, content)
+    VALUES (new.rowid, new.name, new.description, new.content);
+END;
+"""
+
+# Saved fuzzy search index (see write_fuzzy_tables): field 0 holds the node IDs
+# as a JSON list, fields 1 to 3 the joined names, descriptions and contents
+# with their line starts (little-endian arrays, as are the token postings)
+_FUZZY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fuzzy_fields (field INTEGER PRIMARY KEY, text TEXT NOT NULL, starts BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS fuzzy_name_tokens (token TEXT PRIMARY KEY, docnos BLOB NOT NULL);
+"""
+
+
+def _array_from_bytes(typecode: str, data: bytes) -> array:
+    """Array saved by _array_to_bytes"""
+    values = array(typecode, data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _array_to_bytes(values: array) -> bytes:
+    """Little-endian bytes of an array"""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+_NODE_COLUMNS = ("n.id, n.parent_id, n.name, n.node_type, n.content, n.description, n.created_at, n.updated_at, "
+                 "(SELECT COUNT(*) FROM nodes c WHERE c.parent_id = n.id)")
+
+# Name matches rank above description matches above content matches
+_RANK_ORDER = ("CASE WHEN instr(lower(n.name), :kw) THEN 0 "
+               "WHEN instr(lower(n.description), :kw) THEN 1 ELSE 2 END, lower(n.name)")
+
+
+class SqliteStorage(Storage, TreeListener):
+    """
+    SQLite storage: one row per node in an adjacency table indexed on parent_id,
+    plus an FTS5 trigram table for search.
+
+    Every tree event becomes a single-row statement (a cascading delete for
+    removals) in the current transaction; save() commits it. Folders are
+    returned unloaded and only read when their children are asked for.
+    """
+
+    lazy = True
+    searchable = True
+
+    def __init__(self, db_file: str, import_file: Optional[str] = None, journal_mode: str = "WAL"):
+        """
+        Initialize SQLite storage
+
+        Args:
+            db_file: Database file path
+            import_file: JSON data file migrated into an empty database on first open
+            journal_mode: SQLite journal mode ("DELETE" for databases replaced by renaming)
+        """
+        self.db_file = db_file
+        self.import_file = import_file
+        self.data_manager: Optional['DataManager'] = None
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        # Readers share the connection while holding only the tree's read lock
+        self._conn_lock = threading.RLock()
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        self.conn.executescript(_SCHEMA)
+        try:
+            self.conn.executescript(_FTS_SCHEMA + ";".join(_FTS_BULK_TRIGGERS) + ";" + _FTS_UPDATE_TRIGGER)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 / trigram tokenizer: fall back to scanning
+            self.has_fts = False
+        # Whether the database holds a saved fuzzy search index, dropped on the first change
+        self._has_fuzzy_tables = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fuzzy_fields'"
+        ).fetchone() is not None
+
+    # ========== Loading ==========
+
+    def open(self, data_manager: 'DataManager') -> bool:
+        self.data_manager = data_manager
+        data_manager.index.listeners.append(self)
+
+        row = self.conn.execute(
+            f"SELECT {_NODE_COLUMNS} FROM nodes n WHERE n.parent_id IS NULL"
+        ).fetchone()
+        if row is None:
+            if not self._migrate_json():
+                return False
+            row = self.conn.execute(
+                f"SELECT {_NODE_COLUMNS} FROM nodes n WHERE n.parent_id IS NULL"
+            ).fetchone()
+
+        data_manager.set_root(self._node_from_row(row))
+        data_manager.load_children(data_manager.root)
+        return True
+
+    def _migrate_json(self) -> bool:
+        """One-shot import of the JSON data file into an empty database"""
+        if not self.import_file or not os.path.exists(self.import_file):
+            return False
+        try:
+            with open(self.import_file, 'r', encoding='utf-8') as f:
+                root, _ = load_tree(f)
+        except (ValueError, OSError) as e:
+            print(f"Failed to migrate {self.import_file}: {e}")
+            return False
+        if root is None:
+            return False
+        self.write_tree(root)
+        print(f"Migrated {self.import_file} to {self.db_file}")
+        return True
+
+    @staticmethod
+    def _node_from_row(row: Tuple) -> CommandNode:
+        """Build an (unloaded, for folders) node from a database row"""
+        node = CommandNode(
+            id=row[0],
+            parent_id=row[1],
+            name=row[2],
+            node_type=row[3],
+            content=row[4],
+            description=row[5],
+            created_at=row[6],
+            updated_at=row[7],
+        )
+        if node.is_folder():
+            node._loaded = False
+            node._child_count = row[8]
+        return node
+
+    def load_children(self, node: CommandNode) -> List[CommandNode]:
+        with self._conn_lock:
+            rows = self.conn.execute(
+                f"SELECT {_NODE_COLUMNS} FROM nodes n WHERE n.parent_id = ? ORDER BY n.position",
+                (node.id,)
+            ).fetchall()
+        return [self._node_from_row(row) for row in rows]
+
+    def locate(self, node_id: str) -> Optional[List[str]]:
+        with self._conn_lock:
+            rows = self.conn.execute(
+                """
+                WITH RECURSIVE path(id, parent_id, depth) AS (
+                    SELECT id, parent_id, 0 FROM nodes WHERE id = ?
+                    UNION ALL
+                    SELECT n.id, n.parent_id, path.depth + 1 FROM nodes n JOIN path ON n.id = path.parent_id
+                )
+                SELECT id FROM path ORDER BY depth DESC
+                """,
+                (node_id,)
+            ).fetchall()
+        return [row[0] for row in rows] or None
+
+    def iter_commands(self) -> Iterator[Tuple[str, str, str, str]]:
+        with self._conn_lock:
+            rows = self.conn.execute(
+                "SELECT id, name, description, content FROM nodes WHERE node_type = 'command'"
+            ).fetchall()
+        return iter(rows)
+
+    def read_fuzzy_tables(self) -> Optional['FuzzyTables']:
+        if not self._has_fuzzy_tables:
+            return None
+        with self._conn_lock:
+            fields = {field: (text, starts) for field, text, starts
+                      in self.conn.execute("SELECT field, text, starts FROM fuzzy_fields")}
+            rows = self.conn.execute("SELECT token, docnos FROM fuzzy_name_tokens").fetchall()
+        if sorted(fields) != [0, 1, 2, 3]:
+            return None
+        blobs = [(fields[field][0], _array_from_bytes('q', fields[field][1])) for field in (1, 2, 3)]
+        name_tokens = {token: _array_from_bytes('I', docnos) for token, docnos in rows}
+        return json.loads(fields[0][0]), blobs, name_tokens
+
+    # ========== Saving ==========
+
+    def write_fuzzy_tables(self, tables: 'FuzzyTables') -> None:
+        """
+        Save a fuzzy search index with the data, for read_fuzzy_tables()
+
+        The tables are dropped on the first change made through this storage,
+        so only databases that are replaced rather than edited (the query
+        index) keep them.
+
+        Args:
+            tables: Result of search_index.fuzzy_tables() for the current data
+        """
+        ids, blobs, name_tokens = tables
+        fields = [(0, json.dumps(ids), b"")]
+        fields += [(field, text, _array_to_bytes(starts)) for field, (text, starts) in enumerate(blobs, 1)]
+        with self._conn_lock, self.conn:
+            self.conn.executescript(_FUZZY_SCHEMA)
+            self.conn.execute("DELETE FROM fuzzy_fields")
+            self.conn.execute("DELETE FROM fuzzy_name_tokens")
+            self.conn.executemany("INSERT INTO fuzzy_fields (field, text, starts) VALUES (?, ?, ?)", fields)
+            self.conn.executemany("INSERT INTO fuzzy_name_tokens (token, docnos) VALUES (?, ?)",
+                                  ((token, _array_to_bytes(docnos)) for token, docnos in name_tokens.items()))
+        self._has_fuzzy_tables = True
+
+    def _drop_fuzzy_tables(self) -> None:
+        """Drop a saved fuzzy search index that a change makes stale"""
+        if self._has_fuzzy_tables:
+            self.conn.execute("DROP TABLE IF EXISTS fuzzy_fields")
+            self.conn.execute("DROP TABLE IF EXISTS fuzzy_name_tokens")
+            self._has_fuzzy_tables = False
+
+    def save(self) -> None:
+        with self.data_manager.lock, self._conn_lock:
+            self.conn.commit()
+
+    def write_tree(self, root: CommandNode) -> None:
+        with self.conn:
+            self._drop_fuzzy_tables()
+            if self.has_fts:
+                # Indexing every row in one statement is several times faster than the row triggers
+                self.conn.execute("DROP TRIGGER nodes_fts_insert")
+                self.conn.execute("DROP TRIGGER nodes_fts_delete")
+                self.conn.execute("INSERT INTO nodes_fts(nodes_fts) VALUES ('delete-all')")
+            self.conn.execute("DELETE FROM nodes")
+            self.conn.executemany(
+                "INSERT INTO nodes (id, parent_id, position, name, node_type, content, description, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._subtree_rows(root, None, 0)
+            )
+            if self.has_fts:
+                self.conn.execute(
+                    "INSERT INTO nodes_fts(rowid, name, description, content) "
+                    "SELECT rowid, name, description, content FROM nodes WHERE node_type = 'command'"
+                )
+                for trigger in _FTS_BULK_TRIGGERS:
+                    self.conn.execute(trigger)
+
+    @staticmethod
+    def _subtree_rows(node: CommandNode, parent_id: Optional[str], position: int) -> Iterator[Tuple]:
+        """Rows for a subtree, parents before children"""
+        stack = [(node, parent_id, position)]
+        while stack:
+            current, current_parent_id, current_position = stack.pop()
+            yield (current.id, current_parent_id, current_position, current.name, current.node_type,
+                   current.content, current.description, current.created_at, current.updated_at)
+            for i in range(len(current.children) - 1, -1, -1):
+                stack.append((current.children[i], current.id, i))
+
+    def _next_position(self, parent_id: str) -> int:
+        """Position after the last child of a folder"""
+        row = self.conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM nodes WHERE parent_id = ?", (parent_id,)
+        ).fetchone()
+        return row[0]
+
+    def _insert_position(self, node: CommandNode, parent: CommandNode) -> int:
+        """Position for a node added to parent, shifting the siblings after it"""
+        index = parent.insert_position(node)
+        if index is None:
+            return self._next_position(parent.id)
+        next_sibling = parent.children[index + 1]
+        position = self.conn.execute("SELECT position FROM nodes WHERE id = ?", (next_sibling.id,)).fetchone()[0]
+        self.conn.execute(
+            "UPDATE nodes SET position = position + 1 WHERE parent_id = ? AND position >= ?", (parent.id, position)
+        )
+        return position
+
+    def _touch_row(self, node: CommandNode) -> None:
+        """Persist the updated_at of a node"""
+        self.conn.execute("UPDATE nodes SET updated_at = ? WHERE id = ?", (node.updated_at, node.id))
+
+    # ========== TreeListener ==========
+
+    def node_added(self, node: CommandNode, parent: CommandNode) -> None:
+        self._drop_fuzzy_tables()
+        self.conn.executemany(
+            "INSERT INTO nodes (id, parent_id, position, name, node_type, content, description, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._subtree_rows(node, parent.id, self._insert_position(node, parent))
+        )
+        self._touch_row(parent)
+
+    def node_removed(self, node: CommandNode, parent: CommandNode) -> None:
+        self._drop_fuzzy_tables()
+        # Descendants go with it through ON DELETE CASCADE
+        self.conn.execute("DELETE FROM nodes WHERE id = ?", (node.id,))
+        self._touch_row(parent)
+
+    def node_moved(self, node: CommandNode, old_parent: CommandNode, new_parent: CommandNode) -> None:
+        self._drop_fuzzy_tables()
+        self.conn.execute(
+            "UPDATE nodes SET parent_id = ?, position = ? WHERE id = ?",
+            (new_parent.id, self._insert_position(node, new_parent), node.id)
+        )
+        if old_parent is not None:
+            self._touch_row(old_parent)
+        self._touch_row(new_parent)
+
+    def node_updated(self, node: CommandNode) -> None:
+        self._drop_fuzzy_tables()
+        self.conn.execute(
+            "UPDATE nodes SET name = ?, content = ?, description = ?, updated_at = ? WHERE id = ?",
+            (node.name, node.content, node.description, node.updated_at, node.id)
+        )
+
+    # ========== Search ==========
+
+    def search(self, keyword: str, limit: Optional[int] = None) -> Optional[List[str]]:
+        keyword = keyword.lower()
+        if not keyword:
+            return []
+        params = {'kw': keyword, 'limit': -1 if limit is None else limit}
+        if self.has_fts and len(keyword) >= 3:
+            params['query'] = '"' + keyword.replace('"', '""') + '"'
+            sql = (f"SELECT n.id FROM nodes_fts JOIN nodes n ON n.rowid = nodes_fts.rowid "
+                   f"WHERE nodes_fts MATCH :query ORDER BY {_RANK_ORDER} LIMIT :limit")
+        else:
+            sql = (f"SELECT n.id FROM nodes n WHERE n.node_type = 'command' AND "
+                   f"(instr(lower(n.name), :kw) OR instr(lower(n.description), :kw) OR instr(lower(n.content), :kw)) "
+                   f"ORDER BY {_RANK_ORDER} LIMIT :limit")
+        with self._conn_lock:
+            return [row[0] for row in self.conn.execute(sql, params)]
+
+    def files(self) -> List[str]:
+        return [self.db_file, self.db_file + "-wal"]
+
+    def close(self) -> None:
+        if self.data_manager is None:
+            # Never opened: no tree lock to take and nothing to commit
+            self.conn.close()
+            return
+        with self.data_manager.lock, self._conn_lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,337 @@
+"""Storage - Pluggable persistence backends for DataManager"""
+
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from .blob_store import BlobStore
+from .command_node import CommandNode
+from .fileio import atomic_write_bytes
+from .journal import Journal
+from .json_stream import load_tree
+
+if TYPE_CHECKING:
+    from .data_manager import DataManager
+    from .search_index import FuzzyTables
+
+
+class Storage:
+    """
+    Base class for DataManager storage backends.
+
+    A backend loads the tree into a DataManager, follows changes (usually as a
+    TreeListener registered in open()) and persists them in save(). Lazy
+    backends may hand out folders whose children are not loaded yet; the
+    DataManager asks for them through load_children() / locate().
+    """
+
+    # Whether folders may be returned with their children not loaded yet
+    lazy = False
+    # Whether a lazy backend answers searches without loading the tree (search(),
+    # iter_commands()); the tree of other lazy backends is loaded on the first search
+    searchable = False
+    # Whether read_tree() can read the stored data back, so changes other programs
+    # make to the files are merged (see DataManager watch)
+    watchable = False
+
+    def open(self, data_manager: 'DataManager') -> bool:
+        """
+        Load stored data into data_manager (through set_root)
+
+        Args:
+            data_manager: Data manager to fill
+
+        Returns:
+            False when there is no stored data yet
+        """
+        raise NotImplementedError
+
+    def save(self) -> None:
+        """Persist changes made since the last save"""
+        raise NotImplementedError
+
+    def write_tree(self, root: CommandNode) -> None:
+        """
+        Replace all stored data with a fully loaded tree
+
+        Args:
+            root: Root node
+        """
+        raise NotImplementedError
+
+    def read_tree(self) -> Optional[CommandNode]:
+        """
+        Read the whole stored tree as it is on disk now, without loading it (watchable backends only)
+
+        Returns:
+            Root of a tree that is not indexed, None when there is no stored data
+        """
+        raise NotImplementedError
+
+    def load_children(self, node: CommandNode) -> List[CommandNode]:
+        """
+        Load the direct children of a folder (lazy backends only)
+
+        Args:
+            node: Folder whose children are not loaded yet
+
+        Returns:
+            Child nodes in order
+        """
+        raise NotImplementedError
+
+    def locate(self, node_id: str) -> Optional[List[str]]:
+        """
+        Get the IDs on the path from the root to a node (lazy backends only)
+
+        Args:
+            node_id: Node ID
+
+        Returns:
+            IDs from the root down to the node itself, or None if it does not exist
+        """
+        raise NotImplementedError
+
+    def iter_commands(self) -> Iterator[Tuple[str, str, str, str]]:
+        """
+        Read every command without loading the tree (lazy backends only)
+
+        Returns:
+            (node_id, name, description, content) of each command
+        """
+        raise NotImplementedError
+
+    def read_fuzzy_tables(self) -> Optional['FuzzyTables']:
+        """
+        Read a fuzzy search index saved with the data (searchable backends only)
+
+        Returns:
+            The saved tables (see search_index.fuzzy_tables), or None to fill
+            the index from iter_commands()
+        """
+        return None
+
+    def search(self, keyword: str, limit: Optional[int] = None) -> Optional[List[str]]:
+        """
+        Search commands in storage
+
+        Args:
+            keyword: Search keyword
+            limit: Maximum number of results
+
+        Returns:
+            Matching node IDs, or None to use the in-memory SearchIndex
+        """
+        return None
+
+    def files(self) -> List[str]:
+        """
+        Get the files the stored data is made of (existing or not), used to
+        tell whether caches derived from them are still current
+
+        Returns:
+            File paths, empty when the backend cannot tell
+        """
+        return []
+
+    def close(self) -> None:
+        """Release resources and stop background work"""
+
+
+class JsonStorage(Storage):
+    """
+    Single JSON document storage (data/commands.json), optionally with an
+    append-only change journal next to it. Command bodies held by several
+    nodes are written once, in the document's blob table (see BlobStore).
+    """
+
+    def __init__(self, data_file: str, journal: bool = False,
+                 journal_max_records: int = 1000, journal_max_bytes: int = 1024 * 1024):
+        """
+        Initialize JSON storage
+
+        Args:
+            data_file: Snapshot file path
+            journal: Append changes to a journal instead of rewriting the snapshot
+            journal_max_records: Journal records after which the snapshot is rewritten in the background
+            journal_max_bytes: Journal size after which the snapshot is rewritten in the background
+        """
+        self.data_file = data_file
+        self.journal: Optional[Journal] = None
+        if journal:
+            self.journal = Journal(data_file, journal_max_records, journal_max_bytes)
+        # A journal is only meaningful with the snapshot it was written against
+        self.watchable = self.journal is None
+        self.data_manager: Optional['DataManager'] = None
+        self.blobs = BlobStore()
+        self._compaction_thread: Optional[threading.Thread] = None
+
+    def files(self) -> List[str]:
+        if self.journal is None:
+            return [self.data_file]
+        return [self.data_file, self.journal.path, self.journal.compacting_path]
+
+    # ========== Loading ==========
+
+    def open(self, data_manager: 'DataManager') -> bool:
+        self.data_manager = data_manager
+        if not os.path.exists(self.data_file):
+            # Data left in the sharded layout is migrated back (see ShardedStorage)
+            from .sharded_storage import migrate_shards_to_json
+            migrate_shards_to_json(self.data_file)
+        # Registered first, so the loaded tree is counted and its equal bodies shared
+        data_manager.index.blobs = self.blobs
+        data_manager.index.listeners.append(self.blobs)
+        loaded = False
+        if os.path.exists(self.data_file):
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    root, extra = load_tree(f)
+                if root is not None:
+                    data_manager.set_root(root)
+                    self._replay_journal(extra.get('journal_seq', 0))
+                    loaded = True
+            except Exception as e:
+                print(f"Failed to load data: {e}")
+        if self.journal is not None:
+            data_manager.index.listeners.append(self.journal)
+        return loaded
+
+    def read_tree(self) -> Optional[CommandNode]:
+        if not os.path.exists(self.data_file):
+            return None
+        with open(self.data_file, 'r', encoding='utf-8') as f:
+            root, _ = load_tree(f)
+        return root
+
+    def _replay_journal(self, snapshot_seq: int) -> None:
+        """
+        Apply journal records newer than the snapshot
+
+        Args:
+            snapshot_seq: Last journal sequence number contained in the snapshot
+        """
+        journal = self.journal if self.journal is not None else Journal(self.data_file)
+        replayed = 0
+        for record in journal.read_records(snapshot_seq):
+            if not self._apply_journal_record(record):
+                print(f"Skipping journal record {record.get('seq')} ({record.get('op')})")
+            replayed += 1
+
+        if replayed and self.journal is None:
+            # Journal mode was switched off: fold the log into the snapshot
+            self.write_tree(self.data_manager.root)
+            journal.clear()
+
+    def _apply_journal_record(self, record: Dict[str, Any]) -> bool:
+        """
+        Apply one journal record to the tree
+
+        Args:
+            record: Journal record
+
+        Returns:
+            Whether the record could be applied
+        """
+        manager = self.data_manager
+        op = record.get('op')
+        if op == 'add':
+            parent = manager.find_node_by_id(record['parent'])
+            node = Journal.node_from_record(record)
+            if parent is None or node.id in manager.index:
+                return False
+            parent.add_child(node, record.get('index'))
+            parent.updated_at = record.get('at', parent.updated_at)
+        elif op == 'remove':
+            parent = manager.get_parent(record['id'])
+            if parent is None or not parent.remove_child(record['id']):
+                return False
+            parent.updated_at = record.get('at', parent.updated_at)
+        elif op == 'move':
+            node = manager.find_node_by_id(record['id'])
+            new_parent = manager.find_node_by_id(record['parent'])
+            old_parent = manager.get_parent(record['id'])
+            if node is None or new_parent is None or old_parent is None:
+                return False
+            old_parent.detach_child(node.id)
+            new_parent.add_child(node, record.get('index'))
+            old_parent.updated_at = record.get('from_at', old_parent.updated_at)
+            new_parent.updated_at = record.get('at', new_parent.updated_at)
+        elif op == 'update':
+            node = manager.find_node_by_id(record['id'])
+            if node is None:
+                return False
+            node.name = record['name']
+            node.content = record['content']
+            node.description = record['description']
+            node.updated_at = record['updated_at']
+            manager.mark_updated(node)
+        else:
+            return False
+        return True
+
+    # ========== Saving ==========
+
+    def save(self) -> None:
+        if self.journal is None:
+            self.write_tree(self.data_manager.root)
+            return
+        with self.data_manager.lock:
+            self.journal.commit()
+            if self.journal.needs_compaction():
+                self.compact()
+
+    def _encode_snapshot(self, root: CommandNode) -> bytes:
+        """Serialize the whole tree as the data file content (reusing unchanged subtrees)"""
+        payload = self.blobs.wrap_snapshot(root.to_json())
+        if self.journal is not None:
+            payload = b'{"journal_seq":%d,' % self.journal.seq + payload[1:]
+        return payload + b'\n'
+
+    def write_tree(self, root: CommandNode) -> None:
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        # Serializing only reads the tree; clearing the journal must not race a writer appending to it
+        lock = self.data_manager.read_lock if self.journal is None else self.data_manager.lock
+        with lock:
+            payload = self._encode_snapshot(root)
+            if self.journal is not None:
+                # Clear the journal together with the write so no record slips in between
+                atomic_write_bytes(self.data_file, payload)
+                self.journal.clear()
+                return
+        atomic_write_bytes(self.data_file, payload)
+
+    def compact(self, wait: bool = False) -> None:
+        """
+        Rewrite the snapshot in the background and drop the journal records it contains
+
+        Args:
+            wait: Block until the snapshot is written
+        """
+        if self.journal is None:
+            return
+        with self.data_manager.lock:
+            if self._compaction_thread is None or not self._compaction_thread.is_alive():
+                self.journal.commit()
+                payload = self._encode_snapshot(self.data_manager.root)
+                self.journal.rotate()
+                self._compaction_thread = threading.Thread(
+                    target=self._write_compacted_snapshot, args=(payload,),
+                    name="commandnote-compaction", daemon=True
+                )
+                self._compaction_thread.start()
+        if wait:
+            self._compaction_thread.join()
+
+    def _write_compacted_snapshot(self, payload: bytes) -> None:
+        """Compaction thread body: write the snapshot, then drop the rotated journal"""
+        try:
+            atomic_write_bytes(self.data_file, payload)
+            self.journal.finish_compaction()
+        except Exception as e:
+            print(f"Failed to compact journal: {e}")
+
+    def close(self) -> None:
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
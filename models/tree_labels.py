@@ -0,0 +1,224 @@
+"""Tree Labels - Euler-tour interval labels for subtree range queries"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from .node_index import NodeIndex, TreeListener
+
+if TYPE_CHECKING:
+    from .command_node import CommandNode
+
+# Distance between consecutive labels after a build: room for about 30
+# successive insertions at the same place before the labels are rebuilt
+LABEL_SPACING = 1 << 32
+# Changes followed between two queries before the labels are dropped instead
+# (at least this many, or a 32nd of the tree): a rebuild is then cheaper
+MIN_UPDATES = 1024
+
+
+class Subtree:
+    """
+    The nodes inside a folder: a slice of the nodes in label order, with a
+    range test for membership
+    """
+
+    __slots__ = ('_enter', '_low', '_high', '_ids', '_start', '_stop')
+
+    def __init__(self, enter: Dict[str, int], low: int, high: int, ids: List[str], start: int, stop: int):
+        self._enter = enter
+        self._low = low
+        self._high = high
+        self._ids = ids
+        self._start = start
+        self._stop = stop
+
+    def __contains__(self, node_id: str) -> bool:
+        label = self._enter.get(node_id)
+        return label is not None and self._low < label < self._high
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids[self._start:self._stop])
+
+
+class _Labels:
+    """Labels of a tree and its nodes in label order"""
+
+    __slots__ = ('enter', 'exit', 'order', 'ids', 'updates')
+
+    def __init__(self):
+        # Enter label of every node, exit label of every folder
+        self.enter: Dict[str, int] = {}
+        self.exit: Dict[str, int] = {}
+        # Enter labels in increasing order, and the node of each
+        self.order = array('q')
+        self.ids: List[str] = []
+        # Changes followed since the last query
+        self.updates = 0
+
+
+class TreeLabels(TreeListener):
+    """
+    Euler-tour interval labels of the tree: in a depth-first walk every node
+    gets a label when it is entered, and every folder another one when it is
+    left. The nodes inside a folder are exactly those whose enter label lies
+    between the folder's two labels, a contiguous range of the nodes sorted by
+    label: scoped searches read that range, or test a result against it,
+    instead of walking the tree.
+
+    Labels are built on the first query and follow the tree: added and moved
+    subtrees are labeled within the gap between their new neighbours (spread
+    out evenly) and their range is spliced into the sorted array, deleted ones
+    leave a gap, and renames change nothing. When a gap is too narrow, nodes
+    were loaded lazily (without events), or many changes come without a query
+    in between, the labels are dropped and rebuilt by the next query.
+    """
+
+    def __init__(self, index: NodeIndex):
+        """
+        Initialize without labels
+
+        Args:
+            index: Node index of the tree
+        """
+        self.index = index
+        self._root: Optional['CommandNode'] = None
+        self._labels: Optional[_Labels] = None
+
+    def subtree(self, folder: 'CommandNode') -> Subtree:
+        """
+        Get the nodes inside a folder (call under the read lock)
+
+        Args:
+            folder: Indexed folder (its subtree loaded, for lazy backends)
+
+        Returns:
+            Descendants of folder
+        """
+        labels = self._labels
+        if labels is None or len(labels.enter) != len(self.index) or folder.id not in labels.exit:
+            labels = self._build()
+        labels.updates = 0
+        low, high = labels.enter[folder.id], labels.exit[folder.id]
+        return Subtree(labels.enter, low, high, labels.ids,
+                       bisect_right(labels.order, low), bisect_left(labels.order, high))
+
+    def _build(self) -> _Labels:
+        """Label the whole tree (concurrent readers may both build it; either result is current)"""
+        labels = _Labels()
+        if self._root is not None:
+            added, labels.ids = self._label(labels, self._root, 0, LABEL_SPACING)
+            labels.order = array('q', added)
+        self._labels = labels
+        return labels
+
+    @staticmethod
+    def _label(labels: _Labels, node: 'CommandNode', label: int, step: int) -> Tuple[List[int], List[str]]:
+        """Label a subtree after label, step apart; returns its enter labels in increasing order and their nodes"""
+        added = []
+        added_ids = []
+        stack = [(node, False)]
+        while stack:
+            current, leaving = stack.pop()
+            label += step
+            if leaving:
+                labels.exit[current.id] = label
+                continue
+            labels.enter[current.id] = label
+            added.append(label)
+            added_ids.append(current.id)
+            if current.is_folder():
+                stack.append((current, True))
+                stack.extend((child, False) for child in reversed(current.children))
+        return added, added_ids
+
+    def _place(self, node: 'CommandNode', parent: 'CommandNode') -> bool:
+        """
+        Label a subtree in the gap at its position under parent (its old labels, if any, are replaced)
+
+        Returns:
+            False when the gap is too narrow or the neighbours have no labels
+        """
+        labels = self._labels
+        if not self._count_update():
+            return False
+        siblings = parent.children
+        position = siblings.index(node)
+        if position:
+            before = siblings[position - 1]
+            low = labels.exit.get(before.id) if before.is_folder() else labels.enter.get(before.id)
+        else:
+            low = labels.enter.get(parent.id)
+        high = labels.enter.get(siblings[position + 1].id) if position + 1 < len(siblings) \
+            else labels.exit.get(parent.id)
+        if low is None or high is None:
+            return False
+        self._unlist(node)
+        needed = 0
+        for current in _walk(node):
+            needed += 2 if current.is_folder() else 1
+        step = (high - low) // (needed + 1)
+        if step < 1:
+            return False
+        added, added_ids = self._label(labels, node, low, step)
+        # The gap held no other labels: the subtree's range goes in one piece
+        start = bisect_right(labels.order, low)
+        labels.order[start:start] = array('q', added)
+        labels.ids[start:start] = added_ids
+        return True
+
+    def _count_update(self) -> bool:
+        """Count a change to follow; False once rebuilding at the next query is cheaper"""
+        labels = self._labels
+        labels.updates += 1
+        return labels.updates <= max(MIN_UPDATES, len(labels.enter) >> 5)
+
+    def _unlist(self, node: 'CommandNode') -> None:
+        """Take the range of a labeled subtree out of the sorted array"""
+        labels = self._labels
+        first = labels.enter.get(node.id)
+        if first is None:
+            return
+        last = labels.exit.get(node.id, first)
+        start = bisect_left(labels.order, first)
+        stop = bisect_right(labels.order, last)
+        del labels.order[start:stop]
+        del labels.ids[start:stop]
+
+    # ========== TreeListener ==========
+
+    def tree_reset(self, root: 'CommandNode') -> None:
+        self._root = root
+        self._labels = None
+
+    def node_added(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        if self._labels is not None and not self._place(node, parent):
+            self._labels = None
+
+    def node_removed(self, node: 'CommandNode', parent: 'CommandNode') -> None:
+        labels = self._labels
+        if labels is None:
+            return
+        if not self._count_update():
+            self._labels = None
+            return
+        self._unlist(node)
+        for current in _walk(node):
+            labels.enter.pop(current.id, None)
+            labels.exit.pop(current.id, None)
+
+    def node_moved(self, node: 'CommandNode', old_parent: 'CommandNode', new_parent: 'CommandNode') -> None:
+        if self._labels is not None and not self._place(node, new_parent):
+            self._labels = None
+
+
+def _walk(node: 'CommandNode') -> Iterator['CommandNode']:
+    """Nodes of a subtree"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(current.children)
@@ -0,0 +1,190 @@
+"""Tree Merge - Merging a tree read back from disk with unsaved in-memory edits"""
+
+from typing import Dict, Set, Tuple, TYPE_CHECKING
+
+from .command_node import CommandNode
+from .node_index import TreeListener
+
+if TYPE_CHECKING:
+    from .data_manager import DataManager
+
+_Taken = Tuple[Set[str], Set[str], Set[str], Set[str]]
+
+
+def _subtree_ids(node: CommandNode) -> Set[str]:
+    """IDs of a node and its descendants"""
+    ids = set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        ids.add(current.id)
+        stack.extend(current.children)
+    return ids
+
+
+class LocalEdits(TreeListener):
+    """
+    IDs of the nodes changed in memory and not saved yet, by kind of change.
+
+    The DataManager takes the sets when a save starts (and gives them back if
+    it fails); merge_tree() lets these edits win over the data file.
+    """
+
+    def __init__(self):
+        """Initialize empty sets"""
+        self.added: Set[str] = set()
+        self.removed: Set[str] = set()
+        self.moved: Set[str] = set()
+        self.updated: Set[str] = set()
+        # Off while a merge applies the changes read from disk
+        self.enabled = True
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.moved or self.updated)
+
+    def take(self) -> _Taken:
+        """Clear the sets and return their content (call under the tree lock)"""
+        taken = (self.added, self.removed, self.moved, self.updated)
+        self.added, self.removed, self.moved, self.updated = set(), set(), set(), set()
+        return taken
+
+    def restore(self, taken: _Taken) -> None:
+        """Give back sets taken for a save that failed"""
+        for current, old in zip((self.added, self.removed, self.moved, self.updated), taken):
+            current |= old
+
+    # ========== TreeListener ==========
+
+    def tree_reset(self, root: CommandNode) -> None:
+        self.take()
+
+    def node_added(self, node: CommandNode, parent: CommandNode) -> None:
+        if self.enabled:
+            ids = _subtree_ids(node)
+            self.added |= ids
+            self.removed -= ids
+            self.updated.add(parent.id)
+
+    def node_removed(self, node: CommandNode, parent: CommandNode) -> None:
+        if self.enabled:
+            self.removed |= _subtree_ids(node)
+            self.updated.add(parent.id)
+
+    def node_moved(self, node: CommandNode, old_parent: CommandNode, new_parent: CommandNode) -> None:
+        if self.enabled:
+            self.moved.add(node.id)
+            if old_parent is not None:
+                self.updated.add(old_parent.id)
+            self.updated.add(new_parent.id)
+
+    def node_updated(self, node: CommandNode) -> None:
+        if self.enabled:
+            self.updated.add(node.id)
+
+
+def _same_fields(node: CommandNode, other: CommandNode) -> bool:
+    return (node.name == other.name and node.content == other.content and node.description == other.description
+            and node._created == other._created and node._updated == other._updated)
+
+
+def merge_tree(manager: 'DataManager', disk_root: CommandNode, local: LocalEdits) -> bool:
+    """
+    Apply to the tree of manager the differences with a tree read from its
+    data file, except where they would undo edits not saved yet.
+
+    Nodes are matched by ID. Added, removed and moved nodes follow the disk
+    unless the same node was added, removed or moved locally; field changes
+    follow the disk unless the node was edited locally and is newer than on
+    disk (by updated_at). Children are put in the disk order. Call under the
+    tree lock with local disabled; a disk tree with another root replaces the
+    tree (tree_reset) unless there are local edits.
+
+    Args:
+        manager: Data manager (of a fully loaded, non-lazy tree)
+        disk_root: Root of the tree read from disk (not indexed)
+        local: Unsaved local edits
+
+    Returns:
+        Whether local edits were kept that the disk does not have (the tree must be saved)
+    """
+    root = manager.root
+    if disk_root.id != root.id:
+        if local:
+            return True
+        manager.set_root(disk_root)
+        return False
+    index = manager.index
+    kept = False
+
+    # Disk nodes by ID
+    disk: Dict[str, CommandNode] = {}
+    stack = [disk_root]
+    while stack:
+        disk_node = stack.pop()
+        disk[disk_node.id] = disk_node
+        stack.extend(disk_node.children)
+
+    # Additions and moves, top-down so a folder is in place before its children
+    stack = [disk_root]
+    while stack:
+        disk_folder = stack.pop()
+        folder = index.get(disk_folder.id)
+        if folder is None:
+            continue
+        for disk_child in disk_folder.children:
+            node = index.get(disk_child.id)
+            if node is None:
+                if disk_child.id in local.removed:
+                    kept = True
+                    continue
+                folder.add_child(CommandNode.from_fields(disk_child.to_fields()))
+            else:
+                parent = index.get_parent(node.id)
+                if parent is not folder and parent is not None:
+                    if node.id in local.moved:
+                        kept = True
+                    elif not index.is_ancestor(node.id, folder.id):
+                        parent.detach_child(node.id)
+                        folder.add_child(node)
+            stack.append(disk_child)
+        # Disk order among the children that are where the disk has them
+        positions = {child.id: i for i, child in enumerate(disk_folder.children)}
+        current = [child for child in folder.children if child.id in positions]
+        in_order = sorted(current, key=lambda c: positions[c.id])
+        if current != in_order:
+            for child in in_order:
+                if child.id in local.moved:
+                    kept = True
+                    continue
+                folder.detach_child(child.id)
+                folder.add_child(child)
+
+    # Removals: nodes the disk does not have, topmost first
+    for node in list(index.nodes.values()):
+        if node.id in disk:
+            continue
+        parent = index.get_parent(node.id)
+        if parent is None or parent.id not in disk:
+            continue
+        if local.added and not local.added.isdisjoint(_subtree_ids(node)):
+            # Added locally, or holding something added locally
+            kept = True
+            continue
+        parent.remove_child(node.id)
+
+    # Fields, including the updated_at of the folders changed above
+    for node_id, disk_node in disk.items():
+        node = index.get(node_id)
+        if node is None or _same_fields(node, disk_node):
+            continue
+        # Timestamps are compared as isoformat strings (unparsed ones are kept as strings)
+        if node_id in local.updated and (node.updated_at or "") >= (disk_node.updated_at or ""):
+            kept = True
+            continue
+        node.name = disk_node.name
+        node.content = disk_node.content
+        node.description = disk_node.description
+        node._created = disk_node._created
+        node._updated = disk_node._updated
+        manager.mark_updated(node)
+    return kept
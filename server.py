@@ -0,0 +1,57 @@
+"""
+CommandNote server: share one command store with editor plugins and the command line, without the window
+
+Usage:
+    python server.py [--data-file PATH] [--address unix:PATH|HOST:PORT]
+
+Serves the local JSON-RPC protocol described in views/rpc_server.py until
+interrupted, then saves and exits. The window serves the same protocol when
+started with COMMANDNOTE_RPC=1. The storage and undo settings are the application's
+(COMMANDNOTE_STORAGE, COMMANDNOTE_JOURNAL, COMMANDNOTE_WRITE_BEHIND,
+COMMANDNOTE_UNDO_LIMIT).
+"""
+
+import argparse
+import signal
+import sys
+from typing import List, Optional
+
+from config import controller_options, data_manager_options, rpc_options
+from controllers import CommandController
+from models import DataManager
+from views.rpc_server import RpcServer
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Server entry point"""
+    parser = argparse.ArgumentParser(prog="commandnote-server", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-file", default=None, help="JSON data file (default: data/commands.json)")
+    parser.add_argument("--address", default=(rpc_options() or {}).get('address'),
+                        help="unix:PATH or HOST:PORT on the loopback interface "
+                             "(default: COMMANDNOTE_RPC_ADDRESS, else a Unix socket next to the data file)")
+    args = parser.parse_args(argv)
+
+    manager = DataManager(args.data_file, **data_manager_options())
+    server = RpcServer(CommandController(manager, **controller_options()), args.address)
+    try:
+        address = server.start()
+    except (OSError, ValueError) as e:
+        manager.close()
+        sys.stderr.write(f"commandnote-server: {e}\n")
+        return 2
+    print(f"Serving {manager.data_file} on {address}", flush=True)
+    # Stop cleanly on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
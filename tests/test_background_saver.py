@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from controllers import CommandController
+from models import DataManager
+from models.background_saver import BackgroundSaver
+
+
+class Saves:
+    """save callback that counts its calls"""
+
+    def __init__(self, results=(), duration=0.0):
+        self.times = []
+        self.results = list(results)
+        self.duration = duration
+        self.running = threading.Event()
+
+    def __call__(self):
+        self.running.set()
+        time.sleep(self.duration)
+        self.times.append(time.monotonic())
+        self.running.clear()
+        return self.results.pop(0) if self.results else True
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_burst_is_saved_once():
+    saves = Saves()
+    saver = BackgroundSaver(saves, delay=0.05, max_delay=5.0)
+    for _ in range(50):
+        saver.mark_dirty()
+    assert saver.dirty
+    wait_for(lambda: saves.times)
+    time.sleep(0.1)
+    assert len(saves.times) == 1 and not saver.dirty
+    saver.close()
+    assert len(saves.times) == 1
+
+
+def test_steady_changes_are_saved_by_max_delay():
+    saves = Saves()
+    saver = BackgroundSaver(saves, delay=0.05, max_delay=0.1)
+    start = time.monotonic()
+    while time.monotonic() - start < 0.5:
+        saver.mark_dirty()
+        time.sleep(0.01)
+    # Never quiet for the delay, still saved every max_delay
+    assert len(saves.times) >= 3
+    saver.close()
+
+
+def test_failed_save_is_retried():
+    saves = Saves(results=[False, True])
+    saver = BackgroundSaver(saves, delay=0.02)
+    saver.mark_dirty()
+    wait_for(lambda: len(saves.times) == 2)
+    assert not saver.dirty
+    saver.close()
+
+
+def test_flush_waits_for_a_running_save():
+    saves = Saves(duration=0.1)
+    saver = BackgroundSaver(saves, delay=0.0)
+    saver.mark_dirty()
+    saves.running.wait(1)
+    # Marked while the save runs: flush waits for it, then saves again
+    saver.mark_dirty()
+    assert saver.flush()
+    assert len(saves.times) == 2 and not saver.dirty
+    assert saver.flush() and len(saves.times) == 2
+    saver.close()
+
+
+def test_close_saves_what_is_pending():
+    saves = Saves()
+    saver = BackgroundSaver(saves, delay=10.0)
+    saver.mark_dirty()
+    assert saver.close()
+    assert len(saves.times) == 1
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_write_behind_round_trip(tmp_path, journal):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, journal=journal, write_behind=True, save_delay=0.02)
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    ids = [controller.create_command(root_id, f"c{i}", f"echo {i}")['id'] for i in range(20)]
+    controller.update_node(ids[0], name="first")
+    controller.delete_node(ids[1])
+    expected = [(child.id, child.name) for child in manager.get_root().children]
+    manager.close()
+
+    reopened = DataManager(path, journal=journal)
+    assert [(child.id, child.name) for child in reopened.get_root().children] == expected
+    reopened.close()
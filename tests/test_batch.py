@@ -0,0 +1,51 @@
+import pytest
+
+from controllers import CommandController
+from models import DataManager
+
+
+def snapshot(manager):
+    root = manager.get_root()
+    manager.load_subtree(root)
+
+    def walk(node):
+        return (node.id, node.name, node.content, node.description, node.updated_at,
+                [walk(child) for child in node.children])
+
+    return walk(root)
+
+
+@pytest.mark.parametrize('storage, journal', [('json', False), ('json', True), ('sqlite', False), ('sharded', False)])
+def test_failed_batch_changes_nothing(tmp_path, storage, journal):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, storage=storage, journal=journal)
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    tools = controller.create_folder(root_id, "Tools")['id']
+    inner = controller.create_folder(tools, "Inner")['id']
+    command = controller.create_command(inner, "List", "ls -la")['id']
+    manager.flush()
+    before = snapshot(manager)
+    saved = open(path, 'rb').read() if storage == 'json' else None
+
+    with pytest.raises(ValueError, match="Operation 4"):
+        controller.apply_batch([
+            {'op': 'create_folder', 'parent_id': root_id, 'name': "New"},
+            {'op': 'create_command', 'parent_id': '$0', 'name': "Echo", 'content': "echo"},
+            {'op': 'update_node', 'node_id': command, 'name': "Renamed", 'content': "ls"},
+            {'op': 'move_node', 'node_id': inner, 'new_parent_id': '$0'},
+            # Into its own descendant
+            {'op': 'move_node', 'node_id': '$0', 'new_parent_id': inner},
+        ])
+    assert snapshot(manager) == before
+    assert manager.search("echo") == [] and manager.search("renamed") == []
+    manager.flush()
+    if saved is not None:
+        # The snapshot is not rewritten (incremental backends store the changes and
+        # their inverses, checked by reopening below)
+        assert open(path, 'rb').read() == saved
+    manager.close()
+
+    reopened = DataManager(path, storage=storage, journal=journal)
+    assert snapshot(reopened) == before
+    reopened.close()
@@ -0,0 +1,109 @@
+import io
+import json
+
+import pytest
+
+from controllers import CommandController
+from models import DataManager
+from models.json_stream import load_tree
+
+CONTENT = "docker run --rm -it -v \"$PWD\":/work -w /work python:3.12 python -m pytest -q"
+DESCRIPTION = "Run the test suite in a throwaway container, with the working tree mounted"
+
+
+def commands(root):
+    stack, found = [root], []
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        if node.is_command():
+            found.append((node.id, node.content, node.description))
+    return sorted(found)
+
+
+@pytest.mark.parametrize('chunk_size', [64 * 1024, 64])
+def test_duplicate_save_reload_delete_cycle(tmp_path, chunk_size):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path)
+    controller = CommandController(manager)
+    folder = controller.create_folder(manager.get_root().id, "Tests")['id']
+    controller.create_command(folder, "pytest", CONTENT, DESCRIPTION)
+    controller.create_command(folder, "short", "ls", "")
+    copy = controller.duplicate_node(folder)['id']
+    manager.flush()
+
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    data = json.loads(text)
+    # Each shared body is written once, in the table, and referred to by digest
+    assert sorted(data['blobs'].values()) == sorted([CONTENT, DESCRIPTION])
+    assert text.count(CONTENT.replace('"', '\\"')) == 1 and text.count(DESCRIPTION) == 1
+    assert text.count('"content_blob"') == 2 and text.count('"description_blob"') == 2
+    # The short body stays inline
+    folders = [child for child in data['children'] if child['name'].startswith("Tests")]
+    assert [[child.get('content') for child in folder['children']] for folder in folders] == [[None, "ls"]] * 2
+    expected = commands(manager.get_root())
+    copied = {node_id for node_id, _, _ in commands(manager.find_node_by_id(copy))}
+    # Whole subtrees decoded at once (large chunks) or field by field (small chunks)
+    root, _ = load_tree(io.StringIO(text), chunk_size=chunk_size)
+    assert commands(root) == expected
+    manager.close()
+
+    manager = DataManager(path)
+    assert commands(manager.get_root()) == expected
+    controller = CommandController(manager)
+    controller.delete_node(copy)
+    manager.flush()
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    data = json.loads(text)
+    # Held by one node again: back inline
+    assert 'blobs' not in data and '_blob"' not in text
+    root, _ = load_tree(io.StringIO(text), chunk_size=chunk_size)
+    assert commands(root) == [command for command in expected if command[0] not in copied]
+    manager.close()
+
+    manager = DataManager(path)
+    assert commands(manager.get_root()) == commands(root)
+    manager.close()
+
+
+def test_edited_copy_gets_its_own_body(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path)
+    controller = CommandController(manager)
+    command = controller.create_command(manager.get_root().id, "pytest", CONTENT, DESCRIPTION)['id']
+    copy = controller.duplicate_node(command)['id']
+    controller.update_node(copy, content=CONTENT + " -x")
+    manager.close()
+    with open(path, encoding='utf-8') as f:
+        data = json.loads(f.read())
+    assert list(data['blobs'].values()) == [DESCRIPTION]
+    manager = DataManager(path)
+    assert manager.find_node_by_id(copy).content == CONTENT + " -x"
+    assert manager.find_node_by_id(command).content == CONTENT
+    manager.close()
+
+
+def test_one_node_per_line(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path)
+    controller = CommandController(manager)
+    folder = controller.create_folder(manager.get_root().id, "Tests")['id']
+    command = controller.create_command(folder, "pytest", CONTENT, DESCRIPTION)['id']
+    controller.duplicate_node(command)
+    manager.flush()
+    with open(path, encoding='utf-8') as f:
+        before = f.read().splitlines()
+    # The blob table, then each node on a line of its own
+    assert before[0].startswith('{"blobs":') and len(before) == 1 + len(manager.index)
+
+    controller.update_node(command, name="pytest -x")
+    manager.close()
+    with open(path, encoding='utf-8') as f:
+        after = f.read().splitlines()
+    changed = [line for line in after if line not in before]
+    assert len(after) == len(before) and len(changed) == 1 and '"pytest -x"' in changed[0]
+    reopened = DataManager(path)
+    assert commands(reopened.get_root()) == commands(manager.get_root())
+    reopened.close()
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from controllers import CommandController
+from models import DataManager
+
+
+def test_changes_are_coalesced(tmp_path):
+    manager = DataManager(str(tmp_path / "commands.json"))
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    kept = controller.create_folder(root_id, "kept")
+    moved = controller.create_command(root_id, "moved", "ls")
+    version = controller.get_tree_version()
+
+    temporary = controller.create_folder(root_id, "temporary")
+    controller.delete_node(temporary['id'])
+    added = controller.create_command(kept['id'], "added", "pwd")
+    controller.update_node(added['id'], name="added2")
+    controller.move_node(moved['id'], kept['id'])
+    controller.update_node(moved['id'], description="d")
+    controller.update_node(kept['id'], name="kept2")
+
+    changes = controller.get_changes_since(version)
+    assert changes['since'] == version and changes['version'] == controller.get_tree_version()
+    # Inserted and removed again within the window: not reported at all
+    assert changes['removed'] == []
+    assert [(entry['id'], entry['name']) for entry in changes['inserted']] == [(added['id'], "added2")]
+    assert [(entry['id'], entry['parent_id']) for entry in changes['moved']] == [(moved['id'], kept['id'])]
+    assert kept['id'] in {entry['id'] for entry in changes['updated']}
+    assert controller.get_changes_since(controller.get_tree_version())['inserted'] == []
+    # Older than the retained history, or from the future: reload everything
+    manager.set_root(manager.get_root())
+    assert controller.get_changes_since(version)['reset']
+    assert controller.get_changes_since(controller.get_tree_version() + 1)['reset']
+    manager.close()
+
+
+def test_change_set_belongs_to_its_mutation(tmp_path):
+    manager = DataManager(str(tmp_path / "commands.json"))
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    stop = threading.Event()
+
+    def other_writer():
+        while not stop.is_set():
+            controller.create_folder(root_id, "other")
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=other_writer)
+    thread.start()
+    try:
+        for i in range(50):
+            created, changes = controller.run_with_changes(controller.create_command, root_id, f"c{i}", "ls")
+            assert [entry['id'] for entry in changes['inserted']] == [created['id']]
+            assert changes['updated'] == [] or [entry['id'] for entry in changes['updated']] == [root_id]
+    finally:
+        stop.set()
+        thread.join()
+    manager.close()
+
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import cli
+from models import CommandNode
+
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    for name in ("COMMANDNOTE_STORAGE", "COMMANDNOTE_JOURNAL"):
+        monkeypatch.delenv(name, raising=False)
+    root = CommandNode(name="Root", node_type="folder")
+    docker = CommandNode(name="Docker", node_type="folder")
+    root.add_child(docker)
+    docker.add_child(CommandNode(name="Build image", node_type="command", content="docker build -t app .",
+                                 description="Multi\nline"))
+    root.add_child(CommandNode(name="Git status", node_type="command", content="git status"))
+    path = tmp_path / "commands.json"
+    path.write_bytes(root.to_json())
+    return str(path)
+
+
+def test_search_get_and_ls(data_file, capsys):
+    assert cli.main(["--data-file", data_file, "search", "docker"]) == 0
+    node_id, path, content = capsys.readouterr().out.rstrip('\n').split('\t')
+    assert path == "Docker/Build image" and content == "docker build -t app ."
+    assert os.path.exists(data_file + ".index.sqlite3")
+
+    assert cli.main(["--data-file", data_file, "get", "Docker/Build image"]) == 0
+    assert capsys.readouterr().out == "docker build -t app .\n"
+    assert cli.main(["--data-file", data_file, "get", node_id, "--json"]) == 0
+    assert json.loads(capsys.readouterr().out)['description'] == "Multi\nline"
+
+    assert cli.main(["--data-file", data_file, "ls", "--format", "ids", "-r"]) == 0
+    assert len(capsys.readouterr().out.split()) == 3
+    assert cli.main(["--data-file", data_file, "search", "--fuzzy", "gitstat", "--format", "json"]) == 0
+    assert [json.loads(line)['name'] for line in capsys.readouterr().out.splitlines()] == ["Git status"]
+    assert cli.main(["--data-file", data_file, "search", "kubectl"]) == 1
+
+
+def test_add_refreshes_the_index(data_file, capsys):
+    assert cli.main(["--data-file", data_file, "add", "Docker", "Prune", "docker system prune"]) == 0
+    node_id = capsys.readouterr().out.strip()
+    assert cli.main(["--data-file", data_file, "search", "prune", "--format", "ids"]) == 0
+    assert capsys.readouterr().out.split() == [node_id]
+
+
+@pytest.mark.parametrize("storage", [None, "sqlite", "sharded"])
+def test_lookups_without_data_fail_and_create_nothing(tmp_path, monkeypatch, capsys, storage):
+    if storage is None:
+        monkeypatch.delenv("COMMANDNOTE_STORAGE", raising=False)
+    else:
+        monkeypatch.setenv("COMMANDNOTE_STORAGE", storage)
+    data_file = str(tmp_path / "commands.json")
+    for argv in (["search", "git"], ["get", "x"], ["ls"]):
+        assert cli.main(["--data-file", data_file] + argv) == 2
+        assert "No data" in capsys.readouterr().err
+    assert os.listdir(tmp_path) == []
+
+
+def test_lookups_import_neither_the_controller_nor_the_views():
+    code = ("import sys, cli\n"
+            "print(sorted(m for m in sys.modules if m.split('.')[0] in ('controllers', 'views', 'yaml', 'config')))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,36 @@
+import os
+import stat
+
+import pytest
+
+from controllers import CommandController
+from models import DataManager
+from models.fileio import atomic_write_bytes
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fchmod'), reason="POSIX permissions")
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_file_follows_umask(tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    path = str(tmp_path / "new.json")
+    atomic_write_bytes(path, b"{}")
+    assert mode(path) == 0o666 & ~umask
+
+
+def test_replacement_keeps_the_mode(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path)
+    os.chmod(path, 0o640)
+    CommandController(manager).create_folder(manager.get_root().id, "F")
+    assert mode(path) == 0o640
+    manager.close()
+    os.chmod(path, 0o604)
+    atomic_write_bytes(path, b"{}")
+    assert mode(path) == 0o604
+    with open(path, 'rb') as f:
+        assert f.read() == b"{}"
@@ -0,0 +1,85 @@
+import pytest
+
+from models import CommandNode, SearchIndex
+from models.fuzzy import (edit_distance, is_transposition, max_score, max_typos, score_positions,
+                          subsequence_pattern, subsequence_positions, to_ranges)
+
+
+def test_edit_distance():
+    assert edit_distance("docker", "docker", 2) == 0
+    assert edit_distance("dokcer", "docker", 2) == 1
+    assert edit_distance("dcoker", "docker", 1) == 1
+    assert edit_distance("dockr", "docker", 1) == 1
+    assert edit_distance("kubectl", "kubctel", 2) == 2
+    assert edit_distance("kubectl", "kbctel", 2) is None
+    assert edit_distance("git", "docker", 2) is None
+
+
+def test_max_typos_and_transpositions():
+    assert [max_typos(n) for n in (2, 3, 4, 7, 8, 20)] == [0, 0, 1, 1, 2, 2]
+    assert is_transposition("gti", "git")
+    assert not is_transposition("get", "git")
+    assert not is_transposition("tig", "git")
+    assert not is_transposition("git", "git")
+
+
+def test_subsequence_helpers():
+    pattern = subsequence_pattern("gst")
+    assert pattern.search("git status").group() == "git st"
+    assert pattern.search("g\nst") is None
+    assert subsequence_positions("go get it", "git") == [3, 7, 8]
+    assert subsequence_positions("docker", "git") is None
+    assert to_ranges([0, 1, 2, 5, 7, 8]) == [(0, 3), (5, 6), (7, 9)]
+    # Word starts and runs score higher; a whole word scores max_score
+    assert score_positions("git status", [0, 1, 2]) == max_score(3)
+    assert score_positions("git status", [0, 4, 5]) > score_positions("digit status", [2, 3, 4])
+
+
+@pytest.fixture
+def index():
+    root = CommandNode(name="Root", node_type="folder")
+    for name, description, content in [
+            ("Git status", "", "git status"),                   # name word start
+            ("Show gitstatus", "", ""),                         # name, not at a word start
+            ("g i t", "", ""),                                  # name subsequence
+            ("Commit", "run git hooks", ""),                    # description
+            ("Push", "", "git push origin"),                    # content
+            ("Gti", "", ""),                                    # swapped neighbours
+            ("Deploy", "goes into the tree", ""),               # description subsequence
+            ("Fetch", "", "grep -i tags"),                      # content subsequence
+            ("Docker", "", "docker ps")]:
+        root.add_child(CommandNode(name=name, node_type="command", description=description, content=content))
+    index = SearchIndex()
+    index.rebuild(root)
+    return index, {child.id: child.name for child in root.children}
+
+
+def names(index, keyword, limit=None):
+    index, node_names = index
+    return [node_names[node_id] for node_id, _, _ in index.fuzzy_search(keyword, limit)]
+
+
+def test_tiers_rank_best_first(index):
+    assert names(index, "git") == ["Git status", "Show gitstatus", "g i t", "Commit", "Push", "Gti",
+                                   "Deploy", "Fetch"]
+    assert names(index, "git", 3) == ["Git status", "Show gitstatus", "g i t"]
+    results = index[0].fuzzy_search("git", 5)
+    assert [field for _, field, _ in results] == ["name", "name", "name", "description", "content"]
+    assert results[0][2] == [(0, 3)]
+    assert results[2][2] == [(0, 1), (2, 3), (4, 5)]
+
+
+def test_typos(index):
+    assert names(index, "dokcer") == ["Docker"]
+    assert names(index, "gti")[0] == "Gti"
+    # A short keyword forgives swapped neighbours only
+    assert "Git status" in names(index, "gti")
+    assert names(index, "dpcker") == ["Docker"]
+    assert names(index, "gut") == []
+
+
+def test_batches_follow_the_ranking(index):
+    index, _ = index
+    batches = list(index.iter_fuzzy_search("git"))
+    assert len(batches) > 1
+    assert [result for batch in batches for result in batch] == index.fuzzy_search("git")
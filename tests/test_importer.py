@@ -0,0 +1,98 @@
+import io
+import json
+import sys
+
+import pytest
+
+from controllers import CommandController, ImportedCommand
+from controllers.command_importer import (_ProgressFile, detect_format, normalize_command, read_bash_history,
+                                          read_json_snippets, read_yaml_snippets, read_zsh_history)
+from models import DataManager
+
+
+def read(reader, data):
+    return list(reader(_ProgressFile(io.BytesIO(data))))
+
+
+def test_bash_history():
+    data = b"#1700000000\ngit status\n\n  ls -la  \n#1700000001\ncaf\xc3\xa9 --help\n"
+    assert [c.content for c in read(read_bash_history, data)] == ["git status", "ls -la", "café --help"]
+
+
+def test_zsh_history():
+    # Extended format, a multi-line command and a metafied byte (0xa9 stored as 0x83 0x89)
+    data = b": 1700000000:0;git status\n: 1700000001:0;for f in *; do\\\necho $f\\\ndone\necho caf\xc3\x83\x89\nls\n"
+    assert [c.content for c in read(read_zsh_history, data)] == \
+        ["git status", "for f in *; do\necho $f\ndone", "echo café", "ls"]
+
+
+def test_json_snippets():
+    data = json.dumps([
+        "docker ps",
+        {"command": "kubectl get pods", "title": "Pods", "tags": ["k8s", "ops"]},
+        {"content": "ls", "name": "List", "description": "Files", "folder": "Shell/Files"},
+        {"name": "no content"},
+        42,
+    ]).encode()
+    assert read(read_json_snippets, data) == [
+        ImportedCommand("docker ps"),
+        ImportedCommand("kubectl get pods", "Pods", "", "k8s"),
+        ImportedCommand("ls", "List", "Files", "Shell/Files"),
+    ]
+
+
+def test_yaml_snippets():
+    pytest.importorskip("yaml")
+    data = b"- docker ps\n- command: |\n    kubectl get pods\n    --all-namespaces\n  title: Pods\n  category: k8s\n..."
+    assert read(read_yaml_snippets, data) == [
+        ImportedCommand("docker ps"),
+        ImportedCommand("kubectl get pods\n--all-namespaces", "Pods", "", "k8s"),
+    ]
+
+
+def test_yaml_without_pyyaml(monkeypatch):
+    monkeypatch.setitem(sys.modules, "yaml", None)
+    with pytest.raises(ValueError, match="PyYAML"):
+        read(read_yaml_snippets, b"- ls\n")
+
+
+def test_detect_format(tmp_path):
+    zsh = tmp_path / "history"
+    zsh.write_bytes(b": 1700000000:0;ls\n")
+    bash = tmp_path / ".bash_history"
+    bash.write_bytes(b"ls\n")
+    assert [detect_format(str(path)) for path in (zsh, bash)] == ['zsh', 'bash']
+    assert detect_format("snippets.JSON") == 'json' and detect_format("a.yml") == 'yaml'
+    assert normalize_command("git   commit \\\n  -m x") == "git commit -m x"
+
+
+@pytest.mark.parametrize('storage', ['json', 'sqlite'])
+def test_import_skips_duplicates_and_undoes(tmp_path, storage):
+    manager = DataManager(str(tmp_path / "commands.json"), storage=storage)
+    controller = CommandController(manager)
+    root = manager.get_root()
+    controller.create_command(root.id, "Status", "git  status")
+    history = tmp_path / ".bash_history"
+    history.write_bytes(b"git status\nsudo docker ps\ndocker   ps\nls\ngit log\n")
+    names = [child.name for child in root.children]
+    parent_updated_at = root.updated_at
+
+    result = controller.import_file(str(history))
+    assert (result['read'], result['imported'], result['duplicates']) == (5, 4, 1)
+    folder = manager.find_node_by_id(result['folder']['id'])
+    assert sorted(child.name for child in folder.children) == ["docker", "git", "ls"]
+    assert manager.get_root().updated_at != parent_updated_at
+
+    # Commands edited or deleted since are no longer duplicates
+    git_folder = next(child for child in folder.children if child.name == "git")
+    controller.update_node(git_folder.children[0].id, content="git log --oneline")
+    controller.delete_node(next(child for child in folder.children if child.name == "ls").id)
+    assert controller.import_file(str(history))['imported'] == 2
+
+    for _ in range(4):
+        assert controller.undo()
+    assert [child.name for child in manager.get_root().children] == names
+    assert manager.get_root().updated_at == parent_updated_at
+    # The undone import's commands are not in the tree any more
+    assert controller.import_file(str(history))['imported'] == 4
+    manager.close()
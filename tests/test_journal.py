@@ -0,0 +1,81 @@
+import json
+import os
+
+from controllers import CommandController
+from models import DataManager
+
+
+def tree_json(manager):
+    return json.dumps(manager.get_root().to_dict(), sort_keys=True)
+
+
+def test_replay_after_restart(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, journal=True)
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    folder = controller.create_folder(root_id, "F")
+    command = controller.create_command(folder['id'], "a", "echo a")
+    controller.update_node(command['id'], name="b", description="d")
+    other = controller.create_folder(root_id, "G")
+    controller.move_node(folder['id'], other['id'])
+    controller.duplicate_node(folder['id'])
+    controller.delete_node(command['id'])
+    expected = tree_json(manager)
+    snapshot = open(path, 'rb').read()
+    manager.close()
+    # Only the journal changed: the snapshot still holds the tree before the edits
+    assert open(path, 'rb').read() == snapshot
+    assert os.path.getsize(path + ".journal") > 0
+
+    reopened = DataManager(path, journal=True)
+    assert tree_json(reopened) == expected
+    reopened.close()
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, journal=True)
+    controller = CommandController(manager)
+    controller.create_folder(manager.get_root().id, "kept")
+    expected = tree_json(manager)
+    manager.close()
+    journal = path + ".journal"
+    size = os.path.getsize(journal)
+    with open(journal, 'ab') as f:
+        # A crash in the middle of an append
+        f.write(b'{"seq":99,"op":"remove","id":')
+
+    reopened = DataManager(path, journal=True)
+    assert tree_json(reopened) == expected
+    assert os.path.getsize(journal) == size
+    # New records follow the intact ones
+    CommandController(reopened).create_folder(reopened.get_root().id, "after")
+    expected = tree_json(reopened)
+    reopened.close()
+    again = DataManager(path, journal=True)
+    assert tree_json(again) == expected
+    again.close()
+
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, journal=True, journal_max_records=10)
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    for i in range(25):
+        controller.create_command(root_id, f"c{i}", f"echo {i}")
+    expected = tree_json(manager)
+    manager.close()
+    assert not os.path.exists(path + ".journal.compacting")
+    with open(path + ".journal", 'rb') as f:
+        assert sum(1 for _ in f) < 25
+
+    reopened = DataManager(path, journal=True)
+    assert tree_json(reopened) == expected
+    reopened.close()
+    # Switching journal mode off folds the remaining records into the snapshot
+    plain = DataManager(path)
+    assert tree_json(plain) == expected
+    assert not os.path.exists(path + ".journal")
+    plain.close()
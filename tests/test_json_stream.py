@@ -0,0 +1,41 @@
+import io
+import json
+
+from models.json_stream import load_tree
+
+
+def chain(depth):
+    """JSON of a folder chain depth levels deep, with one command at the bottom"""
+    # Built as text: json.dumps() recurses once per level
+    leaf = json.dumps({"id": "leaf", "name": "leaf", "node_type": "command", "content": 'echo "}"', "description": ""})
+    opening = ''.join(f'{{"id": "f{level}", "name": "folder {level}", "node_type": "folder", "description": "", '
+                      f'"children": [' for level in reversed(range(depth)))
+    return opening + leaf + "]}" * depth
+
+
+def test_deep_chain():
+    depth = 3000
+    root, _ = load_tree(io.StringIO(chain(depth)), chunk_size=4096)
+    levels = 0
+    node = root
+    while node.children:
+        assert len(node.children) == 1
+        assert node.children[0].parent_id == node.id
+        node = node.children[0]
+        levels += 1
+    assert levels == depth
+    assert node.id == "leaf" and node.content == 'echo "}"'
+
+
+def test_small_chunks_match_json_module():
+    text = json.dumps({"id": "r", "name": "Root", "node_type": "folder", "description": "x", "children": [
+        {"id": str(i), "name": f"n{i} é", "node_type": "folder", "description": '{["', "children": [
+            {"id": f"{i}.c", "name": "c", "node_type": "command", "content": "a\nb", "description": ""}]}
+        for i in range(50)]})
+    expected = json.loads(text)
+    for chunk_size in (7, 64, 1024):
+        root, _ = load_tree(io.StringIO(text), chunk_size=chunk_size)
+        assert [child.id for child in root.children] == [child['id'] for child in expected['children']]
+        assert [child.name for child in root.children] == [child['name'] for child in expected['children']]
+        assert [child.description for child in root.children] == ['{["'] * 50
+        assert [child.children[0].content for child in root.children] == ["a\nb"] * 50
@@ -0,0 +1,70 @@
+import json
+
+from benchmarks.synthetic import build_tree
+from models import CommandNode, DataManager, QueryIndex
+from models.search_index import StorageSearchIndex
+
+
+def write_tree(path, root):
+    with open(path, 'wb') as f:
+        f.write(root.to_json())
+
+
+def sample_tree():
+    root = build_tree(600, fanout=5, seed=2)
+    folder = root.children[0]
+    for name, content in [("Git status", "git status\ngit diff"), ("Docker build", "docker build -t app ."),
+                          ("Grep logs", "grep -rn ERROR /var/log"), ("git log", "git log --oneline")]:
+        folder.add_child(CommandNode(name=name, node_type="command", content=content, description="Multi\nline"))
+    return root
+
+
+def open_index(path):
+    index = QueryIndex(path, [path])
+
+    def load_root():
+        with open(path, 'rb') as f:
+            return CommandNode.from_dict(json.load(f))
+
+    return DataManager(path, storage=index.open_storage(load_root))
+
+
+def test_saved_fuzzy_index_matches_a_filled_one(tmp_path):
+    path = str(tmp_path / "commands.json")
+    write_tree(path, sample_tree())
+    manager = open_index(path)
+    tables = manager.storage.read_fuzzy_tables()
+    assert tables is not None
+    saved = StorageSearchIndex.from_tables(tables)
+    filled = StorageSearchIndex()
+    filled.add_rows(manager.storage.iter_commands())
+    assert len(saved) == len(filled)
+    for keyword in ["git", "gitt", "dokcer", "docker build", "grep", "line", "multi line", "node 12", "xyz", "rot"]:
+        assert saved.fuzzy_search(keyword, 20) == filled.fuzzy_search(keyword, 20), keyword
+        assert saved.fuzzy_search(keyword) == filled.fuzzy_search(keyword), keyword
+    assert [node_id for node_id, _, _ in manager.fuzzy_search("gti status", 5)] == \
+        [node_id for node_id, _, _ in saved.fuzzy_search("gti status", 5)]
+    manager.close()
+
+
+def test_change_drops_the_saved_fuzzy_index(tmp_path):
+    path = str(tmp_path / "commands.json")
+    write_tree(path, sample_tree())
+    manager = open_index(path)
+    manager.storage.node_updated(manager.get_root())
+    assert manager.storage.read_fuzzy_tables() is None
+    manager.close()
+
+
+def test_index_is_rebuilt_when_the_data_changes(tmp_path):
+    path = str(tmp_path / "commands.json")
+    root = sample_tree()
+    write_tree(path, root)
+    open_index(path).close()
+    root.children[0].add_child(CommandNode(name="kubectl get pods", node_type="command", content="kubectl get pods"))
+    write_tree(path, root)
+    manager = open_index(path)
+    assert [manager.find_node_by_id(node_id).name for node_id, _, _ in manager.fuzzy_search("kubctl", 1)] == \
+        ["kubectl get pods"]
+    assert manager.search("kubectl")
+    manager.close()
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from controllers import CommandController
+from models import DataManager
+from views.rpc_client import RpcClient, RpcError
+from views.rpc_server import RpcServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    manager = DataManager(str(tmp_path / "commands.json"))
+    server = RpcServer(CommandController(manager))
+    server.start()
+    yield server
+    server.stop()
+    manager.close()
+
+
+def test_concurrent_writes_are_saved_once_per_group(server, monkeypatch):
+    manager = server.controller.data_manager
+    path = manager.data_file
+    saves = []
+    groups = []
+    save = manager.storage.save
+    write_group = server._write_group
+
+    def slow_save():
+        # Writes sent meanwhile queue up into the next group
+        time.sleep(0.02)
+        save()
+        saves.append(time.monotonic())
+
+    def counted_group(group):
+        groups.append(len(group))
+        write_group(group)
+
+    monkeypatch.setattr(manager.storage, 'save', slow_save)
+    monkeypatch.setattr(server, '_write_group', counted_group)
+    root_id = manager.get_root().id
+    clients, per_client = 4, 25
+    created = [[] for _ in range(clients)]
+    errors = []
+
+    def run(number):
+        try:
+            with RpcClient(server.address) as client:
+                requests = [client.send('create_command', root_id, f"c{number}.{i}", f"echo {number} {i}")
+                            for i in range(per_client)]
+                for request_id in requests:
+                    node_id = client.receive(request_id)['data']['id']
+                    # Replied to only once saved
+                    with open(path, encoding='utf-8') as f:
+                        assert node_id in f.read()
+                    created[number].append(node_id)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sum(groups) == clients * per_client
+    assert len(saves) == len(groups) < clients * per_client
+
+    reopened = DataManager(path)
+    names = {child.id: child.name for child in reopened.get_root().children}
+    for number, ids in enumerate(created):
+        assert [names[node_id] for node_id in ids] == [f"c{number}.{i}" for i in range(per_client)]
+    reopened.close()
+
+
+def test_failed_write_does_not_fail_its_group(server):
+    root_id = server.controller.data_manager.get_root().id
+    with RpcClient(server.address) as client:
+        first = client.send('create_folder', root_id, "A")
+        bad = client.send('move_node', "missing", root_id)
+        last = client.send('create_folder', root_id, "B")
+        assert client.receive(first)['data']['name'] == "A"
+        with pytest.raises(RpcError):
+            client.receive(bad)
+        assert client.receive(last)['data']['name'] == "B"
+        tree = client.call('get_tree')
+    assert [child['name'] for child in tree['children']][-2:] == ["A", "B"]
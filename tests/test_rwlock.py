@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from models import ReadWriteLock
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def read():
+        with lock.read_lock:
+            # Only passes when all three readers hold the lock at once
+            inside.wait()
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not inside.broken
+
+
+def test_writer_excludes_readers_and_writers():
+    lock = ReadWriteLock()
+    active = {'readers': 0, 'writers': 0}
+    overlaps = []
+    guard = threading.Lock()
+
+    def enter(side):
+        with guard:
+            active[side] += 1
+            if active['writers'] > 1 or (active['writers'] and active['readers']):
+                overlaps.append(dict(active))
+
+    def leave(side):
+        with guard:
+            active[side] -= 1
+
+    def read():
+        for _ in range(300):
+            with lock.read_lock:
+                enter('readers')
+                leave('readers')
+
+    def write():
+        for _ in range(300):
+            with lock.write_lock:
+                enter('writers')
+                leave('writers')
+
+    threads = [threading.Thread(target=read) for _ in range(4)] + [threading.Thread(target=write) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert not any(thread.is_alive() for thread in threads)
+    assert overlaps == []
+
+
+def test_reentrancy():
+    lock = ReadWriteLock()
+    with lock.write_lock:
+        with lock.write_lock:
+            # The writer may also read
+            with lock.read_lock:
+                pass
+    with lock.read_lock:
+        with lock.read_lock:
+            pass
+    # Fully released: another thread can write
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (lock.acquire_write(), lock.release_write(), done.set()))
+    thread.start()
+    thread.join(5)
+    assert done.is_set()
+
+
+def test_read_side_cannot_upgrade():
+    lock = ReadWriteLock()
+    with lock.read_lock:
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
+    with pytest.raises(RuntimeError):
+        lock.release_read()
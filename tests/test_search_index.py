@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from controllers import CommandController
+from models import CommandNode, DataManager, SearchIndex
+
+KEYWORDS = ["git", "docker", "echo", "status", "ls", "a", "c1", "d2", "node", "x", "-rf", "git status", "zzz"]
+WORDS = ["git", "docker", "status", "ls", "-rf", "echo", "build", "Git", "STATUS"]
+
+
+def brute_force(manager, keyword, scope=None):
+    """IDs of the commands containing keyword, by walking the tree"""
+    keyword = keyword.lower()
+    folder = manager.find_node_by_id(scope) if scope else manager.get_root()
+    manager.load_subtree(folder)
+    found = set()
+    stack = list(folder.children)
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        if node.is_command() and any(keyword in text.lower() for text in (node.name, node.description, node.content)):
+            found.add(node.id)
+    return found
+
+
+def check(manager):
+    folders = [node.id for node in manager.get_all_nodes() if node.is_folder()]
+    for keyword in KEYWORDS:
+        results = manager.search(keyword)
+        assert len(results) == len(set(results))
+        assert set(results) == brute_force(manager, keyword), keyword
+        # Name matches rank above description and content matches
+        in_name = [keyword.lower() in manager.find_node_by_id(node_id).name.lower() for node_id in results]
+        assert in_name == sorted(in_name, reverse=True), keyword
+        assert manager.search(keyword, 3) == results[:3]
+        for folder_id in folders[:4]:
+            assert set(manager.search(keyword, scope=folder_id)) == brute_force(manager, keyword, folder_id)
+
+
+def random_text(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 3)))
+
+
+@pytest.mark.parametrize('storage', ['json', 'sqlite'])
+def test_search_matches_brute_force_after_changes(tmp_path, storage):
+    manager = DataManager(str(tmp_path / "commands.json"), storage=storage)
+    controller = CommandController(manager)
+    rng = random.Random(5)
+    root_id = manager.get_root().id
+    for step in range(150):
+        nodes = manager.get_all_nodes()
+        folders = [node.id for node in nodes if node.is_folder()]
+        commands = [node.id for node in nodes if node.is_command()]
+        others = [node.id for node in nodes if node.id != root_id]
+        choice = rng.random()
+        try:
+            if choice < 0.15 or not others:
+                controller.create_folder(rng.choice(folders), f"f{step} {random_text(rng)}")
+            elif choice < 0.45 or not commands:
+                controller.create_command(rng.choice(folders), f"c{step} {random_text(rng)}",
+                                          f"echo {random_text(rng)}", random_text(rng))
+            elif choice < 0.6:
+                controller.update_node(rng.choice(others), name=f"n{step} {random_text(rng)}")
+            elif choice < 0.7:
+                controller.update_node(rng.choice(commands), content=random_text(rng),
+                                       description=f"d{step} {random_text(rng)}")
+            elif choice < 0.85:
+                controller.move_node(rng.choice(others), rng.choice(folders))
+            else:
+                controller.delete_node(rng.choice(others))
+        except ValueError:
+            # Moves into a descendant
+            pass
+        if step % 10 == 9:
+            check(manager)
+    check(manager)
+    manager.close()
+
+
+def test_removed_documents_are_compacted():
+    root = CommandNode(name="Root", node_type="folder")
+    nodes = [CommandNode(name=f"cmd {i}", node_type="command", content=f"echo {i % 7}") for i in range(1500)]
+    for node in nodes:
+        root.add_child(node)
+    index = SearchIndex()
+    index.rebuild(root)
+    for node in nodes[:1400]:
+        index.remove(node.id)
+    assert len(index) == 100
+    assert len(index._docs) < 1500
+    remaining = nodes[1400:]
+    assert sorted(index.search("echo 3")) == sorted(node.id for node in remaining if node.content == "echo 3")
+    assert index.search("cmd 1450") == [nodes[1450].id]
+    assert [node_id for node_id, _, _ in index.fuzzy_search("cmd 1450", 1)] == [nodes[1450].id]
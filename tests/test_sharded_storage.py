@@ -0,0 +1,56 @@
+import os
+
+from benchmarks.synthetic import build_tree
+from models import DataManager
+
+
+def last_node(root):
+    """The node a depth-first walk reaches last, deep inside the last shards"""
+    node = root
+    while node.children:
+        node = node.children[-1]
+    return node
+
+
+def open_sharded(tmp_path):
+    """Migrate a generated tree to sharded storage and reopen it; also return the tree"""
+    path = str(tmp_path / "commands.json")
+    root = build_tree(3000, fanout=6, seed=5)
+    with open(path, 'wb') as f:
+        f.write(root.to_json())
+    DataManager(path, storage='sharded').close()
+    return DataManager(path, storage='sharded'), root
+
+
+def loaded_folders(manager):
+    return {node.id for node in manager.index.nodes.values() if node.is_folder() and node._loaded}
+
+
+def test_unknown_id_loads_no_shard(tmp_path):
+    manager, _ = open_sharded(tmp_path)
+    assert len(manager.storage._shards) > 1
+    before = loaded_folders(manager)
+    assert manager.find_node_by_id("no-such-id") is None
+    assert loaded_folders(manager) == before
+    manager.close()
+
+
+def test_known_id_is_found(tmp_path):
+    manager, root = open_sharded(tmp_path)
+    wanted = last_node(root)
+    node = manager.find_node_by_id(wanted.id)
+    assert node is not None and node.name == wanted.name
+    manager.close()
+
+
+def test_shards_written_before_id_files(tmp_path):
+    manager, root = open_sharded(tmp_path)
+    directory = manager.storage.directory
+    manager.close()
+    for name in os.listdir(directory):
+        if name.endswith(".ids"):
+            os.remove(os.path.join(directory, name))
+    wanted = last_node(root)
+    manager = DataManager(str(tmp_path / "commands.json"), storage='sharded')
+    assert manager.find_node_by_id(wanted.id).name == wanted.name
+    manager.close()
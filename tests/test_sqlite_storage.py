@@ -0,0 +1,82 @@
+import os
+
+from benchmarks.synthetic import build_tree
+from controllers import CommandController
+from models import DataManager, SearchIndex
+from models.sqlite_storage import SqliteStorage
+
+
+def snapshot(manager):
+    root = manager.get_root()
+    manager.load_subtree(root)
+
+    def walk(node):
+        return (node.id, node.name, node.node_type, node.content, node.description, node.updated_at,
+                [walk(child) for child in node.children])
+
+    return walk(root)
+
+
+def test_changes_round_trip(tmp_path):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, storage='sqlite')
+    controller = CommandController(manager)
+    root_id = manager.get_root().id
+    tools = controller.create_folder(root_id, "Tools", "Everyday tools")['id']
+    inner = controller.create_folder(tools, "Inner")['id']
+    commands = [controller.create_command(tools, f"c{i}", f"echo {i}\nline 2", f"d{i}")['id'] for i in range(5)]
+    controller.update_node(commands[1], name="renamed", content="ls -la", description="")
+    controller.move_node(commands[2], inner)
+    controller.delete_node(commands[3])
+    controller.duplicate_node(tools)
+    # Positions are kept when siblings are inserted in the middle (batch rollback, undo)
+    controller.delete_node(commands[0])
+    assert controller.undo()
+    expected = snapshot(manager)
+    manager.close()
+    assert not os.path.exists(path)
+
+    reopened = DataManager(path, storage='sqlite')
+    assert snapshot(reopened) == expected
+    reopened.close()
+
+
+def test_migrates_json_and_loads_lazily(tmp_path):
+    path = str(tmp_path / "commands.json")
+    root = build_tree(500, fanout=4, seed=3)
+    with open(path, 'wb') as f:
+        f.write(root.to_json())
+    manager = DataManager(path, storage='sqlite')
+    assert os.path.exists(str(tmp_path / "commands.sqlite3"))
+    # Only the root's children are read at first
+    assert len(manager.index) < 10
+    deep = root
+    while deep.children:
+        deep = deep.children[-1]
+    node = manager.find_node_by_id(deep.id)
+    assert node is not None and node.content == deep.content
+    manager.close()
+
+    reopened = DataManager(path, storage='sqlite')
+    expected = DataManager(str(tmp_path / "copy.json"))
+    expected.set_root(root)
+    assert snapshot(reopened) == snapshot(expected)
+    reopened.close()
+    expected.close()
+
+
+def test_search_matches_the_in_memory_index(tmp_path):
+    path = str(tmp_path / "commands.json")
+    root = build_tree(400, fanout=5, seed=4, content_size=40)
+    with open(path, 'wb') as f:
+        f.write(root.to_json())
+    index = SearchIndex()
+    index.rebuild(root)
+    manager = DataManager(path, storage='sqlite')
+    for keyword in ["git", "docker", "root/1", "Root/2/3", "--all", "zz", "o", "/var/log"]:
+        assert sorted(manager.search(keyword)) == sorted(index.search(keyword)), keyword
+    manager.close()
+
+
+def test_closing_unopened_storage(tmp_path):
+    SqliteStorage(str(tmp_path / "commands.sqlite3")).close()
@@ -0,0 +1,26 @@
+"""Concurrent reads and writes through one controller (see benchmarks/stress_concurrency.py)"""
+
+import sys
+
+import pytest
+
+from benchmarks.stress_concurrency import stress_test
+
+
+@pytest.fixture
+def frequent_switches():
+    """Switch threads far more often than by default, so races show up within a second"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.parametrize('storage, write_behind', [
+    ('json', False), ('json', True), ('journal', False), ('journal', True), ('sqlite', False), ('sharded', False),
+])
+def test_no_violations(frequent_switches, storage, write_behind):
+    stress, _ = stress_test(storage, write_behind, readers=4, writers=2, seconds=1.5, nodes=500)
+    assert stress.violations == []
+    assert any(name.startswith('write.') for name in stress.counts)
+    assert any(name.startswith('read.') for name in stress.counts)
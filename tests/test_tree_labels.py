@@ -0,0 +1,51 @@
+import random
+
+from benchmarks.synthetic import build_tree
+from controllers import CommandController
+from models import DataManager
+
+
+def descendants(folder):
+    ids = set()
+    stack = list(folder.children)
+    while stack:
+        node = stack.pop()
+        ids.add(node.id)
+        stack.extend(node.children)
+    return ids
+
+
+def test_subtrees_follow_tree_changes(tmp_path):
+    manager = DataManager(str(tmp_path / "commands.json"))
+    manager.set_root(build_tree(400, fanout=4, seed=3))
+    controller = CommandController(manager)
+    rng = random.Random(3)
+    for step in range(300):
+        nodes = manager.get_all_nodes()
+        folders = [node for node in nodes if node.is_folder()]
+        node = rng.choice(nodes[1:])
+        try:
+            choice = rng.random()
+            if choice < 0.4:
+                controller.move_node(node.id, rng.choice(folders).id)
+            elif choice < 0.55:
+                controller.delete_node(node.id)
+            elif choice < 0.75:
+                controller.create_command(rng.choice(folders).id, f"c{step}", "git status")
+            elif choice < 0.9:
+                controller.create_folder(rng.choice(folders).id, f"f{step}")
+            else:
+                controller.duplicate_node(node.id)
+        except ValueError:
+            pass
+        if step % 25 == 0:
+            for folder in rng.sample(folders, min(10, len(folders))):
+                if manager.find_node_by_id(folder.id) is None:
+                    continue
+                expected = descendants(folder)
+                subtree = manager.labels.subtree(folder)
+                assert set(subtree) == expected
+                assert all(node_id in subtree for node_id in expected) and folder.id not in subtree
+                assert {result['id'] for result in controller.search_commands("git", scope=folder.id)} == {
+                    node_id for node_id in manager.search("git") if node_id in expected}
+    manager.close()
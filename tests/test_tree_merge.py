@@ -0,0 +1,83 @@
+import json
+import os
+
+from controllers import CommandController
+from models import DataManager
+
+
+def write_external(path, data):
+    """Replace the data file as another program would, with a newer modification time"""
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000))
+
+
+def find(data, node_id):
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if node['id'] == node_id:
+            return node
+        stack.extend(node.get('children', []))
+    return None
+
+
+def manager_with_folder(tmp_path):
+    path = str(tmp_path / "commands.json")
+    # Polls are triggered by the test through reload_external()
+    manager = DataManager(path, watch=True, watch_interval=3600)
+    controller = CommandController(manager)
+    folder = controller.create_folder(manager.get_root().id, "F")
+    a = controller.create_command(folder['id'], "a", "echo a")
+    b = controller.create_command(folder['id'], "b", "echo b")
+    return path, manager, controller, folder, a, b
+
+
+def test_external_edit_is_merged(tmp_path):
+    path, manager, _, folder, a, b = manager_with_folder(tmp_path)
+    version = manager.change_log.version
+    data = json.load(open(path))
+    folder_data = find(data, folder['id'])
+    first = find(data, a['id'])
+    first.update(name="a2", updated_at="2030-01-01T00:00:00")
+    folder_data['children'] = [first, {"id": "X1", "name": "x", "node_type": "command", "content": "echo x",
+                                       "description": "", "created_at": "2030-01-01T00:00:00",
+                                       "updated_at": "2030-01-01T00:00:00"}]
+    write_external(path, data)
+
+    assert manager.reload_external()
+    assert manager.find_node_by_id(a['id']).name == "a2"
+    assert manager.find_node_by_id(b['id']) is None
+    assert manager.find_node_by_id("X1").parent_id == folder['id']
+    changes = manager.change_log.changes_since(version)
+    assert not changes.get('reset')
+    assert [entry['id'] for entry in changes['removed']] == [b['id']]
+    assert [entry['id'] for entry in changes['inserted']] == ["X1"]
+    # Nothing changed since: the next poll is a no-op
+    assert not manager.reload_external()
+    manager.close()
+
+
+def test_unsaved_local_edit_wins(tmp_path):
+    path, manager, controller, folder, a, _ = manager_with_folder(tmp_path)
+    data = json.load(open(path))
+    data['children'].append({"id": "X2", "name": "ext", "node_type": "folder", "content": "", "description": "",
+                             "children": [], "created_at": "2030-01-01T00:00:00", "updated_at": "2030-01-01T00:00:00"})
+    # The other program also renamed a, earlier than our rename that is not on disk yet
+    find(data, a['id']).update(name="theirs", updated_at="2000-01-01T00:00:00")
+    write_external(path, data)
+    save_data = manager.save_data
+    manager.save_data = lambda: True
+    controller.update_node(a['id'], name="ours")
+    manager.save_data = save_data
+
+    assert manager.reload_external()
+    assert manager.find_node_by_id("X2") is not None
+    assert manager.find_node_by_id(a['id']).name == "ours"
+    # The kept edit was written back together with the external change
+    disk = json.load(open(path))
+    assert find(disk, "X2") is not None
+    assert find(disk, a['id'])['name'] == "ours"
+    manager.close()
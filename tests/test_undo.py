@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from controllers import CommandController
+from models import DataManager
+
+
+def snapshot(manager):
+    root = manager.get_root()
+    manager.load_subtree(root)
+
+    def walk(node):
+        return (node.id, node.name, node.node_type, node.content, node.description, [walk(c) for c in node.children])
+
+    return walk(root)
+
+
+def random_step(controller, rng, step):
+    manager = controller.data_manager
+    nodes = manager.get_all_nodes()
+    folders = [node.id for node in nodes if node.is_folder()]
+    others = [node.id for node in nodes[1:]] or folders
+    choice = rng.random()
+    if choice < 0.2:
+        controller.create_folder(rng.choice(folders), f"f{step}")
+    elif choice < 0.4:
+        controller.create_command(rng.choice(folders), f"c{step}", f"echo {step}", "d")
+    elif choice < 0.55:
+        controller.update_node(rng.choice(others), name=f"u{step}", description=f"d{step}")
+    elif choice < 0.7:
+        controller.move_node(rng.choice(others), rng.choice(folders))
+    elif choice < 0.8:
+        controller.delete_node(rng.choice(others))
+    elif choice < 0.9:
+        controller.duplicate_node(rng.choice(others))
+    else:
+        controller.apply_batch([{'op': 'create_folder', 'parent_id': rng.choice(folders), 'name': f"b{step}"},
+                                {'op': 'create_command', 'parent_id': '$0', 'name': 'x', 'content': 'ls'},
+                                {'op': 'move_node', 'node_id': rng.choice(others), 'new_parent_id': '$0'}])
+
+
+@pytest.mark.parametrize('storage', ['json', 'sqlite', 'sharded'])
+def test_undo_and_redo_are_inverses(tmp_path, storage):
+    path = str(tmp_path / "commands.json")
+    manager = DataManager(path, storage=storage)
+    controller = CommandController(manager, history_size=100)
+    rng = random.Random(7)
+    states = [snapshot(manager)]
+    for step in range(60):
+        try:
+            random_step(controller, rng, step)
+        except ValueError:
+            # Moves into a descendant, deleted targets: nothing changed and nothing was recorded
+            assert snapshot(manager) == states[-1]
+            continue
+        states.append(snapshot(manager))
+    assert controller.get_history() == {'undo': len(states) - 1, 'redo': 0}
+
+    for state in reversed(states[:-1]):
+        assert controller.undo()
+        assert snapshot(manager) == state
+    assert not controller.undo()
+    for state in states[1:]:
+        assert controller.redo()
+        assert snapshot(manager) == state
+    assert not controller.redo()
+
+    for _ in range(10):
+        controller.undo()
+    expected = snapshot(manager)
+    manager.close()
+    reopened = DataManager(path, storage=storage)
+    assert snapshot(reopened) == expected
+    reopened.close()
+
+
+def test_new_change_drops_redo(tmp_path):
+    manager = DataManager(str(tmp_path / "commands.json"))
+    controller = CommandController(manager, history_size=3)
+    root_id = manager.get_root().id
+    for i in range(5):
+        controller.create_folder(root_id, f"n{i}")
+    assert controller.get_history() == {'undo': 3, 'redo': 0}
+    controller.undo()
+    assert controller.get_history() == {'undo': 2, 'redo': 1}
+    controller.create_folder(root_id, "x")
+    assert controller.get_history() == {'undo': 3, 'redo': 0}
+    manager.close()
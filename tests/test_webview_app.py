@@ -0,0 +1,44 @@
+import inspect
+
+from views.webview_app import WebViewApp
+
+# Public methods the page does not call, so they are not recorded
+NOT_INSTRUMENTED = {'initialize_controller', 'run', 'profile_next_calls', 'get_startup_timings'}
+
+
+def exposed(api):
+    """Name and signature of what pywebview's js_api discovery finds: public methods and functions"""
+    functions = {}
+    for name in dir(api):
+        attr = getattr(api, name)
+        if not name.startswith('_') and (inspect.ismethod(attr) or inspect.isfunction(attr)):
+            functions[name] = inspect.signature(attr)
+    return functions
+
+
+def test_metrics_keep_the_exposed_api(tmp_path):
+    data_options = {'data_file': str(tmp_path / "commands.json")}
+    plain = WebViewApp(data_options=data_options)
+    instrumented = WebViewApp(data_options=data_options, metrics_options={})
+    assert exposed(instrumented) == exposed(plain)
+    assert set(exposed(plain)) == set(WebViewApp.INSTRUMENTED_METHODS) | NOT_INSTRUMENTED
+    # The class keeps the plain methods
+    assert WebViewApp.get_tree is plain.get_tree.__func__
+    assert instrumented.get_tree is not WebViewApp.get_tree
+
+
+def test_calls_the_page_makes_are_recorded(tmp_path):
+    app = WebViewApp(data_options={'data_file': str(tmp_path / "commands.json")}, metrics_options={})
+    app.get_first_paint()
+    app.report_startup('first_paint')
+    tree = app.get_tree()
+    app.get_node(tree['id'])
+    app.get_history()
+    assert app.report_startup('nonsense')['success'] is False
+    calls = app.get_metrics()['calls']
+    assert {name: stats['count'] for name, stats in calls.items() if name.startswith('api.')} == {
+        'api.get_first_paint': 1, 'api.report_startup': 2, 'api.get_tree': 1, 'api.get_node': 1,
+        'api.get_history': 1}
+    assert calls['api.report_startup']['errors'] == 1
+    assert app.get_metrics()['calls']['api.get_metrics']['count'] == 1
+    app.controller.data_manager.close()
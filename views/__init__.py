@@ -1,5 +1,24 @@
 """Views package for CommandNote application."""
 
-from .webview_app import WebViewApp
+__all__ = ['WebViewApp', 'RpcServer', 'RpcClient']
 
-__all__ = ['WebViewApp']
+
+def __getattr__(name):
+    # Imported on first use, so that the command line client does not load the
+    # window and the window loads the server only once the data is loaded. The
+    # import statements are spelled out, not computed, so that PyInstaller's
+    # import analysis still finds these modules.
+    if name == 'WebViewApp':
+        from .webview_app import WebViewApp as value
+    elif name == 'RpcServer':
+        from .rpc_server import RpcServer as value
+    elif name == 'RpcClient':
+        from .rpc_client import RpcClient as value
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,221 @@
+"""RPC Client - Connects to the local RPC server of a data file (see rpc_server)
+
+Kept apart from the server so that the command line can reach a running
+server without importing asyncio.
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import sys
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# The controller rejected the call (ValueError: missing node, empty name, ...)
+OPERATION_FAILED = -32000
+UNAUTHORIZED = -32001
+
+
+class RpcError(Exception):
+    """JSON-RPC error (raised by the server for a reply, and by RpcClient for an error reply)"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def discovery_path(data_file: str) -> str:
+    """Discovery file of a data file"""
+    return data_file + ".rpc"
+
+
+def parse_address(address: str) -> Tuple[str, str, int]:
+    """
+    Parse a server address
+
+    Args:
+        address: "unix:PATH", or "HOST:PORT" with a loopback HOST (port 0 picks a free port)
+
+    Returns:
+        ("unix", path, 0) or ("tcp", host, port)
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):], 0
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]') or '127.0.0.1'
+    if not port.isdigit():
+        raise ValueError(f"Invalid RPC address: {address} (expected unix:PATH or HOST:PORT)")
+    try:
+        loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise ValueError(f"The RPC server only listens on the loopback interface, not {host}")
+    return 'tcp', host, int(port)
+
+
+def read_discovery(data_file: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the discovery file of the server running for a data file
+
+    Args:
+        data_file: Data file path
+
+    Returns:
+        {"address", "token", "pid"}, None if no server runs (or it did not shut down cleanly)
+    """
+    try:
+        with open(discovery_path(data_file), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(info, dict) or not isinstance(info.get('address'), str) or not _pid_alive(info.get('pid')):
+        return None
+    return info
+
+
+def _pid_alive(pid: Any) -> bool:
+    """Whether a process exists (assumed on Windows, where the connection attempt tells)"""
+    if not isinstance(pid, int):
+        return False
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) terminates the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def encode_message(message: Any) -> bytes:
+    """One protocol line"""
+    return (json.dumps(message, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+class RpcClient:
+    """
+    Blocking client for one connection
+
+    call() sends a request and waits for its reply. For pipelining, send()
+    several requests and then receive() the replies. Notifications that
+    arrive meanwhile are kept in the notifications queue.
+    """
+
+    def __init__(self, address: str, token: Optional[str] = None, timeout: Optional[float] = 30.0):
+        """
+        Connect to a server
+
+        Args:
+            address: Server address (see parse_address)
+            token: Access token from the discovery file (needed for TCP addresses)
+            timeout: Socket timeout in seconds
+        """
+        kind, host, port = parse_address(address)
+        if kind == 'unix':
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            target: Any = host
+        else:
+            self.sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+            target = (host, port)
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(target)
+        except OSError:
+            self.sock.close()
+            raise
+        if kind == 'tcp':
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile('rb')
+        self._next_id = 0
+        self._replies: Dict[Any, Dict[str, Any]] = {}
+        self.notifications: Deque[Dict[str, Any]] = deque()
+        if kind == 'tcp' and token is not None:
+            self.call('auth', token)
+
+    @classmethod
+    def for_data_file(cls, data_file: str, timeout: Optional[float] = 30.0) -> Optional['RpcClient']:
+        """Connect to the server running for a data file (None if there is none)"""
+        info = read_discovery(data_file)
+        if info is None:
+            return None
+        try:
+            return cls(info['address'], info.get('token'), timeout)
+        except OSError:
+            return None
+
+    def send(self, method: str, *args: Any, **kwargs: Any) -> int:
+        """
+        Send a request without waiting for the reply
+
+        Returns:
+            Request ID, for receive()
+        """
+        if args and kwargs:
+            raise TypeError("Pass params either by position or by name")
+        self._next_id += 1
+        request = {'jsonrpc': '2.0', 'id': self._next_id, 'method': method, 'params': kwargs or list(args)}
+        self.sock.sendall(encode_message(request))
+        return self._next_id
+
+    def receive(self, request_id: int) -> Any:
+        """
+        Wait for the reply to a request
+
+        Returns:
+            Result of the call (raises RpcError for an error reply)
+        """
+        while request_id not in self._replies:
+            message = self._read_message()
+            if 'id' in message:
+                self._replies[message['id']] = message
+            else:
+                self.notifications.append(message)
+        reply = self._replies.pop(request_id)
+        if 'error' in reply:
+            raise RpcError(reply['error'].get('code', INTERNAL_ERROR), reply['error'].get('message', ''))
+        return reply.get('result')
+
+    def call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Call a method and wait for its result"""
+        return self.receive(self.send(method, *args, **kwargs))
+
+    def wait_notification(self) -> Dict[str, Any]:
+        """Wait for the next notification (change sets of a subscription)"""
+        while not self.notifications:
+            message = self._read_message()
+            if 'id' in message:
+                self._replies[message['id']] = message
+            else:
+                self.notifications.append(message)
+        return self.notifications.popleft()
+
+    def _read_message(self) -> Dict[str, Any]:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("RPC server closed the connection")
+        message = json.loads(line)
+        if isinstance(message, dict) and message.get('id') is None and 'error' in message:
+            # Not tied to a request (parse error, oversized line)
+            raise RpcError(message['error'].get('code', INTERNAL_ERROR), message['error'].get('message', ''))
+        return message
+
+    def close(self) -> None:
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self) -> 'RpcClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
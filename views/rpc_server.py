@@ -0,0 +1,610 @@
+"""RPC Server - Local JSON-RPC access to one command tree for several clients
+
+Editor plugins, the command line and the window can share one running store
+through this server instead of each loading the data file and saving over
+each other's changes.
+
+Protocol: JSON-RPC 2.0 with one JSON message per line, over a Unix socket
+(the default on POSIX) or a TCP socket on the loopback interface. Requests
+are pipelined: a client may send many before reading any reply, and replies
+arrive as the calls finish (match them by "id"). The calls of one connection
+still take effect in the order they were sent: a read waits for the writes
+sent before it on the same connection.
+
+Methods take positional or named params, like the CommandController methods:
+
+    reads:  get_tree, get_tree_structure, get_node, get_children, search,
+            get_changes_since, get_tree_version, get_history
+    writes: create_folder, create_command, update_node, delete_node, move_node,
+            duplicate_node, batch, import_file, undo, redo
+            -> {"data": <method result>, "changes": <change set>}
+    subscribe(version=None) -> {"version": ...}, unsubscribe()
+    auth(token): required before anything else on TCP connections
+
+Subscribers are sent {"jsonrpc": "2.0", "method": "changed", "params": <change
+set>} after the tree changed, whoever changed it. A burst of changes is
+coalesced into one notification, carrying everything since the version the
+subscriber saw last (see ChangeLog.changes_since).
+
+Reads run on a thread pool under the tree's read lock, in parallel with each
+other and with the window. Writes run one at a time on a single writer
+thread, so a burst of client writes queues here instead of on the tree lock.
+The writes that queued up while one ran are applied together and saved once
+(group commit); each is replied to after that save. The event loop itself
+never touches the tree.
+
+While the server runs, its address and an access token are written to
+"<data file>.rpc", readable by the owner only. RpcClient.for_data_file
+(rpc_client) connects through it.
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import queue
+import secrets
+import socket
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from models.fileio import atomic_write_bytes
+from models.node_index import TreeListener
+from .rpc_client import (INTERNAL_ERROR, INVALID_PARAMS, INVALID_REQUEST, METHOD_NOT_FOUND, OPERATION_FAILED,
+                         PARSE_ERROR, UNAUTHORIZED, RpcError, discovery_path, encode_message, parse_address,
+                         read_discovery)
+
+# RPC method -> controller method
+READ_METHODS = {
+    'get_tree': 'get_tree_summary',
+    'get_tree_structure': 'get_tree_structure',
+    'get_node': 'get_node_by_id',
+    'get_children': 'get_children',
+    'search': 'search_commands',
+    'get_changes_since': 'get_changes_since',
+    'get_tree_version': 'get_tree_version',
+    'get_history': 'get_history',
+}
+WRITE_METHODS = {
+    'create_folder': 'create_folder',
+    'create_command': 'create_command',
+    'update_node': 'update_node',
+    'delete_node': 'delete_node',
+    'move_node': 'move_node',
+    'duplicate_node': 'duplicate_node',
+    'batch': 'apply_batch',
+    'import_file': 'import_file',
+    'undo': 'undo',
+    'redo': 'redo',
+}
+# Controller parameters clients cannot pass
+_SERVER_ONLY_PARAMS = {'progress', 'cancel'}
+
+# Longest request line accepted
+MAX_LINE_BYTES = 16 * 1024 * 1024
+# Requests of one connection running at a time; the connection is not read further until one finishes
+MAX_IN_FLIGHT = 64
+# A client that lets this much output pile up unread is disconnected
+MAX_PENDING_OUTPUT = 64 * 1024 * 1024
+# Changes are collected this long before subscribers are notified
+NOTIFY_DELAY = 0.02
+# Writes waiting in the queue are applied together, with one save, up to this many
+MAX_WRITE_GROUP = 64
+
+
+def default_address(data_file: str) -> str:
+    """Unix socket next to the data file, or a free localhost port where there are no Unix sockets"""
+    path = os.path.abspath(data_file + ".sock")
+    # sun_path holds 108 bytes on Linux, 104 on macOS
+    if hasattr(socket, 'AF_UNIX') and sys.platform != 'win32' and len(os.fsencode(path)) < 100:
+        return "unix:" + path
+    return "127.0.0.1:0"
+
+
+def _error(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+def _completed(value: Any) -> Awaitable[Any]:
+    """Awaitable with a result already known"""
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+def _failed(error: Exception) -> Awaitable[Any]:
+    """Awaitable that raises an error already known"""
+    future = asyncio.get_running_loop().create_future()
+    future.set_exception(error)
+    return future
+
+
+class _ChangeListener(TreeListener):
+    """Tells the server about every tree event (called by the writing thread, under the tree lock)"""
+
+    def __init__(self, callback: Callable[[], None]):
+        self.callback = callback
+
+    def tree_reset(self, root) -> None:
+        self.callback()
+
+    def node_added(self, node, parent) -> None:
+        self.callback()
+
+    def node_removed(self, node, parent) -> None:
+        self.callback()
+
+    def node_moved(self, node, old_parent, new_parent) -> None:
+        self.callback()
+
+    def node_updated(self, node) -> None:
+        self.callback()
+
+
+class _Connection:
+    """State of one client connection (used on the event loop only)"""
+
+    def __init__(self, writer: asyncio.StreamWriter, authenticated: bool):
+        self.writer = writer
+        self.authenticated = authenticated
+        # Tree version the client saw last, while subscribed
+        self.version: Optional[int] = None
+        # Last write sent on this connection; later reads wait for it
+        self.last_write: Optional[asyncio.Future] = None
+        self.slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self.tasks: Set[asyncio.Task] = set()
+
+    def send(self, message: Any) -> None:
+        if self.writer.is_closing():
+            return
+        self.writer.write(encode_message(message))
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_OUTPUT:
+            self.writer.transport.abort()
+
+    async def drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+
+class RpcServer:
+    """
+    Local JSON-RPC server over a CommandController (see the module docstring)
+
+    The server runs its own event loop on a background thread, so it can be
+    started next to the window (start/stop) or on its own (serve_forever).
+    """
+
+    def __init__(self, controller, address: Optional[str] = None, data_file: Optional[str] = None,
+                 on_change: Optional[Callable[[], None]] = None, read_threads: int = 4):
+        """
+        Initialize server
+
+        Args:
+            controller: CommandController to serve (shared with the rest of the process)
+            address: "unix:PATH" or "HOST:PORT" (loopback only), defaults to default_address()
+            data_file: Data file the discovery file goes next to, defaults to the data manager's
+            on_change: Called on a worker thread after clients changed the tree (to refresh the window)
+            read_threads: Reads run in parallel on this many threads
+        """
+        self.controller = controller
+        self.data_file = data_file or controller.data_manager.data_file
+        self.requested_address = address or default_address(self.data_file)
+        self.address: Optional[str] = None
+        self.on_change = on_change
+        self.token = secrets.token_urlsafe(24)
+        self._read_threads = read_threads
+        self._listener = _ChangeListener(self._tree_changed)
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._write_queue: 'queue.SimpleQueue[Optional[Tuple[Future, Callable, Tuple]]]' = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._socket_path: Optional[str] = None
+        self._connections: Set[_Connection] = set()
+        self._subscribers: Set[_Connection] = set()
+        self._signatures: Dict[str, inspect.Signature] = {}
+        self._notify_pending = False
+        self._client_writes = False
+
+    # ========== Lifecycle ==========
+
+    def start(self) -> str:
+        """
+        Start serving on a background thread
+
+        Returns:
+            Address the server listens on (with the chosen port)
+        """
+        if self._thread is not None:
+            raise RuntimeError("RPC server is already running")
+        ready = threading.Event()
+        errors: List[BaseException] = []
+        self._thread = threading.Thread(target=self._run, args=(ready, errors), name="commandnote-rpc", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            self._thread.join()
+            self._thread = None
+            raise errors[0]
+        return self.address
+
+    def serve_forever(self) -> None:
+        """Start serving and block until stop() is called (from another thread or a signal handler)"""
+        if self._thread is None:
+            self.start()
+        thread = self._thread
+        # Joined in steps, so that Ctrl+C is seen
+        while thread is not None and thread.is_alive():
+            thread.join(0.5)
+
+    def stop(self) -> None:
+        """Stop serving: finish the queued writes, close the connections and remove the socket and discovery files"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        thread.join()
+        self._thread = None
+
+    def _run(self, ready: threading.Event, errors: List[BaseException]) -> None:
+        """Event loop thread"""
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        try:
+            try:
+                loop.run_until_complete(self._open())
+            except Exception as e:
+                errors.append(e)
+                return
+            finally:
+                ready.set()
+            loop.run_until_complete(self._stopping.wait())
+            loop.run_until_complete(self._close())
+        finally:
+            loop.close()
+
+    async def _open(self) -> None:
+        """Listen, follow the tree and write the discovery file"""
+        self._stopping = asyncio.Event()
+        kind, host, port = parse_address(self.requested_address)
+        if kind == 'unix':
+            path = host
+            if os.path.exists(path):
+                if _socket_alive(path):
+                    raise OSError(f"Another RPC server is listening on {path}")
+                # Left behind by a server that did not shut down
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self._serve_connection, path, limit=MAX_LINE_BYTES)
+            self._socket_path = path
+            os.chmod(path, 0o600)
+            self.address = "unix:" + path
+        else:
+            self._server = await asyncio.start_server(self._serve_connection, host, port, limit=MAX_LINE_BYTES)
+            bound_port = self._server.sockets[0].getsockname()[1]
+            self.address = f"[{host}]:{bound_port}" if ':' in host else f"{host}:{bound_port}"
+        self._readers = ThreadPoolExecutor(self._read_threads, thread_name_prefix="commandnote-rpc-read")
+        self._writer = threading.Thread(target=self._write_loop, name="commandnote-rpc-write", daemon=True)
+        self._writer.start()
+        manager = self.controller.data_manager
+        with manager.lock:
+            manager.index.listeners.append(self._listener)
+        info = {'address': self.address, 'token': self.token, 'pid': os.getpid()}
+        # Written through a temporary file, which is created readable by the owner only
+        atomic_write_bytes(discovery_path(self.data_file), json.dumps(info).encode('utf-8'))
+
+    async def _close(self) -> None:
+        """Stop listening, wait for the queued writes and clean up"""
+        self._server.close()
+        for conn in list(self._connections):
+            conn.writer.close()
+        manager = self.controller.data_manager
+        # Writes already queued still run: their clients may not have seen the reply, but expect them applied
+        self._write_queue.put(None)
+        await self._loop.run_in_executor(None, self._writer.join)
+        self._readers.shutdown(wait=False, cancel_futures=True)
+        with manager.lock:
+            manager.index.listeners.remove(self._listener)
+        for conn in list(self._connections):
+            for task in conn.tasks:
+                task.cancel()
+        await self._server.wait_closed()
+        info = read_discovery(self.data_file)
+        if info is not None and info.get('token') == self.token:
+            _remove(discovery_path(self.data_file))
+        if self._socket_path:
+            _remove(self._socket_path)
+
+    # ========== Connections ==========
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read requests from one client and start each as its own task"""
+        # Unix sockets are protected by their file mode, TCP ports by the token
+        conn = _Connection(writer, authenticated=self._socket_path is not None)
+        self._connections.add(conn)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    conn.send(_error(None, INVALID_REQUEST, f"Request longer than {MAX_LINE_BYTES} bytes"))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await conn.slots.acquire()
+                task = asyncio.ensure_future(self._handle_line(conn, line))
+                conn.tasks.add(task)
+                task.add_done_callback(functools.partial(self._request_done, conn))
+        finally:
+            self._subscribers.discard(conn)
+            self._connections.discard(conn)
+            if conn.tasks:
+                await asyncio.wait(list(conn.tasks))
+            writer.close()
+
+    @staticmethod
+    def _request_done(conn: _Connection, task: asyncio.Task) -> None:
+        conn.tasks.discard(task)
+        conn.slots.release()
+
+    async def _handle_line(self, conn: _Connection, line: bytes) -> None:
+        """Answer one request line (a request or a JSON-RPC batch)"""
+        try:
+            message = json.loads(line)
+        except ValueError:
+            conn.send(_error(None, PARSE_ERROR, "Parse error"))
+            return
+        if isinstance(message, list) and message:
+            # All calls are started before any is awaited, so they start in order
+            calls = [self._start_call(conn, request) for request in message]
+            replies = [reply for reply in await asyncio.gather(*calls) if reply is not None]
+            if replies:
+                conn.send(replies)
+        else:
+            reply = await self._start_call(conn, message)
+            if reply is not None:
+                conn.send(reply)
+        await conn.drain()
+
+    def _start_call(self, conn: _Connection, request: Any) -> Awaitable[Optional[Dict[str, Any]]]:
+        """
+        Validate a request and start its call
+
+        Runs synchronously up to handing the call to its executor, so the calls
+        of a connection reach the writer thread in the order they were sent.
+
+        Returns:
+            Awaitable reply (None for notifications)
+        """
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' \
+                or not isinstance(request.get('method'), str):
+            request_id = request.get('id') if isinstance(request, dict) else None
+            return _completed(_error(request_id, INVALID_REQUEST, "Invalid request"))
+        params = request.get('params', [])
+        try:
+            if not isinstance(params, (list, dict)):
+                raise RpcError(INVALID_PARAMS, "params must be an array or an object")
+            call = self._call(conn, request['method'], params)
+        except RpcError as e:
+            call = _failed(e)
+        return self._reply(request.get('id'), 'id' not in request, call)
+
+    async def _reply(self, request_id: Any, notification: bool, call: Awaitable[Any]) -> Optional[Dict[str, Any]]:
+        """Wait for a call and turn its outcome into a reply"""
+        try:
+            result = await call
+        except RpcError as e:
+            reply = _error(request_id, e.code, e.message)
+        except ValueError as e:
+            reply = _error(request_id, OPERATION_FAILED, str(e))
+        except Exception as e:
+            reply = _error(request_id, INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+        else:
+            reply = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        return None if notification else reply
+
+    # ========== Methods ==========
+
+    def _call(self, conn: _Connection, method: str, params: Any) -> Awaitable[Any]:
+        """Start one call"""
+        if method == 'auth':
+            (token,) = self._bind(method, lambda token: None, params)
+            if not isinstance(token, str) or not secrets.compare_digest(token, self.token):
+                raise RpcError(UNAUTHORIZED, "Invalid token")
+            conn.authenticated = True
+            return _completed(True)
+        if not conn.authenticated:
+            raise RpcError(UNAUTHORIZED, "Call auth with the token from the discovery file first")
+
+        if method == 'subscribe':
+            (version,) = self._bind(method, lambda version=None: None, params)
+            return _completed(self._subscribe(conn, version))
+        if method == 'unsubscribe':
+            self._bind(method, lambda: None, params)
+            self._subscribers.discard(conn)
+            return _completed(True)
+
+        if method in READ_METHODS:
+            function = getattr(self.controller, READ_METHODS[method])
+            args = self._bind(method, function, params)
+            return self._read(conn, function, args)
+        if method in WRITE_METHODS:
+            function = getattr(self.controller, WRITE_METHODS[method])
+            args = self._bind(method, function, params)
+            future: Future = Future()
+            self._write_queue.put((future, function, args))
+            conn.last_write = asyncio.wrap_future(future, loop=self._loop)
+            return conn.last_write
+        raise RpcError(METHOD_NOT_FOUND, f"Method not found: {method}")
+
+    def _bind(self, method: str, function: Callable, params: Any) -> Tuple:
+        """Check params against a method's signature; returns them as positional arguments"""
+        signature = self._signatures.get(method)
+        if signature is None:
+            signature = self._signatures[method] = inspect.signature(function)
+        try:
+            bound = signature.bind(*params) if isinstance(params, list) else signature.bind(**params)
+        except TypeError as e:
+            raise RpcError(INVALID_PARAMS, f"{method}: {e}") from None
+        if _SERVER_ONLY_PARAMS & bound.arguments.keys():
+            raise RpcError(INVALID_PARAMS, f"{method}: {', '.join(_SERVER_ONLY_PARAMS & bound.arguments.keys())} "
+                                           f"cannot be passed over RPC")
+        bound.apply_defaults()
+        return bound.args
+
+    async def _read(self, conn: _Connection, function: Callable, args: Tuple) -> Any:
+        """Run a read on the reader pool, after the writes sent before it on the same connection"""
+        last_write = conn.last_write
+        if last_write is not None and not last_write.done():
+            await asyncio.wait([last_write])
+        return await self._loop.run_in_executor(self._readers, function, *args)
+
+    def _write_loop(self) -> None:
+        """Writer thread: apply queued writes in groups, saving once per group"""
+        held = None
+        while True:
+            job = held if held is not None else self._write_queue.get()
+            held = None
+            if job is None:
+                break
+            group = [job]
+            # Imports read their file before they take the tree lock, so they go alone
+            while job[1] != self.controller.import_file and len(group) < MAX_WRITE_GROUP:
+                try:
+                    job = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None or job[1] == self.controller.import_file:
+                    held = job
+                    break
+                group.append(job)
+            self._write_group(group)
+            if held is None and job is None:
+                break
+
+    def _write_group(self, group: List[Tuple[Future, Callable, Tuple]]) -> None:
+        """Apply writes with one save, then complete their futures"""
+        outcomes = []
+        try:
+            if len(group) == 1:
+                outcomes.append(self._write_outcome(*group[0]))
+            else:
+                # Saves inside the block are deferred to its end
+                with self.controller.data_manager.batch():
+                    outcomes.extend(self._write_outcome(*job) for job in group)
+        except Exception as e:
+            outcomes.extend((future, None, e) for future, _, _ in group[len(outcomes):])
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _write_outcome(self, future: Future, function: Callable, args: Tuple) -> Tuple[Future, Any, Any]:
+        try:
+            return future, self._write(function, args), None
+        except Exception as e:
+            return future, None, e
+
+    def _write(self, function: Callable, args: Tuple) -> Dict[str, Any]:
+        """Run one write (on the writer thread)"""
+        if function == self.controller.import_file:
+            data, changes = self.controller.import_file_with_changes(*args)
+        else:
+            # Change set taken under the tree lock of the write: only this write's changes
+            data, changes = self.controller.run_with_changes(function, *args)
+        if data is False:
+            raise ValueError(f"Node does not exist: {args[0]}")
+        # Notify even if the change events were already passed on, so that on_change hears of this write
+        self._client_writes = True
+        self._tree_changed()
+        return {'data': data, 'changes': changes}
+
+    # ========== Notifications ==========
+
+    def _subscribe(self, conn: _Connection, version: Optional[int]) -> Dict[str, int]:
+        current = self.controller.data_manager.change_log.version
+        if version is None:
+            version = current
+        elif not isinstance(version, int):
+            raise RpcError(INVALID_PARAMS, "subscribe: version must be an integer")
+        conn.version = version
+        self._subscribers.add(conn)
+        if version != current:
+            # Catch up at once
+            self._schedule_notify()
+        return {'version': current}
+
+    def _tree_changed(self) -> None:
+        """Tree listener callback (runs on the writing thread)"""
+        if not self._notify_pending:
+            self._notify_pending = True
+            try:
+                self._loop.call_soon_threadsafe(self._schedule_notify)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def _schedule_notify(self) -> None:
+        self._notify_pending = True
+        self._loop.call_later(NOTIFY_DELAY, lambda: asyncio.ensure_future(self._notify()))
+
+    async def _notify(self) -> None:
+        """Send subscribers what changed since the version each of them saw"""
+        if not self._notify_pending:
+            return
+        self._notify_pending = False
+        if self._client_writes:
+            self._client_writes = False
+            if self.on_change is not None:
+                self._loop.run_in_executor(self._readers, self._run_on_change)
+        current = self.controller.data_manager.change_log.version
+        waiting: Dict[int, List[_Connection]] = {}
+        for conn in self._subscribers:
+            if conn.version != current:
+                waiting.setdefault(conn.version, []).append(conn)
+        for version, conns in waiting.items():
+            changes = await self._loop.run_in_executor(self._readers, self.controller.get_changes_since, version)
+            notification = {'jsonrpc': '2.0', 'method': 'changed', 'params': changes}
+            for conn in conns:
+                if conn in self._subscribers and conn.version == version:
+                    conn.version = changes['version']
+                    conn.send(notification)
+
+    def _run_on_change(self) -> None:
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"RPC change callback failed: {e}")
+
+
+def _socket_alive(path: str) -> bool:
+    """Whether a server accepts connections on a Unix socket"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(1.0)
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
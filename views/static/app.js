@@ -6,6 +6,15 @@ let currentParentId = null;
 let isEditing = false;
 let editingNodeId = null;
 let expandedNodeIds = new Set(); // Track which folders are expanded
+const SEARCH_RESULT_LIMIT = 200; // Maximum number of ranked search results
+const SEARCH_DEBOUNCE_MS = 60; // Pause in typing before searching
+let searchGeneration = 0; // Number of the latest search, older results are dropped
+let renderedSearchGeneration = 0; // Search whose results the content area shows
+let searchTimer = null;
+const TREE_PAGE_SIZE = 200; // Children fetched per folder page
+let rootId = null; // ID of the (hidden) root folder
+let treeVersion = null; // Tree version the rendered tree reflects
+let selectedNodeIds = new Set(); // Ctrl/Cmd-clicked nodes, moved and deleted together
 
 // Initialize after page load
 document.addEventListener('DOMContentLoaded', () => {
@@ -19,7 +28,19 @@ document.addEventListener('DOMContentLoaded', () => {
 // Initialize application
 async function initApp() {
     try {
+        // Show the tree saved at the last exit while the data loads
+        const snapshot = await pywebview.api.get_first_paint();
+        const treeView = document.getElementById('treeView');
+        if (snapshot) {
+            rootId = snapshot.id;
+            renderTree(snapshot);
+            treeView.classList.add('preview');
+        }
+        pywebview.api.report_startup('first_paint');
         await loadTree();
+        treeView.classList.remove('preview');
+        refreshHistoryButtons();
+        pywebview.api.report_startup('interactive');
     } catch (error) {
         console.error('Initialization failed:', error);
         showError('Application initialization failed');
@@ -35,6 +56,9 @@ function bindEvents() {
         openFolderModal();
     });
 
+    // Import button
+    document.getElementById('importBtn').addEventListener('click', importCommands);
+
     // New command button
     document.getElementById('addCommandBtn').addEventListener('click', () => {
         if (!currentNode || currentNode.node_type !== 'folder') {
@@ -68,12 +92,32 @@ function bindEvents() {
 
     // Delete button
     document.getElementById('deleteBtn').addEventListener('click', async () => {
+        if (selectedNodeIds.size > 1) {
+            if (confirm(`Are you sure you want to delete ${selectedNodeIds.size} items?`)) {
+                await deleteSelectedNodes();
+            }
+            return;
+        }
         if (!currentNode) return;
         if (confirm(`Are you sure you want to delete "${currentNode.name}"?`)) {
             await deleteNode(currentNode.id);
         }
     });
 
+    // Undo and redo buttons
+    document.getElementById('undoBtn').addEventListener('click', () => runHistory('undo'));
+    document.getElementById('redoBtn').addEventListener('click', () => runHistory('redo'));
+
+    // Undo/redo shortcuts, except where text fields have their own
+    document.addEventListener('keydown', (e) => {
+        if (!(e.ctrlKey || e.metaKey) || e.target.closest('input, textarea, .modal.show')) return;
+        const key = e.key.toLowerCase();
+        if (key === 'z' || key === 'y') {
+            e.preventDefault();
+            runHistory(key === 'y' || e.shiftKey ? 'redo' : 'undo');
+        }
+    });
+
     // Search button
     document.getElementById('searchBtn').addEventListener('click', () => {
         performSearch();
@@ -82,10 +126,16 @@ function bindEvents() {
     // Search input enter key
     document.getElementById('searchInput').addEventListener('keypress', (e) => {
         if (e.key === 'Enter') {
+            clearTimeout(searchTimer);
             performSearch();
         }
     });
 
+    // Search as you type
+    document.getElementById('searchInput').addEventListener('input', scheduleSearch);
+    document.getElementById('fuzzySearch').addEventListener('change', scheduleSearch);
+    document.getElementById('scopeSearch').addEventListener('change', scheduleSearch);
+
     // Modal close button
     document.querySelectorAll('.close').forEach(closeBtn => {
         closeBtn.addEventListener('click', (e) => {
@@ -125,7 +175,7 @@ function bindEvents() {
     treeView.addEventListener('drop', handleTreeViewDrop);
 }
 
-// Load tree structure
+// Load tree structure (root level plus expanded folders)
 async function loadTree(expandNodeId = null) {
     try {
         // Save current expanded state before reloading
@@ -134,7 +184,9 @@ async function loadTree(expandNodeId = null) {
         if (expandNodeId) {
             expandedNodeIds.add(expandNodeId);
         }
-        const tree = await pywebview.api.get_tree();
+        const tree = await pywebview.api.get_tree(Array.from(expandedNodeIds));
+        rootId = tree.id;
+        treeVersion = tree.version;
         renderTree(tree);
         // Restore expanded state after rendering
         restoreExpandedState();
@@ -144,7 +196,7 @@ async function loadTree(expandNodeId = null) {
     }
 }
 
-// Render tree structure
+// Render tree structure from node summaries (id, name, node_type, child_count, children if loaded)
 function renderTree(node, parentElement = null, level = 0) {
     if (!parentElement) {
         parentElement = document.getElementById('treeView');
@@ -153,23 +205,62 @@ function renderTree(node, parentElement = null, level = 0) {
 
     // Don't render root node itself, only its children
     if (level === 0) {
-        node.children.forEach(child => {
-            renderTree(child, parentElement, level + 1);
-        });
+        renderChildren(node, node.children || [], parentElement, level + 1);
         return;
     }
 
+    // Folders expanded in a collapsed parent come back without children: show them collapsed
+    const hasChildren = node.node_type === 'folder' && node.child_count > 0;
+    if (expandedNodeIds.has(node.id) && !node.children) {
+        expandedNodeIds.delete(node.id);
+    }
+    const isExpanded = expandedNodeIds.has(node.id);
+    const nodeDiv = createTreeNodeElement(node, level, isExpanded);
+    parentElement.appendChild(nodeDiv);
+
+    // Children container; its content is fetched on first expand unless already included
+    if (hasChildren) {
+        const childrenContainer = createChildrenContainer(node.id, !!node.children, isExpanded);
+        if (node.children) {
+            renderChildren(node, node.children, childrenContainer, level + 1);
+        }
+        
+        parentElement.appendChild(childrenContainer);
+    }
+}
+
+// Create the (initially empty) children container of a folder
+function createChildrenContainer(nodeId, loaded, isExpanded) {
+    const childrenContainer = document.createElement('div');
+    childrenContainer.className = 'children-container';
+    childrenContainer.setAttribute('data-parent-id', nodeId);
+    childrenContainer.setAttribute('data-loaded', loaded ? 'true' : 'false');
+    
+    // Apply collapsed state if not expanded
+    if (!isExpanded) {
+        childrenContainer.classList.add('collapsed');
+    }
+    return childrenContainer;
+}
+
+// Create the row element of a tree node (without its children container)
+function createTreeNodeElement(node, level, isExpanded) {
     const nodeDiv = document.createElement('div');
     nodeDiv.className = `tree-node ${node.node_type}`;
     nodeDiv.style.paddingLeft = `${level * 16}px`;
     nodeDiv.setAttribute('draggable', 'true');
     nodeDiv.setAttribute('data-node-id', node.id);
     nodeDiv.setAttribute('data-node-type', node.node_type);
+    nodeDiv.setAttribute('data-level', level);
+    if (selectedNodeIds.has(node.id)) {
+        nodeDiv.classList.add('selected');
+    }
+    
+    const hasChildren = node.node_type === 'folder' && node.child_count > 0;
     
     // Add collapse/expand button for folders with children
     let toggleButton = '';
-    const isExpanded = expandedNodeIds.has(node.id);
-    if (node.node_type === 'folder' && node.children && node.children.length > 0) {
+    if (hasChildren) {
         const arrowIcon = isExpanded ? '▼' : '▶';
         toggleButton = `<span class="toggle-btn" data-expanded="${isExpanded}">${arrowIcon}</span>`;
     } else if (node.node_type === 'folder') {
@@ -191,11 +282,15 @@ function renderTree(node, parentElement = null, level = 0) {
     // Click event for node selection
     nodeDiv.addEventListener('click', (e) => {
         e.stopPropagation();
-        selectNode(node);
+        if (e.ctrlKey || e.metaKey) {
+            toggleMultiSelect(node.id, nodeDiv);
+        } else {
+            selectNode(node, nodeDiv);
+        }
     });
     
     // Double-click event for folder expansion/collapse
-    if (node.node_type === 'folder' && node.children && node.children.length > 0) {
+    if (hasChildren) {
         nodeDiv.addEventListener('dblclick', (e) => {
             e.stopPropagation();
             toggleNodeChildren(nodeDiv, node);
@@ -209,29 +304,51 @@ function renderTree(node, parentElement = null, level = 0) {
     nodeDiv.addEventListener('dragleave', handleDragLeave);
     nodeDiv.addEventListener('drop', handleDrop);
 
-    parentElement.appendChild(nodeDiv);
+    return nodeDiv;
+}
 
-    // Recursively render child nodes only if folder is expanded
-    if (node.node_type === 'folder' && node.children.length > 0) {
-        const childrenContainer = document.createElement('div');
-        childrenContainer.className = 'children-container';
-        childrenContainer.setAttribute('data-parent-id', node.id);
-        
-        // Apply collapsed state if not expanded
-        if (!isExpanded) {
-            childrenContainer.classList.add('collapsed');
-        }
-        
-        node.children.forEach(child => {
-            renderTree(child, childrenContainer, level + 1);
+// Render a page of children and a "load more" entry if the folder has more
+function renderChildren(parentNode, children, container, level) {
+    const oldLoadMore = container.querySelector(':scope > .tree-load-more');
+    if (oldLoadMore) {
+        oldLoadMore.remove();
+    }
+    children.forEach(child => {
+        renderTree(child, container, level);
+    });
+
+    const loaded = container.querySelectorAll(':scope > .tree-node').length;
+    const remaining = parentNode.child_count - loaded;
+    if (remaining > 0) {
+        const loadMore = document.createElement('div');
+        loadMore.className = 'tree-load-more';
+        loadMore.style.paddingLeft = `${level * 16}px`;
+        loadMore.setAttribute('data-level', level);
+        loadMore.textContent = `Load more (${remaining} remaining)`;
+        loadMore.addEventListener('click', async (e) => {
+            e.stopPropagation();
+            // Read at click time: the folder may have been moved to another level since
+            await loadChildrenPage(parentNode, container, parseInt(loadMore.getAttribute('data-level'), 10));
         });
-        
-        parentElement.appendChild(childrenContainer);
+        container.appendChild(loadMore);
+    }
+}
+
+// Fetch the next page of children of a folder into its container
+async function loadChildrenPage(parentNode, container, level) {
+    try {
+        const offset = container.querySelectorAll(':scope > .tree-node').length;
+        const children = await pywebview.api.get_children(parentNode.id, offset, TREE_PAGE_SIZE);
+        renderChildren(parentNode, children, container, level);
+        container.setAttribute('data-loaded', 'true');
+    } catch (error) {
+        console.error('Failed to load children:', error);
+        showError('Failed to load folder');
     }
 }
 
 // Toggle children visibility
-function toggleNodeChildren(nodeElement, node) {
+async function toggleNodeChildren(nodeElement, node) {
     const toggleBtn = nodeElement.querySelector('.toggle-btn');
     if (!toggleBtn) return;
     
@@ -252,7 +369,11 @@ function toggleNodeChildren(nodeElement, node) {
         toggleBtn.setAttribute('data-expanded', 'false');
         expandedNodeIds.delete(node.id);
     } else {
-        // Expand
+        // Expand, fetching the first page of children if needed
+        if (childrenContainer.getAttribute('data-loaded') !== 'true') {
+            const level = parseInt(nodeElement.getAttribute('data-level'), 10) + 1;
+            await loadChildrenPage(node, childrenContainer, level);
+        }
         childrenContainer.classList.remove('collapsed');
         toggleBtn.textContent = '▼';
         toggleBtn.setAttribute('data-expanded', 'true');
@@ -260,6 +381,196 @@ function toggleNodeChildren(nodeElement, node) {
     }
 }
 
+// ========== Incremental tree updates ==========
+
+// Find the row element of a node
+function findTreeRow(nodeId) {
+    return document.querySelector(`#treeView .tree-node[data-node-id="${nodeId}"]`);
+}
+
+// Find the element holding the rows of a folder's children (the tree view for the root)
+function findChildrenContainer(nodeId) {
+    if (nodeId === rootId) {
+        return document.getElementById('treeView');
+    }
+    return document.querySelector(`#treeView .children-container[data-parent-id="${nodeId}"]`);
+}
+
+// Remove the row of a node and its children container
+function removeTreeNodeElements(nodeId) {
+    const container = findChildrenContainer(nodeId);
+    if (container && nodeId !== rootId) {
+        container.remove();
+    }
+    const row = findTreeRow(nodeId);
+    if (row) {
+        row.remove();
+    }
+    selectedNodeIds.delete(nodeId);
+}
+
+// Take the row of a moved node and its children container out of the tree, to be put back by insertTreeNode
+function detachTreeNodeElements(nodeId) {
+    const row = findTreeRow(nodeId);
+    if (!row) {
+        return null;
+    }
+    const container = findChildrenContainer(nodeId);
+    row.remove();
+    if (container) {
+        container.remove();
+    }
+    return {row, container};
+}
+
+// Indent a moved row and everything rendered below it for its new level
+function setTreeNodeLevel(elements, level) {
+    const delta = level - parseInt(elements.row.getAttribute('data-level'), 10);
+    if (delta === 0) {
+        return;
+    }
+    const shifted = [elements.row];
+    if (elements.container) {
+        shifted.push(...elements.container.querySelectorAll('.tree-node, .tree-load-more'));
+    }
+    shifted.forEach(element => {
+        const newLevel = parseInt(element.getAttribute('data-level'), 10) + delta;
+        element.setAttribute('data-level', newLevel);
+        element.style.paddingLeft = `${newLevel * 16}px`;
+    });
+}
+
+// Render a node (inserted or moved) at its position if its parent's children are on screen;
+// a moved node's detached elements are put back as they are, so its expanded folders stay expanded
+function insertTreeNode(node, elements = null) {
+    const container = findChildrenContainer(node.parent_id);
+    const rows = container ? container.querySelectorAll(':scope > .tree-node') : [];
+    const loadMore = container ? container.querySelector(':scope > .tree-load-more') : null;
+    if (!container || (container !== document.getElementById('treeView') && container.getAttribute('data-loaded') !== 'true')
+        || (loadMore && node.index >= rows.length)) {
+        // Parent not rendered or not fetched yet: the node shows up when it is expanded
+        // (beyond the fetched page: it comes with "load more")
+        selectedNodeIds.delete(node.id);
+        return;
+    }
+
+    const parentRow = findTreeRow(node.parent_id);
+    const level = parentRow ? parseInt(parentRow.getAttribute('data-level'), 10) + 1 : 1;
+    const fragment = document.createDocumentFragment();
+    if (elements) {
+        setTreeNodeLevel(elements, level);
+        fragment.appendChild(elements.row);
+        if (elements.container) {
+            fragment.appendChild(elements.container);
+        }
+    } else {
+        renderTree(node, fragment, level);
+    }
+    container.insertBefore(fragment, rows[node.index] || loadMore || null);
+    if (elements) {
+        // Its row was built from the summary before the move
+        updateTreeNode(node);
+    }
+}
+
+// Re-render the row of an updated node, keeping its children container
+function updateTreeNode(node) {
+    const row = findTreeRow(node.id);
+    if (!row) {
+        return;
+    }
+    let container = findChildrenContainer(node.id);
+    const level = parseInt(row.getAttribute('data-level'), 10);
+    const isExpanded = !!container && !container.classList.contains('collapsed');
+    const newRow = createTreeNodeElement(node, level, isExpanded);
+    if (row.classList.contains('active')) {
+        newRow.classList.add('active');
+    }
+    row.replaceWith(newRow);
+
+    if (node.node_type !== 'folder') {
+        return;
+    }
+    if (node.child_count === 0 && container) {
+        container.remove();
+        expandedNodeIds.delete(node.id);
+    } else if (node.child_count > 0 && !container) {
+        container = createChildrenContainer(node.id, false, false);
+        newRow.after(container);
+    } else if (container && container.getAttribute('data-loaded') === 'true') {
+        // Refresh the "load more" entry for the new child count
+        renderChildren(node, [], container, level + 1);
+    }
+}
+
+// Change sets are applied one at a time: two overlapping runs would both insert the same nodes
+let applyQueue = Promise.resolve();
+
+// Apply a change set returned by a mutation (or get_changes_since) to the rendered tree
+function applyChanges(changes) {
+    const run = applyQueue.then(() => applyChangesNow(changes));
+    // A failed run is reported to its caller and does not stop the next ones
+    applyQueue = run.catch(() => {});
+    return run;
+}
+
+// Called by the backend when clients of the RPC server changed the tree
+function onExternalChanges() {
+    if (treeVersion === null) return;  // Still loading: the tree will be current
+    // An empty change set from our version, so applyChanges fetches what happened since
+    return applyChanges({since: null}).catch(error => console.error('Failed to apply changes:', error));
+}
+
+async function applyChangesNow(changes) {
+    if (changes && !changes.reset && changes.since !== treeVersion) {
+        // Something else changed the tree in between: fetch everything since our version
+        changes = await pywebview.api.get_changes_since(treeVersion);
+    }
+    if (!changes || changes.reset) {
+        await loadTree();
+        refreshHistoryButtons();
+        return;
+    }
+
+    changes.removed.forEach(change => removeTreeNodeElements(change.id));
+    const detached = new Map();
+    changes.moved.forEach(node => detached.set(node.id, detachTreeNodeElements(node.id)));
+    changes.moved.concat(changes.inserted)
+        .sort((a, b) => a.index - b.index)
+        .forEach(node => insertTreeNode(node, detached.get(node.id)));
+    changes.updated.forEach(node => updateTreeNode(node));
+    treeVersion = changes.version;
+    refreshHistoryButtons();
+
+    // Keep the selected item in sync
+    if (currentNode) {
+        const removed = changes.removed.some(change => change.id === currentNode.id);
+        const changed = changes.updated.concat(changes.moved).some(node => node.id === currentNode.id);
+        if (removed) {
+            currentNode = null;
+            updateActionButtons();
+        } else if (changed) {
+            const detail = await pywebview.api.get_node(currentNode.id);
+            if (detail) {
+                currentNode = detail;
+                await displayNodeContent(detail);
+            }
+        }
+    }
+}
+
+// Expand a folder in the rendered tree (after adding to it)
+async function expandTreeNode(nodeId) {
+    const row = findTreeRow(nodeId);
+    const toggleBtn = row && row.querySelector('.toggle-btn');
+    if (toggleBtn && toggleBtn.getAttribute('data-expanded') === 'false') {
+        const node = await pywebview.api.get_node(nodeId);
+        if (node) {
+            await toggleNodeChildren(row, node);
+        }
+    }
+}
+
 // Save current expanded state
 function saveExpandedState() {
     expandedNodeIds.clear();
@@ -279,21 +590,33 @@ function restoreExpandedState() {
     // The state is automatically restored during renderTree() by checking expandedNodeIds
 }
 
-// Select node
-async function selectNode(node) {
-    currentNode = node;
-    
+// Select node (tree nodes are summaries; details and content are fetched on demand)
+async function selectNode(node, nodeElement) {
     // Update selected state
     document.querySelectorAll('.tree-node').forEach(el => {
         el.classList.remove('active');
     });
-    event.currentTarget.classList.add('active');
+    nodeElement.classList.add('active');
+    clearMultiSelect();
+    selectedNodeIds.add(node.id);
+
+    try {
+        const detail = await pywebview.api.get_node(node.id);
+        if (!detail) {
+            showError('Item no longer exists');
+            return;
+        }
+        currentNode = detail;
 
-    // Display node content
-    await displayNodeContent(node);
+        // Display node content
+        await displayNodeContent(detail);
 
-    // Update button state
-    updateActionButtons();
+        // Update button state
+        updateActionButtons();
+    } catch (error) {
+        console.error('Failed to load node:', error);
+        showError('Failed to load item');
+    }
 }
 
 // Display node content
@@ -304,8 +627,11 @@ async function displayNodeContent(node) {
     contentTitle.textContent = node.name;
 
     if (node.node_type === 'folder') {
-        // Display folder content (child nodes list)
-        const children = node.children || [];
+        // Display folder content (first page of child nodes)
+        const children = node.child_count > 0
+            ? await pywebview.api.get_children(node.id, 0, TREE_PAGE_SIZE)
+            : [];
+        const more = node.child_count - children.length;
         let html = `
             <div class="command-detail">
                 <h2>📁 ${node.name}</h2>
@@ -317,6 +643,7 @@ async function displayNodeContent(node) {
                             const icon = child.node_type === 'folder' ? '📁' : '📝';
                             return `<li>${icon} ${child.name}</li>`;
                         }).join('') || '<li>No content</li>'}
+                        ${more > 0 ? `<li>… and ${more} more</li>` : ''}
                     </ul>
                 </div>
             </div>
@@ -351,6 +678,96 @@ async function displayNodeContent(node) {
     }
 }
 
+// Add a node to the multi-selection, or take it out
+function toggleMultiSelect(nodeId, nodeElement) {
+    if (currentNode && selectedNodeIds.size === 0) {
+        selectedNodeIds.add(currentNode.id);
+    }
+    if (selectedNodeIds.has(nodeId)) {
+        selectedNodeIds.delete(nodeId);
+        nodeElement.classList.remove('selected');
+    } else {
+        selectedNodeIds.add(nodeId);
+        nodeElement.classList.add('selected');
+    }
+}
+
+function clearMultiSelect() {
+    selectedNodeIds.clear();
+    document.querySelectorAll('.tree-node.selected').forEach(el => {
+        el.classList.remove('selected');
+    });
+}
+
+// Apply operations to the tree in one batch (all or nothing)
+async function runBatch(ops, successMessage, errorMessage) {
+    try {
+        const result = await pywebview.api.batch(ops);
+        if (result.success) {
+            await applyChanges(result.changes);
+            showSuccess(successMessage);
+        } else {
+            showError(result.error || errorMessage);
+        }
+        return result.success;
+    } catch (error) {
+        console.error('Batch failed:', error);
+        showError(errorMessage);
+        return false;
+    }
+}
+
+// Undo or redo the latest change
+async function runHistory(action) {
+    try {
+        const result = await pywebview.api[action]();
+        if (result.success) {
+            await applyChanges(result.changes);
+            showInfo(action === 'undo' ? 'Undone' : 'Redone');
+        } else {
+            showInfo(result.error);
+        }
+    } catch (error) {
+        console.error(`${action} failed:`, error);
+        showError(`Failed to ${action}`);
+    }
+}
+
+// Enable the undo and redo buttons when there is something to undo or redo
+async function refreshHistoryButtons() {
+    try {
+        const history = await pywebview.api.get_history();
+        document.getElementById('undoBtn').disabled = !history.undo;
+        document.getElementById('redoBtn').disabled = !history.redo;
+    } catch (error) {
+        console.error('Failed to get the undo history:', error);
+    }
+}
+
+async function deleteSelectedNodes() {
+    const ops = [...selectedNodeIds].map(nodeId => ({op: 'delete_node', node_id: nodeId}));
+    if (await runBatch(ops, `${ops.length} items deleted`, 'Failed to delete items')) {
+        clearMultiSelect();
+        currentNode = null;
+        document.getElementById('contentArea').innerHTML = `
+            <div class="welcome-message">
+                <h2>Items Deleted</h2>
+                <p>Please select another item to view</p>
+            </div>
+        `;
+        updateActionButtons();
+    }
+}
+
+// Nodes a drag moves: the whole multi-selection when the dragged node is part of it
+function draggedNodeIds() {
+    const draggedNodeId = draggedNode.getAttribute('data-node-id');
+    if (selectedNodeIds.size > 1 && selectedNodeIds.has(draggedNodeId)) {
+        return [...selectedNodeIds];
+    }
+    return [draggedNodeId];
+}
+
 // Update action buttons state
 function updateActionButtons() {
     const editBtn = document.getElementById('editBtn');
@@ -454,7 +871,7 @@ async function saveFolderForm() {
             const result = await pywebview.api.update_node(editingNodeId, name, null, description);
             if (result.success) {
                 closeModal('folderModal');
-                await loadTree();
+                await applyChanges(result.changes);
                 showSuccess('Folder updated successfully');
             } else {
                 showError(result.error || 'Update failed');
@@ -470,15 +887,15 @@ async function saveFolderForm() {
                 parentId = currentNode.id;
             } else {
                 // Use root as parent (top-level)
-                const tree = await pywebview.api.get_tree();
-                parentId = tree.id;
+                parentId = rootId;
             }
             
             const result = await pywebview.api.create_folder(parentId, name, description);
             if (result.success) {
                 closeModal('folderModal');
-                // Reload tree and expand parent folder
-                await loadTree(parentId);
+                // Patch tree and expand parent folder
+                await applyChanges(result.changes);
+                await expandTreeNode(parentId);
                 currentParentId = null; // Reset parent flag
                 showSuccess('Folder created successfully');
             } else {
@@ -508,7 +925,7 @@ async function saveCommandForm() {
             const result = await pywebview.api.update_node(editingNodeId, name, content, description);
             if (result.success) {
                 closeModal('commandModal');
-                await loadTree();
+                await applyChanges(result.changes);
                 showSuccess('Command updated successfully');
             } else {
                 showError(result.error || 'Update failed');
@@ -522,8 +939,9 @@ async function saveCommandForm() {
             const result = await pywebview.api.create_command(currentNode.id, name, content, description);
             if (result.success) {
                 closeModal('commandModal');
-                // Reload tree and expand parent folder
-                await loadTree(currentNode.id);
+                // Patch tree and expand parent folder
+                await applyChanges(result.changes);
+                await expandTreeNode(currentNode.id);
                 showSuccess('Command created successfully');
             } else {
                 showError(result.error || 'Creation failed');
@@ -541,7 +959,7 @@ async function deleteNode(nodeId) {
         const result = await pywebview.api.delete_node(nodeId);
         if (result.success) {
             currentNode = null;
-            await loadTree();
+            await applyChanges(result.changes);
             document.getElementById('contentArea').innerHTML = `
                 <div class="welcome-message">
                     <h2>Item Deleted</h2>
@@ -559,64 +977,127 @@ async function deleteNode(nodeId) {
     }
 }
 
-// Perform search
+// Perform search (results arrive through onSearchResults)
 async function performSearch() {
+    const generation = ++searchGeneration;
     const keyword = document.getElementById('searchInput').value.trim();
     if (!keyword) {
         await loadTree();
         return;
     }
 
+    const fuzzy = document.getElementById('fuzzySearch').checked;
     try {
-        const results = await pywebview.api.search(keyword);
-        displaySearchResults(results, keyword);
+        const count = await pywebview.api.search(keyword, SEARCH_RESULT_LIMIT, fuzzy, generation, searchScope());
+        if (count === null || generation !== searchGeneration) {
+            return; // Superseded by a newer search
+        }
+        finishSearchResults(generation, keyword, count);
     } catch (error) {
         console.error('Search failed:', error);
         showError('Search failed');
     }
 }
 
-// Display search results
-function displaySearchResults(results, keyword) {
-    const contentArea = document.getElementById('contentArea');
-    const contentTitle = document.getElementById('contentTitle');
+// Folder the search is limited to: the selected folder, or the folder of the selected command
+function searchScope() {
+    if (!document.getElementById('scopeSearch').checked || !currentNode) {
+        return null;
+    }
+    return currentNode.node_type === 'folder' ? currentNode.id : currentNode.parent_id;
+}
 
-    contentTitle.textContent = `Search Results: "${keyword}"`;
+// Search once typing pauses
+function scheduleSearch() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(performSearch, SEARCH_DEBOUNCE_MS);
+}
 
-    if (results.length === 0) {
-        contentArea.innerHTML = `
-            <div class="welcome-message">
-                <h2>😔 No Results Found</h2>
-                <p>No commands found containing "${keyword}"</p>
+// Show a batch of search results (called from Python, the best results first)
+function onSearchResults(generation, batch) {
+    if (generation !== searchGeneration) {
+        return; // Results of a superseded search
+    }
+    let list = document.getElementById('searchResultList');
+    if (renderedSearchGeneration !== generation) {
+        renderedSearchGeneration = generation;
+        const keyword = document.getElementById('searchInput').value.trim();
+        document.getElementById('contentTitle').textContent = `Search Results: "${keyword}"`;
+        document.getElementById('contentArea').innerHTML = `
+            <div class="command-detail">
+                <h2 id="searchResultCount">Searching…</h2>
+                <div class="info-group" id="searchResultList"></div>
             </div>
         `;
-        return;
+        list = document.getElementById('searchResultList');
+    } else if (!list) {
+        return; // The user moved on to a node meanwhile
     }
 
-    let html = `
-        <div class="command-detail">
-            <h2>Found ${results.length} result(s)</h2>
-            <div class="info-group">
-    `;
-
-    results.forEach(cmd => {
+    let html = '';
+    batch.forEach(cmd => {
+        const name = highlightMatch(cmd, 'name');
+        const description = highlightMatch(cmd, 'description');
         html += `
-            <div style="margin-bottom: 20px; padding: 16px; border: 1px solid #e0e0e0; border-radius: 4px;">
-                <h3>📝 ${cmd.name}</h3>
-                ${cmd.description ? `<p style="color: #666; margin: 8px 0;">${cmd.description}</p>` : ''}
+            <div class="search-result" style="margin-bottom: 20px; padding: 16px; border: 1px solid #e0e0e0; border-radius: 4px;">
+                ${cmd.path ? `<p style="color: #999; font-size: 12px; margin: 0 0 4px;">📁 ${escapeHtml(cmd.path)}</p>` : ''}
+                <h3>📝 ${name}</h3>
+                ${description ? `<p style="color: #666; margin: 8px 0;">${description}</p>` : ''}
                 <div style="background-color: #2d2d2d; color: #f8f8f2; padding: 12px; border-radius: 4px; margin-top: 8px;">
-                    <code>${cmd.content}</code>
+                    <code>${highlightMatch(cmd, 'content')}</code>
                 </div>
             </div>
         `;
     });
+    list.insertAdjacentHTML('beforeend', html);
+}
+
+// Complete the display of a search once all its results are shown
+function finishSearchResults(generation, keyword, count) {
+    const contentArea = document.getElementById('contentArea');
+    const contentTitle = document.getElementById('contentTitle');
 
-    html += `
+    if (count === 0) {
+        renderedSearchGeneration = generation;
+        contentTitle.textContent = `Search Results: "${keyword}"`;
+        contentArea.innerHTML = `
+            <div class="welcome-message">
+                <h2>😔 No Results Found</h2>
+                <p>No commands found matching "${escapeHtml(keyword)}"</p>
             </div>
-        </div>
-    `;
+        `;
+        return;
+    }
 
-    contentArea.innerHTML = html;
+    const header = document.getElementById('searchResultCount');
+    if (header) {
+        header.textContent = `${count >= SEARCH_RESULT_LIMIT ? `Top ${count}` : `Found ${count}`} result(s)`;
+    }
+}
+
+// Escape text for insertion into HTML
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, c => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[c]);
+}
+
+// HTML of a field of a search result, with the matched characters marked
+function highlightMatch(cmd, field) {
+    const text = cmd[field] || '';
+    if (!cmd.match || cmd.match.field !== field) {
+        return escapeHtml(text);
+    }
+    // Offsets count characters (code points), not UTF-16 units
+    const chars = Array.from(text);
+    const slice = (start, end) => escapeHtml(chars.slice(start, end).join(''));
+    let html = '';
+    let last = 0;
+    cmd.match.offsets.forEach(([start, end]) => {
+        html += slice(last, start) + '<mark>' + slice(start, end) + '</mark>';
+        last = end;
+    });
+    return html + slice(last);
 }
 
 // Copy command to clipboard
@@ -648,7 +1129,7 @@ async function duplicateCommand(nodeId) {
     try {
         const result = await pywebview.api.duplicate_node(nodeId);
         if (result.success) {
-            await loadTree();
+            await applyChanges(result.changes);
             showSuccess('Command duplicated successfully');
         } else {
             showError(result.error || 'Duplication failed');
@@ -723,10 +1204,18 @@ async function handleDrop(e) {
         return;
     }
     
+    const nodeIds = draggedNodeIds();
+    if (nodeIds.length > 1) {
+        const ops = nodeIds.map(nodeId => ({op: 'move_node', node_id: nodeId, new_parent_id: targetNodeId}));
+        await runBatch(ops, `${ops.length} items moved`, 'Failed to move items');
+        targetNode.classList.remove('drag-over');
+        return;
+    }
+    
     try {
         const result = await pywebview.api.move_node(draggedNodeId, targetNodeId);
         if (result.success) {
-            await loadTree();
+            await applyChanges(result.changes);
             showSuccess('Item moved successfully');
         } else {
             showError(result.error || 'Failed to move item');
@@ -739,6 +1228,38 @@ async function handleDrop(e) {
     targetNode.classList.remove('drag-over');
 }
 
+// Import a shell history or snippet file into the selected folder (top level otherwise)
+async function importCommands() {
+    const importBtn = document.getElementById('importBtn');
+    const parentId = currentNode && currentNode.node_type === 'folder' ? currentNode.id : rootId;
+    importBtn.disabled = true;
+    try {
+        const result = await pywebview.api.import_file(parentId);
+        if (result.cancelled) return;
+        if (result.success) {
+            await applyChanges(result.changes);
+            showSuccess(`Imported ${result.data.imported} commands, skipped ${result.data.duplicates} duplicates`);
+        } else {
+            showError(result.error || 'Import failed');
+        }
+    } catch (error) {
+        console.error('Import failed:', error);
+        showError('Import failed');
+    } finally {
+        importBtn.disabled = false;
+        importBtn.textContent = '⤓ Import';
+    }
+}
+
+// Called by the backend while an import runs
+function onImportProgress(progress) {
+    const importBtn = document.getElementById('importBtn');
+    if (progress.done) return;
+    importBtn.textContent = progress.total_bytes
+        ? `⤓ ${Math.floor(100 * progress.bytes_read / progress.total_bytes)}%`
+        : `⤓ ${progress.read}`;
+}
+
 // Handle drop on tree view empty area to create top-level folder
 async function handleTreeViewDrop(e) {
     e.preventDefault();
@@ -760,10 +1281,6 @@ async function handleTreeViewDrop(e) {
     }
     
     try {
-        // Get root node ID
-        const tree = await pywebview.api.get_tree();
-        const rootId = tree.id;
-        
         // Check if already at top level
         const draggedNodeData = await pywebview.api.get_node(draggedNodeId);
         if (draggedNodeData && draggedNodeData.parent_id === rootId) {
@@ -775,7 +1292,7 @@ async function handleTreeViewDrop(e) {
         // Move to root (top level)
         const result = await pywebview.api.move_node(draggedNodeId, rootId);
         if (result.success) {
-            await loadTree();
+            await applyChanges(result.changes);
             showSuccess('Folder moved to top level');
         } else {
             showError(result.error || 'Failed to move folder');
@@ -1,50 +1,188 @@
 """WebView Application - PyWebView interface application"""
 
-import webview
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
-from controllers import CommandController
+from models.first_paint import read_first_paint, write_first_paint
+from models.paths import default_data_dir, default_data_file
+
+# The data is loaded by initialize_controller, which runs in the background once
+# the window is up (see run). pywebview is imported by the methods that use it,
+# so the package (and the RPC client in it) can be imported without a GUI.
 
 
 class WebViewApp:
     """PyWebView application class"""
     
-    def __init__(self):
-        """Initialize application"""
+    # Bridge methods recorded when metrics are enabled
+    INSTRUMENTED_METHODS = [
+        'get_tree', 'get_node', 'get_children', 'search', 'get_changes_since', 'create_folder',
+        'create_command', 'update_node', 'delete_node', 'move_node', 'duplicate_node', 'batch', 'import_file',
+        'undo', 'redo', 'get_history', 'get_metrics', 'get_first_paint', 'report_startup',
+    ]
+    
+    # Startup stages reported by the frontend
+    STARTUP_STAGES = ('first_paint', 'interactive')
+    
+    def __init__(self, data_options=None, metrics_options=None, startup_options=None, rpc_options=None,
+                 controller_options=None):
+        """
+        Initialize application
+        
+        Args:
+            data_options: Keyword options for DataManager (storage mode, journal limits)
+            metrics_options: Keyword options for Metrics (log file); metrics are only
+                             collected when given
+            startup_options: Startup timing options: started_at (process start, epoch
+                             seconds), log_file (JSON lines of startup timings) and
+                             exit_after_startup (close once interactive, for benchmarks)
+            rpc_options: Keyword options for RpcServer (address); the local RPC server
+                         is only started when given
+            controller_options: Keyword options for CommandController (undo history size)
+        """
         self.controller = None
         self.window = None
+        self.data_options = data_options or {}
+        self.controller_options = controller_options or {}
+        self._controller_lock = threading.Lock()
+        # Cancel flag of the latest fuzzy or streamed search, and the latest generation started
+        self._search_lock = threading.Lock()
+        self._search_cancel = None
+        self._search_generation = 0
+        self._closed = False
+        self.metrics = None
+        if metrics_options is not None:
+            from models.metrics import Metrics, instrument_methods
+            self.metrics = Metrics(**metrics_options)
+            self.data_options = dict(self.data_options, metrics=self.metrics)
+            # Wrapped per instance, so the disabled path runs the plain methods
+            instrument_methods(self.metrics, self, self.INSTRUMENTED_METHODS, "api")
+        startup_options = startup_options or {}
+        self.startup_log = startup_options.get('log_file')
+        self.exit_after_startup = startup_options.get('exit_after_startup', False)
+        self.rpc_options = rpc_options
+        self.rpc_server = None
+        self._timings = {'process_start': startup_options.get('started_at') or time.time(),
+                         'app_init': time.time()}
     
     def initialize_controller(self):
-        """Initialize controller after window is ready"""
+        """Initialize controller (loads the data once, whichever thread asks first)"""
         if self.controller is None:
-            self.controller = CommandController()
+            with self._controller_lock:
+                if self.controller is None:
+                    from controllers import CommandController
+                    from models import DataManager
+                    controller = CommandController(DataManager(**self.data_options), **self.controller_options)
+                    controller.data_manager.on_external_change = self._push_external_changes
+                    self._timings['data_loaded'] = time.time()
+                    self.controller = controller
+    
+    def _data_file(self):
+        """Data file the first-paint snapshot belongs to"""
+        return self.data_options.get('data_file') or default_data_file()
     
     # ========== API Methods (called by JavaScript) ==========
     
-    def get_tree(self):
-        """Get tree structure"""
+    def get_tree(self, expanded_ids=None):
+        """Get shallow tree structure (root and expanded folders only)"""
         self.initialize_controller()
-        return self.controller.get_tree_structure()
+        return self.controller.get_tree_summary(expanded_ids)
     
     def get_node(self, node_id):
-        """Get node information"""
+        """Get node information including command content"""
         self.initialize_controller()
         return self.controller.get_node_by_id(node_id)
     
-    def get_children(self, node_id):
-        """Get child nodes list"""
+    def get_children(self, node_id, offset=0, limit=None):
+        """Get a page of child node summaries"""
         self.initialize_controller()
-        return self.controller.get_children(node_id)
+        return self.controller.get_children(node_id, offset, limit)
     
-    def search(self, keyword):
-        """Search commands"""
+    def search(self, keyword, limit=None, fuzzy=False, generation=None, scope=None):
+        """
+        Search commands (ranked, at most limit results, within the folder scope if given)
+        
+        Without a generation the results are returned. With one (a number the
+        frontend increases for every search), they are sent to the frontend's
+        onSearchResults(generation, batch) in batches as they are found, the
+        best first, and the number of results is returned.
+        
+        A search abandons the fuzzy or streamed searches started before it that
+        are still running, and a search older than the latest one started is
+        not run: those return None.
+        """
         self.initialize_controller()
-        return self.controller.search_commands(keyword)
+        if not fuzzy and generation is None:
+            return self.controller.search_commands(keyword, limit, scope=scope)
+        from models import SearchCancelled
+        cancel = threading.Event()
+        with self._search_lock:
+            if generation is not None and generation < self._search_generation:
+                return None
+            if self._search_cancel is not None:
+                self._search_cancel.set()
+            self._search_cancel = cancel
+            if generation is not None:
+                self._search_generation = generation
+        try:
+            if generation is None:
+                return self.controller.search_commands(keyword, limit, True, cancel, scope)
+            return self._stream_search(keyword, limit, fuzzy, generation, cancel, scope)
+        except SearchCancelled:
+            return None
+    
+    def _stream_search(self, keyword, limit, fuzzy, generation, cancel, scope=None):
+        """Send the batches of a search to the frontend, returning the number of results or None if abandoned"""
+        # The search holds the tree's read lock while it runs: batches are handed
+        # to a thread that sends them, so it never waits for the GUI with the lock held
+        batches = queue.Queue()
+        sender = threading.Thread(target=self._send_search_results, args=(generation, batches, cancel),
+                                  name="commandnote-search-results", daemon=True)
+        sender.start()
+        count = 0
+        results = self.controller.iter_search_commands(keyword, limit, fuzzy, cancel, scope=scope)
+        try:
+            for batch in results:
+                if cancel.is_set():
+                    return None
+                batches.put(batch)
+                count += len(batch)
+        finally:
+            # Releases the read lock right away when abandoned
+            results.close()
+            batches.put(None)
+        # Returned once every batch is shown
+        sender.join()
+        return None if cancel.is_set() else count
+    
+    def _send_search_results(self, generation, batches, cancel):
+        """Evaluate onSearchResults for each batch until the end marker, skipping them once abandoned"""
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            if self.window is not None and not self._closed and not cancel.is_set():
+                self.window.evaluate_js(f"onSearchResults({json.dumps(generation)}, {json.dumps(batch)})")
+    
+    def get_changes_since(self, version):
+        """Get the tree changes after a version (for patching the rendered tree)"""
+        self.initialize_controller()
+        return self.controller.get_changes_since(version)
+    
+    # Mutations return the change set they caused next to their data
     
     def create_folder(self, parent_id, name, description=""):
         """Create folder"""
         try:
             self.initialize_controller()
-            return {"success": True, "data": self.controller.create_folder(parent_id, name, description)}
+            data, changes = self.controller.run_with_changes(self.controller.create_folder, parent_id, name,
+                                                             description)
+            return {"success": True, "data": data, "changes": changes}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -52,7 +190,9 @@ class WebViewApp:
         """Create command"""
         try:
             self.initialize_controller()
-            return {"success": True, "data": self.controller.create_command(parent_id, name, content, description)}
+            data, changes = self.controller.run_with_changes(self.controller.create_command, parent_id, name, content,
+                                                             description)
+            return {"success": True, "data": data, "changes": changes}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -60,7 +200,9 @@ class WebViewApp:
         """Update node"""
         try:
             self.initialize_controller()
-            return {"success": True, "data": self.controller.update_node(node_id, name, content, description)}
+            data, changes = self.controller.run_with_changes(self.controller.update_node, node_id, name, content,
+                                                             description)
+            return {"success": True, "data": data, "changes": changes}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -68,8 +210,8 @@ class WebViewApp:
         """Delete node"""
         try:
             self.initialize_controller()
-            result = self.controller.delete_node(node_id)
-            return {"success": result}
+            result, changes = self.controller.run_with_changes(self.controller.delete_node, node_id)
+            return {"success": result, "changes": changes}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -77,7 +219,8 @@ class WebViewApp:
         """Move node"""
         try:
             self.initialize_controller()
-            return {"success": True, "data": self.controller.move_node(node_id, new_parent_id)}
+            data, changes = self.controller.run_with_changes(self.controller.move_node, node_id, new_parent_id)
+            return {"success": True, "data": data, "changes": changes}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
@@ -85,14 +228,167 @@ class WebViewApp:
         """Duplicate node"""
         try:
             self.initialize_controller()
-            return {"success": True, "data": self.controller.duplicate_node(node_id)}
+            data, changes = self.controller.run_with_changes(self.controller.duplicate_node, node_id)
+            return {"success": True, "data": data, "changes": changes}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def batch(self, ops):
+        """Apply several operations at once (all or nothing, saved once)"""
+        try:
+            self.initialize_controller()
+            data, changes = self.controller.run_with_changes(self.controller.apply_batch, ops)
+            return {"success": True, "data": data, "changes": changes}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def undo(self):
+        """Undo the latest change (mutation, batch or import)"""
+        try:
+            self.initialize_controller()
+            done, changes = self.controller.run_with_changes(self.controller.undo)
+            if not done:
+                return {"success": False, "error": "Nothing to undo"}
+            return {"success": True, "data": self.controller.get_history(), "changes": changes}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def redo(self):
+        """Redo the latest undone change"""
+        try:
+            self.initialize_controller()
+            done, changes = self.controller.run_with_changes(self.controller.redo)
+            if not done:
+                return {"success": False, "error": "Nothing to redo"}
+            return {"success": True, "data": self.controller.get_history(), "changes": changes}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def get_history(self):
+        """Get how many changes can be undone and redone"""
+        self.initialize_controller()
+        return self.controller.get_history()
+    
+    def import_file(self, parent_id=None):
+        """Pick a shell history or snippet file and import it into a new folder"""
+        try:
+            import webview
+            self.initialize_controller()
+            paths = self.window.create_file_dialog(webview.OPEN_DIALOG)
+            if not paths:
+                return {"success": False, "cancelled": True}
+            data, changes = self.controller.import_file_with_changes(paths[0], parent_id,
+                                                                     progress=self._report_import_progress)
+            return {"success": True, "data": data, "changes": changes}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def _report_import_progress(self, progress):
+        """Forward import counters to the frontend"""
+        if self.window is not None:
+            self.window.evaluate_js(f"onImportProgress({json.dumps(progress)})")
+    
+    # ========== Diagnostics ==========
+    
+    def get_metrics(self):
+        """Get call counts, latency percentiles and payload sizes of the API and of loads/saves"""
+        if self.metrics is None:
+            return {"enabled": False}
+        return dict(self.metrics.snapshot(), enabled=True)
+    
+    def profile_next_calls(self, calls=20):
+        """Profile the next API calls with cProfile and write the stats next to the metrics log"""
+        if self.metrics is None:
+            return {"success": False, "error": "Metrics are not enabled (set COMMANDNOTE_METRICS=1)"}
+        log_file = self.metrics.log_file
+        directory = os.path.dirname(os.path.abspath(log_file)) if log_file else str(default_data_dir())
+        path = os.path.join(directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}.prof")
+        self.metrics.profile_next(int(calls), path)
+        return {"success": True, "data": {"calls": int(calls), "path": path}}
+    
+    # ========== Startup ==========
+    
+    def get_first_paint(self):
+        """Get the snapshot of the top of the tree to show while the data loads (None if loaded or stale)"""
+        if self.controller is not None:
+            return None
+        return read_first_paint(self._data_file())
+    
+    def report_startup(self, stage):
+        """Record when the frontend reached a startup stage (first_paint, interactive)"""
+        if stage not in self.STARTUP_STAGES:
+            return {"success": False, "error": f"Unknown startup stage: {stage}"}
+        self._timings.setdefault(stage, time.time())
+        timings = self.get_startup_timings()
+        if stage == 'interactive':
+            self._log_startup(timings)
+            if self.exit_after_startup and self.window is not None:
+                # Not from this call, so that it can return to the frontend first
+                threading.Thread(target=self.window.destroy, daemon=True).start()
+        return {"success": True, "data": timings}
+    
+    def get_startup_timings(self):
+        """Get the milliseconds from process start to each startup stage reached so far"""
+        start = self._timings['process_start']
+        return {
+            'frozen': bool(getattr(sys, 'frozen', False)),
+            'storage': str(self.data_options.get('storage', 'json')),
+            'ms': {stage: round((at - start) * 1000, 1) for stage, at in self._timings.items()
+                   if stage != 'process_start'},
+        }
+    
+    def _log_startup(self, timings):
+        """Append the timings of this start to the startup log"""
+        if not self.startup_log:
+            return
+        entry = dict(timings, at=datetime.now().isoformat())
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.startup_log)), exist_ok=True)
+            with open(self.startup_log, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Failed to write startup log: {e}")
+    
+    def _load_in_background(self):
+        """Load the data while the window shows the first-paint snapshot"""
+        try:
+            self.initialize_controller()
+        except Exception as e:
+            # The next API call retries and reports the error to the frontend
+            print(f"Background data load failed: {e}")
+            return
+        if read_first_paint(self._data_file()) is None:
+            with self.controller.data_manager.read_lock:
+                summary = self.controller.get_tree_summary()
+                write_first_paint(self._data_file(), summary, self.controller.data_manager.storage.files())
+        if self.rpc_options is not None and not self._closed:
+            self._start_rpc_server()
+    
+    # ========== Local RPC Server ==========
+    
+    def _start_rpc_server(self):
+        """Share the loaded tree with other clients (editor plugins, the command line)"""
+        from views.rpc_server import RpcServer
+        server = RpcServer(self.controller, data_file=self._data_file(),
+                           on_change=self._push_external_changes, **self.rpc_options)
+        try:
+            server.start()
+        except (OSError, ValueError) as e:
+            print(f"Failed to start RPC server: {e}")
+            return
+        self.rpc_server = server
+    
+    def _push_external_changes(self):
+        """Let the frontend fetch the changes RPC clients or other programs (data file edits) made"""
+        if self.window is not None and not self._closed:
+            self.window.evaluate_js("onExternalChanges()")
+    
     # ========== Application Startup ==========
     
     def run(self):
         """Start application"""
+        import webview
+        
         # Get HTML file path
         html_path = Path(__file__).parent / "static" / "index.html"
         
@@ -105,6 +401,26 @@ class WebViewApp:
             resizable=True,
             js_api=self  # Expose Python API to JavaScript
         )
+        # Write pending changes before the window goes away
+        self.window.events.closing += self._on_closing
+        self._timings['window_created'] = time.time()
+        
+        # Load the data while the GUI starts
+        threading.Thread(target=self._load_in_background, name="commandnote-load", daemon=True).start()
         
         # Start application with GUI settings
         webview.start(debug=False, gui='edgechromium')
+        self._on_closing()
+    
+    def _on_closing(self):
+        """Stop the RPC server, flush pending background saves, stop storage threads and snapshot the tree"""
+        if self.controller is not None and not self._closed:
+            self._closed = True
+            if self.rpc_server is not None:
+                # Clients' queued writes go in before the last save
+                self.rpc_server.stop()
+            # Taken before closing (lazy backends need the storage to list children),
+            # fingerprinted after (closing writes the last changes)
+            summary = self.controller.get_tree_summary()
+            self.controller.data_manager.close()
+            write_first_paint(self._data_file(), summary, self.controller.data_manager.storage.files())